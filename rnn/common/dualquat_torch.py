@@ -7,6 +7,7 @@ code from paper: Pose Representations for Deep Skeletal Animaion
 import torch
 import torch.nn.functional as nnF
 import common.quaternion_torch as tquat
+import common.dualquat_np as ndquat
 
 def conj(dq):
     """
@@ -53,7 +54,6 @@ def mul(dq1, dq2):  # accepts normalized quaternions (*,8)
     q_ = tquat.mul(q, r)
     d_ = tquat.mul(q, d_r) + tquat.mul(d_q, r)
 
-    assert (q_ == tquat.mul(q, r)).all()
     return torch.cat((q_, d_), 1)
     
 
@@ -136,3 +136,72 @@ def translation(dq):
     qt = tquat.conj(dq[:,:4])
     return tquat.mul(torch.mul(2,dualquats_normalized),qt)[:,1:]
 
+
+def qtvec2dq(q_r, v_t):
+    """
+    Create dual quaternions from quaternions q_r (*, 4) and translations v_t (*, 3)
+    q_r is normalised
+    
+    outputs
+    -------
+    torch.tensor, shape: (*,8)
+    """
+    q_r = nnF.normalize(q_r, dim=-1)
+    q_r, v_t = torch.broadcast_tensors(q_r, torch.cat((torch.zeros_like(v_t[..., :1]), v_t), dim=-1))
+    q_d = tquat.mul(0.5 * v_t, q_r)
+    return torch.cat((q_r, q_d), dim=-1)
+
+def localquats2currentdq(lq, offsets, parents, joints_num=None):
+    """
+    Converts local joint rotations and joint offsets to hierarchy-aware (global) dual quaternions,
+    all joints of the same depth in the hierarchy are processed at once for all frames (same as dualquat_np.localquats2currentdq)
+    inputs
+    -------
+    lq: local quaternions, torch.tensor, shape: (*, J*4)
+    offsets: joint offsets, torch.tensor, shape: (J, 3)
+    parents: parents list, -1 for the root
+    joints_num: number of joints used, all joints in parents if None
+    
+    outputs
+    -------
+    torch.tensor, shape: (*, J*8), global dual quaternions
+    """
+    
+    if joints_num is None:
+        joints_num = len(parents)
+        
+    parents = parents[:joints_num]
+    
+    batch_shape = lq.shape[:-1]
+    lq = lq.reshape(batch_shape + (-1, 4))[..., :joints_num, :]
+    offsets = offsets[:joints_num].to(dtype=lq.dtype, device=lq.device)
+    
+    # local transformations
+    local_dq = qtvec2dq(lq, offsets)
+    
+    # the global dual quaternions are collected level by level, joint_index maps a joint to its position in current_dq
+    current_dq = None
+    joint_index = [ -1 ] * joints_num
+    processed_joints = []
+    
+    for level, joints in enumerate(ndquat.joint_levels(parents)):
+        
+        joints = joints.tolist()
+        
+        if level == 0:
+            level_dq = normalize(local_dq[..., joints, :].reshape(-1, 8))
+        else:
+            parent_dq = current_dq[..., [ joint_index[parents[joint]] for joint in joints ], :]
+            level_dq = normalize(mul(parent_dq.reshape(-1, 8), local_dq[..., joints, :].reshape(-1, 8)))
+            
+        level_dq = level_dq.reshape(batch_shape + (len(joints), 8))
+        
+        current_dq = level_dq if current_dq is None else torch.cat((current_dq, level_dq), dim=-2)
+        
+        for joint in joints:
+            joint_index[joint] = len(processed_joints)
+            processed_joints.append(joint)
+            
+    current_dq = current_dq[..., joint_index, :]
+    
+    return current_dq.reshape(batch_shape + (joints_num * 8, ))
@@ -3,9 +3,7 @@ quaternion operations and conversions that operate on numpy arrays
 representation: w, x, y, z
 """
 
-import torch
 import numpy as np
-import common.quaternion_torch as tquat 
 
 def mag(q):
     """
@@ -43,18 +41,97 @@ def normalize(q):
     return q / np.linalg.norm(q, axis=-1, keepdims=True)
 
 def mul(q, r):
-    q = torch.from_numpy(q).contiguous()
-    r = torch.from_numpy(r).contiguous()
-    return tquat.mul(q, r).numpy()
+    """
+    Multiply quaternion(s) q with quaternion(s) r (tested)
+    Expects two arrays of shape (*, 4) that broadcast against each other
+    Returns q*r as an array of shape (*, 4)
+    """
+    
+    assert q.shape[-1] == 4
+    assert r.shape[-1] == 4
+    
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    r0, r1, r2, r3 = r[..., 0], r[..., 1], r[..., 2], r[..., 3]
+    
+    w = q0 * r0 - q1 * r1 - q2 * r2 - q3 * r3
+    x = q0 * r1 + q1 * r0 + q2 * r3 - q3 * r2
+    y = q0 * r2 - q1 * r3 + q2 * r0 + q3 * r1
+    z = q0 * r3 + q1 * r2 - q2 * r1 + q3 * r0
+    
+    return np.stack((w, x, y, z), axis=-1)
 
 def rot(q, v):
     """
     Rotate a 3D vector by the rotation stored in the quaternion (tested)
+    Expects an array of shape (*, 4) for q and an array of shape (*, 3) for v that broadcast against each other
+    Returns an array of shape (*, 3)
     """
+    
+    assert q.shape[-1] == 4
+    assert v.shape[-1] == 3
+    
+    qvec = q[..., 1:]
+    
+    uv = np.cross(qvec, v)
+    uuv = np.cross(qvec, uv)
+    return v + 2 * (q[..., :1] * uv + uuv)
+
+def mat2quat(R):
+    """
+    from paper: Ganimator (tested)
+    but adapted for numpy instead of torch
+    """
+
+    # The rotation matrix must be orthonormal
+
+    w2 = (1 + R[..., 0, 0] + R[..., 1, 1] + R[..., 2, 2])
+    x2 = (1 + R[..., 0, 0] - R[..., 1, 1] - R[..., 2, 2])
+    y2 = (1 - R[..., 0, 0] + R[..., 1, 1] - R[..., 2, 2])
+    z2 = (1 - R[..., 0, 0] - R[..., 1, 1] + R[..., 2, 2])
+
+    yz = (R[..., 1, 2] + R[..., 2, 1])
+    xz = (R[..., 2, 0] + R[..., 0, 2])
+    xy = (R[..., 0, 1] + R[..., 1, 0])
+
+    wx = (R[..., 2, 1] - R[..., 1, 2])
+    wy = (R[..., 0, 2] - R[..., 2, 0])
+    wz = (R[..., 1, 0] - R[..., 0, 1])
+
+    # integer matrices would truncate the square roots
+    w = np.empty(x2.shape, dtype=np.result_type(x2.dtype, np.float32))
+    x = np.empty_like(w)
+    y = np.empty_like(w)
+    z = np.empty_like(w)
 
-    q = torch.from_numpy(q).contiguous()
-    v = torch.from_numpy(v).contiguous()
-    return tquat.rot(q, v).numpy()
+    flagA = (R[..., 2, 2] < 0) * (R[..., 0, 0] > R[..., 1, 1])
+    flagB = (R[..., 2, 2] < 0) * (R[..., 0, 0] <= R[..., 1, 1])
+    flagC = (R[..., 2, 2] >= 0) * (R[..., 0, 0] < -R[..., 1, 1])
+    flagD = (R[..., 2, 2] >= 0) * (R[..., 0, 0] >= -R[..., 1, 1])
+
+    x[flagA] = np.sqrt(x2[flagA])
+    w[flagA] = wx[flagA] / x[flagA]
+    y[flagA] = xy[flagA] / x[flagA]
+    z[flagA] = xz[flagA] / x[flagA]
+
+    y[flagB] = np.sqrt(y2[flagB])
+    w[flagB] = wy[flagB] / y[flagB]
+    x[flagB] = xy[flagB] / y[flagB]
+    z[flagB] = yz[flagB] / y[flagB]
+
+    z[flagC] = np.sqrt(z2[flagC])
+    w[flagC] = wz[flagC] / z[flagC]
+    x[flagC] = xz[flagC] / z[flagC]
+    y[flagC] = yz[flagC] / z[flagC]
+
+    w[flagD] = np.sqrt(w2[flagD])
+    x[flagD] = wx[flagD] / w[flagD]
+    y[flagD] = wy[flagD] / w[flagD]
+    z[flagD] = wz[flagD] / w[flagD]
+
+    res = [w, x, y, z]
+    res = [np.expand_dims(z, axis=-1) for z in res]
+
+    return np.concatenate(res, axis=-1) / 2
 
 def quat2mat(q):
     """
@@ -96,6 +173,9 @@ def quat2mat(q):
     return m
 
 def quat2euler(q, order, epsilon=0, use_gpu=False):
+    import torch
+    import common.quaternion_torch as tquat
+    
     if use_gpu:
         q = torch.from_numpy(q).cuda()
         return tquat.quat2euler(q, order, epsilon).cpu().numpy()
@@ -105,34 +185,35 @@ def quat2euler(q, order, epsilon=0, use_gpu=False):
 
 def slerp(q0, q1, t=0.5, unit=True):
     """
-    tested
-    :param q0: shape = (*, n)
-    :param q1: shape = (*, n)
-    :param t: shape = (*)
+    spherical linear interpolation (tested)
+    
+    branch free: the shorter path and the fallback to a normalised linear interpolation
+    for nearly parallel quaternions are selected with np.where
+    :param q0: shape = (*, 4)
+    :param q1: shape = (*, 4)
+    :param t: shape = (*) or a scalar, broadcasts against the leading dimensions of q0 and q1
     :param unit: If q0 and q1 are unit vectors
-    :return: res: shape = (*, n)
+    :return: res: shape = (*, 4)
     """
-    eps = 1e-8
     if not unit:
-        q0_n = q0 / np.linalg.norm(q0, axis=-1, keepdims=True)
-        q1_n = q1 / np.linalg.norm(q1, axis=-1, keepdims=True)
-    else:
-        q0_n = q0
-        q1_n = q1
-    omega = np.arccos((q0_n * q1_n).sum(axis=-1).clip(-1, 1))
-    dom = np.sin(omega)
-
-    flag = dom < eps
-
-    res = np.empty_like(q0_n)
-    t_t = np.expand_dims(t[flag], axis=-1)
-    res[flag] = (1 - t_t) * q0_n[flag] + t_t * q1_n[flag]
-
-    flag = ~ flag
-
-    t_t = t[flag]
-    d_t = dom[flag]
-    va = np.sin((1 - t_t) * omega[flag]) / d_t
-    vb = np.sin(t_t * omega[flag]) / d_t
-    res[flag] = (np.expand_dims(va, axis=-1) * q0_n[flag] + np.expand_dims(vb, axis=-1) * q1_n[flag])
-    return res
+        q0 = normalize(q0)
+        q1 = normalize(q1)
+        
+    t = np.expand_dims(np.asarray(t, dtype=q0.dtype), axis=-1)
+    
+    # q and -q are the same rotation, take the shorter path
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0.0, -q1, q1)
+    dot = np.abs(dot)
+    
+    # sin(omega) can not be zero, the clipped values are not used for nearly parallel quaternions
+    linear = dot > 0.9995
+    omega = np.arccos(np.minimum(dot, 0.9995))
+    sin_omega = np.sin(omega)
+    
+    s0 = np.where(linear, 1.0 - t, np.sin((1.0 - t) * omega) / sin_omega)
+    s1 = np.where(linear, t, np.sin(t * omega) / sin_omega)
+    
+    res = s0 * q0 + s1 * q1
+    
+    return np.where(linear, normalize(res), res)
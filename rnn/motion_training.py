@@ -0,0 +1,231 @@
+import torch
+from torch import nn
+
+from common.quaternion import qmul, qrot
+from common.repr6d_torch import repr6d2quat
+
+"""
+loss functions and training steps of rnn.py
+the settings of the training script are passed as arguments so that rnn_benchmark.py measures the same code
+
+skeleton is a dict with:
+ -- offsets: (J, 3) tensor of joint offsets on the training device
+ -- parents, children: joint hierarchy in the format of mocap_data["skeleton"]
+ -- joint_loss_weights: (1, 1, J) or (1, 1, 1) tensor of per joint loss weights
+loss_scales is a dict with the weights of the "norm", "pos" and "quat" loss terms
+"""
+
+def norm_loss(yhat):
+    _yhat = yhat.view(-1, 4)
+    _norm = torch.norm(_yhat, dim=1)
+    _diff = (_norm - 1.0) ** 2
+    _loss = torch.mean(_diff)
+    return _loss
+
+def poses_to_quat(poses, joint_count, pose_representation):
+    """
+    Convert poses from the training representation to unit quaternions.
+    Expects a tensor of shape (*, joint_count * D) and returns a tensor of shape (*, J, 4).
+    All poses are converted in one batched op.
+    """
+
+    poses = poses.reshape(poses.shape[:-1] + (joint_count, -1))
+
+    if pose_representation == "repr6d":
+        return repr6d2quat(poses)
+
+    return nn.functional.normalize(poses, p=2, dim=-1)
+
+def forward_kinematics(rotations, root_positions, skeleton):
+    """
+    Perform forward kinematics using the given trajectory and local rotations.
+    Arguments (where N = batch size, L = sequence length, J = number of joints):
+     -- rotations: (N, L, J, 4) tensor of unit quaternions describing the local rotations of each joint.
+     -- root_positions: (N, L, 3) tensor describing the root joint positions.
+    """
+
+    assert len(rotations.shape) == 4
+    assert rotations.shape[-1] == 4
+
+    offsets = skeleton["offsets"]
+    parents = skeleton["parents"]
+    children = skeleton["children"]
+
+    positions_world = []
+    rotations_world = []
+
+    expanded_offsets = offsets.expand(rotations.shape[0], rotations.shape[1], offsets.shape[0], offsets.shape[1])
+
+    # Parallelize along the batch and time dimensions
+    for jI in range(offsets.shape[0]):
+        if parents[jI] == -1:
+            positions_world.append(root_positions)
+            rotations_world.append(rotations[:, :, 0])
+        else:
+            positions_world.append(qrot(rotations_world[parents[jI]], expanded_offsets[:, :, jI]) \
+                                   + positions_world[parents[jI]])
+            if len(children[jI]) > 0:
+                rotations_world.append(qmul(rotations_world[parents[jI]], rotations[:, :, jI]))
+            else:
+                # This joint is a terminal node -> it would be useless to compute the transformation
+                rotations_world.append(None)
+
+    return torch.stack(positions_world, dim=3).permute(0, 1, 3, 2)
+
+def pos_loss(y, yhat, skeleton):
+
+    # y and yhat shapes: batch_size, seq_length, pose_dim
+
+    # normalize tensors
+    _yhat = yhat.view(-1, 4)
+
+    _yhat_norm = nn.functional.normalize(_yhat, p=2, dim=1)
+    _y_rot = y.view((y.shape[0], y.shape[1], -1, 4))
+    _yhat_rot = _yhat.view((y.shape[0], y.shape[1], -1, 4))
+
+    zero_trajectory = torch.zeros((y.shape[0], y.shape[1], 3), dtype=torch.float32, requires_grad=True).to(y.device)
+
+    _y_pos = forward_kinematics(_y_rot, zero_trajectory, skeleton)
+    _yhat_pos = forward_kinematics(_yhat_rot, zero_trajectory, skeleton)
+
+    _pos_diff = torch.norm((_y_pos - _yhat_pos), dim=3)
+
+    _pos_diff_weighted = _pos_diff * skeleton["joint_loss_weights"]
+
+    _loss = torch.mean(_pos_diff_weighted)
+
+    return _loss
+
+def quat_loss(y, yhat, skeleton):
+
+    # y and yhat shapes: batch_size, seq_length, pose_dim
+
+    # normalize quaternion
+
+    _y = y.view((-1, 4))
+    _yhat = yhat.view((-1, 4))
+    _yhat_norm = nn.functional.normalize(_yhat, p=2, dim=1)
+
+    # inverse of quaternion: https://www.mathworks.com/help/aeroblks/quaternioninverse.html
+    _yhat_inv = _yhat_norm * torch.tensor([[1.0, -1.0, -1.0, -1.0]], dtype=torch.float32).to(y.device)
+
+    # calculate difference quaternion
+    _diff = qmul(_yhat_inv, _y)
+    # length of complex part
+    _len = torch.norm(_diff[:, 1:], dim=1)
+    # atan2
+    _atan = torch.atan2(_len, _diff[:, 0])
+    # abs
+    _abs = torch.abs(_atan)
+
+    _abs = _abs.reshape(-1, 1, skeleton["offsets"].shape[0])
+
+    _abs_weighted = _abs * skeleton["joint_loss_weights"]
+
+    _loss = torch.mean(_abs_weighted)
+    return _loss
+
+# autoencoder loss function
+def loss(y, yhat, skeleton, loss_scales, pose_representation="quat"):
+
+    if pose_representation == "repr6d":
+        # 6d rotations have no length to constrain, the position and rotation losses are computed on quaternions
+        joint_count = skeleton["offsets"].shape[0]
+        _norm_loss = torch.zeros((), dtype=torch.float32, device=yhat.device)
+        y = poses_to_quat(y, joint_count, pose_representation).reshape(y.shape[:-1] + (joint_count * 4, ))
+        yhat = poses_to_quat(yhat, joint_count, pose_representation).reshape(yhat.shape[:-1] + (joint_count * 4, ))
+    else:
+        _norm_loss = norm_loss(yhat)
+
+    _pos_loss = pos_loss(y, yhat, skeleton)
+    _quat_loss = quat_loss(y, yhat, skeleton)
+
+    _total_loss = 0.0
+    _total_loss += _norm_loss * loss_scales["norm"]
+    _total_loss += _pos_loss * loss_scales["pos"]
+    _total_loss += _quat_loss * loss_scales["quat"]
+
+    return _total_loss, _norm_loss, _pos_loss, _quat_loss
+
+def train_step(rnn, optimizer, pose_sequences, target_poses, teacher_forcing, skeleton, loss_scales, pose_representation="quat", average_gradients=None):
+    """
+    autoregressive training step with backpropagation
+    average_gradients is called between the backward pass and the optimizer step, data parallel training uses it
+    to average the gradients of the worker processes
+    """
+
+    rnn.train()
+
+    _input_poses = pose_sequences
+    output_poses_length = target_poses.shape[1]
+
+    _pred_poses_for_loss = []
+    _target_poses_for_loss = []
+
+    for o_i in range(1, output_poses_length):
+
+        _pred_poses = rnn(_input_poses)
+        _pred_poses = torch.unsqueeze(_pred_poses, axis=1)
+
+        _target_poses = target_poses[:,o_i,:].detach().clone()
+        _target_poses = torch.unsqueeze(_target_poses, axis=1)
+
+        _pred_poses_for_loss.append(_pred_poses)
+        _target_poses_for_loss.append(_target_poses)
+
+        # shift input pose seqeunce one pose to the right
+        # remove pose from beginning input pose sequence
+        # detach necessary to avoid error concerning running backprob a second time
+        _input_poses = _input_poses[:, 1:, :].detach().clone()
+        _target_poses = _target_poses.detach().clone()
+        _pred_poses = _pred_poses.detach().clone()
+
+        # add predicted or target pose to end of input pose sequence
+        if teacher_forcing == True:
+            _input_poses = torch.concat((_input_poses, _target_poses), axis=1)
+        else:
+            _input_poses = torch.cat((_input_poses, _pred_poses), axis=1)
+
+    _pred_poses_for_loss = torch.cat(_pred_poses_for_loss, dim=1)
+    _target_poses_for_loss = torch.cat(_target_poses_for_loss, dim=1)
+
+    _loss, _norm_loss, _pos_loss, _quat_loss = loss(_target_poses_for_loss, _pred_poses_for_loss, skeleton, loss_scales, pose_representation)
+
+    # Backpropagation
+    optimizer.zero_grad()
+    _loss.backward()
+
+    if average_gradients is not None:
+        average_gradients()
+
+    optimizer.step()
+
+    return _loss, _norm_loss, _pos_loss, _quat_loss
+
+def test_step(rnn, pose_sequences, target_poses, teacher_forcing, skeleton, loss_scales, pose_representation="quat"):
+
+    # single stateful rollout: the input sequence is processed once, afterwards only the newest pose is fed to the model
+    # the caller sets eval mode and no_grad
+
+    output_poses_length = target_poses.shape[1]
+
+    _pred_poses, _state = rnn.forward_state(pose_sequences)
+
+    _pred_poses_for_loss = [ torch.unsqueeze(_pred_poses, axis=1) ]
+
+    for o_i in range(1, output_poses_length - 1):
+
+        # continue with the predicted or target pose
+        if teacher_forcing == True:
+            _next_poses = target_poses[:, o_i:o_i+1, :]
+        else:
+            _next_poses = torch.unsqueeze(_pred_poses, axis=1)
+
+        _pred_poses, _state = rnn.forward_state(_next_poses, _state)
+
+        _pred_poses_for_loss.append(torch.unsqueeze(_pred_poses, axis=1))
+
+    _pred_poses_for_loss = torch.cat(_pred_poses_for_loss, dim=1)
+    _target_poses_for_loss = target_poses[:, 1:output_poses_length, :].contiguous() # pos_loss and quat_loss reshape the targets with view
+
+    return loss(_target_poses_for_loss, _pred_poses_for_loss, skeleton, loss_scales, pose_representation)
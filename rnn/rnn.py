@@ -7,20 +7,26 @@ import torch
 from torch.utils.data import Dataset
 from torch.utils.data import DataLoader
 from torch import nn
+import torch.distributed as dist
 from collections import OrderedDict
 import networkx as nx
 import scipy.linalg as sclinalg
 
 import os, sys, time, subprocess
+import argparse, copy, queue, random, threading
 import numpy as np
 import math
+import multiprocessing
 
 from common import utils
 from common import bvh_tools as bvh
 from common import fbx_tools as fbx
 from common import mocap_tools as mocap
 from common.quaternion import qmul, qrot, qnormalize_np, slerp
-from common.pose_renderer import PoseRenderer
+from common.repr6d_torch import quat2repr6d
+from common.pose_renderer import create_pose_renderer
+
+import motion_training
 
 """
 Compute Device
@@ -82,9 +88,26 @@ Model Settings
 rnn_layer_dim = 512
 rnn_layer_count = 2
 
+# rotation representation the model is trained on
+# "quat": quaternions, the predictions are normalised and the norm loss keeps them close to unit length
+# "repr6d": first two rows of the rotation matrix, needs neither normalisation nor norm loss
+pose_representation = "quat"
+
 save_weights = True
 load_weights = True
 rnn_weights_file = "results_XSens_Muriel_EmbodiedMachineVariations-7/weights/rnn_weights_epoch_200"
+save_checkpoints = True # full training state (model, optimizer, scheduler, loss history, random states) for resuming a run
+checkpoint_interval = 1 # epochs between checkpoints, checkpoints are written in the background
+checkpoint_file = "results/weights/rnn_checkpoint"
+resume_checkpoint_file = None # continue an interrupted run from its checkpoint, can also be given on the command line: --resume results/weights/rnn_checkpoint
+
+# command line
+arg_parser = argparse.ArgumentParser()
+arg_parser.add_argument("--resume", default=None, help="checkpoint file of an interrupted run")
+args, _ = arg_parser.parse_known_args()
+
+if args.resume is not None:
+    resume_checkpoint_file = args.resume
 
 """
 Training settings
@@ -102,6 +125,11 @@ pos_loss_scale = 0.1
 quat_loss_scale = 0.9
 teacher_forcing_prob = 0.0
 model_save_interval = 10
+eval_batch_size = 256 # the test set is evaluated without gradients, larger batches only cost memory
+eval_interval = 1 # evaluate the test set every eval_interval epochs, other epochs have a nan test loss
+train_process_count = 1 # cpu only: number of data parallel worker processes, each trains on its own shard with batch_size samples per step
+train_threads_per_process = 0 # 0: the available cores are divided equally among the worker processes
+train_master_port = 29500 # local port for exchanging gradients between the worker processes
 
 epochs = 200
 save_history = True
@@ -158,6 +186,7 @@ view_ele = 90.0
 view_azi = -90.0
 view_line_width = 1.0
 view_size = 4.0
+view_backend = "matplotlib" # "matplotlib" or "raster" (numpy rasterizer, much faster for long animations)
 
 """
 Load mocap data
@@ -202,6 +231,10 @@ joint_count = mocap_data["motion"]["rot_local"].shape[1]
 joint_dim = mocap_data["motion"]["rot_local"].shape[2]
 pose_dim = joint_count * joint_dim
 
+# joint and pose dimension in the representation the model works with
+model_joint_dim = 6 if pose_representation == "repr6d" else joint_dim
+model_pose_dim = joint_count * model_joint_dim
+
 offsets = mocap_data["skeleton"]["offsets"].astype(np.float32)
 parents = mocap_data["skeleton"]["parents"]
 children = mocap_data["skeleton"]["children"]
@@ -230,7 +263,12 @@ for i, mocap_data in enumerate(all_mocap_data):
     print("mocap ", mocap_files[i])
     
     pose_sequence = mocap_data["motion"]["rot_local"]
-    pose_sequence = np.reshape(pose_sequence, (-1, pose_dim))
+    
+    # the whole sequence is converted to the training representation once
+    if pose_representation == "repr6d":
+        pose_sequence = quat2repr6d(torch.from_numpy(pose_sequence.astype(np.float32))).numpy()
+    
+    pose_sequence = np.reshape(pose_sequence, (-1, model_pose_dim))
     
     print("shape ", pose_sequence.shape)
     
@@ -246,10 +284,10 @@ for i, mocap_data in enumerate(all_mocap_data):
         for pI in np.arange(frame_range_start, frame_range_end - seq_input_length - seq_output_length - 1):
 
             X_sample = pose_sequence[pI:pI+seq_input_length]
-            X.append(X_sample.reshape((seq_input_length, pose_dim)))
+            X.append(X_sample.reshape((seq_input_length, model_pose_dim)))
             
             Y_sample = pose_sequence[pI+seq_input_length:pI+seq_input_length+seq_output_length]  
-            y.append(Y_sample.reshape((seq_output_length, pose_dim)))
+            y.append(Y_sample.reshape((seq_output_length, model_pose_dim)))
 
 X = np.array(X)
 y = np.array(y)
@@ -278,10 +316,17 @@ print("y_item s ", y_item.shape)
 test_size = int(test_percentage * len(full_dataset))
 train_size = len(full_dataset) - test_size
 
-train_dataset, test_dataset = torch.utils.data.random_split(full_dataset, [train_size, test_size])
+# a resumed run continues with the training and test windows of the interrupted run
+resume_checkpoint = torch.load(resume_checkpoint_file, map_location=device, weights_only=False) if resume_checkpoint_file is not None else None
+
+if resume_checkpoint is not None:
+    train_dataset = torch.utils.data.Subset(full_dataset, resume_checkpoint["dataset_split"]["train"])
+    test_dataset = torch.utils.data.Subset(full_dataset, resume_checkpoint["dataset_split"]["test"])
+else:
+    train_dataset, test_dataset = torch.utils.data.random_split(full_dataset, [train_size, test_size])
 
 train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+test_loader = DataLoader(test_dataset, batch_size=eval_batch_size, shuffle=False)
 
 X_batch, y_batch = next(iter(train_loader))
 
@@ -317,8 +362,21 @@ class Reccurent(nn.Module):
         x = self.dense_layers(x)
         
         return x
+    
+    def forward_state(self, x, state=None):
+        """
+        stateful variant of forward
+        continues from the LSTM state (h, c) returned by a previous call instead of starting from zeros
+        """
+        
+        x, state = self.rnn_layers.rnn(x, state)
+        
+        x = x[:, -1, :] # only last time step 
+        x = self.dense_layers(x)
+        
+        return x, state
 
-rnn = Reccurent(pose_dim, rnn_layer_dim, pose_dim, rnn_layer_count).to(device)
+rnn = Reccurent(model_pose_dim, rnn_layer_dim, model_pose_dim, rnn_layer_count).to(device)
 print(rnn)
 
 # test Reccurent model
@@ -344,282 +402,192 @@ Training
 optimizer = torch.optim.Adam(rnn.parameters(), lr=learning_rate)
 scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=50, gamma=0.336) # reduce the learning every 20 epochs by a factor of 10
 
-joint_loss_weights = torch.tensor(joint_loss_weights, dtype=torch.float32)
-joint_loss_weights = joint_loss_weights.reshape(1, 1, -1).to(device)
-
-def norm_loss(yhat):
-    _yhat = yhat.view(-1, 4)
-    _norm = torch.norm(_yhat, dim=1)
-    _diff = (_norm - 1.0) ** 2
-    _loss = torch.mean(_diff)
-    return _loss
+"""
+Checkpoints
+"""
 
-def forward_kinematics(rotations, root_positions):
-    """
-    Perform forward kinematics using the given trajectory and local rotations.
-    Arguments (where N = batch size, L = sequence length, J = number of joints):
-     -- rotations: (N, L, J, 4) tensor of unit quaternions describing the local rotations of each joint.
-     -- root_positions: (N, L, 3) tensor describing the root joint positions.
-    """
+# files are written by a background thread so that training doesn't wait for the disk
+checkpoint_queue = queue.Queue(maxsize=2)
+checkpoint_thread = None
+checkpoint_error = None
 
-    assert len(rotations.shape) == 4
-    assert rotations.shape[-1] == 4
+def checkpoint_writer():
     
-    toffsets = torch.tensor(offsets).to(device)
+    global checkpoint_error
     
-    positions_world = []
-    rotations_world = []
-
-    expanded_offsets = toffsets.expand(rotations.shape[0], rotations.shape[1], offsets.shape[0], offsets.shape[1])
-
-    # Parallelize along the batch and time dimensions
-    for jI in range(offsets.shape[0]):
-        if parents[jI] == -1:
-            positions_world.append(root_positions)
-            rotations_world.append(rotations[:, :, 0])
-        else:
-            positions_world.append(qrot(rotations_world[parents[jI]], expanded_offsets[:, :, jI]) \
-                                   + positions_world[parents[jI]])
-            if len(children[jI]) > 0:
-                rotations_world.append(qmul(rotations_world[parents[jI]], rotations[:, :, jI]))
-            else:
-                # This joint is a terminal node -> it would be useless to compute the transformation
-                rotations_world.append(None)
-
-    return torch.stack(positions_world, dim=3).permute(0, 1, 3, 2)
+    while True:
+        state, file_name = checkpoint_queue.get()
+        
+        if state is None:
+            break
+        
+        # after a failed write the states are still taken from the queue so that training never blocks on it,
+        # the error is raised on the training thread
+        if checkpoint_error is not None:
+            continue
+        
+        try:
+            # write to a temporary file first so that an interrupted write never replaces a complete file
+            tmp_file_name = file_name + ".tmp"
+            
+            with open(tmp_file_name, "wb") as f:
+                torch.save(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            os.replace(tmp_file_name, file_name)
+        except Exception as e:
+            checkpoint_error = e
 
-def pos_loss(y, yhat):
+def raise_checkpoint_error():
     
-    #print("pos_loss")
-    #print("y s ", y.shape)
-    #print("yhat s ", yhat.shape)
-    
-    # y and yhat shapes: batch_size, seq_length, pose_dim
-
-    # normalize tensors
-    _yhat = yhat.view(-1, 4)
+    if checkpoint_error is not None:
+        raise RuntimeError("writing a checkpoint failed") from checkpoint_error
 
-    _yhat_norm = nn.functional.normalize(_yhat, p=2, dim=1)
-    _y_rot = y.view((y.shape[0], y.shape[1], -1, 4))
-    _yhat_rot = _yhat.view((y.shape[0], y.shape[1], -1, 4))
+def start_checkpoint_writer():
     
-    #print("_y_rot s ", _y_rot.shape)
-    #print("_yhat_rot s ", _yhat_rot.shape)
-
-    zero_trajectory = torch.zeros((y.shape[0], y.shape[1], 3), dtype=torch.float32, requires_grad=True).to(device)
-
-    _y_pos = forward_kinematics(_y_rot, zero_trajectory)
-    _yhat_pos = forward_kinematics(_yhat_rot, zero_trajectory)
+    global checkpoint_thread, checkpoint_error
     
-    #print("_y_pos s ", _y_pos.shape)
-    #print("_yhat_pos s ", _yhat_pos.shape)
+    checkpoint_error = None
+    checkpoint_thread = threading.Thread(target=checkpoint_writer)
+    checkpoint_thread.start()
 
-    _pos_diff = torch.norm((_y_pos - _yhat_pos), dim=3)
+def stop_checkpoint_writer():
     
-    #print("_pos_diff s ", _pos_diff.shape)
+    checkpoint_queue.put((None, None))
+    checkpoint_thread.join()
     
-    _pos_diff_weighted = _pos_diff * joint_loss_weights
-    
-    _loss = torch.mean(_pos_diff_weighted)
-
-    return _loss
+    raise_checkpoint_error()
 
-def quat_loss(y, yhat):
+def save_state(state, file_name):
     
-    #print("quat_loss")
-    #print("y s ", y.shape)
-    #print("yhat s ", yhat.shape)
+    raise_checkpoint_error()
     
-    # y and yhat shapes: batch_size, seq_length, pose_dim
-    
-    # normalize quaternion
-    
-    _y = y.view((-1, 4))
-    _yhat = yhat.view((-1, 4))
-    _yhat_norm = nn.functional.normalize(_yhat, p=2, dim=1)
+    # the copy is taken on the training thread, training continues to change the original tensors
+    checkpoint_queue.put((copy.deepcopy(state), file_name))
+
+def create_checkpoint(epoch, loss_history):
     
-    #print("_y s ", _y.shape)
-    #print("_yhat_norm s ", _yhat_norm.shape)
+    checkpoint = {}
+    checkpoint["epoch"] = epoch # next epoch to train
+    checkpoint["model"] = rnn.state_dict()
+    checkpoint["optimizer"] = optimizer.state_dict()
+    checkpoint["scheduler"] = scheduler.state_dict()
+    checkpoint["loss_history"] = loss_history
+    checkpoint["dataset_split"] = {"train": list(train_dataset.indices), "test": list(test_dataset.indices)}
+    checkpoint["pose_representation"] = pose_representation
+    checkpoint["rng_states"] = {"torch": torch.get_rng_state(),
+                                "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+                                "numpy": np.random.get_state(),
+                                "python": random.getstate()}
     
-    # inverse of quaternion: https://www.mathworks.com/help/aeroblks/quaternioninverse.html
-    _yhat_inv = _yhat_norm * torch.tensor([[1.0, -1.0, -1.0, -1.0]], dtype=torch.float32).to(device)
+    return checkpoint
 
-    # calculate difference quaternion
-    _diff = qmul(_yhat_inv, _y)
-    # length of complex part
-    _len = torch.norm(_diff[:, 1:], dim=1)
-    # atan2
-    _atan = torch.atan2(_len, _diff[:, 0])
-    # abs
-    _abs = torch.abs(_atan)
+def load_checkpoint(checkpoint):
     
-    _abs = _abs.reshape(-1, 1, joint_count)
+    assert checkpoint.get("pose_representation", "quat") == pose_representation, "checkpoint was trained with pose_representation {}".format(checkpoint.get("pose_representation", "quat"))
     
-    #print("_abs s ", _abs.shape)
+    rnn.load_state_dict(checkpoint["model"])
+    optimizer.load_state_dict(checkpoint["optimizer"])
+    scheduler.load_state_dict(checkpoint["scheduler"])
     
-    _abs_weighted = _abs * joint_loss_weights
+    # the random states decide the shuffling of the training set and teacher forcing
+    rng_states = checkpoint["rng_states"]
+    torch.set_rng_state(rng_states["torch"].cpu())
+    if rng_states["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([ rng_state.cpu() for rng_state in rng_states["cuda"] ])
+    np.random.set_state(rng_states["numpy"])
+    random.setstate(rng_states["python"])
     
-    _loss = torch.mean(_abs_weighted)   
-    return _loss
+    return checkpoint["epoch"], checkpoint["loss_history"]
 
-# autoencoder loss function
-def loss(y, yhat):
-    _norm_loss = norm_loss(yhat)
-    _pos_loss = pos_loss(y, yhat)
-    _quat_loss = quat_loss(y, yhat)
-    
-    _total_loss = 0.0
-    _total_loss += _norm_loss * norm_loss_scale
-    _total_loss += _pos_loss * pos_loss_scale
-    _total_loss += _quat_loss * quat_loss_scale
-    
-    return _total_loss, _norm_loss, _pos_loss, _quat_loss
+start_epoch = 0
+start_loss_history = None
 
-def train_step(pose_sequences, target_poses, teacher_forcing):
+if resume_checkpoint_file is not None:
+    start_epoch, start_loss_history = load_checkpoint(resume_checkpoint)
     
-    rnn.train()
+    print("resume from epoch ", start_epoch)
 
-    #print("ar_train_step")    
-    #print("teacher_forcing ", teacher_forcing)
-    #print("pose_sequences s ", pose_sequences.shape)
-    #print("target_poses s ", target_poses.shape)
+joint_loss_weights = torch.tensor(joint_loss_weights, dtype=torch.float32)
+joint_loss_weights = joint_loss_weights.reshape(1, 1, -1).to(device)
 
-    #_input_poses = pose_sequences.detach().clone()    
-    _input_poses = pose_sequences  
-    output_poses_length = target_poses.shape[1]
-    
-    #print("output_poses_length ", output_poses_length)
-    
-    _pred_poses_for_loss = []
-    _target_poses_for_loss = []
-    
-    for o_i in range(1, output_poses_length):
-        
-        #print("_input_poses s ", _input_poses.shape)
-        
-        _pred_poses = rnn(_input_poses)
-        _pred_poses = torch.unsqueeze(_pred_poses, axis=1)
-        
-        #print("_pred_poses s ", _pred_poses.shape)
-        
-        _target_poses = target_poses[:,o_i,:].detach().clone()
-        _target_poses = torch.unsqueeze(_target_poses, axis=1)
+# the loss functions and training steps are in motion_training, rnn_benchmark.py measures the same code
+skeleton = {"offsets": torch.tensor(offsets).to(device),
+            "parents": parents,
+            "children": children,
+            "joint_loss_weights": joint_loss_weights}
 
-        #print("_target_poses s ", _target_poses.shape)
-        
-        _pred_poses_for_loss.append(_pred_poses)
-        _target_poses_for_loss.append(_target_poses)
-        
-        # shift input pose seqeunce one pose to the right
-        # remove pose from beginning input pose sequence
-        # detach necessary to avoid error concerning running backprob a second time
-        _input_poses = _input_poses[:, 1:, :].detach().clone()
-        _target_poses = _target_poses.detach().clone()
-        _pred_poses = _pred_poses.detach().clone()
-        
-        # add predicted or target pose to end of input pose sequence
-        if teacher_forcing == True:
-            _input_poses = torch.concat((_input_poses, _target_poses), axis=1)
-        else:
-            #_pred_poses = torch.reshape(_pred_poses, (_pred_poses.shape[0], 1, joint_count, joint_dim))
-            _input_poses = torch.cat((_input_poses, _pred_poses), axis=1)
-            
-        #print("_input_poses s ", _input_poses.shape)
+loss_scales = {"norm": norm_loss_scale, "pos": pos_loss_scale, "quat": quat_loss_scale}
 
-        
-        #print("_input_poses 2 s ", _input_poses.shape)
-        
-    _pred_poses_for_loss = torch.cat(_pred_poses_for_loss, dim=1)
-    _target_poses_for_loss = torch.cat(_target_poses_for_loss, dim=1)
+"""
+Data Parallel Training
+"""
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+def is_main_process():
+    return is_distributed() == False or dist.get_rank() == 0
+
+def average_gradients():
     
-    #print("_pred_poses_for_loss 2 s ", _pred_poses_for_loss.shape)
-    #print("_target_poses_for_loss 2 s ", _target_poses_for_loss.shape)
+    # the gradients are flattened into a single tensor so that each step needs only one all_reduce
+    grads = [ param.grad for param in rnn.parameters() ]
+    flat_grads = torch.cat([ grad.reshape(-1) for grad in grads ])
     
-    _loss, _norm_loss, _pos_loss, _quat_loss = loss(_target_poses_for_loss, _pred_poses_for_loss) 
+    dist.all_reduce(flat_grads, op=dist.ReduceOp.SUM)
+    flat_grads /= dist.get_world_size()
     
-    # Backpropagation
-    optimizer.zero_grad()
-    _loss.backward()
-    optimizer.step()
+    offset = 0
+    for grad in grads:
+        grad.copy_(flat_grads[offset:offset+grad.numel()].view_as(grad))
+        offset += grad.numel()
+
+def reduce_epoch_stats(epoch_losses, sample_count):
+    """
+    averages the epoch losses and sums the number of trained samples of all worker processes
+    """
     
-    #print("_ar_loss_total mean s ", _ar_loss_total.shape)
+    stats = torch.tensor(list(epoch_losses) + [ sample_count ], dtype=torch.float64)
+    dist.all_reduce(stats, op=dist.ReduceOp.SUM)
     
-    #return _ar_loss, _ar_norm_loss, _ar_quat_loss
+    return (stats[:-1] / dist.get_world_size()).tolist(), int(stats[-1].item())
+
+def train_step(pose_sequences, target_poses, teacher_forcing):
     
-    return _loss, _norm_loss, _pos_loss, _quat_loss
+    # the gradients of the worker processes are averaged before the optimizer step
+    return motion_training.train_step(rnn, optimizer, pose_sequences, target_poses, teacher_forcing, skeleton, loss_scales, pose_representation, 
+                                      average_gradients if is_distributed() == True else None)
 
 def test_step(pose_sequences, target_poses, teacher_forcing):
     
-    rnn.eval()
-
-    #print("ar_train_step")    
-    #print("teacher_forcing ", teacher_forcing)
-    #print("pose_sequences s ", pose_sequences.shape)
-    #print("target_poses s ", target_poses.shape)
+    return motion_training.test_step(rnn, pose_sequences, target_poses, teacher_forcing, skeleton, loss_scales, pose_representation)
 
-    #_input_poses = pose_sequences.detach().clone()    
-    _input_poses = pose_sequences  
-    output_poses_length = target_poses.shape[1]
+def test(test_dataloader):
     
-    #print("output_poses_length ", output_poses_length)
+    rnn.eval()
     
-    _pred_poses_for_loss = []
-    _target_poses_for_loss = []
+    # losses are summed on the device and only copied once at the end
+    _loss_sum = torch.zeros(1, dtype=torch.float32).to(device)
+    _sample_count = 0
     
     with torch.no_grad():
     
-        for o_i in range(1, output_poses_length):
-            
-            #print("_input_poses s ", _input_poses.shape)
-            
-            _pred_poses = rnn(_input_poses)
-            _pred_poses = torch.unsqueeze(_pred_poses, axis=1)
-            
-            #print("_pred_poses s ", _pred_poses.shape)
-            
-            _target_poses = target_poses[:,o_i,:].detach().clone()
-            _target_poses = torch.unsqueeze(_target_poses, axis=1)
-    
-            #print("_target_poses s ", _target_poses.shape)
-            
-            _pred_poses_for_loss.append(_pred_poses)
-            _target_poses_for_loss.append(_target_poses)
+        for test_batch in test_dataloader:
+            input_pose_sequences = test_batch[0].to(device)
+            target_poses = test_batch[1].to(device)
             
-            # shift input pose seqeunce one pose to the right
-            # remove pose from beginning input pose sequence
-            # detach necessary to avoid error concerning running backprob a second time
-            _input_poses = _input_poses[:, 1:, :].detach().clone()
-            _target_poses = _target_poses.detach().clone()
-            _pred_poses = _pred_poses.detach().clone()
+            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
             
-            # add predicted or target pose to end of input pose sequence
-            if teacher_forcing == True:
-                _input_poses = torch.concat((_input_poses, _target_poses), axis=1)
-            else:
-                #_pred_poses = torch.reshape(_pred_poses, (_pred_poses.shape[0], 1, joint_count, joint_dim))
-                _input_poses = torch.cat((_input_poses, _pred_poses), axis=1)
-                
-            #print("_input_poses s ", _input_poses.shape)
-    
+            _loss, _, _, _ = test_step(input_pose_sequences, target_poses, use_teacher_forcing)
             
-            #print("_input_poses 2 s ", _input_poses.shape)
+            _loss_sum += _loss * input_pose_sequences.shape[0]
+            _sample_count += input_pose_sequences.shape[0]
             
-        _pred_poses_for_loss = torch.cat(_pred_poses_for_loss, dim=1)
-        _target_poses_for_loss = torch.cat(_target_poses_for_loss, dim=1)
-        
-        #print("_pred_poses_for_loss 2 s ", _pred_poses_for_loss.shape)
-        #print("_target_poses_for_loss 2 s ", _target_poses_for_loss.shape)
-        
-        _loss, _norm_loss, _pos_loss, _quat_loss = loss(_target_poses_for_loss, _pred_poses_for_loss) 
-    
-    #print("_ar_loss_total mean s ", _ar_loss_total.shape)
-    
-    #return _ar_loss, _ar_norm_loss, _ar_quat_loss
-    
     rnn.train()
     
-    return _loss, _norm_loss, _pos_loss, _quat_loss
-
+    return (_loss_sum / max(_sample_count, 1)).item()
 
 def train(train_dataloader, test_dataloader, epochs):
     
@@ -630,71 +598,178 @@ def train(train_dataloader, test_dataloader, epochs):
     loss_history["pos"] = []
     loss_history["quat"] = []
 
-    for epoch in range(epochs):
-        start = time.time()
+    # continue the loss history of a resumed run
+    if start_loss_history is not None:
+        loss_history = copy.deepcopy(start_loss_history)
+    
+    if is_main_process() == True:
+        start_checkpoint_writer()
+
+    # the writer thread is also stopped when training fails, otherwise it keeps the process alive
+    try:
+        for epoch in range(start_epoch, epochs):
+            start = time.time()
         
-        _train_loss_per_epoch = []
-        _norm_loss_per_epoch = []
-        _pos_loss_per_epoch = []
-        _quat_loss_per_epoch = []
-
-        for train_batch in train_dataloader:
-            input_pose_sequences = train_batch[0].to(device)
-            target_poses = train_batch[1].to(device)
+            _train_loss_per_epoch = []
+            _norm_loss_per_epoch = []
+            _pos_loss_per_epoch = []
+            _sample_count = 0
+            _quat_loss_per_epoch = []
+
+            for train_batch in train_dataloader:
+                input_pose_sequences = train_batch[0].to(device)
+                target_poses = train_batch[1].to(device)
             
-            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
+                use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
             
-            _loss, _norm_loss, _pos_loss, _quat_loss = train_step(input_pose_sequences, target_poses, use_teacher_forcing)
+                _loss, _norm_loss, _pos_loss, _quat_loss = train_step(input_pose_sequences, target_poses, use_teacher_forcing)
             
-            _loss = _loss.detach().cpu().numpy()
-            _norm_loss = _norm_loss.detach().cpu().numpy()
-            _pos_loss = _pos_loss.detach().cpu().numpy()
-            _quat_loss = _quat_loss.detach().cpu().numpy()
+                _loss = _loss.detach().cpu().numpy()
+                _norm_loss = _norm_loss.detach().cpu().numpy()
+                _pos_loss = _pos_loss.detach().cpu().numpy()
+                _quat_loss = _quat_loss.detach().cpu().numpy()
             
-            _train_loss_per_epoch.append(_loss)
-            _norm_loss_per_epoch.append(_norm_loss)
-            _pos_loss_per_epoch.append(_pos_loss)
-            _quat_loss_per_epoch.append(_quat_loss)
-
-        _train_loss_per_epoch = np.mean(np.array(_train_loss_per_epoch))
-        _norm_loss_per_epoch = np.mean(np.array(_norm_loss_per_epoch))
-        _pos_loss_per_epoch = np.mean(np.array(_pos_loss_per_epoch))
-        _quat_loss_per_epoch = np.mean(np.array(_quat_loss_per_epoch))
+                _train_loss_per_epoch.append(_loss)
+                _norm_loss_per_epoch.append(_norm_loss)
+                _pos_loss_per_epoch.append(_pos_loss)
+                _quat_loss_per_epoch.append(_quat_loss)
+                _sample_count += input_pose_sequences.shape[0]
+
+            _train_loss_per_epoch = np.mean(np.array(_train_loss_per_epoch))
+            _norm_loss_per_epoch = np.mean(np.array(_norm_loss_per_epoch))
+            _pos_loss_per_epoch = np.mean(np.array(_pos_loss_per_epoch))
+            _quat_loss_per_epoch = np.mean(np.array(_quat_loss_per_epoch))
+
+            if is_distributed() == True:
+                (_train_loss_per_epoch, _norm_loss_per_epoch, _pos_loss_per_epoch, _quat_loss_per_epoch), _sample_count = reduce_epoch_stats([_train_loss_per_epoch, _norm_loss_per_epoch, _pos_loss_per_epoch, _quat_loss_per_epoch], _sample_count)
+        
+            _samples_per_second = _sample_count / (time.time() - start)
 
-        _test_loss_per_epoch = []
+            if is_main_process() == True and (epoch % eval_interval == 0 or epoch == epochs - 1):
+                _test_loss_per_epoch = test(test_dataloader)
+            else:
+                _test_loss_per_epoch = float("nan")
         
-        for test_batch in test_dataloader:
-            input_pose_sequences = train_batch[0].to(device)
-            target_poses = train_batch[1].to(device)
-            
-            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
-            
-            _loss, _, _, _ = test_step(input_pose_sequences, target_poses, use_teacher_forcing)
-            #_loss, _, _ = test_step(input_pose_sequences, target_poses)
-            
-            _loss = _loss.detach().cpu().numpy()
-            
-            _test_loss_per_epoch.append(_loss)
+            if epoch % model_save_interval == 0 and save_weights == True and is_main_process() == True:
+                save_state(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epoch))
         
-        _test_loss_per_epoch = np.mean(np.array(_test_loss_per_epoch))
+            loss_history["train"].append(_train_loss_per_epoch)
+            loss_history["test"].append(_test_loss_per_epoch)
+            loss_history["norm"].append(_norm_loss_per_epoch)
+            loss_history["pos"].append(_pos_loss_per_epoch)
+            loss_history["quat"].append(_quat_loss_per_epoch)
         
-        if epoch % model_save_interval == 0 and save_weights == True:
-            torch.save(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epoch))
+            scheduler.step()
         
-        loss_history["train"].append(_train_loss_per_epoch)
-        loss_history["test"].append(_test_loss_per_epoch)
-        loss_history["norm"].append(_norm_loss_per_epoch)
-        loss_history["pos"].append(_pos_loss_per_epoch)
-        loss_history["quat"].append(_quat_loss_per_epoch)
+            if save_checkpoints == True and is_main_process() == True and ((epoch + 1) % checkpoint_interval == 0 or epoch == epochs - 1):
+                save_state(create_checkpoint(epoch + 1, loss_history), checkpoint_file)
         
-        scheduler.step()
+            if is_main_process() == True:
+                print ('epoch {} : train: {:01.4f} test: {:01.4f} norm {:01.4f} pos {:01.4f} quat {:01.4f} samples/sec {:01.1f} time {:01.2f}'.format(epoch + 1, _train_loss_per_epoch, _test_loss_per_epoch, _norm_loss_per_epoch, _pos_loss_per_epoch, _quat_loss_per_epoch, _samples_per_second, time.time()-start))
+    finally:
+        if is_main_process() == True:
+            stop_checkpoint_writer()
+    
+    return loss_history
+
+def train_worker(rank, train_dataset, test_dataloader, epochs, shared_state, history_queue):
+    
+    # each process is pinned to its own set of consecutive cores
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(multiprocessing.cpu_count()))
+    thread_count = train_threads_per_process if train_threads_per_process > 0 else max(len(cores) // train_process_count, 1)
+    process_cores = cores[rank * thread_count:(rank + 1) * thread_count]
+    
+    if hasattr(os, "sched_setaffinity") and len(process_cores) > 0:
+        os.sched_setaffinity(0, process_cores)
+    
+    torch.set_num_threads(thread_count)
+    
+    dist.init_process_group("gloo", init_method="tcp://127.0.0.1:{}".format(train_master_port), rank=rank, world_size=train_process_count)
+    
+    # shards of equal size so that all processes run the same number of steps per epoch
+    shard_size = len(train_dataset) // train_process_count
+    train_shard = torch.utils.data.Subset(train_dataset, list(range(rank, shard_size * train_process_count, train_process_count)))
+    train_shard_loader = DataLoader(train_shard, batch_size=batch_size, shuffle=True)
+    
+    loss_history = train(train_shard_loader, test_dataloader, epochs)
+    
+    if rank == 0:
+        for name, tensor in rnn.state_dict().items():
+            shared_state[name].copy_(tensor)
         
-        print ('epoch {} : train: {:01.4f} test: {:01.4f} norm {:01.4f} pos {:01.4f} quat {:01.4f} time {:01.2f}'.format(epoch + 1, _train_loss_per_epoch, _test_loss_per_epoch, _norm_loss_per_epoch, _pos_loss_per_epoch, _quat_loss_per_epoch, time.time()-start))
+        history_queue.put(loss_history)
+    
+    dist.destroy_process_group()
+
+def fork_supported():
+    """
+    the worker processes have to be forked, a spawned worker would rerun this whole script
+    fork doesn't exist on windows and is not safe together with the thread pools of torch on macos
+    """
+    
+    return "fork" in multiprocessing.get_all_start_methods() and sys.platform != "darwin"
+
+def train_distributed(train_dataset, test_dataloader, epochs):
+    """
+    data parallel training on the cpu with train_process_count worker processes
+    the processes are forked and start with the current model and optimizer, gradients are averaged after each step
+    the weights of the first process are copied back into rnn after training
+    only called if fork_supported() is True
+    """
+    
+    context = multiprocessing.get_context("fork")
+    
+    shared_state = { name: tensor.detach().clone().share_memory_() for name, tensor in rnn.state_dict().items() }
+    history_queue = context.Queue()
+    
+    processes = [ context.Process(target=train_worker, args=(rank, train_dataset, test_dataloader, epochs, shared_state, history_queue)) for rank in range(train_process_count) ]
+    
+    for process in processes:
+        process.start()
+    
+    # a worker that crashes leaves the others waiting in their collectives, the queue is polled and the exit codes are checked instead of waiting for the history
+    loss_history = None
+    processes_finished = False
+    
+    while loss_history is None:
+        
+        try:
+            loss_history = history_queue.get(timeout=1.0)
+        except queue.Empty:
+            
+            failed_processes = [ (rank, process.exitcode) for rank, process in enumerate(processes) if process.exitcode is not None and process.exitcode != 0 ]
+            
+            if len(failed_processes) > 0 or processes_finished == True:
+                
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+                    process.join()
+                
+                if len(failed_processes) > 0:
+                    raise RuntimeError("training process {} exited with code {}".format(*failed_processes[0]))
+                
+                raise RuntimeError("training processes exited without a loss history")
+            
+            # the history might still be in transit when all processes have exited, it is polled once more
+            processes_finished = all(process.exitcode is not None for process in processes)
+    
+    for process in processes:
+        process.join()
+    
+    rnn.load_state_dict(shared_state)
     
     return loss_history
 
 # fit model
-loss_history = train(train_loader, test_loader, epochs)
+if train_process_count > 1 and fork_supported() == False:
+    print("data parallel training forks the worker processes, which is not supported on {}: training with a single process".format(sys.platform))
+    train_process_count = 1
+
+if train_process_count > 1 and device == 'cpu':
+    loss_history = train_distributed(train_dataset, test_loader, epochs)
+else:
+    loss_history = train(train_loader, test_loader, epochs)
 
 # save history
 utils.save_loss_as_csv(loss_history, "results/histories/rnn_history_{}.csv".format(epochs))
@@ -704,7 +779,7 @@ utils.save_loss_as_image(loss_history, "results/histories/rnn_history_{}.png".fo
 torch.save(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epochs))
 
 # inference and rendering 
-poseRenderer = PoseRenderer(edge_list)
+poseRenderer = create_pose_renderer(edge_list, view_backend)
 
 def export_sequence_anim(pose_sequence, file_name):
     
@@ -714,7 +789,7 @@ def export_sequence_anim(pose_sequence, file_name):
     pose_sequence = torch.tensor(np.expand_dims(pose_sequence, axis=0)).to(device)
     zero_trajectory = torch.tensor(np.zeros((1, pose_count, 3), dtype=np.float32)).to(device)
     
-    skel_sequence = forward_kinematics(pose_sequence, zero_trajectory)
+    skel_sequence = motion_training.forward_kinematics(pose_sequence, zero_trajectory, skeleton)
     
     skel_sequence = skel_sequence.detach().cpu().numpy()
     skel_sequence = np.squeeze(skel_sequence)    
@@ -764,7 +839,11 @@ def create_pred_sequence(pose_sequence, pose_count):
 
     start_seq = pose_sequence
     start_seq = torch.from_numpy(start_seq).to(device)
-    start_seq = torch.reshape(start_seq, (seq_input_length, pose_dim))
+    
+    if pose_representation == "repr6d":
+        start_seq = quat2repr6d(start_seq)
+    
+    start_seq = torch.reshape(start_seq, (seq_input_length, model_pose_dim))
     
     next_seq = start_seq
     
@@ -775,13 +854,18 @@ def create_pred_sequence(pose_sequence, pose_count):
         with torch.no_grad():
             pred_pose = rnn(torch.unsqueeze(next_seq, axis=0))
 
-        # normalize pred pose
         pred_pose = torch.squeeze(pred_pose)
-        pred_pose = pred_pose.reshape((-1, 4))
-        pred_pose = nn.functional.normalize(pred_pose, p=2, dim=1)
-        pred_pose = pred_pose.reshape((1, pose_dim))
-
-        pred_poses.append(pred_pose)
+        
+        # normalize pred pose, 6d poses are converted to quaternions and back before they are fed to the model again
+        # like in rnn_rollout.py and the interactive apps, so that the same weights continue a sequence the same way
+        pred_pose = motion_training.poses_to_quat(pred_pose, joint_count, pose_representation)
+        
+        pred_poses.append(pred_pose.reshape((1, joint_count, joint_dim)))
+        
+        if pose_representation == "repr6d":
+            pred_pose = quat2repr6d(pred_pose)
+        
+        pred_pose = pred_pose.reshape((1, model_pose_dim))
     
         #print("next_seq s ", next_seq.shape)
         #print("pred_pose s ", pred_pose.shape)
@@ -789,7 +873,6 @@ def create_pred_sequence(pose_sequence, pose_count):
         next_seq = torch.cat([next_seq[1:,:], pred_pose], axis=0)
 
     pred_poses = torch.cat(pred_poses, dim=0)
-    pred_poses = pred_poses.reshape((pose_count, joint_count, joint_dim))
 
     rnn.train()
     
@@ -0,0 +1,353 @@
+"""
+Training throughput benchmark
+Measures the training side of rnn.py on synthetic skeletons with random walk joint rotations, no mocap recordings are needed
+
+The loss functions and training steps are the ones rnn.py trains with (motion_training), changes to them show up here directly
+
+Benchmarks (samples/sec and peak resident memory of the process so far):
+ -- dataset: building the input and target windows from a pose sequence
+ -- to_quat: conversion of the target windows from the training representation to unit quaternions
+ -- fk: forward kinematics of the target windows
+ -- norm_loss, pos_loss, quat_loss: the three loss terms, forward only
+ -- test_step: evaluation rollout without gradients
+ -- train_step: autoregressive training step with backpropagation
+
+Each configuration of the sweep runs in its own process so that the memory of one configuration doesn't hide the next one
+Results are appended as JSON lines together with the git commit, --compare prints the speedup over an earlier results file
+
+Examples:
+python rnn_benchmark.py --joint_counts 17 26 34 64 --thread_counts 1 4 16
+python rnn_benchmark.py --rnn_layer_dims 256 512 1024 --batch_sizes 32 128 --output results/benchmark/after.jsonl --compare results/benchmark/before.jsonl
+python rnn_benchmark.py --joint_counts 34 --pose_representations quat repr6d
+"""
+
+import torch
+import numpy as np
+
+import os, sys, time, argparse, json, itertools, subprocess
+import multiprocessing
+
+import motion_model
+import motion_training
+from motion_training import norm_loss, poses_to_quat, forward_kinematics, pos_loss, quat_loss
+
+from common.quaternion import qfix, expmap_to_quaternion
+from common.repr6d_torch import quat2repr6d
+
+try:
+    import resource
+except ImportError:
+    resource = None # windows
+
+"""
+Synthetic data
+"""
+
+def create_skeleton(joint_count, rng):
+    """
+    random joint hierarchy, mostly chains with occasional branches like the limbs of a body
+    returns offsets (joints, 3), parents and children in the format of mocap_data["skeleton"]
+    """
+
+    parents = [ -1 ]
+
+    for jI in range(1, joint_count):
+        parents.append(jI - 1 if rng.uniform() < 0.7 else int(rng.integers(0, jI)))
+
+    children = [ [] for _ in range(joint_count) ]
+
+    for jI, parent in enumerate(parents):
+        if parent >= 0:
+            children[parent].append(jI)
+
+    offsets = rng.normal(size=(joint_count, 3)).astype(np.float32) * 10.0
+    offsets[0] = 0.0
+
+    return {"offsets": offsets, "parents": parents, "children": children}
+
+def create_motion(joint_count, frame_count, rng, step_size=0.02):
+    """
+    random walk of the joint rotations in axis-angle space
+    returns a continuous quaternion sequence (frames, joints, 4)
+    """
+
+    rotations = np.cumsum(rng.normal(scale=step_size, size=(frame_count, joint_count, 3)), axis=0)
+
+    return qfix(expmap_to_quaternion(rotations)).astype(np.float32)
+
+def create_dataset(pose_sequence, seq_input_length, seq_output_length, pose_representation="quat"):
+    """
+    input and target windows, same as in rnn.py
+    """
+
+    frame_count = pose_sequence.shape[0]
+
+    if pose_representation == "repr6d":
+        pose_sequence = quat2repr6d(torch.from_numpy(pose_sequence)).numpy()
+
+    pose_dim = pose_sequence.shape[1] * pose_sequence.shape[2]
+
+    pose_sequence = np.reshape(pose_sequence, (-1, pose_dim))
+
+    X = []
+    y = []
+
+    for pI in np.arange(0, frame_count - seq_input_length - seq_output_length - 1):
+
+        X_sample = pose_sequence[pI:pI+seq_input_length]
+        X.append(X_sample.reshape((seq_input_length, pose_dim)))
+
+        Y_sample = pose_sequence[pI+seq_input_length:pI+seq_input_length+seq_output_length]
+        y.append(Y_sample.reshape((seq_output_length, pose_dim)))
+
+    X = np.array(X)
+    y = np.array(y)
+
+    X = torch.from_numpy(X).to(torch.float32)
+    y = torch.from_numpy(y).to(torch.float32)
+
+    return X, y
+
+"""
+Measurements
+"""
+
+def peak_rss_mb():
+
+    if resource is None:
+        return float("nan")
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on linux, bytes on macos
+    return peak_rss / (1024.0 * 1024.0) if sys.platform == "darwin" else peak_rss / 1024.0
+
+def measure(name, func, sample_count, repeats, warmup, device):
+
+    for _ in range(warmup):
+        func()
+
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+    start_time = time.perf_counter()
+
+    for _ in range(repeats):
+        func()
+
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+    duration = (time.perf_counter() - start_time) / repeats
+
+    return {"benchmark": name,
+            "samples_per_sec": sample_count / duration,
+            "time": duration,
+            "peak_rss_mb": peak_rss_mb()}
+
+def run_configuration(config, settings):
+    """
+    runs all benchmarks for one configuration of the sweep
+    """
+
+    if config["thread_count"] > 0:
+        torch.set_num_threads(config["thread_count"])
+
+    device = settings["device"]
+    repeats = settings["repeats"]
+    warmup = settings["warmup"]
+
+    rng = np.random.default_rng(settings["seed"])
+    torch.manual_seed(settings["seed"])
+
+    joint_count = config["joint_count"]
+    pose_representation = config["pose_representation"]
+    pose_dim = joint_count * (6 if pose_representation == "repr6d" else 4)
+    batch_size = config["batch_size"]
+
+    skeleton = create_skeleton(joint_count, rng)
+    skeleton["offsets"] = torch.tensor(skeleton["offsets"]).to(device)
+    skeleton["joint_loss_weights"] = torch.ones((1, 1, 1), dtype=torch.float32).to(device)
+
+    loss_scales = {"norm": 0.1, "pos": 0.1, "quat": 0.9}
+
+    pose_sequence = create_motion(joint_count, settings["frame_count"], rng)
+
+    results = []
+
+    # dataset
+    X, y = create_dataset(pose_sequence, config["seq_input_length"], config["seq_output_length"], pose_representation)
+
+    results.append(measure("dataset", lambda: create_dataset(pose_sequence, config["seq_input_length"], config["seq_output_length"], pose_representation), X.shape[0], 1, 0, "cpu"))
+
+    batch_indices = rng.integers(0, X.shape[0], size=batch_size)
+    input_pose_sequences = X[batch_indices].to(device)
+    target_poses = y[batch_indices].to(device)
+
+    # conversion, forward kinematics and losses on the target windows
+    # the losses are always computed on quaternions
+    target_rotations = poses_to_quat(target_poses, joint_count, pose_representation)
+    target_quat_poses = target_rotations.reshape(batch_size, config["seq_output_length"], joint_count * 4)
+    zero_trajectory = torch.zeros((batch_size, config["seq_output_length"], 3), dtype=torch.float32).to(device)
+    pred_poses = target_quat_poses + torch.randn_like(target_quat_poses) * 0.1
+
+    with torch.no_grad():
+        results.append(measure("to_quat", lambda: poses_to_quat(target_poses, joint_count, pose_representation), batch_size, repeats, warmup, device))
+        results.append(measure("fk", lambda: forward_kinematics(target_rotations, zero_trajectory, skeleton), batch_size, repeats, warmup, device))
+        results.append(measure("norm_loss", lambda: norm_loss(pred_poses), batch_size, repeats, warmup, device))
+        results.append(measure("pos_loss", lambda: pos_loss(target_quat_poses, pred_poses, skeleton), batch_size, repeats, warmup, device))
+        results.append(measure("quat_loss", lambda: quat_loss(target_quat_poses, pred_poses, skeleton), batch_size, repeats, warmup, device))
+
+    # model steps
+    model_config = dict(motion_model.config)
+    model_config["data_dim"] = pose_dim
+    model_config["node_dim"] = config["rnn_layer_dim"]
+    model_config["layer_count"] = config["rnn_layer_count"]
+    model_config["device"] = device
+    model_config["weights_path"] = ""
+
+    rnn = motion_model.createModel(model_config)
+    optimizer = torch.optim.Adam(rnn.parameters(), lr=1e-4)
+
+    def run_test_step():
+        rnn.eval()
+        with torch.no_grad():
+            motion_training.test_step(rnn, input_pose_sequences, target_poses, False, skeleton, loss_scales, pose_representation)
+
+    results.append(measure("test_step", run_test_step, batch_size, repeats, warmup, device))
+    results.append(measure("train_step", lambda: motion_training.train_step(rnn, optimizer, input_pose_sequences, target_poses, False, skeleton, loss_scales, pose_representation), batch_size, repeats, warmup, device))
+
+    for result in results:
+        result.update(config)
+        result["thread_count"] = torch.get_num_threads()
+
+    return results
+
+"""
+Results
+"""
+
+config_keys = [ "joint_count", "seq_input_length", "seq_output_length", "rnn_layer_dim", "rnn_layer_count", "batch_size", "thread_count", "pose_representation" ]
+
+def git_commit():
+
+    try:
+        path = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=path, check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, cwd=path, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return commit + "-dirty" if len(changes) > 0 else commit
+
+def result_key(result):
+    return tuple([ result[key] for key in config_keys ] + [ result["benchmark"] ])
+
+def print_results(results, compare_results=None):
+
+    header = config_keys + [ "benchmark", "samples/sec", "peak_rss_mb" ]
+
+    if compare_results is not None:
+        # the latest entry of each configuration in the comparison file
+        compare_samples_per_sec = { result_key(result): result["samples_per_sec"] for result in compare_results }
+        header += [ "before", "speedup" ]
+
+    rows = []
+
+    for result in results:
+
+        row = [ str(result[key]) for key in config_keys ] + [ result["benchmark"], "{:01.1f}".format(result["samples_per_sec"]), "{:01.1f}".format(result["peak_rss_mb"]) ]
+
+        if compare_results is not None:
+            before = compare_samples_per_sec.get(result_key(result), None)
+            row += [ "-", "-" ] if before is None else [ "{:01.1f}".format(before), "{:01.2f}".format(result["samples_per_sec"] / before) ]
+
+        rows.append(row)
+
+    column_widths = [ max([ len(row[cI]) for row in [ header ] + rows ]) for cI in range(len(header)) ]
+
+    for row in [ header ] + rows:
+        print("  ".join([ row[cI].rjust(column_widths[cI]) for cI in range(len(header)) ]))
+
+def load_results(file_name):
+
+    with open(file_name) as f:
+        results = [ json.loads(line) for line in f if line.strip() != "" ]
+
+    # files written before the representation was configurable
+    for result in results:
+        result.setdefault("pose_representation", "quat")
+
+    return results
+
+"""
+Command line
+"""
+
+def main():
+
+    parser = argparse.ArgumentParser(description="training throughput benchmark on synthetic skeletons")
+
+    parser.add_argument("--joint_counts", type=int, nargs="+", default=[ 17, 26, 34, 64 ])
+    parser.add_argument("--seq_input_lengths", type=int, nargs="+", default=[ 64 ])
+    parser.add_argument("--seq_output_lengths", type=int, nargs="+", default=[ 10 ])
+    parser.add_argument("--rnn_layer_dims", type=int, nargs="+", default=[ 512 ])
+    parser.add_argument("--rnn_layer_counts", type=int, nargs="+", default=[ 2 ])
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[ 32 ])
+    parser.add_argument("--thread_counts", type=int, nargs="+", default=[ 0 ], help="0: torch default")
+    parser.add_argument("--pose_representations", nargs="+", default=[ "quat" ], choices=[ "quat", "repr6d" ])
+    parser.add_argument("--frame_count", type=int, default=2000, help="length of the synthetic motion")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default="results/benchmark/rnn_benchmark.jsonl")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare with")
+
+    args = parser.parse_args()
+
+    settings = {"device": args.device,
+                "repeats": args.repeats,
+                "warmup": args.warmup,
+                "seed": args.seed,
+                "frame_count": args.frame_count}
+
+    sweep = itertools.product(args.joint_counts, args.seq_input_lengths, args.seq_output_lengths, args.rnn_layer_dims, args.rnn_layer_counts, args.batch_sizes, args.thread_counts, args.pose_representations)
+    configs = [ dict(zip(config_keys, values)) for values in sweep ]
+
+    run_info = {"commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "torch": torch.__version__,
+                "cpu_count": multiprocessing.cpu_count(),
+                "device": args.device,
+                "frame_count": args.frame_count}
+
+    print("commit ", run_info["commit"], " configurations ", len(configs))
+
+    # spawn instead of fork so that each configuration starts with a fresh process
+    context = multiprocessing.get_context("spawn")
+
+    results = []
+
+    for config in configs:
+
+        with context.Pool(1) as pool:
+            config_results = pool.apply(run_configuration, (config, settings))
+
+        for result in config_results:
+            result.update(run_info)
+
+        results += config_results
+
+        print("joints ", config["joint_count"], " train_step ", "{:01.1f}".format(config_results[-1]["samples_per_sec"]), " samples/sec")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    with open(args.output, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    print_results(results, load_results(args.compare) if args.compare is not None else None)
+
+if __name__ == "__main__":
+    main()
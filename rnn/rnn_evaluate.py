@@ -0,0 +1,286 @@
+"""
+Checkpoint evaluation
+Evaluates all weights saved during training (rnn_weights_epoch_N in a weights folder) on the same test seeds
+and ranks them by test loss, rollout drift and time to stagnation
+The checkpoints are spread over several processes, each process uses its share of the cpu cores
+
+Metrics per checkpoint:
+ -- loss: mean joint position error over the first output_length predicted frames (autoregressive, as in test_step)
+ -- quat: mean joint rotation angle error in radians over the same frames (--data rot only)
+ -- drift: mean joint position error over the last output_length frames of a drift_length frame rollout
+ -- stagnation: mean time in seconds until a long rollout stagnates or loops (see rnn_survey.py)
+
+The test seeds are taken every --test_stride frames of the clips, a fixed random subset of --test_percentage is used,
+this is not the same split as the random split during training
+
+Example:
+python rnn_evaluate.py --weights results/weights --mocap D:/Data/mocap/Daniel/Zed/fbx/daniel_zed_solo1.fbx --processes 4
+"""
+
+import torch
+from torch import nn
+import numpy as np
+
+import os, sys, time, re
+import multiprocessing
+
+import rnn_rollout
+import rnn_survey
+from common.quaternion import qmul
+
+"""
+Checkpoints
+"""
+
+def find_checkpoints(weights_path):
+    """
+    returns (epoch, file path) of all rnn_weights_epoch_N files in weights_path, sorted by epoch
+    """
+
+    checkpoints = []
+
+    for file_name in os.listdir(weights_path):
+
+        match = re.fullmatch("rnn_weights_epoch_([0-9]+)", file_name)
+
+        if match is not None:
+            checkpoints.append((int(match.group(1)), os.path.join(weights_path, file_name)))
+
+    return sorted(checkpoints)
+
+"""
+Metrics
+"""
+
+def position_error(pred_sequences, target_sequences, corpus, device):
+    """
+    mean joint position error per frame (N, L, joints, joint_dim) -> (L)
+    """
+
+    pred_positions = rnn_rollout.joint_positions(pred_sequences, corpus, device)
+    target_positions = rnn_rollout.joint_positions(target_sequences, corpus, device)
+
+    return np.mean(np.linalg.norm(pred_positions - target_positions, axis=-1), axis=(0, 2))
+
+def rotation_error(pred_sequences, target_sequences):
+    """
+    mean joint rotation angle error per frame in radians (N, L, joints, 4) -> (L)
+    """
+
+    pred = torch.from_numpy(pred_sequences).reshape(-1, 4)
+    target = torch.from_numpy(target_sequences).reshape(-1, 4)
+
+    # same as quat_loss in rnn.py
+    pred_inv = pred * torch.tensor([[1.0, -1.0, -1.0, -1.0]], dtype=torch.float32)
+    diff = qmul(pred_inv, target)
+    angle = torch.abs(torch.atan2(torch.norm(diff[:, 1:], dim=1), diff[:, 0]))
+    angle = angle.reshape(pred_sequences.shape[:3])
+
+    return torch.mean(angle, dim=(0, 2)).numpy()
+
+def evaluate_checkpoint(model, evaluation):
+    """
+    compute all metrics for one model
+    """
+
+    args = evaluation["args"]
+    corpus = evaluation["corpus"]
+    all_pose_sequences = evaluation["all_pose_sequences"]
+
+    joint_count = corpus["joint_count"]
+    joint_dim = corpus["joint_dim"]
+
+    metrics = {}
+
+    # test loss and drift from the same rollouts
+    test_seeds = evaluation["test_seeds"]
+
+    seed_windows = rnn_rollout.create_seed_windows(all_pose_sequences, test_seeds, args.input_length)
+
+    pred_sequences = rnn_rollout.rollout(model, seed_windows, args.drift_length, joint_dim, corpus["pose_mean"], corpus["pose_std"], args.batch_size, args.stateful, args.device, corpus["representation"])
+    pred_sequences = np.reshape(pred_sequences, (len(test_seeds), args.drift_length, joint_count, joint_dim))
+
+    target_sequences = [ all_pose_sequences[seq_index][start+args.input_length:start+args.input_length+args.drift_length] for seq_index, start in test_seeds ]
+    target_sequences = np.stack(target_sequences, axis=0).astype(np.float32)
+
+    pos_error = position_error(pred_sequences, target_sequences, corpus, args.device)
+
+    metrics["loss"] = float(np.mean(pos_error[:args.output_length]))
+    metrics["drift"] = float(np.mean(pos_error[-args.output_length:]))
+
+    if corpus["data"] == "rot":
+        metrics["quat"] = float(np.mean(rotation_error(pred_sequences[:, :args.output_length], target_sequences[:, :args.output_length])))
+
+    # time to stagnation from long rollouts
+    survey_seeds = evaluation["survey_seeds"]
+
+    seed_windows = rnn_rollout.create_seed_windows(all_pose_sequences, survey_seeds, args.input_length)
+
+    pred_sequences = rnn_rollout.rollout(model, seed_windows, args.length, joint_dim, corpus["pose_mean"], corpus["pose_std"], args.batch_size, args.stateful, args.device, corpus["representation"])
+    pred_sequences = np.reshape(pred_sequences, (len(survey_seeds), args.length, joint_count, joint_dim))
+
+    positions = rnn_rollout.joint_positions(pred_sequences, corpus, args.device)
+
+    collapse_frames, _ = rnn_survey.detect_collapse(positions, evaluation["survey_settings"], evaluation["reference_variance"])
+    collapse_frames = [ collapse_frame if collapse_frame >= 0 else args.length for collapse_frame in collapse_frames ]
+
+    metrics["stagnation"] = float(np.mean(collapse_frames) / evaluation["survey_settings"]["fps"])
+
+    return metrics
+
+"""
+Worker processes
+"""
+
+_evaluation = None
+
+def init_worker(evaluation, thread_count):
+
+    global _evaluation
+
+    _evaluation = evaluation
+
+    torch.set_num_threads(thread_count)
+
+def run_worker(checkpoint):
+
+    epoch, weights_path = checkpoint
+
+    start_time = time.time()
+
+    model = rnn_rollout.load_model(_evaluation["args"], _evaluation["corpus"], weights_path)
+    metrics = evaluate_checkpoint(model, _evaluation)
+
+    metrics["epoch"] = epoch
+    metrics["weights"] = weights_path
+
+    print("epoch ", epoch, " time ", time.time() - start_time)
+
+    return metrics
+
+"""
+Ranking
+"""
+
+def write_ranking(results, metric_names, rank_by, file_name):
+
+    # lower is better except for the time to stagnation
+    results = sorted(results, key=lambda result: -result[rank_by] if rank_by == "stagnation" else result[rank_by])
+
+    header = [ "rank", "epoch" ] + metric_names
+    rows = [ [ str(rI + 1), str(result["epoch"]) ] + [ "{:01.4f}".format(result[metric_name]) for metric_name in metric_names ] for rI, result in enumerate(results) ]
+
+    column_widths = [ max([ len(row[cI]) for row in [ header ] + rows ]) for cI in range(len(header)) ]
+
+    table = "  ".join([ header[cI].rjust(column_widths[cI]) for cI in range(len(header)) ]) + "\n"
+    table += "\n".join([ "  ".join([ row[cI].rjust(column_widths[cI]) for cI in range(len(header)) ]) for row in rows ]) + "\n"
+
+    print(table)
+
+    with open(file_name + ".txt", "w") as f:
+        f.write("ranked by {}\n\n".format(rank_by))
+        f.write(table)
+
+    with open(file_name + ".csv", "w") as f:
+        f.write(",".join(header + [ "weights" ]) + "\n")
+        for row, result in zip(rows, results):
+            f.write(",".join(row + [ result["weights"] ]) + "\n")
+
+"""
+Command line
+"""
+
+def main():
+
+    parser = rnn_rollout.create_argument_parser("evaluate and rank all saved checkpoints", weights_help="folder with the weights saved during training")
+
+    parser.add_argument("--test_percentage", type=float, default=0.1)
+    parser.add_argument("--test_stride", type=int, default=10, help="distance in frames between test seeds")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for choosing the test seeds")
+    parser.add_argument("--output_length", type=int, default=10, help="number of frames for the test loss (seq_output_length in rnn.py)")
+    parser.add_argument("--drift_length", type=int, default=150, help="number of frames for the drift")
+    parser.add_argument("--survey_seed_count", type=int, default=64, help="number of long rollouts for the time to stagnation")
+    parser.add_argument("--rank_by", choices=["loss", "drift", "stagnation", "quat"], default="loss")
+    parser.add_argument("--processes", type=int, default=max(multiprocessing.cpu_count() // 4, 1))
+    parser.add_argument("--output_path", default="results/evaluation")
+
+    args = parser.parse_args()
+
+    checkpoints = find_checkpoints(args.weights)
+
+    if len(checkpoints) == 0:
+        print("no checkpoints found in ", args.weights)
+        return
+
+    print("evaluate ", len(checkpoints), " checkpoints")
+
+    all_pose_sequences, corpus = rnn_rollout.load_corpus(args)
+
+    fps = float(corpus["fps"])
+
+    # test seeds, the same for all checkpoints
+
+    seq_indices = args.seq_indices if args.seq_indices is not None else list(range(len(all_pose_sequences)))
+
+    seeds = []
+    for seq_index in seq_indices:
+        starts = list(range(0, all_pose_sequences[seq_index].shape[0], args.test_stride))
+        seeds += rnn_rollout.create_seeds(all_pose_sequences, [ seq_index ], starts, args.input_length, args.drift_length)
+
+    rng = np.random.default_rng(args.seed)
+    seeds = [ seeds[sI] for sI in rng.permutation(len(seeds)) ]
+
+    test_seeds = seeds[:max(int(len(seeds) * args.test_percentage), 1)]
+    survey_seeds = test_seeds[:args.survey_seed_count]
+
+    print("test seeds ", len(test_seeds), " survey seeds ", len(survey_seeds))
+
+    # survey settings with the defaults of rnn_survey.py
+
+    survey_settings = {"fps": fps,
+                       "window_length": max(int(1.0 * fps), 2),
+                       "periodic_window_length": int(6.0 * fps),
+                       "min_lag": max(int(0.3 * fps), 1),
+                       "max_lag": int(3.0 * fps),
+                       "stagnation_threshold": 0.05,
+                       "periodicity_threshold": 0.9,
+                       "collapse_windows": 3}
+
+    reference_positions = [ rnn_rollout.joint_positions(np.expand_dims(all_pose_sequences[seq_index], axis=0), corpus, args.device) for seq_index in seq_indices ]
+    reference_variance = np.median(np.concatenate([ rnn_survey.windowed_variance(positions, survey_settings["window_length"]).flatten() for positions in reference_positions ]))
+
+    evaluation = {"args": args,
+                  "corpus": corpus,
+                  "all_pose_sequences": all_pose_sequences,
+                  "test_seeds": test_seeds,
+                  "survey_seeds": survey_seeds,
+                  "survey_settings": survey_settings,
+                  "reference_variance": reference_variance}
+
+    # evaluate checkpoints
+
+    start_time = time.time()
+
+    process_count = min(args.processes, len(checkpoints))
+    thread_count = max(multiprocessing.cpu_count() // process_count, 1)
+
+    if process_count > 1 and args.device == "cpu":
+        with multiprocessing.Pool(process_count, initializer=init_worker, initargs=(evaluation, thread_count)) as pool:
+            results = pool.map(run_worker, checkpoints)
+    else:
+        # a single gpu is shared better by evaluating one checkpoint after the other
+        init_worker(evaluation, torch.get_num_threads())
+        results = [ run_worker(checkpoint) for checkpoint in checkpoints ]
+
+    print("evaluation time ", time.time() - start_time)
+
+    # ranking
+
+    metric_names = [ "loss", "quat", "drift", "stagnation" ] if corpus["data"] == "rot" else [ "loss", "drift", "stagnation" ]
+
+    os.makedirs(args.output_path, exist_ok=True)
+
+    write_ranking(results, metric_names, args.rank_by if args.rank_by in metric_names else "loss", os.path.join(args.output_path, "checkpoint_ranking"))
+
+if __name__ == "__main__":
+    main()
@@ -7,18 +7,22 @@ import torch
 from torch.utils.data import Dataset
 from torch.utils.data import DataLoader
 from torch import nn
+import torch.distributed as dist
 from collections import OrderedDict
 import networkx as nx
 import scipy.linalg as sclinalg
 
 import os, sys, time, subprocess
+import argparse, copy, queue, random, threading
 import numpy as np
 import math
+import multiprocessing
 import json
 import pickle
 
 from common import utils
-from common.pose_renderer import PoseRenderer
+from common.pose_renderer import create_pose_renderer
+from common.mocap_recording import load_motiondata, RecordingWriter
 
 """
 Compute Device
@@ -63,6 +67,18 @@ rnn_layer_count = 2
 save_weights = True
 load_weights = False
 rnn_weights_file = "results_xSens_stocos_takes1-7/weights/rnn_weights_epoch_200"
+save_checkpoints = True # full training state (model, optimizer, scheduler, loss history, random states) for resuming a run
+checkpoint_interval = 1 # epochs between checkpoints, checkpoints are written in the background
+checkpoint_file = "results/weights/rnn_checkpoint"
+resume_checkpoint_file = None # continue an interrupted run from its checkpoint, can also be given on the command line: --resume results/weights/rnn_checkpoint
+
+# command line
+arg_parser = argparse.ArgumentParser()
+arg_parser.add_argument("--resume", default=None, help="checkpoint file of an interrupted run")
+args, _ = arg_parser.parse_known_args()
+
+if args.resume is not None:
+    resume_checkpoint_file = args.resume
 
 """
 Training settings
@@ -76,6 +92,11 @@ learning_rate = 1e-4
 pos_loss_scale = 1.0
 teacher_forcing_prob = 0.0
 model_save_interval = 10
+eval_batch_size = 256 # the test set is evaluated without gradients, larger batches only cost memory
+eval_interval = 1 # evaluate the test set every eval_interval epochs, other epochs have a nan test loss
+train_process_count = 1 # cpu only: number of data parallel worker processes, each trains on its own shard with batch_size samples per step
+train_threads_per_process = 0 # 0: the available cores are divided equally among the worker processes
+train_master_port = 29500 # local port for exchanging gradients between the worker processes
 epochs = 200
 save_history = True
 joint_loss_weights = [1.0]
@@ -95,6 +116,8 @@ else:
     view_line_width = 1.0
     view_size = 4.0
 
+view_backend = "matplotlib" # "matplotlib" or "raster" (numpy rasterizer, much faster for long animations)
+
 """
 Load mocap data
 """
@@ -115,29 +138,6 @@ def config_to_skeletondata(mocap_config):
     
     return skeleton_data
 
-def recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids):
-    
-    joint_count = len(skeleton_data["joints"])
-    
-    # gather sensor values
-    motion_data = {}
-    
-    sensor_ids = mocap_recording["sensor_ids"]
-    sensor_values = mocap_recording["sensor_values"]
-    
-    for sensor_id in mocap_sensor_ids:
-
-        print("sensor_id ", sensor_id)
-        
-        motion_data[sensor_id]  = [ sensor_values [vI] for vI in range(len(sensor_values)) if sensor_ids[vI].endswith(sensor_id) ]
-        motion_data[sensor_id] = np.array(motion_data[sensor_id], dtype=np.float32)
-        
-        print("motion_data[sensor_id s ", motion_data[sensor_id].shape)
-        
-        motion_data[sensor_id] = np.reshape(motion_data[sensor_id], (motion_data[sensor_id].shape[0], joint_count, -1))
-
-    return motion_data
-
 skeleton_data = config_to_skeletondata(mocap_config)
 
 all_motion_data = []
@@ -146,12 +146,10 @@ for mocap_file in mocap_files:
     
     print("process file ", mocap_file)
     
-    with open(mocap_file_path + "/" + mocap_file, "rb") as f:
-        mocap_recording = pickle.load(f)
-        
-        motion_data = recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids)
-        
-        all_motion_data.append(motion_data)
+    # pickled recording or columnar recording directory (see common/mocap_recording.py)
+    motion_data = load_motiondata(mocap_file_path + "/" + mocap_file, skeleton_data, mocap_sensor_ids)
+    
+    all_motion_data.append(motion_data)
         
 # retrieve mocap properties
 
@@ -264,10 +262,17 @@ print("y_item s ", y_item.shape)
 test_size = int(test_percentage * len(full_dataset))
 train_size = len(full_dataset) - test_size
 
-train_dataset, test_dataset = torch.utils.data.random_split(full_dataset, [train_size, test_size])
+# a resumed run continues with the training and test windows of the interrupted run
+resume_checkpoint = torch.load(resume_checkpoint_file, map_location=device, weights_only=False) if resume_checkpoint_file is not None else None
+
+if resume_checkpoint is not None:
+    train_dataset = torch.utils.data.Subset(full_dataset, resume_checkpoint["dataset_split"]["train"])
+    test_dataset = torch.utils.data.Subset(full_dataset, resume_checkpoint["dataset_split"]["test"])
+else:
+    train_dataset, test_dataset = torch.utils.data.random_split(full_dataset, [train_size, test_size])
 
 train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+test_loader = DataLoader(test_dataset, batch_size=eval_batch_size, shuffle=False)
 
 X_batch, y_batch = next(iter(train_loader))
 
@@ -303,6 +308,19 @@ class Reccurent(nn.Module):
         x = self.dense_layers(x)
         
         return x
+    
+    def forward_state(self, x, state=None):
+        """
+        stateful variant of forward
+        continues from the LSTM state (h, c) returned by a previous call instead of starting from zeros
+        """
+        
+        x, state = self.rnn_layers.rnn(x, state)
+        
+        x = x[:, -1, :] # only last time step 
+        x = self.dense_layers(x)
+        
+        return x, state
 
 rnn = Reccurent(pose_dim, rnn_layer_dim, pose_dim, rnn_layer_count).to(device)
 print(rnn)
@@ -328,6 +346,110 @@ Training
 optimizer = torch.optim.Adam(rnn.parameters(), lr=learning_rate)
 scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=50, gamma=0.336) # reduce the learning every 20 epochs by a factor of 10
 
+"""
+Checkpoints
+"""
+
+# files are written by a background thread so that training doesn't wait for the disk
+checkpoint_queue = queue.Queue(maxsize=2)
+checkpoint_thread = None
+checkpoint_error = None
+
+def checkpoint_writer():
+    
+    global checkpoint_error
+    
+    while True:
+        state, file_name = checkpoint_queue.get()
+        
+        if state is None:
+            break
+        
+        # after a failed write the states are still taken from the queue so that training never blocks on it,
+        # the error is raised on the training thread
+        if checkpoint_error is not None:
+            continue
+        
+        try:
+            # write to a temporary file first so that an interrupted write never replaces a complete file
+            tmp_file_name = file_name + ".tmp"
+            
+            with open(tmp_file_name, "wb") as f:
+                torch.save(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            os.replace(tmp_file_name, file_name)
+        except Exception as e:
+            checkpoint_error = e
+
+def raise_checkpoint_error():
+    
+    if checkpoint_error is not None:
+        raise RuntimeError("writing a checkpoint failed") from checkpoint_error
+
+def start_checkpoint_writer():
+    
+    global checkpoint_thread, checkpoint_error
+    
+    checkpoint_error = None
+    checkpoint_thread = threading.Thread(target=checkpoint_writer)
+    checkpoint_thread.start()
+
+def stop_checkpoint_writer():
+    
+    checkpoint_queue.put((None, None))
+    checkpoint_thread.join()
+    
+    raise_checkpoint_error()
+
+def save_state(state, file_name):
+    
+    raise_checkpoint_error()
+    
+    # the copy is taken on the training thread, training continues to change the original tensors
+    checkpoint_queue.put((copy.deepcopy(state), file_name))
+
+def create_checkpoint(epoch, loss_history):
+    
+    checkpoint = {}
+    checkpoint["epoch"] = epoch # next epoch to train
+    checkpoint["model"] = rnn.state_dict()
+    checkpoint["optimizer"] = optimizer.state_dict()
+    checkpoint["scheduler"] = scheduler.state_dict()
+    checkpoint["loss_history"] = loss_history
+    checkpoint["dataset_split"] = {"train": list(train_dataset.indices), "test": list(test_dataset.indices)}
+    checkpoint["rng_states"] = {"torch": torch.get_rng_state(),
+                                "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+                                "numpy": np.random.get_state(),
+                                "python": random.getstate()}
+    
+    return checkpoint
+
+def load_checkpoint(checkpoint):
+    
+    rnn.load_state_dict(checkpoint["model"])
+    optimizer.load_state_dict(checkpoint["optimizer"])
+    scheduler.load_state_dict(checkpoint["scheduler"])
+    
+    # the random states decide the shuffling of the training set and teacher forcing
+    rng_states = checkpoint["rng_states"]
+    torch.set_rng_state(rng_states["torch"].cpu())
+    if rng_states["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([ rng_state.cpu() for rng_state in rng_states["cuda"] ])
+    np.random.set_state(rng_states["numpy"])
+    random.setstate(rng_states["python"])
+    
+    return checkpoint["epoch"], checkpoint["loss_history"]
+
+start_epoch = 0
+start_loss_history = None
+
+if resume_checkpoint_file is not None:
+    start_epoch, start_loss_history = load_checkpoint(resume_checkpoint)
+    
+    print("resume from epoch ", start_epoch)
+
 # pose mean and std
 
 pose_mean = torch.tensor(pose_mean).reshape(1, 1, -1).to(device)
@@ -373,6 +495,40 @@ def loss(y, yhat):
     
     return _total_loss, _pos_loss
 
+"""
+Data Parallel Training
+"""
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+def is_main_process():
+    return is_distributed() == False or dist.get_rank() == 0
+
+def average_gradients():
+    
+    # the gradients are flattened into a single tensor so that each step needs only one all_reduce
+    grads = [ param.grad for param in rnn.parameters() ]
+    flat_grads = torch.cat([ grad.reshape(-1) for grad in grads ])
+    
+    dist.all_reduce(flat_grads, op=dist.ReduceOp.SUM)
+    flat_grads /= dist.get_world_size()
+    
+    offset = 0
+    for grad in grads:
+        grad.copy_(flat_grads[offset:offset+grad.numel()].view_as(grad))
+        offset += grad.numel()
+
+def reduce_epoch_stats(epoch_losses, sample_count):
+    """
+    averages the epoch losses and sums the number of trained samples of all worker processes
+    """
+    
+    stats = torch.tensor(list(epoch_losses) + [ sample_count ], dtype=torch.float64)
+    dist.all_reduce(stats, op=dist.ReduceOp.SUM)
+    
+    return (stats[:-1] / dist.get_world_size()).tolist(), int(stats[-1].item())
+
 def train_step(pose_sequences, target_poses, teacher_forcing):
     
     rnn.train()
@@ -444,6 +600,10 @@ def train_step(pose_sequences, target_poses, teacher_forcing):
     # Backpropagation
     optimizer.zero_grad()
     _loss.backward()
+    
+    if is_distributed() == True:
+        average_gradients()
+    
     optimizer.step()
     
     #print("_ar_loss_total mean s ", _ar_loss_total.shape)
@@ -454,16 +614,10 @@ def train_step(pose_sequences, target_poses, teacher_forcing):
 
 def test_step(pose_sequences, target_poses, teacher_forcing):
     
-    rnn.eval()
-
-    #print("ar_train_step")    
-    #print("teacher_forcing ", teacher_forcing)
-    #print("pose_sequences s ", pose_sequences.shape)
-    #print("target_poses s ", target_poses.shape)
-
-    #_input_poses = pose_sequences.detach().clone()    
-    _input_poses = pose_sequences  
-    _input_poses_norm = (_input_poses - pose_mean) / pose_std
+    # single stateful rollout: the input sequence is processed once, afterwards only the newest pose is fed to the model
+    # the caller sets eval mode and no_grad
+    
+    _input_poses_norm = (pose_sequences - pose_mean) / pose_std
     _input_poses_norm = torch.nan_to_num(_input_poses_norm)
     
     target_poses_norm = (target_poses - pose_mean) / pose_std
@@ -471,64 +625,53 @@ def test_step(pose_sequences, target_poses, teacher_forcing):
     
     output_poses_length = target_poses_norm.shape[1]
     
-    #print("output_poses_length ", output_poses_length)
+    _pred_poses_norm, _state = rnn.forward_state(_input_poses_norm)
     
-    _pred_poses_norm_for_loss = []
-    _target_poses_norm_for_loss = []
+    _pred_poses_norm_for_loss = [ torch.unsqueeze(_pred_poses_norm, axis=1) ]
     
-    with torch.no_grad():
-    
-        for o_i in range(1, output_poses_length):
-            
-            #print("_input_poses_norm s ", _input_poses_norm.shape)
-            
-            _pred_poses_norm = rnn(_input_poses_norm)
-            _pred_poses_norm = torch.unsqueeze(_pred_poses_norm, axis=1)
-            
-            #print("_pred_poses s ", _pred_poses.shape)
-            
-            _target_poses_norm = target_poses_norm[:,o_i,:].detach().clone()
-            _target_poses_norm = torch.unsqueeze(_target_poses_norm, axis=1)
-    
-            #print("_target_poses_norm s ", _target_poses_norm.shape)
-            
-            _pred_poses_norm_for_loss.append(_pred_poses_norm)
-            _target_poses_norm_for_loss.append(_target_poses_norm)
-            
-            # shift input pose seqeunce one pose to the right
-            # remove pose from beginning input pose sequence
-            # detach necessary to avoid error concerning running backprob a second time
-            _input_poses_norm = _input_poses_norm[:, 1:, :].detach().clone()
-            _target_poses_norm = _target_poses_norm.detach().clone()
-            _pred_poses_norm = _pred_poses_norm.detach().clone()
-            
-            # add predicted or target pose to end of input pose sequence
-            if teacher_forcing == True:
-                _input_poses_norm = torch.concat((_input_poses_norm, _target_poses_norm), axis=1)
-            else:
-                #_pred_poses = torch.reshape(_pred_poses, (_pred_poses.shape[0], 1, joint_count, joint_dim))
-                _input_poses_norm = torch.cat((_input_poses_norm, _pred_poses_norm), axis=1)
-                
-            #print("_input_poses s ", _input_poses.shape)
-    
-            
-            #print("_input_poses 2 s ", _input_poses.shape)
+    for o_i in range(1, output_poses_length - 1):
+        
+        # continue with the predicted or target pose
+        if teacher_forcing == True:
+            _next_poses_norm = target_poses_norm[:, o_i:o_i+1, :]
+        else:
+            _next_poses_norm = torch.unsqueeze(_pred_poses_norm, axis=1)
             
-        _pred_poses_norm_for_loss = torch.cat(_pred_poses_norm_for_loss, dim=1)
-        _target_poses_norm_for_loss = torch.cat(_target_poses_norm_for_loss, dim=1)
+        _pred_poses_norm, _state = rnn.forward_state(_next_poses_norm, _state)
         
-        #print("_pred_poses_for_loss 2 s ", _pred_poses_for_loss.shape)
-        #print("_target_poses_for_loss 2 s ", _target_poses_for_loss.shape)
+        _pred_poses_norm_for_loss.append(torch.unsqueeze(_pred_poses_norm, axis=1))
         
-        _loss, _pos_loss = loss(_target_poses_norm_for_loss, _pred_poses_norm_for_loss) 
+    _pred_poses_norm_for_loss = torch.cat(_pred_poses_norm_for_loss, dim=1)
+    _target_poses_norm_for_loss = target_poses_norm[:, 1:output_poses_length, :]
     
-    #print("_ar_loss_total mean s ", _ar_loss_total.shape)
+    _loss, _pos_loss = loss(_target_poses_norm_for_loss, _pred_poses_norm_for_loss) 
     
-    #return _ar_loss, _ar_norm_loss, _ar_quat_loss
+    return _loss, _pos_loss
+
+def test(test_dataloader):
     
+    rnn.eval()
+    
+    # losses are summed on the device and only copied once at the end
+    _loss_sum = torch.zeros(1, dtype=torch.float32).to(device)
+    _sample_count = 0
+    
+    with torch.no_grad():
+    
+        for test_batch in test_dataloader:
+            input_pose_sequences = test_batch[0].to(device)
+            target_poses = test_batch[1].to(device)
+            
+            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
+            
+            _loss, _ = test_step(input_pose_sequences, target_poses, use_teacher_forcing)
+            
+            _loss_sum += _loss * input_pose_sequences.shape[0]
+            _sample_count += input_pose_sequences.shape[0]
+            
     rnn.train()
     
-    return _loss, _pos_loss
+    return (_loss_sum / max(_sample_count, 1)).item()
 
 def train(train_dataloader, test_dataloader, epochs):
     
@@ -537,60 +680,168 @@ def train(train_dataloader, test_dataloader, epochs):
     loss_history["test"] = []
     loss_history["pos"] = []
 
-    for epoch in range(epochs):
-        start = time.time()
+    # continue the loss history of a resumed run
+    if start_loss_history is not None:
+        loss_history = copy.deepcopy(start_loss_history)
+    
+    if is_main_process() == True:
+        start_checkpoint_writer()
+
+    # the writer thread is also stopped when training fails, otherwise it keeps the process alive
+    try:
+        for epoch in range(start_epoch, epochs):
+            start = time.time()
         
-        _train_loss_per_epoch = []
-        _pos_loss_per_epoch = []
+            _train_loss_per_epoch = []
+            _pos_loss_per_epoch = []
+            _sample_count = 0
 
-        for train_batch in train_dataloader:
-            input_pose_sequences = train_batch[0].to(device)
-            target_poses = train_batch[1].to(device)
+            for train_batch in train_dataloader:
+                input_pose_sequences = train_batch[0].to(device)
+                target_poses = train_batch[1].to(device)
             
-            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
+                use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
             
-            _loss, _pos_loss = train_step(input_pose_sequences, target_poses, use_teacher_forcing)
+                _loss, _pos_loss = train_step(input_pose_sequences, target_poses, use_teacher_forcing)
             
-            _loss = _loss.detach().cpu().numpy()
-            _pos_loss = _pos_loss.detach().cpu().numpy()
+                _loss = _loss.detach().cpu().numpy()
+                _pos_loss = _pos_loss.detach().cpu().numpy()
             
-            _train_loss_per_epoch.append(_loss)
-            _pos_loss_per_epoch.append(_pos_loss)
+                _train_loss_per_epoch.append(_loss)
+                _pos_loss_per_epoch.append(_pos_loss)
+                _sample_count += input_pose_sequences.shape[0]
 
-        _train_loss_per_epoch = np.mean(np.array(_train_loss_per_epoch))
-        _pos_loss_per_epoch = np.mean(np.array(_pos_loss_per_epoch))
+            _train_loss_per_epoch = np.mean(np.array(_train_loss_per_epoch))
+            _pos_loss_per_epoch = np.mean(np.array(_pos_loss_per_epoch))
 
-        _test_loss_per_epoch = []
+            if is_distributed() == True:
+                (_train_loss_per_epoch, _pos_loss_per_epoch), _sample_count = reduce_epoch_stats([_train_loss_per_epoch, _pos_loss_per_epoch], _sample_count)
         
-        for test_batch in test_dataloader:
-            input_pose_sequences = train_batch[0].to(device)
-            target_poses = train_batch[1].to(device)
-            
-            use_teacher_forcing = np.random.uniform() < teacher_forcing_prob
-            
-            _loss, _ = test_step(input_pose_sequences, target_poses, use_teacher_forcing)
-            
-            _loss = _loss.detach().cpu().numpy()
-            
-            _test_loss_per_epoch.append(_loss)
+            _samples_per_second = _sample_count / (time.time() - start)
+
+            if is_main_process() == True and (epoch % eval_interval == 0 or epoch == epochs - 1):
+                _test_loss_per_epoch = test(test_dataloader)
+            else:
+                _test_loss_per_epoch = float("nan")
+        
+            if epoch % model_save_interval == 0 and save_weights == True and is_main_process() == True:
+                save_state(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epoch))
         
-        _test_loss_per_epoch = np.mean(np.array(_test_loss_per_epoch))
+            loss_history["train"].append(_train_loss_per_epoch)
+            loss_history["test"].append(_test_loss_per_epoch)
+            loss_history["pos"].append(_pos_loss_per_epoch)
         
-        if epoch % model_save_interval == 0 and save_weights == True:
-            torch.save(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epoch))
+            scheduler.step()
         
-        loss_history["train"].append(_train_loss_per_epoch)
-        loss_history["test"].append(_test_loss_per_epoch)
-        loss_history["pos"].append(_pos_loss_per_epoch)
+            if save_checkpoints == True and is_main_process() == True and ((epoch + 1) % checkpoint_interval == 0 or epoch == epochs - 1):
+                save_state(create_checkpoint(epoch + 1, loss_history), checkpoint_file)
         
-        scheduler.step()
+            if is_main_process() == True:
+                print ('epoch {} : train: {:01.4f} test: {:01.4f} pos {:01.4f} samples/sec {:01.1f} time {:01.2f}'.format(epoch + 1, _train_loss_per_epoch, _test_loss_per_epoch, _pos_loss_per_epoch, _samples_per_second, time.time()-start))
+    finally:
+        if is_main_process() == True:
+            stop_checkpoint_writer()
+    
+    return loss_history
+
+def train_worker(rank, train_dataset, test_dataloader, epochs, shared_state, history_queue):
+    
+    # each process is pinned to its own set of consecutive cores
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(multiprocessing.cpu_count()))
+    thread_count = train_threads_per_process if train_threads_per_process > 0 else max(len(cores) // train_process_count, 1)
+    process_cores = cores[rank * thread_count:(rank + 1) * thread_count]
+    
+    if hasattr(os, "sched_setaffinity") and len(process_cores) > 0:
+        os.sched_setaffinity(0, process_cores)
+    
+    torch.set_num_threads(thread_count)
+    
+    dist.init_process_group("gloo", init_method="tcp://127.0.0.1:{}".format(train_master_port), rank=rank, world_size=train_process_count)
+    
+    # shards of equal size so that all processes run the same number of steps per epoch
+    shard_size = len(train_dataset) // train_process_count
+    train_shard = torch.utils.data.Subset(train_dataset, list(range(rank, shard_size * train_process_count, train_process_count)))
+    train_shard_loader = DataLoader(train_shard, batch_size=batch_size, shuffle=True)
+    
+    loss_history = train(train_shard_loader, test_dataloader, epochs)
+    
+    if rank == 0:
+        for name, tensor in rnn.state_dict().items():
+            shared_state[name].copy_(tensor)
+        
+        history_queue.put(loss_history)
+    
+    dist.destroy_process_group()
+
+def fork_supported():
+    """
+    the worker processes have to be forked, a spawned worker would rerun this whole script
+    fork doesn't exist on windows and is not safe together with the thread pools of torch on macos
+    """
+    
+    return "fork" in multiprocessing.get_all_start_methods() and sys.platform != "darwin"
+
+def train_distributed(train_dataset, test_dataloader, epochs):
+    """
+    data parallel training on the cpu with train_process_count worker processes
+    the processes are forked and start with the current model and optimizer, gradients are averaged after each step
+    the weights of the first process are copied back into rnn after training
+    only called if fork_supported() is True
+    """
+    
+    context = multiprocessing.get_context("fork")
+    
+    shared_state = { name: tensor.detach().clone().share_memory_() for name, tensor in rnn.state_dict().items() }
+    history_queue = context.Queue()
+    
+    processes = [ context.Process(target=train_worker, args=(rank, train_dataset, test_dataloader, epochs, shared_state, history_queue)) for rank in range(train_process_count) ]
+    
+    for process in processes:
+        process.start()
+    
+    # a worker that crashes leaves the others waiting in their collectives, the queue is polled and the exit codes are checked instead of waiting for the history
+    loss_history = None
+    processes_finished = False
+    
+    while loss_history is None:
         
-        print ('epoch {} : train: {:01.4f} test: {:01.4f} pos {:01.4f} time {:01.2f}'.format(epoch + 1, _train_loss_per_epoch, _test_loss_per_epoch, _pos_loss_per_epoch, time.time()-start))
+        try:
+            loss_history = history_queue.get(timeout=1.0)
+        except queue.Empty:
+            
+            failed_processes = [ (rank, process.exitcode) for rank, process in enumerate(processes) if process.exitcode is not None and process.exitcode != 0 ]
+            
+            if len(failed_processes) > 0 or processes_finished == True:
+                
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+                    process.join()
+                
+                if len(failed_processes) > 0:
+                    raise RuntimeError("training process {} exited with code {}".format(*failed_processes[0]))
+                
+                raise RuntimeError("training processes exited without a loss history")
+            
+            # the history might still be in transit when all processes have exited, it is polled once more
+            processes_finished = all(process.exitcode is not None for process in processes)
+    
+    for process in processes:
+        process.join()
+    
+    rnn.load_state_dict(shared_state)
     
     return loss_history
 
 # fit model
-loss_history = train(train_loader, test_loader, epochs)
+if train_process_count > 1 and fork_supported() == False:
+    print("data parallel training forks the worker processes, which is not supported on {}: training with a single process".format(sys.platform))
+    train_process_count = 1
+
+if train_process_count > 1 and device == 'cpu':
+    loss_history = train_distributed(train_dataset, test_loader, epochs)
+else:
+    loss_history = train(train_loader, test_loader, epochs)
 
 # save history
 utils.save_loss_as_csv(loss_history, "results/histories/rnn_history_{}.csv".format(epochs))
@@ -600,7 +851,7 @@ utils.save_loss_as_image(loss_history, "results/histories/rnn_history_{}.png".fo
 torch.save(rnn.state_dict(), "results/weights/rnn_weights_epoch_{}".format(epochs))
 
 # inference and rendering 
-poseRenderer = PoseRenderer(edge_list)
+poseRenderer = create_pose_renderer(edge_list, view_backend)
 
 def export_sequence_anim(pose_sequence, file_name):
 
@@ -634,6 +885,17 @@ def export_sequence_pkl(pose_sequence, file_name):
     
     with open(file_name, "wb") as f:
         pickle.dump(export_dict, f)
+
+def export_sequence_rec(pose_sequence, file_name):
+    
+    # same content as export_sequence_pkl, written as columnar recording directory
+    pose_count = pose_sequence.shape[0]
+    pose_sequence = np.reshape(pose_sequence, (pose_count, pose_dim))
+    
+    sensor_id = "/mocap/0/joint/pos2d_world" if joint_dim == 2 else "/mocap/0/joint/pos3d_world"
+    
+    with RecordingWriter(file_name, attributes={"class_id": 0}) as writer:
+        writer.append(sensor_id, np.arange(0, pose_count, 1) * (1.0 / mocap_fps), pose_sequence)
     
 def create_pred_sequence(pose_sequence, pose_count):
     
@@ -692,6 +954,7 @@ orig_sequence = all_motion_data[seq_index]["/mocap/0/joint/pos_root_zero"].astyp
 
 export_sequence_anim(orig_sequence[seq_start:seq_start+seq_length], "results/anims/orig_sequence_seq_start_{}_length_{}.gif".format(seq_start, seq_length))
 export_sequence_pkl(orig_sequence[seq_start:seq_start+seq_length], "results/anims/orig_sequence_seq_start_{}_length_{}.pkl".format(seq_start, seq_length))
+export_sequence_rec(orig_sequence[seq_start:seq_start+seq_length], "results/anims/orig_sequence_seq_start_{}_length_{}.rec".format(seq_start, seq_length))
 
 # create predicted sequence
 
@@ -704,3 +967,4 @@ pred_sequence = create_pred_sequence(orig_sequence[seq_start:seq_start+seq_input
 
 export_sequence_anim(pred_sequence, "results/anims/pred_sequence_epoch_{}_seq_start_{}_length_{}.gif".format(epochs, seq_start, seq_length))
 export_sequence_pkl(pred_sequence, "results/anims/pred_sequence_epoch_{}_seq_start_{}_length_{}.pkl".format(epochs, seq_start, seq_length))
+export_sequence_rec(pred_sequence, "results/anims/pred_sequence_epoch_{}_seq_start_{}_length_{}.rec".format(epochs, seq_start, seq_length))
@@ -0,0 +1,526 @@
+"""
+Batched sequence continuation
+Rolls out continuations from many seed start frames at once with a trained model and writes one file per seed
+
+Works with the models trained by rnn.py (joint rotations, BVH or FBX recordings, --data rot)
+and by rnn_pos.py (joint positions, pickled recordings or columnar recording directories, --data pos)
+
+Examples:
+python rnn_rollout.py --weights results/weights/rnn_weights_epoch_200 --mocap D:/Data/mocap/Daniel/Zed/fbx/daniel_zed_solo1.fbx --starts 1000 2000 3000 --length 1000 --formats fbx npz
+python rnn_rollout.py --weights results/weights/rnn_weights_epoch_200 --mocap D:/Data/mocap/Daniel/Zed/fbx/daniel_zed_solo1.fbx --start_grid 0 9000 90 --length 1000
+python rnn_rollout.py --representation repr6d --weights results/weights/rnn_weights_epoch_200 --mocap D:/Data/mocap/Daniel/Zed/fbx/daniel_zed_solo1.fbx --starts 1000 --formats bvh
+python rnn_rollout.py --data pos --weights results/weights/rnn_weights_epoch_200 --mocap mocap/Mocap_class_0_time_1724065746.5842216.pkl --mocap_config configs/Human36M_config.json --root_joint Bottom_Torso --starts 1000 --formats pkl
+"""
+
+import torch
+from torch import nn
+import numpy as np
+
+import os, sys, time, argparse, json, pickle
+import multiprocessing
+
+import motion_model
+
+from common import bvh_tools as bvh
+from common import fbx_tools as fbx
+from common import mocap_tools as mocap
+from common.quaternion import qmul, qrot
+from common.repr6d_torch import quat2repr6d, repr6d2quat
+from common.mocap_recording import load_motiondata
+
+"""
+Load mocap data
+"""
+
+def load_rot_corpus(mocap_files, mocap_pos_scale=1.0):
+    """
+    load BVH / FBX recordings the same way as rnn.py
+    returns the recordings (for export) and their joint rotation sequences (frames, joints, 4)
+    """
+
+    bvh_tools = bvh.BVH_Tools()
+    fbx_tools = fbx.FBX_Tools()
+    mocap_tools = mocap.Mocap_Tools()
+
+    all_mocap_data = []
+    all_pose_sequences = []
+
+    for mocap_file in mocap_files:
+
+        print("process file ", mocap_file)
+
+        if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+            bvh_data = bvh_tools.load(mocap_file)
+            mocap_data = mocap_tools.bvh_to_mocap(bvh_data)
+        elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+            fbx_data = fbx_tools.load(mocap_file)
+            mocap_data = mocap_tools.fbx_to_mocap(fbx_data)[0] # first skeleton only
+
+        mocap_data["skeleton"]["offsets"] *= mocap_pos_scale
+        mocap_data["motion"]["pos_local"] *= mocap_pos_scale
+
+        # set x and z offset of root joint to zero
+        mocap_data["skeleton"]["offsets"][0, 0] = 0.0
+        mocap_data["skeleton"]["offsets"][0, 2] = 0.0
+
+        if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+            mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat_bvh(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+        elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+            mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+
+        all_mocap_data.append(mocap_data)
+        all_pose_sequences.append(mocap_data["motion"]["rot_local"].astype(np.float32))
+
+    return all_mocap_data, all_pose_sequences
+
+def load_pos_corpus(mocap_files, mocap_config_file, mocap_sensor_id, mocap_root_joint_name):
+    """
+    load pickled recordings or columnar recording directories (see common/mocap_recording.py) the same way as rnn_pos.py
+    returns the skeleton, the root centered joint position sequences (frames, joints, joint_dim)
+    and the pose normalisation values computed over all recordings
+    """
+
+    with open(mocap_config_file) as f:
+        mocap_config = json.load(f)
+
+    skeleton_data = {}
+    skeleton_data["joints"] = mocap_config["jointNames"]
+    skeleton_data["root"] = skeleton_data["joints"][0]
+    skeleton_data["parents"] = mocap_config["jointParents"]
+    skeleton_data["children"] = mocap_config["jointChildren"]
+
+    root_joint_index = skeleton_data["joints"].index(mocap_root_joint_name)
+
+    all_pose_sequences = []
+
+    for mocap_file in mocap_files:
+
+        print("process file ", mocap_file)
+
+        joint_pos = load_motiondata(mocap_file, skeleton_data, [ mocap_sensor_id ])[mocap_sensor_id]
+
+        # set root position to zero
+        joint_pos = joint_pos - joint_pos[:, root_joint_index:root_joint_index+1, :]
+
+        all_pose_sequences.append(joint_pos)
+
+    pose_sequence_all = np.concatenate(all_pose_sequences, axis=0)
+
+    pose_mean = np.mean(pose_sequence_all, axis=0).flatten()
+    pose_std = np.std(pose_sequence_all, axis=0).flatten()
+
+    return skeleton_data, all_pose_sequences, pose_mean, pose_std
+
+"""
+Seeds
+"""
+
+def create_seeds(all_pose_sequences, seq_indices, starts, seq_input_length, pose_count=0):
+    """
+    returns a list of (seq_index, start frame) for all start frames and sequences,
+    start frames that don't leave room for the seed window (and the pose_count reference frames) are skipped
+    """
+
+    seeds = []
+
+    for seq_index in seq_indices:
+
+        frame_count = all_pose_sequences[seq_index].shape[0]
+
+        for start in starts:
+            if start >= 0 and start + seq_input_length + pose_count <= frame_count:
+                seeds.append((seq_index, start))
+            else:
+                print("skip seed seq ", seq_index, " start ", start)
+
+    return seeds
+
+def create_seed_windows(all_pose_sequences, seeds, seq_input_length):
+    """
+    returns the seed windows as one array (seed count, seq_input_length, pose_dim)
+    """
+
+    windows = [ all_pose_sequences[seq_index][start:start+seq_input_length] for seq_index, start in seeds ]
+    windows = np.stack(windows, axis=0)
+    windows = np.reshape(windows, (windows.shape[0], seq_input_length, -1))
+
+    return windows.astype(np.float32)
+
+"""
+Rollout
+"""
+
+def poses_to_model(poses, representation):
+    """
+    convert quaternion poses (*, J * 4) into the model input (*, J * D)
+    D is 4 for models trained on quaternions and 6 for models trained on the 6d representation (pose_representation in rnn.py)
+    """
+
+    if representation == "repr6d":
+        poses = quat2repr6d(poses.reshape(poses.shape[:-1] + (-1, 4)))
+        return poses.reshape(poses.shape[:-2] + (-1, ))
+
+    return poses
+
+def poses_to_quat(pred_poses, representation):
+    """
+    convert model predictions (*, J * D) into unit quaternion poses (*, J * 4)
+    """
+
+    if representation == "repr6d":
+        poses = repr6d2quat(pred_poses.reshape(pred_poses.shape[:-1] + (-1, 6)))
+    else:
+        poses = nn.functional.normalize(pred_poses.reshape(pred_poses.shape[:-1] + (-1, 4)), p=2, dim=-1)
+
+    return poses.reshape(poses.shape[:-2] + (-1, ))
+
+def rollout(model, seed_windows, pose_count, joint_dim, pose_mean=None, pose_std=None, batch_size=256, stateful=False, device="cpu", representation="quat"):
+    """
+    continue all seed windows (seed count, seq_input_length, pose_dim) by pose_count poses
+    the seeds are rolled out in batches of batch_size, all poses of a batch are predicted with one model call per frame
+    joint_dim == 4: predicted poses are converted to unit quaternions per joint (rnn.py), the windows are converted
+                    to the representation the model was trained with before each model call
+    pose_mean / pose_std: model input and output are normalized with these values (rnn_pos.py)
+    stateful: only the last predicted pose is fed to the model which continues from its LSTM state,
+              this is much faster but differs from training where the model always sees a full window
+    returns the predicted poses (seed count, pose_count, pose_dim)
+    """
+
+    model.eval()
+
+    seed_count, seq_input_length, pose_dim = seed_windows.shape
+
+    if pose_mean is not None:
+        pose_mean = torch.tensor(pose_mean, dtype=torch.float32).reshape(1, 1, -1).to(device)
+        pose_std = torch.tensor(pose_std, dtype=torch.float32).reshape(1, 1, -1).to(device)
+
+    pred_sequences = np.empty((seed_count, pose_count, pose_dim), dtype=np.float32)
+
+    for bI in range(0, seed_count, batch_size):
+
+        next_seq = torch.from_numpy(seed_windows[bI:bI+batch_size]).to(device)
+        batch_count = next_seq.shape[0]
+
+        pred_poses = torch.empty((batch_count, pose_count, pose_dim), dtype=torch.float32, device=device)
+
+        state = None
+
+        with torch.no_grad():
+
+            for pI in range(pose_count):
+
+                if stateful == True and state is not None:
+                    model_input = next_seq[:, -1:]
+                else:
+                    model_input = next_seq
+
+                if pose_mean is not None:
+                    model_input = torch.nan_to_num((model_input - pose_mean) / pose_std)
+
+                if joint_dim == 4:
+                    model_input = poses_to_model(model_input, representation)
+
+                if stateful == True:
+                    pred_pose, state = model.forward_state(model_input, state)
+                else:
+                    pred_pose = model(model_input)
+
+                if pose_mean is not None:
+                    pred_pose = pred_pose * pose_std[:, 0] + pose_mean[:, 0]
+
+                if joint_dim == 4:
+                    pred_pose = poses_to_quat(pred_pose, representation)
+
+                pred_poses[:, pI] = pred_pose
+
+                next_seq = torch.cat([next_seq[:, 1:], pred_pose.unsqueeze(1)], dim=1)
+
+        pred_sequences[bI:bI+batch_count] = pred_poses.cpu().numpy()
+
+    return pred_sequences
+
+"""
+Joint positions
+"""
+
+def forward_kinematics(rotations, root_positions, offsets, parents, children):
+    """
+    Perform forward kinematics using the given trajectory and local rotations.
+    Arguments (where N = batch size, L = sequence length, J = number of joints):
+     -- rotations: (N, L, J, 4) tensor of unit quaternions describing the local rotations of each joint.
+     -- root_positions: (N, L, 3) tensor describing the root joint positions.
+    """
+
+    assert len(rotations.shape) == 4
+    assert rotations.shape[-1] == 4
+
+    toffsets = torch.tensor(offsets, dtype=torch.float32).to(rotations.device)
+
+    positions_world = []
+    rotations_world = []
+
+    expanded_offsets = toffsets.expand(rotations.shape[0], rotations.shape[1], offsets.shape[0], offsets.shape[1])
+
+    # Parallelize along the batch and time dimensions
+    for jI in range(offsets.shape[0]):
+        if parents[jI] == -1:
+            positions_world.append(root_positions)
+            rotations_world.append(rotations[:, :, jI])
+        else:
+            positions_world.append(qrot(rotations_world[parents[jI]], expanded_offsets[:, :, jI]) \
+                                   + positions_world[parents[jI]])
+            if len(children[jI]) > 0:
+                rotations_world.append(qmul(rotations_world[parents[jI]], rotations[:, :, jI]))
+            else:
+                # This joint is a terminal node -> it would be useless to compute the transformation
+                rotations_world.append(None)
+
+    return torch.stack(positions_world, dim=3).permute(0, 1, 3, 2)
+
+def joint_positions(pose_sequences, corpus, device="cpu"):
+    """
+    joint positions (N, L, joints, 3) of pose sequences (N, L, joints, joint_dim)
+    joint rotations are converted with forward kinematics, joint positions are returned as they are
+    """
+
+    if corpus["data"] == "pos":
+        return pose_sequences
+
+    skeleton = corpus["skeleton"]
+
+    rotations = torch.from_numpy(np.ascontiguousarray(pose_sequences, dtype=np.float32)).to(device)
+    zero_trajectory = torch.zeros((rotations.shape[0], rotations.shape[1], 3), dtype=torch.float32).to(device)
+
+    with torch.no_grad():
+        positions = forward_kinematics(rotations, zero_trajectory, skeleton["offsets"].astype(np.float32), skeleton["parents"], skeleton["children"])
+
+    return positions.cpu().numpy()
+
+"""
+Export
+"""
+
+def export_rollout(export_job):
+    """
+    write one predicted sequence, runs in a worker process
+    export_job: (pred_sequence, file_name, file_format, export_data)
+    """
+
+    pred_sequence, file_name, file_format, export_data = export_job
+
+    if file_format == "npz":
+        np.savez(file_name, pred_sequence=pred_sequence, seq_index=export_data["seq_index"], seq_start=export_data["seq_start"])
+
+    elif file_format == "pkl" and export_data["data"] == "pos":
+
+        # same format as the recordings and as export_sequence_pkl in rnn_pos.py
+        pose_count = pred_sequence.shape[0]
+
+        export_dict = {}
+        export_dict["class_id"] = 0
+        export_dict["sensor_ids"] = [ export_data["sensor_id"] ] * pose_count
+        export_dict["sensor_values"] = np.reshape(pred_sequence, (pose_count, -1)).tolist()
+        export_dict["time_stamps"] = (np.arange(0, pose_count, 1) * (1.0 / export_data["fps"])).tolist()
+
+        with open(file_name, "wb") as f:
+            pickle.dump(export_dict, f)
+
+    elif file_format == "pkl":
+
+        export_dict = {}
+        export_dict["skeleton"] = export_data["skeleton"]
+        export_dict["rot_local"] = pred_sequence
+        export_dict["seq_index"] = export_data["seq_index"]
+        export_dict["seq_start"] = export_data["seq_start"]
+
+        with open(file_name, "wb") as f:
+            pickle.dump(export_dict, f)
+
+    elif file_format == "bvh" or file_format == "fbx":
+
+        # same as export_sequence_bvh and export_sequence_fbx in rnn.py
+        mocap_tools = mocap.Mocap_Tools()
+
+        pose_count = pred_sequence.shape[0]
+
+        pred_dataset = {}
+        pred_dataset["frame_rate"] = export_data["frame_rate"]
+        pred_dataset["rot_sequence"] = export_data["rot_sequence"]
+        pred_dataset["skeleton"] = export_data["skeleton"]
+        pred_dataset["motion"] = {}
+        pred_dataset["motion"]["pos_local"] = np.repeat(np.expand_dims(pred_dataset["skeleton"]["offsets"], axis=0), pose_count, axis=0)
+        pred_dataset["motion"]["rot_local"] = pred_sequence
+
+        if file_format == "bvh":
+            pred_dataset["motion"]["rot_local_euler"] = mocap_tools.quat_to_euler_bvh(pred_dataset["motion"]["rot_local"], pred_dataset["rot_sequence"])
+            bvh.BVH_Tools().write(mocap_tools.mocap_to_bvh(pred_dataset), file_name)
+        else:
+            pred_dataset["motion"]["rot_local_euler"] = mocap_tools.quat_to_euler(pred_dataset["motion"]["rot_local"], pred_dataset["rot_sequence"])
+            fbx.FBX_Tools().write(mocap_tools.mocap_to_fbx([pred_dataset]), file_name)
+
+    return file_name
+
+def export_rollouts(pred_sequences, seeds, file_formats, output_path, file_prefix, export_data, worker_count):
+    """
+    write all predicted sequences (seed count, pose_count, joints, joint_dim) using a pool of worker processes
+    """
+
+    export_jobs = []
+
+    for sI, (seq_index, seq_start) in enumerate(seeds):
+
+        seed_export_data = dict(export_data)
+        seed_export_data["seq_index"] = seq_index
+        seed_export_data["seq_start"] = seq_start
+
+        for file_format in file_formats:
+            file_name = os.path.join(output_path, "{}_seq_{}_start_{}_length_{}.{}".format(file_prefix, seq_index, seq_start, pred_sequences.shape[1], file_format))
+            export_jobs.append((pred_sequences[sI], file_name, file_format, seed_export_data))
+
+    if worker_count > 1:
+        with multiprocessing.Pool(worker_count) as pool:
+            file_names = pool.map(export_rollout, export_jobs)
+    else:
+        file_names = [ export_rollout(export_job) for export_job in export_jobs ]
+
+    return file_names
+
+"""
+Command line
+"""
+
+def create_argument_parser(description, weights_help="model weights saved during training"):
+    """
+    arguments shared by the command line tools that roll out a trained model
+    """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument("--data", choices=["rot", "pos"], default="rot", help="rot: joint rotations (rnn.py), pos: joint positions (rnn_pos.py)")
+    parser.add_argument("--representation", choices=["quat", "repr6d"], default="quat", help="rotation representation the model was trained with, pose_representation in rnn.py (--data rot only)")
+    parser.add_argument("--weights", required=True, help=weights_help)
+    parser.add_argument("--mocap", nargs="+", required=True, help="mocap files of the corpus")
+    parser.add_argument("--mocap_pos_scale", type=float, default=1.0)
+    parser.add_argument("--mocap_config", default="configs/Human36M_config.json", help="skeleton config (--data pos only)")
+    parser.add_argument("--sensor_id", default="/mocap/0/joint/pos3d_world", help="joint position sensor (--data pos only)")
+    parser.add_argument("--root_joint", default="Bottom_Torso", help="root joint name (--data pos only)")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate of the recordings (--data pos only)")
+    parser.add_argument("--node_dim", type=int, default=512)
+    parser.add_argument("--layer_count", type=int, default=2)
+    parser.add_argument("--input_length", type=int, default=64)
+    parser.add_argument("--seq_indices", type=int, nargs="+", default=None, help="indices of the mocap files to take seeds from, default all")
+    parser.add_argument("--length", type=int, default=1000, help="number of predicted frames per seed")
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--stateful", action="store_true", help="feed one frame per step and continue from the LSTM state")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+
+    return parser
+
+def load_corpus(args):
+    """
+    returns the pose sequences and the data needed for rollout and export
+    """
+
+    if args.data == "pos" and args.representation != "quat":
+        raise ValueError("--representation {} requires --data rot".format(args.representation))
+
+    corpus = {"data": args.data, "representation": args.representation}
+
+    if args.data == "rot":
+        all_mocap_data, all_pose_sequences = load_rot_corpus(args.mocap, args.mocap_pos_scale)
+
+        corpus["skeleton"] = all_mocap_data[0]["skeleton"]
+        corpus["frame_rate"] = all_mocap_data[0]["frame_rate"]
+        corpus["rot_sequence"] = all_mocap_data[0]["rot_sequence"]
+        corpus["fps"] = all_mocap_data[0]["frame_rate"]
+        corpus["pose_mean"] = None
+        corpus["pose_std"] = None
+    else:
+        skeleton_data, all_pose_sequences, pose_mean, pose_std = load_pos_corpus(args.mocap, args.mocap_config, args.sensor_id, args.root_joint)
+
+        corpus["skeleton"] = skeleton_data
+        corpus["sensor_id"] = args.sensor_id
+        corpus["fps"] = args.fps
+        corpus["pose_mean"] = pose_mean
+        corpus["pose_std"] = pose_std
+
+    corpus["joint_count"] = all_pose_sequences[0].shape[1]
+    corpus["joint_dim"] = all_pose_sequences[0].shape[2]
+
+    return all_pose_sequences, corpus
+
+def load_model(args, corpus, weights_path):
+
+    model_config = dict(motion_model.config)
+    model_config["input_length"] = args.input_length
+    model_config["data_dim"] = corpus["joint_count"] * (6 if corpus["representation"] == "repr6d" else corpus["joint_dim"])
+    model_config["node_dim"] = args.node_dim
+    model_config["layer_count"] = args.layer_count
+    model_config["device"] = args.device
+    model_config["weights_path"] = weights_path
+    model_config["representation"] = corpus["representation"]
+
+    return motion_model.createModel(model_config)
+
+def load_corpus_and_model(args):
+    """
+    returns the pose sequences, the model, and the data needed for rollout and export
+    """
+
+    all_pose_sequences, corpus = load_corpus(args)
+
+    model = load_model(args, corpus, args.weights)
+
+    return all_pose_sequences, model, corpus
+
+def main():
+
+    parser = create_argument_parser("roll out continuations for many seed start frames in one batched pass")
+
+    parser.add_argument("--starts", type=int, nargs="+", default=[], help="seed start frames")
+    parser.add_argument("--start_grid", type=int, nargs=3, default=None, metavar=("START", "STOP", "STEP"), help="seed start frames from a range")
+    parser.add_argument("--formats", nargs="+", choices=["bvh", "fbx", "pkl", "npz"], default=["npz"])
+    parser.add_argument("--output_path", default="results/rollouts")
+    parser.add_argument("--prefix", default="pred_sequence")
+    parser.add_argument("--workers", type=int, default=4, help="number of processes writing the output files")
+
+    args = parser.parse_args()
+
+    if args.data == "pos" and ("bvh" in args.formats or "fbx" in args.formats):
+        parser.error("bvh and fbx export requires --data rot")
+
+    all_pose_sequences, model, corpus = load_corpus_and_model(args)
+
+    starts = list(args.starts)
+    if args.start_grid is not None:
+        starts += list(range(*args.start_grid))
+
+    seq_indices = args.seq_indices if args.seq_indices is not None else list(range(len(all_pose_sequences)))
+
+    seeds = create_seeds(all_pose_sequences, seq_indices, starts, args.input_length)
+
+    if len(seeds) == 0:
+        print("no valid seeds")
+        return
+
+    seed_windows = create_seed_windows(all_pose_sequences, seeds, args.input_length)
+
+    print("roll out ", len(seeds), " seeds with ", args.length, " frames each")
+
+    start_time = time.time()
+
+    pred_sequences = rollout(model, seed_windows, args.length, corpus["joint_dim"], corpus["pose_mean"], corpus["pose_std"], args.batch_size, args.stateful, args.device, corpus["representation"])
+    pred_sequences = np.reshape(pred_sequences, (len(seeds), args.length, corpus["joint_count"], corpus["joint_dim"]))
+
+    print("rollout time ", time.time() - start_time)
+
+    os.makedirs(args.output_path, exist_ok=True)
+
+    start_time = time.time()
+
+    file_names = export_rollouts(pred_sequences, seeds, args.formats, args.output_path, args.prefix, corpus, args.workers)
+
+    print("wrote ", len(file_names), " files in ", time.time() - start_time)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Start frame survey
+Rolls out continuations from start frames across all clips of a corpus and detects automatically
+when each rollout collapses into stagnation or a periodic loop
+Writes a text report (grouped by clip, similar to docs/notes_for_different_starting_frames.txt)
+and a JSON index of the good seeds with their time to collapse
+
+Stagnation: the joint position variance within a window drops below a fraction of the typical variance of the corpus
+Periodicity: the normalised autocorrelation of the joint positions within a window has a peak above a threshold
+             for a lag between min_period and max_period
+
+Examples:
+python rnn_survey.py --weights results/weights/rnn_weights_epoch_200 --mocap D:/Data/mocap/Daniel/Zed/fbx/daniel_zed_solo1.fbx --start_step 100 --length 3000
+python rnn_survey.py --data pos --weights results/weights/rnn_weights_epoch_200 --mocap mocap/Mocap_class_0_time_1724065746.5842216.pkl --root_joint Bottom_Torso
+"""
+
+import torch
+import numpy as np
+
+import os, sys, time, json
+
+import rnn_rollout
+
+"""
+Collapse detection
+"""
+
+def windowed_variance(positions, window_length):
+    """
+    mean joint position variance in consecutive windows
+    positions: (N, L, joints, dim) -> (N, L // window_length)
+    """
+
+    seq_count, frame_count = positions.shape[:2]
+    window_count = frame_count // window_length
+
+    windows = positions[:, :window_count * window_length].reshape(seq_count, window_count, window_length, -1)
+
+    return np.mean(np.var(windows, axis=2), axis=2)
+
+def windowed_periodicity(positions, window_length, hop_length, min_lag, max_lag):
+    """
+    maximum normalised autocorrelation for lags between min_lag and max_lag in windows of window_length frames
+    that start every hop_length frames, values close to 1 mean that the motion repeats itself within the window
+    positions: (N, L, joints, dim) -> (N, window count)
+    """
+
+    seq_count, frame_count = positions.shape[:2]
+    positions = positions.reshape(seq_count, frame_count, -1)
+
+    window_starts = list(range(0, frame_count - window_length + 1, hop_length))
+
+    periodicity = np.zeros((seq_count, len(window_starts)), dtype=np.float32)
+
+    for wI, window_start in enumerate(window_starts):
+
+        x = positions[:, window_start:window_start+window_length]
+        x = x - np.mean(x, axis=1, keepdims=True)
+
+        # autocorrelation via fft, summed over all joint dimensions
+        x_fft = np.fft.rfft(x, n=2 * window_length, axis=1)
+        autocorr = np.fft.irfft(np.abs(x_fft) ** 2, axis=1)[:, :window_length]
+        autocorr = np.sum(autocorr, axis=2)
+
+        # normalise by the energy and by the number of overlapping frames per lag
+        lags = np.arange(min_lag, max_lag + 1)
+        autocorr = autocorr[:, lags] / np.maximum(autocorr[:, :1], 1e-12) * (window_length / (window_length - lags))
+
+        periodicity[:, wI] = np.max(autocorr, axis=1)
+
+    return periodicity
+
+def jitter(positions):
+    """
+    mean joint acceleration magnitude, shaky rollouts have a much higher value than the original recordings
+    positions: (N, L, joints, dim) -> (N)
+    """
+
+    acceleration = positions[:, 2:] - 2.0 * positions[:, 1:-1] + positions[:, :-2]
+
+    return np.mean(np.linalg.norm(acceleration, axis=-1), axis=(1, 2))
+
+def detect_collapse(positions, survey_settings, reference_variance):
+    """
+    returns per sequence the first collapsed frame (-1 if the sequence doesn't collapse) and the type of collapse
+    """
+
+    window_length = survey_settings["window_length"]
+    periodic_window_length = survey_settings["periodic_window_length"]
+
+    variance = windowed_variance(positions, window_length)
+    stagnant = variance < survey_settings["stagnation_threshold"] * reference_variance
+
+    periodicity = windowed_periodicity(positions, periodic_window_length, window_length, survey_settings["min_lag"], survey_settings["max_lag"])
+    periodic = periodicity > survey_settings["periodicity_threshold"]
+
+    collapse_frames = []
+    collapse_types = []
+
+    for sI in range(positions.shape[0]):
+
+        # a collapse has to last for a few windows, single quiet or repetitive windows are part of normal dancing
+        stagnant_frame = _first_run(stagnant[sI], survey_settings["collapse_windows"]) * window_length
+        periodic_frame = _first_run(periodic[sI], survey_settings["collapse_windows"]) * window_length
+
+        if stagnant_frame < 0 and periodic_frame < 0:
+            collapse_frames.append(-1)
+            collapse_types.append("none")
+        elif periodic_frame < 0 or (stagnant_frame >= 0 and stagnant_frame <= periodic_frame):
+            collapse_frames.append(stagnant_frame)
+            collapse_types.append("stagnation")
+        else:
+            collapse_frames.append(periodic_frame)
+            collapse_types.append("loop")
+
+    return collapse_frames, collapse_types
+
+def _first_run(flags, run_length):
+    """
+    index of the first of run_length consecutive true values, -1 if there is none
+    """
+
+    count = 0
+
+    for fI, flag in enumerate(flags):
+        count = count + 1 if flag else 0
+
+        if count == run_length:
+            return fI - run_length + 1
+
+    return -1
+
+"""
+Report
+"""
+
+def format_time(seconds):
+    return "{} mins {} secs".format(int(seconds // 60), int(seconds % 60))
+
+def write_report(results, mocap_files, survey_settings, file_name):
+
+    with open(file_name, "w") as f:
+
+        f.write("Start frame survey\n\n")
+        f.write("rollout length {} frames ({})\n".format(survey_settings["length"], format_time(survey_settings["length"] / survey_settings["fps"])))
+        f.write("good seeds: no collapse within {}\n".format(format_time(min(survey_settings["min_good_seconds"], survey_settings["length"] / survey_settings["fps"]))))
+
+        for seq_index, mocap_file in enumerate(mocap_files):
+
+            seq_results = [ result for result in results if result["seq_index"] == seq_index ]
+
+            if len(seq_results) == 0:
+                continue
+
+            f.write("\n{}\n".format(os.path.basename(mocap_file)))
+
+            for result in seq_results:
+
+                if result["collapse_type"] == "none":
+                    description = "no collapse"
+                elif result["collapse_type"] == "stagnation":
+                    description = "stagnation after {}".format(format_time(result["time_to_collapse"]))
+                else:
+                    description = "enters loop after {}".format(format_time(result["time_to_collapse"]))
+
+                if result["jitter"] > survey_settings["jitter_threshold"]:
+                    description += ", shaky"
+
+                if result["good"] == True:
+                    description += ", good"
+
+                f.write("{}: {}\n".format(result["start"], description))
+
+def write_index(results, mocap_files, survey_settings, file_name):
+
+    good_seeds = [ result for result in results if result["good"] == True ]
+    good_seeds = sorted(good_seeds, key=lambda result: -result["time_to_collapse"])
+
+    index = {"settings": survey_settings,
+             "mocap_files": mocap_files,
+             "good_seeds": good_seeds,
+             "all_seeds": results}
+
+    with open(file_name, "w") as f:
+        json.dump(index, f, indent=4)
+
+"""
+Command line
+"""
+
+def main():
+
+    parser = rnn_rollout.create_argument_parser("survey start frames for stagnation and loops")
+
+    parser.add_argument("--start_step", type=int, default=100, help="distance in frames between surveyed start frames")
+    parser.add_argument("--window_seconds", type=float, default=1.0, help="window for the variance test")
+    parser.add_argument("--periodic_window_seconds", type=float, default=6.0, help="window for the autocorrelation test")
+    parser.add_argument("--min_period_seconds", type=float, default=0.3)
+    parser.add_argument("--max_period_seconds", type=float, default=3.0)
+    parser.add_argument("--stagnation_threshold", type=float, default=0.05, help="fraction of the median windowed variance of the corpus")
+    parser.add_argument("--periodicity_threshold", type=float, default=0.9)
+    parser.add_argument("--jitter_threshold", type=float, default=2.0, help="multiple of the jitter of the corpus above which a rollout is shaky")
+    parser.add_argument("--collapse_windows", type=int, default=3, help="number of consecutive windows that make a collapse")
+    parser.add_argument("--min_good_seconds", type=float, default=60.0)
+    parser.add_argument("--output_path", default="results/survey")
+
+    args = parser.parse_args()
+
+    all_pose_sequences, model, corpus = rnn_rollout.load_corpus_and_model(args)
+
+    fps = float(corpus["fps"])
+
+    survey_settings = {"length": args.length,
+                       "fps": fps,
+                       "start_step": args.start_step,
+                       "window_length": max(int(args.window_seconds * fps), 2),
+                       "periodic_window_length": int(args.periodic_window_seconds * fps),
+                       "min_lag": max(int(args.min_period_seconds * fps), 1),
+                       "max_lag": int(args.max_period_seconds * fps),
+                       "stagnation_threshold": args.stagnation_threshold,
+                       "periodicity_threshold": args.periodicity_threshold,
+                       "jitter_threshold": args.jitter_threshold,
+                       "collapse_windows": args.collapse_windows,
+                       "min_good_seconds": args.min_good_seconds,
+                       "stateful": args.stateful}
+
+    # reference statistics of the original recordings
+
+    reference_positions = [ rnn_rollout.joint_positions(np.expand_dims(pose_sequence, axis=0), corpus, args.device) for pose_sequence in all_pose_sequences ]
+
+    reference_variance = np.median(np.concatenate([ windowed_variance(positions, survey_settings["window_length"]).flatten() for positions in reference_positions ]))
+    reference_jitter = np.mean([ jitter(positions)[0] for positions in reference_positions ])
+
+    print("reference variance ", reference_variance, " jitter ", reference_jitter)
+
+    # seeds
+
+    seq_indices = args.seq_indices if args.seq_indices is not None else list(range(len(all_pose_sequences)))
+
+    seeds = []
+    for seq_index in seq_indices:
+        starts = list(range(0, all_pose_sequences[seq_index].shape[0] - args.input_length, args.start_step))
+        seeds += rnn_rollout.create_seeds(all_pose_sequences, [ seq_index ], starts, args.input_length)
+
+    print("survey ", len(seeds), " seeds with ", args.length, " frames each")
+
+    # rollout and analysis, one batch at a time so that the rollouts don't need to be kept in memory
+
+    # seeds that don't collapse within a rollout shorter than min_good_seconds are good as well
+    min_good_seconds = min(args.min_good_seconds, args.length / fps)
+
+    results = []
+
+    start_time = time.time()
+
+    for bI in range(0, len(seeds), args.batch_size):
+
+        batch_seeds = seeds[bI:bI+args.batch_size]
+
+        seed_windows = rnn_rollout.create_seed_windows(all_pose_sequences, batch_seeds, args.input_length)
+
+        pred_sequences = rnn_rollout.rollout(model, seed_windows, args.length, corpus["joint_dim"], corpus["pose_mean"], corpus["pose_std"], args.batch_size, args.stateful, args.device, corpus["representation"])
+        pred_sequences = np.reshape(pred_sequences, (len(batch_seeds), args.length, corpus["joint_count"], corpus["joint_dim"]))
+
+        positions = rnn_rollout.joint_positions(pred_sequences, corpus, args.device)
+
+        collapse_frames, collapse_types = detect_collapse(positions, survey_settings, reference_variance)
+        jitters = jitter(positions) / reference_jitter
+
+        for sI, (seq_index, start) in enumerate(batch_seeds):
+
+            collapse_frame = collapse_frames[sI] if collapse_frames[sI] >= 0 else args.length
+            time_to_collapse = float(collapse_frame / fps)
+
+            results.append({"seq_index": seq_index,
+                            "file": args.mocap[seq_index],
+                            "start": start,
+                            "collapse_type": collapse_types[sI],
+                            "collapse_frame": collapse_frames[sI],
+                            "time_to_collapse": time_to_collapse,
+                            "jitter": float(jitters[sI]),
+                            "good": bool(time_to_collapse >= min_good_seconds and jitters[sI] <= args.jitter_threshold)})
+
+        print("seeds ", min(bI + args.batch_size, len(seeds)), " / ", len(seeds), " time ", time.time() - start_time)
+
+    os.makedirs(args.output_path, exist_ok=True)
+
+    write_report(results, args.mocap, survey_settings, os.path.join(args.output_path, "survey_report.txt"))
+    write_index(results, args.mocap, survey_settings, os.path.join(args.output_path, "good_seeds.json"))
+
+    print("good seeds ", sum([ result["good"] for result in results ]), " / ", len(results))
+
+if __name__ == "__main__":
+    main()
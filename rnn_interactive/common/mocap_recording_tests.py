@@ -0,0 +1,160 @@
+from unittest import TestCase
+import numpy as np
+import tempfile
+import pickle
+import os
+
+import common.mocap_recording as mrec
+
+class RecordingTestCase(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        self.skeleton_data = {"joints": ["joint{}".format(jI) for jI in range(17)]}
+        self.mocap_sensor_ids = ["pos2d_world", "pos3d_world", "visibility"]
+
+        # interleaved messages of several senders, including an address that matches no sensor
+        addresses = [ ("/mocap/0/joint/pos2d_world", 34), ("/mocap/1/joint/pos3d_world", 51), ("/mocap/0/joint/visibility", 17), ("/mocap/0/joint/pos2d_screen", 34) ]
+        address_indices = rng.integers(0, len(addresses), size=500)
+
+        self.mocap_recording = {}
+        self.mocap_recording["sensor_ids"] = [ addresses[aI][0] for aI in address_indices ]
+        self.mocap_recording["sensor_values"] = [ rng.standard_normal(addresses[aI][1]).tolist() for aI in address_indices ]
+        self.mocap_recording["time_stamps"] = list(np.arange(len(address_indices)) * 0.01)
+
+    def reference(self):
+        # per sensor scan over the whole recording as done by the original training scripts
+        joint_count = len(self.skeleton_data["joints"])
+        sensor_ids = self.mocap_recording["sensor_ids"]
+        sensor_values = self.mocap_recording["sensor_values"]
+
+        motion_data = {}
+
+        for sensor_id in self.mocap_sensor_ids:
+            values = np.array([ sensor_values[vI] for vI in range(len(sensor_values)) if sensor_ids[vI].endswith(sensor_id) ], dtype=np.float32)
+            motion_data[sensor_id] = np.reshape(values, (values.shape[0], joint_count, -1))
+
+        return motion_data
+
+class TestRecordingToMotiondata(RecordingTestCase):
+
+    def test_chunk_sizes(self):
+
+        expected = self.reference()
+
+        for chunk_size in [1, 7, 100000, None]:
+            motion_data = mrec.recording_to_motiondata(self.mocap_recording, self.skeleton_data, self.mocap_sensor_ids, chunk_size=chunk_size)
+
+            self.assertEqual(list(motion_data.keys()), self.mocap_sensor_ids)
+
+            for sensor_id in self.mocap_sensor_ids:
+                self.assertEqual(motion_data[sensor_id].dtype, np.float32)
+                np.testing.assert_array_equal(motion_data[sensor_id], expected[sensor_id], err_msg="{} chunk size {}".format(sensor_id, chunk_size))
+
+    def test_missing_sensor(self):
+
+        motion_data = mrec.recording_to_motiondata(self.mocap_recording, self.skeleton_data, ["pos2d_world", "rot_world"])
+
+        self.assertEqual(motion_data["rot_world"].shape[0], 0)
+        self.assertEqual(motion_data["pos2d_world"].shape[1:], (17, 2))
+
+    def test_sensor_codes(self):
+
+        codes = mrec.sensor_codes(self.mocap_recording["sensor_ids"], self.mocap_sensor_ids, chunk_size=3)
+        expected = [ next((sI for sI, sensor_id in enumerate(self.mocap_sensor_ids) if address.endswith(sensor_id)), -1) for address in self.mocap_recording["sensor_ids"] ]
+
+        np.testing.assert_array_equal(codes, expected)
+
+class TestColumnarRecording(RecordingTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.recording_path = os.path.join(self.temp_dir.name, "recording.rec")
+
+        self.mocap_recording["class_id"] = 3
+        mrec.write_recording(self.mocap_recording, self.recording_path, chunk_size=16, message_chunk_size=50)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_columns(self):
+
+        recording = mrec.Recording(self.recording_path)
+
+        self.assertEqual(set(recording.sensor_ids), set(self.mocap_recording["sensor_ids"]))
+        self.assertEqual(recording.attributes["class_id"], 3)
+
+        for address in recording.sensor_ids:
+            message_indices = [ vI for vI, sensor_id in enumerate(self.mocap_recording["sensor_ids"]) if sensor_id == address ]
+            time_stamps, values = recording.read(address)
+
+            self.assertEqual(recording.frame_count(address), len(message_indices))
+            np.testing.assert_array_equal(time_stamps, np.array(self.mocap_recording["time_stamps"])[message_indices])
+            np.testing.assert_array_equal(values, np.array([ self.mocap_recording["sensor_values"][vI] for vI in message_indices ], dtype=np.float32))
+
+    def test_load_motiondata(self):
+
+        expected = self.reference()
+        motion_data = mrec.load_motiondata(self.recording_path, self.skeleton_data, self.mocap_sensor_ids)
+
+        for sensor_id in self.mocap_sensor_ids:
+            np.testing.assert_array_equal(motion_data[sensor_id], expected[sensor_id])
+
+    def test_merged_addresses(self):
+
+        # two senders with the same sensor, their frames are merged in the order of arrival
+        self.mocap_recording["sensor_ids"] = [ address.replace("/mocap/0/", "/mocap/{}/".format(vI % 2)) if address.endswith("pos2d_world") else address for vI, address in enumerate(self.mocap_recording["sensor_ids"]) ]
+        self.mocap_sensor_ids = ["joint/pos2d_world", "visibility"]
+
+        mrec.write_recording(self.mocap_recording, self.recording_path + "2", chunk_size=16)
+
+        expected = self.reference()
+        motion_data = mrec.load_motiondata(self.recording_path + "2", self.skeleton_data, self.mocap_sensor_ids)
+
+        for sensor_id in self.mocap_sensor_ids:
+            np.testing.assert_array_equal(motion_data[sensor_id], expected[sensor_id])
+
+    def test_time_range(self):
+
+        start_time, end_time = 1.234, 3.5
+
+        recording = self.mocap_recording
+        selected = [ vI for vI, time_stamp in enumerate(recording["time_stamps"]) if start_time <= time_stamp < end_time ]
+        self.mocap_recording = { key: [ recording[key][vI] for vI in selected ] for key in ["sensor_ids", "sensor_values", "time_stamps"] }
+        expected = self.reference()
+
+        pickle_file = os.path.join(self.temp_dir.name, "recording.pkl")
+        with open(pickle_file, "wb") as f:
+            pickle.dump(recording, f)
+
+        for path in [self.recording_path, pickle_file]:
+            motion_data = mrec.load_motiondata(path, self.skeleton_data, self.mocap_sensor_ids, start_time=start_time, end_time=end_time)
+
+            for sensor_id in self.mocap_sensor_ids:
+                np.testing.assert_array_equal(motion_data[sensor_id], expected[sensor_id], err_msg=path)
+
+    def test_memory_map(self):
+
+        recording = mrec.Recording(self.recording_path)
+        address = recording.sensor_ids[0]
+        chunk_start, chunk_end = recording.sensors[address]["chunks"][1]["start_time"], recording.sensors[address]["chunks"][1]["end_time"]
+
+        # a range inside one chunk is a view of the mapped file
+        time_stamps, values = recording.read(address, chunk_start, chunk_end)
+
+        self.assertIsInstance(values.base, np.memmap)
+        self.assertEqual(len(time_stamps), recording.sensors[address]["chunks"][1]["frame_count"] - 1)
+
+    def test_interrupted_writer(self):
+
+        writer = mrec.RecordingWriter(self.recording_path + "3", chunk_size=4)
+        writer.append("/mocap/0/joint/visibility", np.arange(10) * 0.1, np.ones((10, 17)))
+
+        # the full chunks are readable before the writer is closed
+        self.assertEqual(mrec.Recording(self.recording_path + "3").frame_count("/mocap/0/joint/visibility"), 8)
+
+        writer.close()
+        self.assertEqual(mrec.Recording(self.recording_path + "3").frame_count("/mocap/0/joint/visibility"), 10)
@@ -0,0 +1,71 @@
+from unittest import TestCase
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+
+from common.pose_renderer import PoseRenderer, PoseRasterizer, create_pose_renderer
+
+class TestPoseRenderer(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        parents = [-1, 0, 1, 2, 0, 4, 5, 0, 7]
+        self.renderer = PoseRenderer([ [parent, joint] for joint, parent in enumerate(parents) if parent >= 0 ])
+
+        self.poses = np.cumsum(rng.standard_normal((6, len(parents), 3)), axis=0) + rng.standard_normal((1, len(parents), 3)) * 10.0
+        self.view_settings = (self.poses.min(axis=(0, 1)), self.poses.max(axis=(0, 1)), 0.0, 90.0, 2.0, 2, 2)
+
+    def test_pose_images(self):
+
+        # the images rendered with reused artists and a restored background are identical to a full draw of each pose
+        images = self.renderer.create_pose_images(self.poses, *self.view_settings)
+
+        self.assertEqual(len(images), len(self.poses))
+
+        for pose, image in zip(self.poses, images):
+            self.assertEqual(image.mode, "RGBA")
+            np.testing.assert_array_equal(np.asarray(image), np.asarray(self.renderer.create_pose_image(pose, *self.view_settings)))
+
+    def test_frames_are_copies(self):
+
+        images = self.renderer.create_pose_images(self.poses[:2], *self.view_settings)
+
+        self.assertFalse(np.array_equal(np.asarray(images[0]), np.asarray(images[1])))
+
+    def test_grid_image(self):
+
+        images = self.renderer.create_pose_images(self.poses[:4], *self.view_settings)
+        grid_image = self.renderer.create_grid_image(images, (2, 2))
+
+        self.assertEqual(grid_image.size, (400, 400))
+
+
+class TestPoseRasterizer(TestPoseRenderer):
+
+    def setUp(self):
+        super().setUp()
+
+        self.renderer = PoseRasterizer(self.renderer.edge_data)
+
+    def test_batches(self):
+
+        images = self.renderer.create_pose_images(self.poses, *self.view_settings, batch_size=4)
+
+        for image, batch_image in zip(self.renderer.create_pose_images(self.poses, *self.view_settings), images):
+            np.testing.assert_array_equal(np.asarray(image), np.asarray(batch_image))
+
+    def test_joints_are_drawn(self):
+
+        image = np.asarray(self.renderer.create_pose_image(self.poses[0], *self.view_settings))
+        positions = self.renderer.project(self.poses[:1], *self.view_settings[:4], image.shape[1], image.shape[0])[0]
+
+        for x, y in np.round(positions).astype(np.int64):
+            if 0 <= x < image.shape[1] and 0 <= y < image.shape[0]:
+                self.assertTrue(np.all(image[y, x, :3] < 255))
+
+    def test_backend(self):
+
+        self.assertIsInstance(create_pose_renderer(self.renderer.edge_data, "raster"), PoseRasterizer)
+        self.assertNotIsInstance(create_pose_renderer(self.renderer.edge_data), PoseRasterizer)
+        self.assertRaises(ValueError, create_pose_renderer, self.renderer.edge_data, "opengl")
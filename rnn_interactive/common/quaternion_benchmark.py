@@ -0,0 +1,394 @@
+"""
+benchmark and equivalence check of the quaternion and dual quaternion kernels
+in quaternion.py, quaternion_np.py, quaternion_torch.py, dualquat_np.py and dualquat_torch.py
+
+every kernel (qmul, qrot, slerp, quat2euler, euler2quat, dq_mul, dq_sclerp, dq_hierarchy) is timed for all implementations
+over batch sizes from 1 to 1e6, the fastest implementation per batch size is marked with *
+the outputs of all implementations are compared with the first implementation of the kernel (the reference)
+and the maximum absolute difference is reported, differences above the tolerance of the kernel are marked with !
+
+implementations that only work on a single item are called in a python loop and skipped for batch sizes above loop_max_size
+for dq_hierarchy the batch size is the number of joints (frames x joints of the hierarchy_parents skeleton)
+
+Examples:
+python -m common.quaternion_benchmark
+python -m common.quaternion_benchmark --kernels qmul slerp --sizes 1 1000 1000000 --output results/quaternion_benchmark.json
+"""
+
+import torch
+import numpy as np
+
+import time, json, argparse
+
+import common.quaternion as quat
+import common.quaternion_np as nquat
+import common.quaternion_torch as tquat
+import common.dualquat_np as ndquat
+import common.dualquat_torch as tdquat
+
+"""
+Inputs
+"""
+
+def random_quats(size, rng):
+    """
+    random unit quaternions (size, 4)
+    """
+
+    q = rng.normal(size=(size, 4)).astype(np.float32)
+
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def random_dualquats(size, rng):
+    """
+    random unit dual quaternions (size, 8) from a random rotation and translation
+    """
+
+    q_r = random_quats(size, rng)
+    v_t = rng.uniform(-1.0, 1.0, size=(size, 3)).astype(np.float32)
+
+    q_d = nquat.mul(0.5 * np.concatenate((np.zeros((size, 1), dtype=np.float32), v_t), axis=-1), q_r)
+
+    return np.concatenate((q_r, q_d), axis=-1)
+
+def slerp_inputs(size, rng):
+
+    q0 = random_quats(size, rng)
+    q1 = random_quats(size, rng)
+
+    t = rng.uniform(0.0, 1.0, size=size).astype(np.float32)
+
+    return q0, q1, t
+
+def euler_inputs(size, rng):
+
+    q = random_quats(size * 2, rng)
+
+    # the euler angles near gimbal lock are ill conditioned
+    q = q[np.abs(2.0 * (q[:, 1] * q[:, 3] + q[:, 0] * q[:, 2])) < 0.99][:size]
+
+    while q.shape[0] < size:
+        q = np.concatenate((q, euler_inputs(size - q.shape[0], rng)[0]), axis=0)
+
+    return (q, )
+
+def sclerp_inputs(size, rng):
+
+    dq1 = random_dualquats(size, rng)
+    dq2 = random_dualquats(size, rng)
+
+    # dualquat_np.sclerp takes the shorter path, the check is easier without sign flips
+    dq2[np.sum(dq1[:, :4] * dq2[:, :4], axis=-1) < 0.0] *= -1.0
+
+    t = rng.uniform(0.0, 1.0, size=size).astype(np.float32)
+
+    return dq1, dq2, t
+
+# 32 joints with a spine, a head and four limbs
+hierarchy_parents = [-1, 0, 1, 2, 3, 4, 5, 3, 7, 8, 9, 10, 3, 12, 13, 14, 15, 0, 17, 18, 19, 20, 0, 22, 23, 24, 25, 5, 27, 28, 29, 30]
+
+def hierarchy_inputs(size, rng):
+
+    frame_count = max(size // len(hierarchy_parents), 1)
+
+    lq = random_quats(frame_count * len(hierarchy_parents), rng).reshape(frame_count, -1)
+    offsets = rng.normal(size=(len(hierarchy_parents), 3)).astype(np.float32)
+
+    return lq, offsets
+
+"""
+Implementations
+"""
+
+def _dq_mul_np(dq1, dq2):
+    return ndquat.mul(dq1[:, :4], dq1[:, 4:], dq2[:, :4], dq2[:, 4:])
+
+def _dq_sclerp_np(dq1, dq2, t):
+    return ndquat.sclerp(dq1[:, :4], dq1[:, 4:], dq2[:, :4], dq2[:, 4:], t)
+
+def _dq_sclerp_np_loop(dq1, dq2, t):
+
+    results = [ ndquat.sclerp(dq1[i, :4], dq1[i, 4:], dq2[i, :4], dq2[i, 4:], t[i]) for i in range(dq1.shape[0]) ]
+
+    return np.stack([ np.concatenate(result) for result in results ], axis=0)
+
+def create_kernels():
+    """
+    kernel name -> inputs, tolerance and implementations
+    every implementation is (name, backend, loop, function), torch implementations get their inputs as tensors
+    """
+
+    kernels = {}
+
+    kernels["qmul"] = {"inputs": lambda size, rng: (random_quats(size, rng), random_quats(size, rng)),
+                       "tolerance": 1e-5,
+                       "implementations": [ ("quaternion_np.mul", "numpy", False, nquat.mul),
+                                            ("quaternion.qmul", "torch", False, quat.qmul),
+                                            ("quaternion_torch.mul", "torch", False, tquat.mul),
+                                            ("quaternion.qmul_np", "numpy", False, quat.qmul_np) ]}
+
+    kernels["qrot"] = {"inputs": lambda size, rng: (random_quats(size, rng), rng.normal(size=(size, 3)).astype(np.float32)),
+                       "tolerance": 1e-5,
+                       "implementations": [ ("quaternion_np.rot", "numpy", False, nquat.rot),
+                                            ("quaternion.qrot", "torch", False, quat.qrot),
+                                            ("quaternion_torch.rot", "torch", False, tquat.rot),
+                                            ("quaternion.qrot_np", "numpy", False, quat.qrot_np) ]}
+
+    kernels["slerp"] = {"inputs": slerp_inputs,
+                        "tolerance": 1e-4,
+                        "implementations": [ ("quaternion_np.slerp", "numpy", False, nquat.slerp),
+                                             ("quaternion_torch.slerp", "torch", False, tquat.slerp) ]}
+
+    # not every copy of common/quaternion.py has the array versions of slerp
+    if hasattr(quat, "slerp_np"):
+        kernels["slerp"]["implementations"].append(("quaternion.slerp_np", "numpy", False, quat.slerp_np))
+    if hasattr(quat, "slerp2"):
+        kernels["slerp"]["implementations"].append(("quaternion.slerp2", "torch", False, quat.slerp2))
+
+    kernels["quat2euler"] = {"inputs": euler_inputs,
+                             "tolerance": 1e-4,
+                             "angles": True,
+                             "implementations": [ ("quaternion.qeuler_np", "numpy", False, lambda q: quat.qeuler_np(q, "xyz")),
+                                                  ("quaternion.qeuler", "torch", False, lambda q: quat.qeuler(q, "xyz")),
+                                                  ("quaternion_torch.quat2euler", "torch", False, lambda q: tquat.quat2euler(q, "xyz", degrees=False)),
+                                                  ("quaternion_np.quat2euler", "numpy", False, lambda q: nquat.quat2euler(q, "xyz")) ]}
+
+    kernels["euler2quat"] = {"inputs": lambda size, rng: (rng.uniform(-np.pi, np.pi, size=(size, 3)).astype(np.float32), ),
+                             "tolerance": 1e-5,
+                             "implementations": [ ("quaternion.euler_to_quaternion", "numpy", False, lambda e: quat.euler_to_quaternion(e, "xyz")) ]}
+
+    kernels["dq_mul"] = {"inputs": lambda size, rng: (random_dualquats(size, rng), random_dualquats(size, rng)),
+                         "tolerance": 1e-5,
+                         "implementations": [ ("dualquat_np.mul", "numpy", False, _dq_mul_np),
+                                              ("dualquat_torch.mul", "torch", False, tdquat.mul) ]}
+
+    kernels["dq_sclerp"] = {"inputs": sclerp_inputs,
+                            "tolerance": 1e-4,
+                            "implementations": [ ("dualquat_np.sclerp", "numpy", False, _dq_sclerp_np),
+                                                 ("dualquat_np.sclerp loop", "numpy", True, _dq_sclerp_np_loop) ]}
+
+    kernels["dq_hierarchy"] = {"inputs": hierarchy_inputs,
+                               "tolerance": 1e-4,
+                               "implementations": [ ("dualquat_np.localquats2currentdq", "numpy", False, lambda lq, offsets: ndquat.localquats2currentdq(lq, offsets, hierarchy_parents)),
+                                                    ("dualquat_torch.localquats2currentdq", "torch", False, lambda lq, offsets: tdquat.localquats2currentdq(lq, offsets, hierarchy_parents)) ]}
+
+    return kernels
+
+"""
+Timing
+"""
+
+def to_numpy(result):
+
+    if isinstance(result, (tuple, list)):
+        return np.concatenate([ to_numpy(part) for part in result ], axis=-1)
+
+    if isinstance(result, torch.Tensor):
+        return result.detach().cpu().numpy()
+
+    return np.asarray(result)
+
+def prepare_inputs(inputs, backend, device):
+
+    if backend == "torch":
+        return [ torch.from_numpy(x).to(device) for x in inputs ]
+
+    # some numpy implementations modify their inputs
+    return [ x.copy() for x in inputs ]
+
+def synchronize(device):
+
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+def measure(function, args, min_time, min_repeats, device):
+    """
+    median time per call in seconds, repeats until min_time has passed
+    """
+
+    # warmup
+    function(*args)
+    synchronize(device)
+
+    durations = []
+    total_start_time = time.perf_counter()
+
+    while len(durations) < min_repeats or time.perf_counter() - total_start_time < min_time:
+
+        start_time = time.perf_counter()
+        function(*args)
+        synchronize(device)
+        durations.append(time.perf_counter() - start_time)
+
+        if len(durations) >= 10000:
+            break
+
+    return float(np.median(durations))
+
+def max_difference(result, reference, angles=False):
+
+    difference = result.astype(np.float64) - reference.astype(np.float64)
+
+    if angles == True:
+        # wrap angle differences to -pi .. pi
+        difference = (difference + np.pi) % (2.0 * np.pi) - np.pi
+
+    return float(np.max(np.abs(difference)))
+
+def run_kernel(kernel_name, kernel, sizes, settings):
+    """
+    times all implementations of a kernel for all sizes and compares their outputs with the reference
+    returns one result per size and implementation
+    """
+
+    results = []
+
+    for size in sizes:
+
+        rng = np.random.default_rng(settings["seed"])
+        inputs = kernel["inputs"](size, rng)
+
+        reference = None
+
+        for name, backend, loop, function in kernel["implementations"]:
+
+            result = {"kernel": kernel_name, "size": size, "implementation": name, "backend": backend, "time": None, "difference": None, "error": None}
+            results.append(result)
+
+            if loop == True and size > settings["loop_max_size"]:
+                result["error"] = "skipped"
+                continue
+
+            device = settings["device"] if backend == "torch" else "cpu"
+            args = prepare_inputs(inputs, backend, device)
+
+            try:
+                with torch.no_grad():
+                    output = to_numpy(function(*args))
+                    result["time"] = measure(function, args, settings["min_time"], settings["min_repeats"], device)
+            except Exception as e:
+                result["error"] = "{}: {}".format(type(e).__name__, e)
+                continue
+
+            if size > settings["check_max_size"]:
+                continue
+
+            if reference is None:
+                reference = output
+                result["difference"] = 0.0
+            else:
+                result["difference"] = max_difference(output, reference, kernel.get("angles", False))
+
+        # fastest implementation for this size
+        times = [ result for result in results if result["size"] == size and result["kernel"] == kernel_name and result["time"] is not None ]
+
+        if len(times) > 0:
+            fastest = min(times, key=lambda result: result["time"])
+            for result in times:
+                result["fastest"] = result is fastest
+
+    return results
+
+"""
+Report
+"""
+
+def format_size(size):
+    return "1e{}".format(int(np.log10(size))) if size >= 1000 and 10 ** int(np.log10(size)) == size else str(size)
+
+def format_result(result, tolerance):
+
+    if result["time"] is None:
+        return "n/a" if result["error"] != "skipped" else "-"
+
+    text = "{:.2f}".format(result["time"] * 1e6)
+
+    if result.get("fastest", False) == True:
+        text += "*"
+    if result["difference"] is not None and result["difference"] > tolerance:
+        text += "!"
+
+    return text
+
+def print_kernel(kernel_name, kernel, results, sizes):
+
+    names = [ implementation[0] for implementation in kernel["implementations"] ]
+
+    header = [ "size" ] + names
+    rows = []
+
+    for size in sizes:
+        size_results = { result["implementation"]: result for result in results if result["size"] == size }
+        rows.append([ format_size(size) ] + [ format_result(size_results[name], kernel["tolerance"]) for name in names ])
+
+    column_widths = [ max([ len(row[cI]) for row in [ header ] + rows ]) for cI in range(len(header)) ]
+
+    print("\n{} (usec per call, * fastest, ! differs from {} by more than {})".format(kernel_name, names[0], kernel["tolerance"]))
+    print("  ".join([ header[cI].rjust(column_widths[cI]) for cI in range(len(header)) ]))
+    for row in rows:
+        print("  ".join([ row[cI].rjust(column_widths[cI]) for cI in range(len(header)) ]))
+
+    # largest difference and errors per implementation
+    for name in names[1:]:
+        differences = [ result["difference"] for result in results if result["implementation"] == name and result["difference"] is not None ]
+        if len(differences) > 0:
+            print("max difference {} {:.2e}".format(name, max(differences)))
+
+    for result in results:
+        if result["error"] is not None and result["error"] != "skipped":
+            print("error {} size {}: {}".format(result["implementation"], result["size"], result["error"]))
+
+"""
+Command line
+"""
+
+def main():
+
+    kernels = create_kernels()
+
+    parser = argparse.ArgumentParser(description="benchmark and equivalence check of the quaternion and dual quaternion kernels")
+
+    parser.add_argument("--kernels", nargs="+", choices=list(kernels.keys()), default=list(kernels.keys()))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--device", default="cpu", help="device for the torch implementations")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads, 0 keeps the torch default")
+    parser.add_argument("--min_time", type=float, default=0.2, help="minimum measuring time in seconds per implementation and size")
+    parser.add_argument("--min_repeats", type=int, default=3)
+    parser.add_argument("--loop_max_size", type=int, default=10000, help="largest batch size for single item implementations")
+    parser.add_argument("--check_max_size", type=int, default=100000, help="largest batch size for the equivalence check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="json file for the results")
+
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    settings = {"device": args.device,
+                "min_time": args.min_time,
+                "min_repeats": args.min_repeats,
+                "loop_max_size": args.loop_max_size,
+                "check_max_size": args.check_max_size,
+                "seed": args.seed}
+
+    print("torch ", torch.__version__, " numpy ", np.__version__, " torch threads ", torch.get_num_threads(), " device ", args.device)
+
+    all_results = []
+
+    for kernel_name in args.kernels:
+
+        results = run_kernel(kernel_name, kernels[kernel_name], args.sizes, settings)
+        print_kernel(kernel_name, kernels[kernel_name], results, args.sizes)
+
+        all_results += results
+
+    mismatches = [ result for result in all_results if result["difference"] is not None and result["difference"] > kernels[result["kernel"]]["tolerance"] ]
+
+    print("\n{} mismatches".format(len(mismatches)))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": all_results}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -49,46 +49,40 @@ def mul(q, r):
     from paper: Quaternet 
     
     Multiply quaternion(s) q with quaternion(s) s
-    Expects two equally-sized tensors of shape (*, 4), where * denotes any number of dimensions
+    Expects two tensors of shape (*, 4) that broadcast against each other
     Returns q*r as a tensor of shape (*, 4)
     """
 
     assert q.shape[-1] == 4
     assert r.shape[-1] == 4
-
-    original_shape = q.shape
     
-    # Compute outer product
-    terms = torch.bmm(r.view(-1, 4, 1), q.view(-1, 1, 4))
+    q0, q1, q2, q3 = torch.unbind(q, dim=-1)
+    r0, r1, r2, r3 = torch.unbind(r, dim=-1)
+    
+    w = q0 * r0 - q1 * r1 - q2 * r2 - q3 * r3
+    x = q0 * r1 + q1 * r0 + q2 * r3 - q3 * r2
+    y = q0 * r2 - q1 * r3 + q2 * r0 + q3 * r1
+    z = q0 * r3 + q1 * r2 - q2 * r1 + q3 * r0
     
-    w = terms[:, 0, 0] - terms[:, 1, 1] - terms[:, 2, 2] - terms[:, 3, 3]
-    x = terms[:, 0, 1] + terms[:, 1, 0] - terms[:, 2, 3] + terms[:, 3, 2]
-    y = terms[:, 0, 2] + terms[:, 1, 3] + terms[:, 2, 0] - terms[:, 3, 1]
-    z = terms[:, 0, 3] - terms[:, 1, 2] + terms[:, 2, 1] + terms[:, 3, 0]
-    return torch.stack((w, x, y, z), dim=1).view(original_shape)
+    return torch.stack((w, x, y, z), dim=-1)
 
 def rot(q, v):
     """
     from paper: Quaternet(tested)
     
     Rotate vector(s) v about the rotation described by quaternion(s) q.
-    Expects a tensor of shape (*, 4) for q and a tensor of shape (*, 3) for v,
-    where * denotes any number of dimensions.
+    Expects a tensor of shape (*, 4) for q and a tensor of shape (*, 3) for v
+    that broadcast against each other.
     Returns a tensor of shape (*, 3).
     """
     assert q.shape[-1] == 4
     assert v.shape[-1] == 3
-    assert q.shape[:-1] == v.shape[:-1]
-    
-    original_shape = list(v.shape)
-    q = q.view(-1, 4)
-    v = v.view(-1, 3)
     
-    qvec = q[:, 1:]
+    qvec = q[..., 1:]
     
-    uv = torch.cross(qvec, v, dim=1)
-    uuv = torch.cross(qvec, uv, dim=1)
-    return (v + 2 * (q[:, :1] * uv + uuv)).view(original_shape)
+    uv = torch.linalg.cross(qvec, v, dim=-1)
+    uuv = torch.linalg.cross(qvec, uv, dim=-1)
+    return v + 2 * (q[..., :1] * uv + uuv)
 
 
 def aa2quat(rots, form='wxyz', unified_orient=True):
@@ -230,35 +224,22 @@ def mat2quat(R):
     wy = (R[..., 0, 2] - R[..., 2, 0])
     wz = (R[..., 1, 0] - R[..., 0, 1])
 
-    w = torch.empty_like(x2)
-    x = torch.empty_like(x2)
-    y = torch.empty_like(x2)
-    z = torch.empty_like(x2)
-
-    flagA = (R[..., 2, 2] < 0) * (R[..., 0, 0] > R[..., 1, 1])
-    flagB = (R[..., 2, 2] < 0) * (R[..., 0, 0] <= R[..., 1, 1])
-    flagC = (R[..., 2, 2] >= 0) * (R[..., 0, 0] < -R[..., 1, 1])
-    flagD = (R[..., 2, 2] >= 0) * (R[..., 0, 0] >= -R[..., 1, 1])
-
-    x[flagA] = torch.sqrt(x2[flagA])
-    w[flagA] = wx[flagA] / x[flagA]
-    y[flagA] = xy[flagA] / x[flagA]
-    z[flagA] = xz[flagA] / x[flagA]
-
-    y[flagB] = torch.sqrt(y2[flagB])
-    w[flagB] = wy[flagB] / y[flagB]
-    x[flagB] = xy[flagB] / y[flagB]
-    z[flagB] = yz[flagB] / y[flagB]
-
-    z[flagC] = torch.sqrt(z2[flagC])
-    w[flagC] = wz[flagC] / z[flagC]
-    x[flagC] = xz[flagC] / z[flagC]
-    y[flagC] = yz[flagC] / z[flagC]
+    # the four cases are evaluated for all matrices and selected with torch.where so that the
+    # conversion has no data dependent indexing (traceable, one batched op for autograd)
+    # the square roots are clamped so that the unselected cases stay finite
+    x = torch.sqrt(torch.clamp(x2, min=1e-8))
+    y = torch.sqrt(torch.clamp(y2, min=1e-8))
+    z = torch.sqrt(torch.clamp(z2, min=1e-8))
+    w = torch.sqrt(torch.clamp(w2, min=1e-8))
+    
+    qA = torch.stack((wx / x, x, xy / x, xz / x), dim=-1)
+    qB = torch.stack((wy / y, xy / y, y, yz / y), dim=-1)
+    qC = torch.stack((wz / z, xz / z, yz / z, z), dim=-1)
+    qD = torch.stack((w, wx / w, wy / w, wz / w), dim=-1)
 
-    w[flagD] = torch.sqrt(w2[flagD])
-    x[flagD] = wx[flagD] / w[flagD]
-    y[flagD] = wy[flagD] / w[flagD]
-    z[flagD] = wz[flagD] / w[flagD]
+    flagA = ((R[..., 2, 2] < 0) & (R[..., 0, 0] > R[..., 1, 1])).unsqueeze(-1)
+    flagB = ((R[..., 2, 2] < 0) & (R[..., 0, 0] <= R[..., 1, 1])).unsqueeze(-1)
+    flagC = ((R[..., 2, 2] >= 0) & (R[..., 0, 0] < -R[..., 1, 1])).unsqueeze(-1)
 
     # if R[..., 2, 2] < 0:
     #
@@ -292,42 +273,41 @@ def mat2quat(R):
     #         y = wy / w
     #         z = wz / w
 
-    res = [w, x, y, z]
-    res = [z.unsqueeze(-1) for z in res]
+    res = torch.where(flagA, qA, torch.where(flagB, qB, torch.where(flagC, qC, qD)))
 
-    return torch.cat(res, dim=-1) / 2
+    return res / 2
 
 def slerp(q0, q1, t=0.5, unit=True):
     """
-    from paper: Ganimator (tested)
+    spherical linear interpolation (tested)
     
-    :param q0: shape = (*, n)
-    :param q1: shape = (*, n)
-    :param t: shape = (*)
+    branch free: the shorter path and the fallback to a normalised linear interpolation
+    for nearly parallel quaternions are selected with torch.where
+    :param q0: shape = (*, 4)
+    :param q1: shape = (*, 4)
+    :param t: shape = (*) or a scalar, broadcasts against the leading dimensions of q0 and q1
     :param unit: If q0 and q1 are unit vectors
-    :return: res: shape = (*, n)
+    :return: res: shape = (*, 4)
     """
-    eps = 1e-8
     if not unit:
-        q0_n = q0 / torch.norm(q0, dim=-1, keepdim=True)
-        q1_n = q1 / torch.norm(q1, dim=-1, keepdim=True)
-    else:
-        q0_n = q0
-        q1_n = q1
-    omega = torch.acos((q0_n * q1_n).sum(dim=-1).clamp(-1, 1))
-    dom = torch.sin(omega)
-
-    flag = dom < eps
-
-    res = torch.empty_like(q0_n)
-    t_t = t[flag].unsqueeze(-1)
-    res[flag] = (1 - t_t) * q0_n[flag] + t_t * q1_n[flag]
-
-    flag = ~ flag
-
-    t_t = t[flag]
-    d_t = dom[flag]
-    va = torch.sin((1 - t_t) * omega[flag]) / d_t
-    vb = torch.sin(t_t * omega[flag]) / d_t
-    res[flag] = (va.unsqueeze(-1) * q0_n[flag] + vb.unsqueeze(-1) * q1_n[flag])
-    return res
\ No newline at end of file
+        q0 = normalize(q0)
+        q1 = normalize(q1)
+        
+    t = torch.as_tensor(t, dtype=q0.dtype, device=q0.device).unsqueeze(-1)
+    
+    # q and -q are the same rotation, take the shorter path
+    dot = torch.sum(q0 * q1, dim=-1, keepdim=True)
+    q1 = torch.where(dot < 0.0, -q1, q1)
+    dot = torch.abs(dot)
+    
+    # sin(omega) can not be zero, the clamped values are not used for nearly parallel quaternions
+    linear = dot > 0.9995
+    omega = torch.acos(torch.clamp(dot, max=0.9995))
+    sin_omega = torch.sin(omega)
+    
+    s0 = torch.where(linear, 1.0 - t, torch.sin((1.0 - t) * omega) / sin_omega)
+    s1 = torch.where(linear, t, torch.sin(t * omega) / sin_omega)
+    
+    res = s0 * q0 + s1 * q1
+    
+    return torch.where(linear, normalize(res), res)
@@ -0,0 +1,252 @@
+import threading
+import time
+from time import sleep
+from collections import OrderedDict
+
+import torch
+from torch import nn
+import numpy as np
+
+import motion_synthesis
+import motion_sender
+
+"""
+synthesis engine for several independent dancers (sessions) in one process
+all sessions share the model and the skeleton, each session has its own motion window (or LSTM state),
+its own control parameters and its own OSC output
+per tick all sessions are advanced with one batched model forward and one batched forward kinematics
+"""
+
+config = {"model": None,
+          "device": "cuda",
+          "representation": "quat",
+          "stateful": False,
+          "update_interval": 0.02
+          }
+
+session_config = {"skeleton": None,
+                  "model": None,
+                  "seq_length": 64,
+                  "orig_sequences": [],
+                  "orig_seq_index": 0,
+                  "device": "cuda",
+                  "compile_step": False,
+                  "representation": "quat",
+                  "ip": "127.0.0.1",
+                  "port": 9004,
+                  "address": "/mocap"
+                  }
+
+class MotionSession(motion_synthesis.MotionSynthesis):
+    """
+    MotionSynthesis with its own OSC output, advanced by a MotionEngine instead of calling update itself
+    the setter methods are the same as in MotionSynthesis so that a MotionControl can be attached to a session
+    """
+
+    def __init__(self, config):
+
+        config = dict(config)
+        config["compile_step"] = False
+
+        super().__init__(config)
+
+        self.address = config["address"]
+
+        sender_config = dict(motion_sender.config)
+        sender_config["ip"] = config["ip"]
+        sender_config["port"] = config["port"]
+
+        self.sender = motion_sender.OscSender(sender_config)
+
+        # LSTM state (h, c), only used when the engine runs stateful
+        self.lstm_state = None
+
+    def setJointRotation(self, joint_index, joint_rot, frame_count):
+
+        super().setJointRotation(joint_index, joint_rot, frame_count)
+        self.lstm_state = None
+
+    def changeJointRotation(self, joint_index, joint_rot, frame_count):
+
+        super().changeJointRotation(joint_index, joint_rot, frame_count)
+        self.lstm_state = None
+
+    def changeSequence(self):
+
+        super().changeSequence()
+        self.lstm_state = None
+
+    def send(self):
+
+        # convert from left handed bvh coordinate system to right handed standard coordinate system
+        wpos_rh = np.stack([self.synth_pose_wpos[:, 0], -self.synth_pose_wpos[:, 2], self.synth_pose_wpos[:, 1]], axis=1) / 100.0
+        wrot_rh = np.stack([self.synth_pose_wrot[:, 0], self.synth_pose_wrot[:, 1], -self.synth_pose_wrot[:, 3], self.synth_pose_wrot[:, 2]], axis=1)
+
+        self.sender.send(self.address + "/joint/pos_world", wpos_rh)
+        self.sender.send(self.address + "/joint/rot_world", wrot_rh)
+        self.sender.send(self.address + "/joint/rot_local", self.synth_pose_lrot)
+
+class MotionEngine():
+
+    def __init__(self, config):
+
+        self.model = config["model"]
+        self.device = config["device"]
+        self.representation = config["representation"]
+        self.stateful = config["stateful"]
+        self.update_interval = config["update_interval"]
+
+        self.sessions = OrderedDict()
+        self.session_lock = threading.Lock()
+        self.next_session_id = 0
+
+        self.update_time = 0.0
+
+        self.engine_thread = None
+
+    def addSession(self, config):
+        """
+        create a session from a session_config and return its id
+        sessions can be added while the engine is running, they take part from the next tick on
+        """
+
+        config = dict(config)
+        config["model"] = self.model
+        config["device"] = self.device
+        config["representation"] = self.representation
+
+        session = MotionSession(config)
+
+        with self.session_lock:
+            session_id = self.next_session_id
+            self.next_session_id += 1
+            self.sessions[session_id] = session
+
+        return session_id
+
+    def removeSession(self, session_id):
+
+        with self.session_lock:
+            self.sessions.pop(session_id, None)
+
+    def getSession(self, session_id):
+
+        with self.session_lock:
+            return self.sessions.get(session_id, None)
+
+    def update(self):
+
+        with self.session_lock:
+            sessions = list(self.sessions.values())
+
+        if len(sessions) == 0:
+            return
+
+        for session in sessions:
+            if session.orig_seq_changed == True:
+                session.changeSequence()
+
+        session_count = len(sessions)
+        joint_count = sessions[0].joint_count
+        joint_dim = sessions[0].joint_dim
+
+        self.model.eval()
+
+        with torch.no_grad():
+
+            if self.stateful == True:
+                pred_poses = self._predict_stateful(sessions)
+            else:
+                pred_poses = self.model(torch.stack([ motion_synthesis.poseToModel(session.motion_seq, self.representation) for session in sessions ], dim=0))
+
+            # convert to unit quaternions, the poses of all sessions are converted as one pose with session_count * joint_count joints
+            pred_poses = motion_synthesis.modelToPose(pred_poses, session_count * joint_count, self.representation)
+            pred_poses = pred_poses.reshape((session_count, joint_count, joint_dim))
+
+            # convert quaternion poses to position poses, the skeleton is shared by all sessions
+            zero_trajectory = torch.zeros((session_count, 1, 3), dtype=torch.float32).to(self.device)
+
+            synth_poses_wpos, synth_poses_wrot = sessions[0]._forward_kinematics(torch.unsqueeze(pred_poses, dim=1), zero_trajectory)
+
+        synth_poses_lrot = pred_poses.cpu().numpy()
+        synth_poses_wpos = synth_poses_wpos.cpu().numpy().reshape((session_count, joint_count, 3))
+        synth_poses_wrot = synth_poses_wrot.cpu().numpy().reshape((session_count, joint_count, 4))
+
+        for sI, session in enumerate(sessions):
+
+            session.pred_pose = pred_poses[sI:sI+1]
+            session.appendPose(session.pred_pose)
+
+            session.synth_pose_lrot = synth_poses_lrot[sI]
+            session.synth_pose_wpos = synth_poses_wpos[sI]
+            session.synth_pose_wrot = synth_poses_wrot[sI]
+
+    def _predict_stateful(self, sessions):
+        """
+        sessions without LSTM state (new or edited) are primed with their full window,
+        all other sessions only feed their last frame and continue from their state
+        """
+
+        pred_poses = [None] * len(sessions)
+
+        prime_indices = [ sI for sI, session in enumerate(sessions) if session.lstm_state is None ]
+        step_indices = [ sI for sI, session in enumerate(sessions) if session.lstm_state is not None ]
+
+        if len(prime_indices) > 0:
+
+            x = torch.stack([ motion_synthesis.poseToModel(sessions[sI].motion_seq, self.representation) for sI in prime_indices ], dim=0)
+            y, (h, c) = self.model.forward_state(x)
+
+            for bI, sI in enumerate(prime_indices):
+                pred_poses[sI] = y[bI]
+                sessions[sI].lstm_state = (h[:, bI:bI+1], c[:, bI:bI+1])
+
+        if len(step_indices) > 0:
+
+            x = torch.stack([ motion_synthesis.poseToModel(sessions[sI].motion_seq[-1:], self.representation) for sI in step_indices ], dim=0)
+            h = torch.cat([ sessions[sI].lstm_state[0] for sI in step_indices ], dim=1)
+            c = torch.cat([ sessions[sI].lstm_state[1] for sI in step_indices ], dim=1)
+            y, (h, c) = self.model.forward_state(x, (h, c))
+
+            for bI, sI in enumerate(step_indices):
+                pred_poses[sI] = y[bI]
+                sessions[sI].lstm_state = (h[:, bI:bI+1], c[:, bI:bI+1])
+
+        return torch.stack(pred_poses, dim=0)
+
+    def send(self):
+
+        with self.session_lock:
+            sessions = list(self.sessions.values())
+
+        for session in sessions:
+            if session.synth_pose_wpos is not None:
+                session.send()
+
+    def start(self):
+
+        self.engine_thread_event = threading.Event()
+        self.engine_thread = threading.Thread(target=self.run)
+        self.engine_thread.start()
+
+    def stop(self):
+
+        self.engine_thread_event.set()
+        self.engine_thread.join()
+
+    def run(self):
+
+        while self.engine_thread_event.is_set() == False:
+
+            start_time = time.time()
+
+            self.update()
+            self.send()
+
+            end_time = time.time()
+
+            self.update_time = end_time - start_time
+
+            next_update_interval = max(self.update_interval - self.update_time, 0.0)
+
+            sleep(next_update_interval)
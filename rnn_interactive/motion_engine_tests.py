@@ -0,0 +1,137 @@
+from unittest import TestCase
+import numpy as np
+import torch
+
+import motion_model
+import motion_synthesis
+import motion_engine
+import motion_service
+
+class TestMotionSessions(TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+
+        self.joint_count = 6
+        parents = [ -1, 0, 1, 2, 1, 4 ]
+
+        self.skeleton = {}
+        self.skeleton["offsets"] = rng.normal(size=(self.joint_count, 3)).astype(np.float32)
+        self.skeleton["parents"] = parents
+        self.skeleton["children"] = [ [ child for child, parent in enumerate(parents) if parent == joint ] for joint in range(self.joint_count) ]
+
+        orig_sequences = []
+        for _ in range(2):
+            orig_seq = rng.normal(size=(100, self.joint_count, 4)).astype(np.float32)
+            orig_sequences.append(orig_seq / np.linalg.norm(orig_seq, axis=-1, keepdims=True))
+        self.orig_sequences = orig_sequences
+
+        self.seq_length = 16
+
+    def createModel(self, representation):
+
+        torch.manual_seed(0)
+
+        model_config = dict(motion_model.config)
+        model_config["input_length"] = self.seq_length
+        model_config["data_dim"] = self.joint_count * (6 if representation == "repr6d" else 4)
+        model_config["node_dim"] = 32
+        model_config["device"] = "cpu"
+        model_config["weights_path"] = ""
+        model_config["representation"] = representation
+
+        return motion_model.createModel(model_config)
+
+    def createSynthesis(self, model, representation, seq_index):
+
+        synthesis_config = dict(motion_synthesis.config)
+        synthesis_config["skeleton"] = self.skeleton
+        synthesis_config["model"] = model
+        synthesis_config["seq_length"] = self.seq_length
+        synthesis_config["orig_sequences"] = self.orig_sequences
+        synthesis_config["orig_seq_index"] = seq_index
+        synthesis_config["device"] = "cpu"
+        synthesis_config["representation"] = representation
+
+        return motion_synthesis.MotionSynthesis(synthesis_config)
+
+    def test_engine_sessions(self):
+
+        for representation in [ "quat", "repr6d" ]:
+
+            model = self.createModel(representation)
+
+            engine_config = dict(motion_engine.config)
+            engine_config["model"] = model
+            engine_config["device"] = "cpu"
+            engine_config["representation"] = representation
+
+            engine = motion_engine.MotionEngine(engine_config)
+
+            syntheses = []
+
+            for seq_index in range(2):
+
+                # the session config of rnn_interactive_multi.py
+                session_config = dict(motion_engine.session_config)
+                session_config["skeleton"] = self.skeleton
+                session_config["seq_length"] = self.seq_length
+                session_config["orig_sequences"] = self.orig_sequences
+                session_config["orig_seq_index"] = seq_index
+
+                engine.addSession(session_config)
+                syntheses.append(self.createSynthesis(model, representation, seq_index))
+
+            for _ in range(3):
+
+                engine.update()
+
+                for session_id, synthesis in enumerate(syntheses):
+                    synthesis.update()
+
+                    session = engine.getSession(session_id)
+
+                    self.assertEqual(session.representation, representation)
+                    np.testing.assert_allclose(session.synth_pose_lrot, synthesis.synth_pose_lrot, atol=1e-5)
+                    np.testing.assert_allclose(session.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-4)
+
+    def test_service_sessions(self):
+
+        for representation in [ "quat", "repr6d" ]:
+
+            model = self.createModel(representation)
+
+            service_config = dict(motion_service.config)
+            service_config["model"] = model
+            service_config["skeleton"] = self.skeleton
+            service_config["seq_length"] = self.seq_length
+            service_config["orig_sequences"] = self.orig_sequences
+            service_config["device"] = "cpu"
+            service_config["representation"] = representation
+            service_config["port"] = 0
+
+            service = motion_service.MotionService(service_config)
+
+            try:
+                session_id = service.addSession(1)
+                synthesis = self.createSynthesis(model, representation, 1)
+
+                client_address = ("127.0.0.1", 9)
+                window = self.orig_sequences[0][:self.seq_length].reshape(self.seq_length, -1)
+
+                for request_id in range(3):
+
+                    batch = [ motion_service.ServiceRequest("advance", client_address, request_id, 1.0, session_id),
+                              motion_service.ServiceRequest("continue", client_address, request_id, 1.0, window) ]
+
+                    service.processBatch(batch)
+                    synthesis.update()
+
+                    session = service.sessions[session_id]
+
+                    self.assertEqual(session.representation, representation)
+                    np.testing.assert_allclose(session.synth_pose_lrot, synthesis.synth_pose_lrot, atol=1e-5)
+                    np.testing.assert_allclose(session.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-4)
+            finally:
+                service.server.server_close()
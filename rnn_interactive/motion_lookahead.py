@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+
+"""
+lookahead generation for MotionSynthesis
+a producer thread runs the synthesis ahead of the output clock into a bounded buffer,
+the consumer (MotionGui) takes one frame per tick so that slow ticks of the model don't delay the output
+control messages that edit the motion window discard the lookahead, the synthesis is reset to the last
+emitted frame and generation continues from the edit
+the class has the same interface as MotionSynthesis and can be passed to MotionGui and MotionControl in its place
+"""
+
+config = {"synthesis": None,
+          "lookahead_frames": 8,
+          "edit_hold": 0.2
+          }
+
+class LookaheadFrame():
+
+    def __init__(self, synthesis):
+
+        self.synth_pose_lrot = synthesis.synth_pose_lrot
+        self.synth_pose_wpos = synthesis.synth_pose_wpos
+        self.synth_pose_wrot = synthesis.synth_pose_wrot
+
+        # motion window after this frame was generated, needed to go back to this frame when the lookahead is discarded
+        self.motion_seq = _copy_seq(synthesis.motion_seq)
+
+def _copy_seq(motion_seq):
+
+    # torch tensors (motion_synthesis) or numpy arrays (motion_synthesis_np)
+    if hasattr(motion_seq, "clone"):
+        return motion_seq.clone()
+
+    return motion_seq.copy()
+
+class MotionLookahead():
+
+    def __init__(self, config):
+
+        self.synthesis = config["synthesis"]
+        self.lookahead_frames = config["lookahead_frames"]
+        self.edit_hold = config["edit_hold"]
+
+        # synthesis_lock is held while the synthesis runs or is edited, frames_condition only guards the buffer
+        # so that the consumer doesn't wait for the producer while frames are buffered
+        self.synthesis_lock = threading.Lock()
+        self.frames = deque()
+        self.frames_condition = threading.Condition()
+
+        # motion window after the last emitted frame
+        self.committed_seq = _copy_seq(self.synthesis.motion_seq)
+
+        # no lookahead is generated until edit_hold seconds after the last edit
+        self.last_edit_time = 0.0
+
+        self.synth_pose_wpos = None
+        self.synth_pose_wrot = None
+        self.synth_pose_lrot = None
+
+        self.producer_thread = None
+
+    def __getattr__(self, name):
+
+        # everything else (edge_list, joint_count, ...) is taken from the synthesis
+        return getattr(self.synthesis, name)
+
+    """
+    producer
+    """
+
+    def start(self):
+
+        self.producer_thread_event = threading.Event()
+        self.producer_thread = threading.Thread(target=self.produce)
+        self.producer_thread.start()
+
+    def stop(self):
+
+        self.producer_thread_event.set()
+
+        with self.frames_condition:
+            self.frames_condition.notify_all()
+
+        self.producer_thread.join()
+
+    def produce(self):
+
+        while self.producer_thread_event.is_set() == False:
+
+            with self.frames_condition:
+
+                hold_time = self.last_edit_time + self.edit_hold - time.time()
+
+                if len(self.frames) >= self.lookahead_frames or hold_time > 0.0:
+                    self.frames_condition.wait(timeout=max(hold_time, 0.01))
+                    continue
+
+            with self.synthesis_lock:
+
+                self.synthesis.update()
+                frame = LookaheadFrame(self.synthesis)
+
+                with self.frames_condition:
+                    self.frames.append(frame)
+
+    """
+    consumer
+    """
+
+    def update(self):
+
+        frame = self._pop_frame()
+
+        if frame is None:
+
+            with self.synthesis_lock:
+
+                # the producer might have finished a frame in the meantime
+                frame = self._pop_frame()
+
+                if frame is None:
+                    # nothing buffered (e.g. right after an edit), generate the frame on the output clock
+                    self.synthesis.update()
+                    frame = LookaheadFrame(self.synthesis)
+
+                    self.committed_seq = frame.motion_seq
+
+        self.synth_pose_lrot = frame.synth_pose_lrot
+        self.synth_pose_wpos = frame.synth_pose_wpos
+        self.synth_pose_wrot = frame.synth_pose_wrot
+
+    def _pop_frame(self):
+
+        with self.frames_condition:
+
+            if len(self.frames) == 0:
+                return None
+
+            frame = self.frames.popleft()
+            self.committed_seq = frame.motion_seq
+
+            self.frames_condition.notify_all()
+
+        return frame
+
+    """
+    edits
+    """
+
+    def _edit(self, edit_func, *args):
+
+        with self.synthesis_lock:
+
+            with self.frames_condition:
+
+                # discard the lookahead and go back to the last emitted frame before applying the edit
+                if len(self.frames) > 0:
+                    self.frames.clear()
+                    self.synthesis.motion_seq = _copy_seq(self.committed_seq)
+
+                self.last_edit_time = time.time()
+
+            edit_func(*args)
+
+    def setOrigSeqIndex(self, index):
+        self._edit(self.synthesis.setOrigSeqIndex, index)
+
+    def setOrigSeqStartFrameIndex(self, index):
+        self._edit(self.synthesis.setOrigSeqStartFrameIndex, index)
+
+    def setOrigSeqFrameCount(self, count):
+        self._edit(self.synthesis.setOrigSeqFrameCount, count)
+
+    def setOrigSeqBlend(self, blend):
+        self._edit(self.synthesis.setOrigSeqBlend, blend)
+
+    def setRandRange(self, rand):
+        self._edit(self.synthesis.setRandRange, rand)
+
+    def setJointRotation(self, joint_index, joint_rot, frame_count):
+        self._edit(self.synthesis.setJointRotation, joint_index, joint_rot, frame_count)
+
+    def changeJointRotation(self, joint_index, joint_rot, frame_count):
+        self._edit(self.synthesis.changeJointRotation, joint_index, joint_rot, frame_count)
@@ -0,0 +1,171 @@
+import time
+import threading
+from unittest import TestCase
+import numpy as np
+import torch
+
+import motion_model
+import motion_synthesis
+import motion_lookahead
+
+class TestMotionLookahead(TestCase):
+
+    def setUp(self):
+
+        torch.manual_seed(0)
+        rng = np.random.default_rng(0)
+
+        self.joint_count = 6
+        parents = [ -1, 0, 1, 2, 1, 4 ]
+
+        self.skeleton = {}
+        self.skeleton["offsets"] = rng.normal(size=(self.joint_count, 3)).astype(np.float32)
+        self.skeleton["parents"] = parents
+        self.skeleton["children"] = [ [ child for child, parent in enumerate(parents) if parent == joint ] for joint in range(self.joint_count) ]
+
+        orig_sequences = []
+        for _ in range(3):
+            orig_seq = rng.normal(size=(200, self.joint_count, 4)).astype(np.float32)
+            orig_sequences.append(orig_seq / np.linalg.norm(orig_seq, axis=-1, keepdims=True))
+        self.orig_sequences = orig_sequences
+
+        model_config = dict(motion_model.config)
+        model_config["data_dim"] = self.joint_count * 4
+        model_config["node_dim"] = 32
+        model_config["device"] = "cpu"
+        model_config["weights_path"] = ""
+
+        self.model = motion_model.createModel(model_config)
+
+        self.joint_rot = np.array([0.7071, 0.7071, 0.0, 0.0], dtype=np.float32)
+
+    def createSynthesis(self):
+
+        synthesis_config = dict(motion_synthesis.config)
+        synthesis_config["skeleton"] = self.skeleton
+        synthesis_config["model"] = self.model
+        synthesis_config["orig_sequences"] = self.orig_sequences
+        synthesis_config["device"] = "cpu"
+
+        return motion_synthesis.MotionSynthesis(synthesis_config)
+
+    def createLookahead(self, edit_hold):
+
+        lookahead_config = dict(motion_lookahead.config)
+        lookahead_config["synthesis"] = self.createSynthesis()
+        lookahead_config["lookahead_frames"] = 4
+        lookahead_config["edit_hold"] = edit_hold
+
+        return motion_lookahead.MotionLookahead(lookahead_config)
+
+    def waitForFullBuffer(self, lookahead):
+
+        deadline = time.time() + 10.0
+
+        while len(lookahead.frames) < lookahead.lookahead_frames:
+            self.assertLess(time.time(), deadline, "lookahead buffer was not filled")
+            time.sleep(0.01)
+
+    def stopLookahead(self, lookahead):
+
+        # stop must return even if the producer is waiting for the buffer or for the edit hold
+        stop_thread = threading.Thread(target=lookahead.stop)
+        stop_thread.start()
+        stop_thread.join(timeout=10.0)
+
+        self.assertFalse(stop_thread.is_alive())
+        self.assertFalse(lookahead.producer_thread.is_alive())
+
+    def test_frames_match_synthesis(self):
+
+        synthesis = self.createSynthesis()
+        lookahead = self.createLookahead(edit_hold=0.0)
+
+        lookahead.start()
+
+        try:
+            for _ in range(10):
+                lookahead.update()
+                synthesis.update()
+
+                np.testing.assert_allclose(lookahead.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-5)
+        finally:
+            self.stopLookahead(lookahead)
+
+    def test_edit_with_full_lookahead(self):
+
+        synthesis = self.createSynthesis()
+
+        # the long edit hold keeps the producer from refilling the buffer after the edit
+        lookahead = self.createLookahead(edit_hold=60.0)
+
+        lookahead.start()
+
+        try:
+            for _ in range(3):
+                lookahead.update()
+                synthesis.update()
+
+            self.waitForFullBuffer(lookahead)
+
+            # the synthesis has run ahead of the emitted frames
+            self.assertFalse(torch.equal(lookahead.synthesis.motion_seq, lookahead.committed_seq))
+
+            lookahead.setJointRotation(3, self.joint_rot, 1)
+            synthesis.setJointRotation(3, self.joint_rot, 1)
+
+            # the lookahead is discarded and the edit is applied to the window of the last emitted frame
+            self.assertEqual(len(lookahead.frames), 0)
+            np.testing.assert_allclose(lookahead.synthesis.motion_seq.numpy(), synthesis.motion_seq.numpy())
+
+            for _ in range(5):
+                lookahead.update()
+                synthesis.update()
+
+                np.testing.assert_allclose(lookahead.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-5)
+
+            self.assertEqual(len(lookahead.frames), 0)
+        finally:
+            self.stopLookahead(lookahead)
+
+    def test_edit_without_lookahead(self):
+
+        synthesis = self.createSynthesis()
+        lookahead = self.createLookahead(edit_hold=60.0)
+
+        # without a running producer every frame is generated on the output clock, edits apply directly
+        for _ in range(3):
+            lookahead.update()
+            synthesis.update()
+
+        lookahead.setOrigSeqIndex(2)
+        synthesis.setOrigSeqIndex(2)
+
+        for _ in range(3):
+            lookahead.update()
+            synthesis.update()
+
+            np.testing.assert_allclose(lookahead.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-5)
+
+        np.testing.assert_allclose(lookahead.committed_seq.numpy(), synthesis.motion_seq.numpy())
+
+    def test_stop(self):
+
+        # producer waiting for a full buffer to be consumed
+        lookahead = self.createLookahead(edit_hold=0.0)
+        lookahead.start()
+        self.waitForFullBuffer(lookahead)
+        self.stopLookahead(lookahead)
+
+        # producer holding after an edit
+        lookahead = self.createLookahead(edit_hold=60.0)
+        lookahead.start()
+        lookahead.setRandRange(0.0)
+        self.stopLookahead(lookahead)
+
+        # a stopped lookahead keeps generating frames on the output clock
+        frame_count = len(lookahead.frames)
+        lookahead.update()
+
+        self.assertEqual(len(lookahead.frames), max(frame_count - 1, 0))
+        self.assertEqual(lookahead.synth_pose_wpos.shape, (self.joint_count, 3))
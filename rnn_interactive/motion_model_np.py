@@ -0,0 +1,232 @@
+import numpy as np
+import zipfile
+import pickle
+import collections
+
+"""
+numpy version of the recurrent model (multi-layer LSTM followed by a dense layer)
+has the same call interface as motion_model.Reccurent but does not depend on torch
+weights are read directly from the state_dict files written by torch.save during training
+"""
+
+config = {
+    "input_length": 64,
+    "data_dim": 308,
+    "node_dim": 512,
+    "layer_count": 2,
+    "device": "cpu",
+    "weights_path": "results/weights/rnn_weights_epoch_400",
+    "backend": "numpy",
+    "onnx_path": "",
+    "onnx_step_path": "",
+    "representation": "quat"
+    }
+
+"""
+state_dict loading without torch
+"""
+
+_storage_dtypes = {
+    "FloatStorage": np.float32,
+    "DoubleStorage": np.float64,
+    "HalfStorage": np.float16,
+    "LongStorage": np.int64,
+    "IntStorage": np.int32,
+    "ShortStorage": np.int16,
+    "CharStorage": np.int8,
+    "ByteStorage": np.uint8,
+    "BoolStorage": np.bool_
+    }
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args):
+
+    if len(size) == 0:
+        return storage[storage_offset].copy()
+
+    byte_strides = [ s * storage.itemsize for s in stride ]
+
+    return np.lib.stride_tricks.as_strided(storage[storage_offset:], shape=size, strides=byte_strides).copy()
+
+def _rebuild_parameter(data, *args):
+    return data
+
+class _StateDictUnpickler(pickle.Unpickler):
+    """
+    unpickles the data.pkl record of a torch.save zip archive into numpy arrays
+    """
+
+    def __init__(self, file, archive, archive_prefix):
+        super().__init__(file)
+
+        self.archive = archive
+        self.archive_prefix = archive_prefix
+
+    def find_class(self, module, name):
+
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return _rebuild_tensor
+        if module == "torch._utils" and name == "_rebuild_parameter":
+            return _rebuild_parameter
+        if module == "torch" and name in _storage_dtypes:
+            return name
+        if module == "collections" and name == "OrderedDict":
+            return collections.OrderedDict
+
+        return super().find_class(module, name)
+
+    def persistent_load(self, pid):
+
+        # pid: ("storage", storage type, key, location, element count)
+        storage_type, key = pid[1], pid[2]
+
+        data = self.archive.read("{}data/{}".format(self.archive_prefix, key))
+
+        return np.frombuffer(data, dtype=_storage_dtypes[storage_type])
+
+def load_state_dict(weights_path):
+    """
+    load a state_dict saved with torch.save as a dictionary of numpy arrays
+    """
+
+    with zipfile.ZipFile(weights_path) as archive:
+        pkl_name = [ name for name in archive.namelist() if name.endswith("data.pkl") ][0]
+        archive_prefix = pkl_name[:-len("data.pkl")]
+
+        with archive.open(pkl_name) as f:
+            state_dict = _StateDictUnpickler(f, archive, archive_prefix).load()
+
+    return state_dict
+
+"""
+model architecture
+"""
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+class NumpyReccurent():
+    def __init__(self, input_dim, hidden_dim, output_dim, layer_count):
+
+        self.input_dim = input_dim
+        self.hidden_dim = hidden_dim
+        self.layer_count = layer_count
+        self.output_dim = output_dim
+
+        # weights are stored transposed and with both LSTM biases summed
+        self.w_ih = [ np.zeros((self.input_dim if lI == 0 else self.hidden_dim, 4 * self.hidden_dim), dtype=np.float32) for lI in range(self.layer_count) ]
+        self.w_hh = [ np.zeros((self.hidden_dim, 4 * self.hidden_dim), dtype=np.float32) for lI in range(self.layer_count) ]
+        self.b = [ np.zeros((4 * self.hidden_dim), dtype=np.float32) for lI in range(self.layer_count) ]
+
+        self.w_dense = np.zeros((self.hidden_dim, self.output_dim), dtype=np.float32)
+        self.b_dense = np.zeros((self.output_dim), dtype=np.float32)
+
+    def load_state_dict(self, state_dict):
+
+        for lI in range(self.layer_count):
+            self.w_ih[lI] = np.ascontiguousarray(state_dict["rnn_layers.rnn.weight_ih_l{}".format(lI)].T, dtype=np.float32)
+            self.w_hh[lI] = np.ascontiguousarray(state_dict["rnn_layers.rnn.weight_hh_l{}".format(lI)].T, dtype=np.float32)
+            self.b[lI] = (state_dict["rnn_layers.rnn.bias_ih_l{}".format(lI)] + state_dict["rnn_layers.rnn.bias_hh_l{}".format(lI)]).astype(np.float32)
+
+        self.w_dense = np.ascontiguousarray(state_dict["dense_layers.dense.weight"].T, dtype=np.float32)
+        self.b_dense = state_dict["dense_layers.dense.bias"].astype(np.float32)
+
+    def __call__(self, x):
+        return self.forward(x)
+
+    def forward(self, x):
+
+        x, _ = self.forward_state(x)
+
+        return x
+
+    def forward_state(self, x, state=None):
+        """
+        continues from the LSTM state (h, c) returned by a previous call instead of starting from zeros
+        h and c have shape (layer_count, batch, hidden_dim) as in torch
+        """
+
+        _x, to_input_type = self._to_numpy(x)
+
+        batch_size = _x.shape[0]
+
+        if state is None:
+            h = np.zeros((self.layer_count, batch_size, self.hidden_dim), dtype=np.float32)
+            c = np.zeros((self.layer_count, batch_size, self.hidden_dim), dtype=np.float32)
+        else:
+            h = np.array(self._to_numpy(state[0])[0], dtype=np.float32)
+            c = np.array(self._to_numpy(state[1])[0], dtype=np.float32)
+
+        for lI in range(self.layer_count):
+            _x, h[lI], c[lI] = self._lstm_layer(_x, h[lI], c[lI], lI)
+
+        y = _x[:, -1, :] @ self.w_dense + self.b_dense # only last time step
+
+        return to_input_type(y), (to_input_type(h), to_input_type(c))
+
+    def _lstm_layer(self, x, h, c, layer_index):
+
+        H = self.hidden_dim
+        seq_length = x.shape[1]
+
+        # input projection for all time steps at once, only the recurrent part runs per time step
+        x_gates = x @ self.w_ih[layer_index] + self.b[layer_index]
+        w_hh = self.w_hh[layer_index]
+
+        outputs = np.empty((x.shape[0], seq_length, H), dtype=np.float32)
+
+        for tI in range(seq_length):
+            gates = x_gates[:, tI] + h @ w_hh
+
+            # gate order as in torch: input, forget, cell, output
+            i = _sigmoid(gates[:, :H])
+            f = _sigmoid(gates[:, H:2*H])
+            g = np.tanh(gates[:, 2*H:3*H])
+            o = _sigmoid(gates[:, 3*H:])
+
+            c = f * c + i * g
+            h = o * np.tanh(c)
+
+            outputs[:, tI] = h
+
+        return outputs, h, c
+
+    def _to_numpy(self, x):
+        """
+        accept numpy arrays and torch tensors, results are returned as the same type as the input
+        """
+
+        if isinstance(x, np.ndarray):
+            return np.asarray(x, dtype=np.float32), lambda y: y
+
+        # torch tensor, torch is only used here if the caller already works with torch
+        import torch
+
+        device = x.device
+
+        return x.detach().cpu().numpy().astype(np.float32), lambda y: torch.from_numpy(y).to(device)
+
+    # no-ops for interface compatibility with torch modules
+
+    def eval(self):
+        return self
+
+    def train(self, mode=True):
+        return self
+
+    def to(self, device):
+        return self
+
+def createModel(config):
+
+    # the onnxruntime backend does not depend on torch either
+    if config["backend"] == "onnx":
+        import motion_model_onnx
+
+        return motion_model_onnx.createModel(config)
+
+    rnn = NumpyReccurent(config["data_dim"], config["node_dim"], config["data_dim"], config["layer_count"])
+
+    if config["weights_path"] != "":
+        rnn.load_state_dict(load_state_dict(config["weights_path"]))
+
+    return rnn
@@ -0,0 +1,225 @@
+import os
+import sys
+import subprocess
+import tempfile
+import importlib.util
+from unittest import TestCase, skipIf
+import numpy as np
+import torch
+
+import motion_model
+import motion_model_np
+
+onnx_available = importlib.util.find_spec("onnxruntime") is not None
+
+@skipIf(onnx_available == False, "onnxruntime is not installed")
+class TestOnnxModel(TestCase):
+
+    def setUp(self):
+        
+        torch.manual_seed(0)
+        
+        self.config = dict(motion_model.config)
+        self.config["input_length"] = 16
+        self.config["data_dim"] = 40
+        self.config["node_dim"] = 32
+        self.config["layer_count"] = 2
+        self.config["device"] = "cpu"
+        self.config["weights_path"] = ""
+        
+        self.model = motion_model.createModel(self.config)
+        self.model.eval()
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        
+        self.config["backend"] = "onnx"
+        self.config["onnx_path"] = os.path.join(self.tmp_dir.name, "rnn.onnx")
+        self.config["onnx_step_path"] = os.path.join(self.tmp_dir.name, "rnn_step.onnx")
+        
+        motion_model.exportOnnx(self.model, self.config, self.config["onnx_path"], stateful=False)
+        motion_model.exportOnnx(self.model, self.config, self.config["onnx_step_path"], stateful=True)
+        
+        self.onnx_model = motion_model.createModel(self.config)
+        
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        
+    def test_window_parity(self):
+        
+        for batch_size in [1, 4]:
+            x = torch.randn((batch_size, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+            
+            with torch.no_grad():
+                y = self.model(x).numpy()
+            
+            # numpy input
+            y_onnx = self.onnx_model(x.numpy())
+            np.testing.assert_allclose(y, y_onnx, atol=1e-5)
+            
+            # torch input
+            y_onnx = self.onnx_model(x)
+            self.assertTrue(isinstance(y_onnx, torch.Tensor))
+            np.testing.assert_allclose(y, y_onnx.numpy(), atol=1e-5)
+            
+    def test_state_parity(self):
+        
+        x = torch.randn((2, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        x_next = torch.randn((2, 1, self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y, state = self.model.forward_state(x)
+            y_next, _ = self.model.forward_state(x_next, state)
+            
+        y_onnx, state_onnx = self.onnx_model.forward_state(x.numpy())
+        y_next_onnx, _ = self.onnx_model.forward_state(x_next.numpy(), state_onnx)
+        
+        np.testing.assert_allclose(y.numpy(), y_onnx, atol=1e-5)
+        np.testing.assert_allclose(state[0].numpy(), state_onnx[0], atol=1e-5)
+        np.testing.assert_allclose(state[1].numpy(), state_onnx[1], atol=1e-5)
+        np.testing.assert_allclose(y_next.numpy(), y_next_onnx, atol=1e-5)
+        
+    def test_stateful_matches_window(self):
+        
+        # stepping the state one pose at a time ends where the full window ends
+        x = torch.randn((1, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y = self.model(x).numpy()
+        
+        state = None
+        for pI in range(self.config["input_length"]):
+            y_step, state = self.onnx_model.forward_state(x[:, pI:pI+1].numpy(), state)
+            
+        np.testing.assert_allclose(y, y_step, atol=1e-5)
+        
+    def test_torch_free_model(self):
+        
+        # the torch free runtime creates onnx models with motion_model_np, which must not import torch
+        config = dict(motion_model_np.config)
+        config["node_dim"] = self.config["node_dim"]
+        config["layer_count"] = self.config["layer_count"]
+        config["backend"] = "onnx"
+        config["onnx_path"] = self.config["onnx_path"]
+        config["onnx_step_path"] = self.config["onnx_step_path"]
+        
+        x = np.random.default_rng(0).standard_normal((1, self.config["input_length"], self.config["data_dim"])).astype(np.float32)
+        
+        np.testing.assert_allclose(motion_model_np.createModel(config)(x), self.onnx_model(x), atol=1e-6)
+        
+        code = "import sys, motion_model_np; motion_model_np.createModel({}); sys.exit(int('torch' in sys.modules))".format(repr(config))
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        
+        self.assertEqual(subprocess.run([sys.executable, "-c", code], cwd=test_dir).returncode, 0)
+
+class TestNumpyModel(TestCase):
+
+    def setUp(self):
+        
+        torch.manual_seed(0)
+        
+        self.config = dict(motion_model.config)
+        self.config["input_length"] = 16
+        self.config["data_dim"] = 40
+        self.config["node_dim"] = 32
+        self.config["layer_count"] = 2
+        self.config["device"] = "cpu"
+        self.config["weights_path"] = ""
+        
+        self.model = motion_model.createModel(self.config)
+        self.model.eval()
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        
+        self.config["backend"] = "numpy"
+        self.config["weights_path"] = os.path.join(self.tmp_dir.name, "rnn_weights")
+        
+        torch.save(self.model.state_dict(), self.config["weights_path"])
+        
+        self.numpy_model = motion_model.createModel(self.config)
+        
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        
+    def test_window_parity(self):
+        
+        for batch_size in [1, 4]:
+            x = torch.randn((batch_size, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+            
+            with torch.no_grad():
+                y = self.model(x).numpy()
+            
+            y_numpy = self.numpy_model(x.numpy())
+            np.testing.assert_allclose(y, y_numpy, atol=1e-5)
+            
+    def test_state_parity(self):
+        
+        x = torch.randn((2, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        x_next = torch.randn((2, 1, self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y, state = self.model.forward_state(x)
+            y_next, _ = self.model.forward_state(x_next, state)
+            
+        y_numpy, state_numpy = self.numpy_model.forward_state(x.numpy())
+        y_next_numpy, _ = self.numpy_model.forward_state(x_next.numpy(), state_numpy)
+        
+        np.testing.assert_allclose(y.numpy(), y_numpy, atol=1e-5)
+        np.testing.assert_allclose(state[1].numpy(), state_numpy[1], atol=1e-5)
+        np.testing.assert_allclose(y_next.numpy(), y_next_numpy, atol=1e-5)
+
+class TestRepresentation(TestCase):
+    
+    def setUp(self):
+        
+        torch.manual_seed(0)
+        rng = np.random.default_rng(0)
+        
+        self.joint_count = 6
+        self.offsets = rng.normal(size=(self.joint_count, 3)).astype(np.float32)
+        self.parents = [ -1, 0, 1, 2, 1, 4 ]
+        self.children = [ [1], [2, 4], [3], [], [5], [] ]
+        
+        motion_seq = rng.normal(size=(16, self.joint_count, 4)).astype(np.float32)
+        self.motion_seq = motion_seq / np.linalg.norm(motion_seq, axis=-1, keepdims=True)
+        
+    def test_numpy_parity(self):
+        
+        import motion_synthesis
+        import motion_synthesis_np
+        
+        for representation, joint_dim in [ ("quat", 4), ("repr6d", 6) ]:
+            x = motion_synthesis.poseToModel(torch.from_numpy(self.motion_seq), representation)
+            x_numpy = motion_synthesis_np.poseToModel(self.motion_seq, representation)
+            
+            self.assertEqual(x.shape, (16, self.joint_count * joint_dim))
+            np.testing.assert_allclose(x.numpy(), x_numpy, atol=1e-6)
+            
+            pred_pose = torch.randn((1, self.joint_count * joint_dim), dtype=torch.float32)
+            q = motion_synthesis.modelToPose(pred_pose, self.joint_count, representation)
+            q_numpy = motion_synthesis_np.modelToPose(pred_pose.numpy(), self.joint_count, representation)
+            
+            np.testing.assert_allclose(q.numpy(), q_numpy, atol=1e-5)
+            np.testing.assert_allclose(np.linalg.norm(q_numpy, axis=-1), 1.0, atol=1e-5)
+            
+    def test_synthesis_step(self):
+        
+        import motion_synthesis
+        
+        config = dict(motion_model.config)
+        config["data_dim"] = self.joint_count * 6
+        config["node_dim"] = 32
+        config["device"] = "cpu"
+        config["weights_path"] = ""
+        
+        model = motion_model.createModel(config)
+        model.eval()
+        
+        synthesis_step = motion_synthesis.SynthesisStep(model, self.offsets, self.parents, self.children, "repr6d")
+        motion_seq = torch.from_numpy(self.motion_seq)
+        
+        with torch.no_grad():
+            outputs = synthesis_step(motion_seq)
+            traced_outputs = torch.jit.trace(synthesis_step, motion_seq)(motion_seq)
+            
+        for output, traced_output in zip(outputs, traced_outputs):
+            np.testing.assert_allclose(output.numpy(), traced_output.numpy(), atol=1e-5)
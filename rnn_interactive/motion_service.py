@@ -0,0 +1,422 @@
+import threading
+import queue
+import time
+from collections import OrderedDict
+
+import torch
+from torch import nn
+import numpy as np
+
+from pythonosc import dispatcher
+from pythonosc import osc_server
+from pythonosc.udp_client import SimpleUDPClient
+
+import motion_engine
+import motion_synthesis
+
+"""
+inference service that is shared by several client applications on the same machine
+requests arriving over OSC are collected for at most max_latency seconds and run as one batched model forward
+
+requests (OSC address, arguments):
+ -- /service/continue request_id budget_ms v0 v1 ... : continue the window given as L * pose_dim floats
+    reply: /service/pose request_id rot_local (J * 4 floats)
+ -- /service/advance request_id budget_ms session_id : advance a session held by the service by one frame
+    reply: /service/pose request_id rot_local (J * 4 floats) pos_world (J * 3 floats) rot_world (J * 4 floats)
+ -- /service/addsession request_id seq_index : create a session starting from one of the original sequences
+    reply: /service/session request_id session_id
+ -- /service/removesession session_id
+ -- /service/metrics
+    reply: /service/metrics request_count late_count batch_count mean_batch_size max_batch_size mean_wait_ms mean_forward_ms
+
+errors:
+ -- /service/error request_id message : sent instead of the reply if a request is malformed, refers to an unknown session
+    or its batch failed, the service keeps running
+
+budget_ms is the latency budget of a request, a budget <= 0 means the service default is used
+replies are sent back to the address and port the request came from
+an OSC message has to fit into one UDP datagram (about 64 kB), clients with large poses have to send shorter windows
+"""
+
+config = {"model": None,
+          "skeleton": None,
+          "seq_length": 64,
+          "orig_sequences": [],
+          "device": "cuda",
+          "representation": "quat",
+          "ip": "127.0.0.1",
+          "port": 9010,
+          "max_latency": 0.005,
+          "max_batch_size": 32,
+          "default_budget": 0.02
+          }
+
+class ServiceRequest():
+
+    def __init__(self, kind, client_address, request_id, budget, data):
+
+        self.kind = kind
+        self.client_address = client_address
+        self.request_id = request_id
+        self.data = data
+
+        self.arrival_time = time.time()
+        self.deadline = self.arrival_time + budget
+
+class MotionService():
+
+    def __init__(self, config):
+
+        self.model = config["model"]
+        self.skeleton = config["skeleton"]
+        self.seq_length = config["seq_length"]
+        self.orig_sequences = config["orig_sequences"]
+        self.device = config["device"]
+        self.representation = config["representation"]
+        self.ip = config["ip"]
+        self.port = config["port"]
+        self.max_latency = config["max_latency"]
+        self.max_batch_size = config["max_batch_size"]
+        self.default_budget = config["default_budget"]
+
+        self.joint_count = self.orig_sequences[0].shape[1]
+        self.joint_dim = self.orig_sequences[0].shape[2]
+        self.pose_dim = self.joint_count * self.joint_dim
+
+        self.sessions = OrderedDict()
+        self.next_session_id = 0
+
+        self.requests = queue.Queue()
+        self.clients = {}
+
+        self.resetMetrics()
+
+        # running estimate of the time one batch takes, used to flush a batch before the tightest budget runs out
+        self.forward_time_estimate = 0.0
+
+        self.dispatcher = dispatcher.Dispatcher()
+
+        self.dispatcher.map("/service/continue", self.receiveContinue, needs_reply_address=True)
+        self.dispatcher.map("/service/advance", self.receiveAdvance, needs_reply_address=True)
+        self.dispatcher.map("/service/addsession", self.receiveAddSession, needs_reply_address=True)
+        self.dispatcher.map("/service/removesession", self.receiveRemoveSession, needs_reply_address=True)
+        self.dispatcher.map("/service/metrics", self.receiveMetrics, needs_reply_address=True)
+
+        self.server = osc_server.ThreadingOSCUDPServer((self.ip, self.port), self.dispatcher)
+        self.server.max_packet_size = 65535 # socketserver default of 8192 bytes is too small for windows
+
+    """
+    sessions
+    """
+
+    def addSession(self, seq_index):
+
+        session_config = dict(motion_engine.session_config)
+        session_config["skeleton"] = self.skeleton
+        session_config["model"] = self.model
+        session_config["seq_length"] = self.seq_length
+        session_config["orig_sequences"] = self.orig_sequences
+        session_config["orig_seq_index"] = min(seq_index, len(self.orig_sequences) - 1)
+        session_config["device"] = self.device
+        session_config["representation"] = self.representation
+
+        session = motion_engine.MotionSession(session_config)
+
+        session_id = self.next_session_id
+        self.next_session_id += 1
+        self.sessions[session_id] = session
+
+        return session_id
+
+    def removeSession(self, session_id):
+
+        self.sessions.pop(session_id, None)
+
+    """
+    OSC requests
+    """
+
+    def _budget(self, budget_ms):
+
+        return budget_ms / 1000.0 if budget_ms > 0 else self.default_budget
+
+    def receiveContinue(self, client_address, address, *args):
+
+        # malformed requests are answered right away and never reach the batch
+        if len(args) < 3 or len(args[2:]) % self.pose_dim != 0:
+            self._replyError(client_address, args[0] if len(args) > 0 else -1, "continue expects a window of L * {} values".format(self.pose_dim))
+            return
+
+        request_id, budget_ms = args[0], args[1]
+
+        try:
+            window = np.array(args[2:], dtype=np.float32).reshape(-1, self.pose_dim)
+        except ValueError:
+            self._replyError(client_address, request_id, "continue expects a window of numbers")
+            return
+
+        self.requests.put(ServiceRequest("continue", client_address, request_id, self._budget(budget_ms), window))
+
+    def receiveAdvance(self, client_address, address, *args):
+
+        if len(args) < 3 or isinstance(args[2], int) == False:
+            self._replyError(client_address, args[0] if len(args) > 0 else -1, "advance expects a session id")
+            return
+
+        request_id, budget_ms, session_id = args[0], args[1], args[2]
+
+        self.requests.put(ServiceRequest("advance", client_address, request_id, self._budget(budget_ms), session_id))
+
+    def receiveAddSession(self, client_address, address, *args):
+
+        if len(args) < 2 or isinstance(args[1], int) == False or args[1] < 0:
+            self._replyError(client_address, args[0] if len(args) > 0 else -1, "addsession expects a sequence index")
+            return
+
+        request_id, seq_index = args[0], args[1]
+
+        # sessions are only changed by the batch thread
+        self.requests.put(ServiceRequest("addsession", client_address, request_id, self.default_budget, seq_index))
+
+    def receiveRemoveSession(self, client_address, address, *args):
+
+        if len(args) < 1:
+            return
+
+        self.requests.put(ServiceRequest("removesession", client_address, -1, self.default_budget, args[0]))
+
+    def receiveMetrics(self, client_address, address, *args):
+
+        metrics = self.getMetrics()
+
+        self._reply(client_address, "/service/metrics", [ metrics["request_count"], metrics["late_count"], metrics["batch_count"],
+                                                          metrics["mean_batch_size"], metrics["max_batch_size"],
+                                                          metrics["mean_wait"] * 1000.0, metrics["mean_forward"] * 1000.0 ])
+
+    def _reply(self, client_address, address, values):
+
+        if client_address not in self.clients:
+            self.clients[client_address] = SimpleUDPClient(client_address[0], client_address[1])
+
+        self.clients[client_address].send_message(address, values)
+
+    def _replyError(self, client_address, request_id, message):
+
+        self._reply(client_address, "/service/error", [ request_id, message ])
+
+    """
+    metrics
+    """
+
+    def resetMetrics(self):
+
+        self.request_count = 0
+        self.late_count = 0
+        self.batch_count = 0
+        self.batch_sizes = {}
+        self.wait_time_sum = 0.0
+        self.forward_time_sum = 0.0
+
+    def getMetrics(self):
+
+        batch_count = max(self.batch_count, 1)
+        request_count = max(self.request_count, 1)
+
+        return {"request_count": self.request_count,
+                "late_count": self.late_count,
+                "batch_count": self.batch_count,
+                "batch_sizes": dict(self.batch_sizes),
+                "mean_batch_size": sum([ size * count for size, count in self.batch_sizes.items() ]) / batch_count,
+                "max_batch_size": max(self.batch_sizes.keys(), default=0),
+                "mean_wait": self.wait_time_sum / request_count,
+                "mean_forward": self.forward_time_sum / batch_count}
+
+    """
+    batching
+    """
+
+    def collectBatch(self, timeout=0.1):
+        """
+        wait for a first request, then collect further requests until max_latency has passed since the first one,
+        the batch is full, or the tightest latency budget in the batch would otherwise be missed
+        """
+
+        try:
+            request = self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+        batch = [ request ]
+
+        flush_time = min(request.arrival_time + self.max_latency, request.deadline - self.forward_time_estimate)
+
+        while len(batch) < self.max_batch_size:
+
+            wait_time = flush_time - time.time()
+
+            if wait_time <= 0.0:
+                break
+
+            try:
+                request = self.requests.get(timeout=wait_time)
+            except queue.Empty:
+                break
+
+            batch.append(request)
+
+            flush_time = min(flush_time, request.deadline - self.forward_time_estimate)
+
+        return batch
+
+    def processBatch(self, batch):
+
+        # session management requests are handled before the forward pass
+        for request in batch:
+            try:
+                if request.kind == "addsession":
+                    session_id = self.addSession(request.data)
+                    self._reply(request.client_address, "/service/session", [ request.request_id, session_id ])
+                elif request.kind == "removesession":
+                    self.removeSession(request.data)
+            except Exception as e:
+                self._replyError(request.client_address, request.request_id, "{} failed: {}".format(request.kind, e))
+
+        for request in batch:
+            if request.kind == "advance" and request.data not in self.sessions:
+                self._replyError(request.client_address, request.request_id, "unknown session {}".format(request.data))
+
+        continue_requests = [ request for request in batch if request.kind == "continue" ]
+        advance_requests = [ request for request in batch if request.kind == "advance" and request.data in self.sessions ]
+
+        try:
+            self._processForward(continue_requests, advance_requests)
+        except Exception as e:
+            # a failing batch is answered with an error for each of its requests, the service thread keeps running
+            print("service batch failed:", e)
+
+            for request in continue_requests + advance_requests:
+                self._replyError(request.client_address, request.request_id, "batch failed: {}".format(e))
+
+    def _processForward(self, continue_requests, advance_requests):
+
+        # a session is advanced only once per batch even if it was requested several times
+        advance_sessions = list(OrderedDict.fromkeys([ request.data for request in advance_requests ]).keys())
+
+        if len(continue_requests) + len(advance_sessions) == 0:
+            return
+
+        start_time = time.time()
+
+        for session_id in advance_sessions:
+            if self.sessions[session_id].orig_seq_changed == True:
+                self.sessions[session_id].changeSequence()
+
+        # windows of different length are batched separately, usually all windows have the service sequence length
+        windows = [ torch.from_numpy(request.data.reshape(-1, self.joint_count, self.joint_dim)).to(self.device) for request in continue_requests ]
+        windows += [ self.sessions[session_id].motion_seq for session_id in advance_sessions ]
+        windows = [ motion_synthesis.poseToModel(window, self.representation) for window in windows ]
+
+        self.model.eval()
+
+        with torch.no_grad():
+
+            pred_poses = [ None ] * len(windows)
+
+            for window_length in set([ window.shape[0] for window in windows ]):
+
+                window_indices = [ wI for wI, window in enumerate(windows) if window.shape[0] == window_length ]
+
+                pred = self.model(torch.stack([ windows[wI] for wI in window_indices ], dim=0))
+
+                for bI, wI in enumerate(window_indices):
+                    pred_poses[wI] = pred[bI]
+
+            # convert to unit quaternions, all poses of the batch are converted as one pose with len(windows) * joint_count joints
+            pred_poses = motion_synthesis.modelToPose(torch.stack(pred_poses, dim=0), len(windows) * self.joint_count, self.representation)
+            pred_poses = pred_poses.reshape((-1, self.joint_count, self.joint_dim))
+
+            session_poses = pred_poses[len(continue_requests):]
+
+            if len(advance_sessions) > 0:
+
+                # convert quaternion poses to position poses, the skeleton is shared by all sessions
+                zero_trajectory = torch.zeros((len(advance_sessions), 1, 3), dtype=torch.float32).to(self.device)
+
+                session_poses_wpos, session_poses_wrot = self.sessions[advance_sessions[0]]._forward_kinematics(torch.unsqueeze(session_poses, dim=1), zero_trajectory)
+
+                session_poses_wpos = session_poses_wpos.cpu().numpy().reshape((-1, self.joint_count, 3))
+                session_poses_wrot = session_poses_wrot.cpu().numpy().reshape((-1, self.joint_count, 4))
+
+        pred_poses_lrot = pred_poses.cpu().numpy()
+
+        for sI, session_id in enumerate(advance_sessions):
+
+            session = self.sessions[session_id]
+
+            session.pred_pose = session_poses[sI:sI+1]
+            session.appendPose(session.pred_pose)
+
+            session.synth_pose_lrot = pred_poses_lrot[len(continue_requests) + sI]
+            session.synth_pose_wpos = session_poses_wpos[sI]
+            session.synth_pose_wrot = session_poses_wrot[sI]
+
+        end_time = time.time()
+
+        forward_time = end_time - start_time
+        self.forward_time_estimate = 0.9 * self.forward_time_estimate + 0.1 * forward_time if self.batch_count > 0 else forward_time
+
+        # replies
+        for rI, request in enumerate(continue_requests):
+            self._reply(request.client_address, "/service/pose", [ request.request_id ] + pred_poses_lrot[rI].reshape(-1).tolist())
+
+        for request in advance_requests:
+            session = self.sessions[request.data]
+            self._reply(request.client_address, "/service/pose", [ request.request_id ] + session.synth_pose_lrot.reshape(-1).tolist()
+                        + session.synth_pose_wpos.reshape(-1).tolist() + session.synth_pose_wrot.reshape(-1).tolist())
+
+        # metrics
+        batch_size = len(continue_requests) + len(advance_sessions)
+
+        self.batch_count += 1
+        self.batch_sizes[batch_size] = self.batch_sizes.get(batch_size, 0) + 1
+        self.forward_time_sum += forward_time
+
+        for request in continue_requests + advance_requests:
+            self.request_count += 1
+            self.wait_time_sum += start_time - request.arrival_time
+            if end_time > request.deadline:
+                self.late_count += 1
+
+    def run(self):
+
+        while self.service_thread_event.is_set() == False:
+
+            batch = self.collectBatch()
+
+            if len(batch) > 0:
+                try:
+                    self.processBatch(batch)
+                except Exception as e:
+                    # e.g. a reply that could not be sent, the other clients are still served
+                    print("service batch failed:", e)
+
+    """
+    start / stop
+    """
+
+    def start(self):
+
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+        self.service_thread_event = threading.Event()
+        self.service_thread = threading.Thread(target=self.run)
+        self.service_thread.start()
+
+    def stop(self):
+
+        self.service_thread_event.set()
+        self.service_thread.join()
+
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,121 @@
+import time
+from unittest import TestCase
+import numpy as np
+import torch
+
+import motion_model
+import motion_service
+
+class TestMotionService(TestCase):
+
+    def setUp(self):
+
+        torch.manual_seed(0)
+        rng = np.random.default_rng(0)
+
+        self.joint_count = 6
+        parents = [ -1, 0, 1, 2, 1, 4 ]
+
+        skeleton = {}
+        skeleton["offsets"] = rng.normal(size=(self.joint_count, 3)).astype(np.float32)
+        skeleton["parents"] = parents
+        skeleton["children"] = [ [ child for child, parent in enumerate(parents) if parent == joint ] for joint in range(self.joint_count) ]
+
+        orig_seq = rng.normal(size=(100, self.joint_count, 4)).astype(np.float32)
+        self.orig_sequences = [ orig_seq / np.linalg.norm(orig_seq, axis=-1, keepdims=True) ]
+
+        self.seq_length = 16
+
+        model_config = dict(motion_model.config)
+        model_config["input_length"] = self.seq_length
+        model_config["data_dim"] = self.joint_count * 4
+        model_config["node_dim"] = 32
+        model_config["device"] = "cpu"
+        model_config["weights_path"] = ""
+
+        service_config = dict(motion_service.config)
+        service_config["model"] = motion_model.createModel(model_config)
+        service_config["skeleton"] = skeleton
+        service_config["seq_length"] = self.seq_length
+        service_config["orig_sequences"] = self.orig_sequences
+        service_config["device"] = "cpu"
+        service_config["port"] = 0
+
+        self.service = motion_service.MotionService(service_config)
+
+        # replies are collected instead of sent
+        self.replies = []
+        self.service._reply = lambda client_address, address, values: self.replies.append((address, values))
+
+        self.client_address = ("127.0.0.1", 9)
+        self.window = self.orig_sequences[0][:self.seq_length].reshape(-1).tolist()
+
+    def tearDown(self):
+        self.service.server.server_close()
+
+    def processRequests(self):
+
+        batch = []
+        while self.service.requests.empty() == False:
+            batch.append(self.service.requests.get())
+
+        self.service.processBatch(batch)
+
+    def test_malformed_requests(self):
+
+        self.service.receiveContinue(self.client_address, "/service/continue", 1, 0.0)
+        self.service.receiveContinue(self.client_address, "/service/continue", 2, 0.0, *self.window[:-1])
+        self.service.receiveAdvance(self.client_address, "/service/advance", 3, 0.0)
+        self.service.receiveAddSession(self.client_address, "/service/addsession", 4, "walk")
+
+        # malformed requests are answered without being queued
+        self.assertTrue(self.service.requests.empty())
+        self.assertEqual([ address for address, _ in self.replies ], [ "/service/error" ] * 4)
+        self.assertEqual([ values[0] for _, values in self.replies ], [ 1, 2, 3, 4 ])
+
+    def test_unknown_session(self):
+
+        self.service.receiveAdvance(self.client_address, "/service/advance", 1, 0.0, 5)
+        self.service.receiveContinue(self.client_address, "/service/continue", 2, 0.0, *self.window)
+        self.processRequests()
+
+        self.assertEqual(self.replies[0], ("/service/error", [ 1, "unknown session 5" ]))
+        self.assertEqual(self.replies[1][0], "/service/pose")
+        self.assertEqual(self.replies[1][1][0], 2)
+        self.assertEqual(len(self.replies), 2)
+
+    def test_failed_batch(self):
+
+        model = self.service.model
+
+        def failing_model(x):
+            raise RuntimeError("model failed")
+
+        self.service.model = failing_model
+        self.service.model.eval = lambda: None
+
+        self.service.start()
+
+        try:
+            self.service.receiveContinue(self.client_address, "/service/continue", 1, 0.0, *self.window)
+
+            deadline = time.time() + 10.0
+            while len(self.replies) < 1 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(self.replies[0][0], "/service/error")
+            self.assertEqual(self.replies[0][1][0], 1)
+
+            # the service thread survives the failed batch and serves the next request
+            self.service.model = model
+            self.service.receiveContinue(self.client_address, "/service/continue", 2, 0.0, *self.window)
+
+            deadline = time.time() + 10.0
+            while len(self.replies) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertTrue(self.service.service_thread.is_alive())
+            self.assertEqual(self.replies[1][0], "/service/pose")
+            self.assertEqual(self.replies[1][1][0], 2)
+        finally:
+            self.service.stop()
@@ -4,13 +4,16 @@ import numpy as np
 
 from common.quaternion import qmul, qrot, qnormalize_np, qfix
 from common.quaternion_torch import slerp
+from common.repr6d_torch import quat2repr6d, repr6d2quat
 
 config = {"skeleton": None,
           "model": None,
           "seq_length": 64,
           "orig_sequences": [],
           "orig_seq_index": 0,
-          "device": "cuda"
+          "device": "cuda",
+          "compile_step": False,
+          "representation": "quat"
           }
 
 """
@@ -24,6 +27,85 @@ test_rot_norm = nn.functional.normalize(test_rot, p=2, dim=0)
 test_rot_norm
 """
 
+"""
+Model Representation
+"""
+
+def poseToModel(motion_seq, representation):
+    """
+    convert a (L, J, 4) quaternion window into the (L, J * D) model input
+    D is 4 for models trained on quaternions and 6 for models trained on the 6d representation
+    """
+    
+    if representation == "repr6d":
+        motion_seq = quat2repr6d(motion_seq)
+        
+    return motion_seq.reshape(motion_seq.shape[0], -1)
+
+def modelToPose(pred_pose, joint_count, representation):
+    """
+    convert a model prediction with J * D values into a (J, 4) tensor of unit quaternions
+    """
+    
+    if representation == "repr6d":
+        return repr6d2quat(pred_pose.reshape(joint_count, 6))
+    
+    return nn.functional.normalize(pred_pose.reshape(joint_count, 4), p=2, dim=1)
+
+class SynthesisStep(nn.Module):
+    """
+    one synthesis step as a single module: model prediction, conversion to unit quaternions and forward kinematics
+    the module is traced into a frozen TorchScript graph so that the per tick work runs in one call
+    Arguments (where L = sequence length, J = number of joints):
+     -- motion_seq: (L, J, 4) tensor of local joint rotations (the model input window)
+    Returns:
+     -- pred_pose: (J, 4) tensor of normalised local joint rotations
+     -- positions_world: (J, 3) tensor of world joint positions
+     -- rotations_world: (J, 4) tensor of world joint rotations
+    """
+    
+    def __init__(self, model, joint_offsets, joint_parents, joint_children, representation="quat"):
+        super(SynthesisStep, self).__init__()
+        
+        self.model = model
+        self.representation = representation
+        self.joint_parents = list(joint_parents)
+        self.joint_terminal = [ len(children) == 0 for children in joint_children ]
+        
+        self.register_buffer("joint_offsets", torch.tensor(joint_offsets, dtype=torch.float32))
+        self.register_buffer("identity_rot", torch.tensor([1.0, 0.0, 0.0, 0.0], dtype=torch.float32))
+        self.register_buffer("root_position", torch.zeros(3, dtype=torch.float32))
+        
+    def forward(self, motion_seq):
+        
+        joint_count = motion_seq.shape[1]
+        
+        pred_pose = self.model(poseToModel(motion_seq, self.representation).unsqueeze(0))
+        
+        # normalize pred pose
+        pred_pose = modelToPose(pred_pose, joint_count, self.representation)
+        
+        # convert quaternion pose to position pose
+        positions_world = []
+        rotations_world = []
+        
+        for jI in range(joint_count):
+            parent_index = self.joint_parents[jI]
+            
+            if parent_index == -1:
+                positions_world.append(self.root_position)
+                rotations_world.append(pred_pose[jI])
+            else:
+                positions_world.append(qrot(rotations_world[parent_index], self.joint_offsets[jI]) + positions_world[parent_index])
+                
+                if self.joint_terminal[jI] == False:
+                    rotations_world.append(qmul(rotations_world[parent_index], pred_pose[jI]))
+                else:
+                    # This joint is a terminal node -> it would be useless to compute the transformation
+                    rotations_world.append(self.identity_rot)
+                    
+        return pred_pose, torch.stack(positions_world, dim=0), torch.stack(rotations_world, dim=0)
+
 class MotionSynthesis():
     
     def __init__(self, config):
@@ -37,6 +119,8 @@ class MotionSynthesis():
         self.orig_seq_frame_count = self.seq_length
         self.orig_seq_blend_factor = 1.0
         self.seq_rand_range = 0.00 # TODO: remove this, doesn't help a bit
+        self.compile_step = config["compile_step"]
+        self.representation = config["representation"]
 
         self.motion_seq = torch.from_numpy(self.orig_sequences[self.orig_seq_index][self.orig_seq_start_frame_index:self.orig_seq_start_frame_index + self.orig_seq_frame_count, ...]).to(self.device)
         
@@ -52,6 +136,16 @@ class MotionSynthesis():
         
         self._create_edge_list()
         
+        self.synthesis_step = None
+        
+        if self.compile_step == True:
+            # only torch modules can be traced, other backends (e.g. onnxruntime) leave torch inside the model call
+            # and their prediction would be baked into the graph as a constant
+            if isinstance(self.model, nn.Module):
+                self._create_synthesis_step()
+            else:
+                print("compile_step requires a torch model, the synthesis step is not compiled")
+        
         self.synth_pose_wpos = None
         self.synth_pose_wrot = None
         self.synth_pose_lrot = None
@@ -64,6 +158,26 @@ class MotionSynthesis():
             for child_joint_index in self.joint_children[parent_joint_index]:
                 self.edge_list.append([parent_joint_index, child_joint_index])
                 
+    def _create_synthesis_step(self):
+        
+        # trace model prediction, normalisation and forward kinematics into a single frozen graph
+        # the model stays in eval mode from here on
+        self.model.eval()
+        
+        synthesis_step = SynthesisStep(self.model, self.joint_offsets, self.joint_parents, self.joint_children, self.representation).to(self.device)
+        synthesis_step.eval()
+        
+        with torch.no_grad():
+            synthesis_step = torch.jit.trace(synthesis_step, self.motion_seq.clone())
+            synthesis_step = torch.jit.freeze(synthesis_step)
+            synthesis_step = torch.jit.optimize_for_inference(synthesis_step)
+            
+            # warm up the profiling executor
+            for _ in range(3):
+                synthesis_step(self.motion_seq)
+        
+        self.synthesis_step = synthesis_step
+                
     def setOrigSeqIndex(self, index):
         
         self.orig_seq_index = min(index, len(self.orig_sequences) - 1 ) 
@@ -101,31 +215,19 @@ class MotionSynthesis():
                 self.motion_seq = orig_seq
         else:
 
+            # the whole window is blended at once
             if self.orig_seq_frame_count < self.seq_length:
                 
-                orig_seq = orig_seq.reshape(-1, self.joint_dim)
-                cur_seq  = self.motion_seq[:self.orig_seq_frame_count, ...].reshape(-1, self.joint_dim)
-                blend_factor = torch.ones([orig_seq.shape[0]], dtype=torch.float32).to(self.device) * self.orig_seq_blend_factor
-                
-                #print("frame_count ", self.orig_seq_frame_count, " orig_seq s ", orig_seq.shape, " cur_seq s ", cur_seq.shape, " blend_factor s ", blend_factor.shape)
-                
-                blend_seq = slerp(cur_seq, orig_seq, blend_factor)
-                blend_seq = blend_seq.reshape(-1, self.joint_count, self.joint_dim)
+                cur_seq  = self.motion_seq[:self.orig_seq_frame_count, ...]
                 
+                blend_seq = slerp(cur_seq, orig_seq, self.orig_seq_blend_factor)
                 blend_seq = torch.concat( (blend_seq, self.motion_seq[:self.seq_length - self.orig_seq_frame_count, ...]), dim=0)
                 
                 self.motion_seq  = blend_seq
                 
             else:
                 
-                orig_seq = orig_seq.reshape(-1, self.joint_dim)
-                cur_seq  = self.motion_seq.reshape(-1, self.joint_dim)
-                blend_factor = torch.ones([orig_seq.shape[0]], dtype=torch.float32).to(self.device) * self.orig_seq_blend_factor
-                
-                blend_seq = slerp(cur_seq, orig_seq, blend_factor)
-                blend_seq = blend_seq.reshape(-1, self.joint_count, self.joint_dim)
-                
-                self.motion_seq  = blend_seq
+                self.motion_seq  = slerp(self.motion_seq, orig_seq, self.orig_seq_blend_factor)
 
         self.orig_seq_changed = False
         
@@ -185,15 +287,17 @@ class MotionSynthesis():
         if self.orig_seq_changed == True:
             self.changeSequence()
             
+        if self.synthesis_step is not None:
+            self._update_step()
+            return
+            
         self.model.eval()
         
         with torch.no_grad():
-            self.pred_pose = self.model(torch.unsqueeze(self.motion_seq.reshape(-1, self.pose_dim), axis=0))
+            self.pred_pose = self.model(torch.unsqueeze(poseToModel(self.motion_seq, self.representation), axis=0))
                 
         # normalize pred pose
-        self.pred_pose = torch.squeeze(self.pred_pose)
-        self.pred_pose = self.pred_pose.reshape((-1, 4))
-        self.pred_pose = nn.functional.normalize(self.pred_pose, p=2, dim=1)
+        self.pred_pose = modelToPose(self.pred_pose, self.joint_count, self.representation)
         self.pred_pose = self.pred_pose.reshape((1, self.joint_count, self.joint_dim))
         
         self.synth_pose_lrot = self.pred_pose.detach().cpu().numpy()
@@ -209,14 +313,7 @@ class MotionSynthesis():
         """
     
         # append pred pose to sequence
-        self.motion_seq = torch.cat([self.motion_seq[1:,:], self.pred_pose], axis=0)
-        
-        # debug randomize first pose in motion seq
-        if self.seq_rand_range > 0:
-            rand_rot = torch.rand([self.joint_count, 4], dtype=torch.float32).to(self.device)
-            rand_rot = nn.functional.normalize(rand_rot, p=2, dim=1)
-            rand_range = torch.ones(self.joint_count, dtype=torch.float32).to(self.device) * self.seq_rand_range
-            self.motion_seq[0] = (slerp(self.motion_seq[0], rand_rot, rand_range))
+        self.appendPose(self.pred_pose)
 
         # convert quaternion pose to position pose
         zero_trajectory = torch.tensor(np.zeros((1, 1, 3), dtype=np.float32))
@@ -231,6 +328,34 @@ class MotionSynthesis():
         self.synth_pose_wrot = self.synth_pose_wrot.reshape((self.joint_count, 4))
         
         self.model.train()
+        
+    def appendPose(self, pred_pose):
+        """
+        shift the motion sequence by one frame and append the (1, J, 4) predicted pose
+        """
+        
+        self.motion_seq = torch.cat([self.motion_seq[1:,:], pred_pose], axis=0)
+        
+        # debug randomize first pose in motion seq
+        if self.seq_rand_range > 0:
+            rand_rot = torch.rand([self.joint_count, 4], dtype=torch.float32).to(self.device)
+            rand_rot = nn.functional.normalize(rand_rot, p=2, dim=1)
+            rand_range = torch.ones(self.joint_count, dtype=torch.float32).to(self.device) * self.seq_rand_range
+            self.motion_seq[0] = (slerp(self.motion_seq[0], rand_rot, rand_range))
+        
+    def _update_step(self):
+        
+        with torch.no_grad():
+            pred_pose, synth_pose_wpos, synth_pose_wrot = self.synthesis_step(self.motion_seq)
+        
+        self.pred_pose = pred_pose.reshape((1, self.joint_count, self.joint_dim))
+        
+        # append pred pose to sequence
+        self.appendPose(self.pred_pose)
+        
+        self.synth_pose_lrot = pred_pose.cpu().numpy()
+        self.synth_pose_wpos = synth_pose_wpos.cpu().numpy()
+        self.synth_pose_wrot = synth_pose_wrot.cpu().numpy()
 
                 
     def _forward_kinematics(self, rotations, root_positions):
@@ -263,7 +388,7 @@ class MotionSynthesis():
                     rotations_world.append(qmul(rotations_world[self.joint_parents[jI]], rotations[:, :, jI]))
                 else:
                     # This joint is a terminal node -> it would be useless to compute the transformation
-                    rotations_world.append(torch.Tensor([[[1.0, 0.0, 0.0, 0.0]]]).to(self.device))
+                    rotations_world.append(torch.Tensor([1.0, 0.0, 0.0, 0.0]).to(self.device).expand(rotations.shape[0], rotations.shape[1], 4))
                     
         return torch.stack(positions_world, dim=3).permute(0, 1, 3, 2), torch.stack(rotations_world, dim=3).permute(0, 1, 3, 2)
 
@@ -0,0 +1,222 @@
+import numpy as np
+
+import common.quaternion_np as nquat
+
+"""
+numpy version of motion_synthesis.MotionSynthesis
+runs the synthesis loop (model prediction, quaternion normalisation, forward kinematics) without torch
+to be used together with a model created by motion_model_np
+"""
+
+config = {"skeleton": None,
+          "model": None,
+          "seq_length": 64,
+          "orig_sequences": [],
+          "orig_seq_index": 0,
+          "device": "cpu",
+          "representation": "quat"
+          }
+
+"""
+Model Representation
+"""
+
+def poseToModel(motion_seq, representation):
+    """
+    numpy version of motion_synthesis.poseToModel
+    convert a (L, J, 4) quaternion window into the (L, J * D) model input, D is 4 or 6
+    """
+
+    if representation == "repr6d":
+        motion_seq = nquat.quat2mat(motion_seq)[..., :2, :]
+
+    return motion_seq.reshape(motion_seq.shape[0], -1)
+
+def modelToPose(pred_pose, joint_count, representation):
+    """
+    numpy version of motion_synthesis.modelToPose
+    convert a model prediction with J * D values into a (J, 4) array of unit quaternions
+    """
+
+    if representation == "repr6d":
+        pred_pose = pred_pose.reshape(joint_count, 6)
+
+        # Gram-Schmidt orthogonalisation, same as repr6d_torch.repr6d2mat
+        x = pred_pose[:, :3] / np.linalg.norm(pred_pose[:, :3], axis=1, keepdims=True)
+        z = np.cross(x, pred_pose[:, 3:])
+        z = z / np.linalg.norm(z, axis=1, keepdims=True)
+        y = np.cross(z, x)
+
+        return nquat.mat2quat(np.stack((x, y, z), axis=-2)).astype(np.float32)
+
+    pred_pose = pred_pose.reshape(joint_count, 4)
+
+    return pred_pose / np.maximum(np.linalg.norm(pred_pose, axis=1, keepdims=True), 1e-12)
+
+class MotionSynthesis():
+
+    def __init__(self, config):
+        self.skeleton = config["skeleton"]
+        self.model = config["model"]
+        self.seq_length = config["seq_length"]
+        self.device = config["device"]
+        self.orig_sequences = config["orig_sequences"]
+        self.orig_seq_index = config["orig_seq_index"]
+        self.orig_seq_start_frame_index = 0
+        self.orig_seq_frame_count = self.seq_length
+        self.orig_seq_blend_factor = 1.0
+        self.seq_rand_range = 0.00
+        self.representation = config["representation"]
+
+        self.motion_seq = np.array(self.orig_sequences[self.orig_seq_index][self.orig_seq_start_frame_index:self.orig_seq_start_frame_index + self.orig_seq_frame_count, ...], dtype=np.float32)
+
+        self.orig_seq_changed = False
+
+        self.joint_count = self.motion_seq.shape[1]
+        self.joint_dim = self.motion_seq.shape[2]
+        self.pose_dim = self.joint_count * self.joint_dim
+
+        self.joint_offsets = self.skeleton ["offsets"].astype(np.float32)
+        self.joint_parents = self.skeleton ["parents"]
+        self.joint_children = self.skeleton ["children"]
+
+        self._create_edge_list()
+
+        self.synth_pose_wpos = None
+        self.synth_pose_wrot = None
+        self.synth_pose_lrot = None
+
+    def _create_edge_list(self):
+
+        self.edge_list = []
+
+        for parent_joint_index in range(len(self.joint_children)):
+            for child_joint_index in self.joint_children[parent_joint_index]:
+                self.edge_list.append([parent_joint_index, child_joint_index])
+
+    def setOrigSeqIndex(self, index):
+
+        self.orig_seq_index = min(index, len(self.orig_sequences) - 1 )
+        self.orig_seq_changed = True
+
+    def setOrigSeqStartFrameIndex(self, index):
+
+        self.orig_seq_start_frame_index = min(index, self.orig_sequences[self.orig_seq_index].shape[0] - self.seq_length )
+        self.orig_seq_changed = True
+
+    def setOrigSeqFrameCount(self, count):
+
+        self.orig_seq_frame_count = min(count, self.seq_length)
+        self.orig_seq_changed = True
+
+    def setOrigSeqBlend(self, blend):
+
+        self.orig_seq_blend_factor = max(min(1.0, blend), 0.0)
+        self.orig_seq_changed = True
+
+    def setRandRange(self, rand):
+        self.seq_rand_range = rand
+
+    def changeSequence(self):
+
+        orig_seq = np.array(self.orig_sequences[self.orig_seq_index][self.orig_seq_start_frame_index:self.orig_seq_start_frame_index + self.orig_seq_frame_count, ... ], dtype=np.float32)
+
+        if self.orig_seq_blend_factor >= 1.0:
+
+            if self.orig_seq_frame_count < self.seq_length:
+                self.motion_seq = np.concatenate( (orig_seq, self.motion_seq[:self.seq_length - self.orig_seq_frame_count, ...]), axis=0)
+            else:
+                self.motion_seq = orig_seq
+        else:
+
+            cur_seq = self.motion_seq[:self.orig_seq_frame_count, ...]
+
+            blend_seq = nquat.slerp(cur_seq, orig_seq, self.orig_seq_blend_factor).astype(np.float32)
+
+            if self.orig_seq_frame_count < self.seq_length:
+                blend_seq = np.concatenate( (blend_seq, self.motion_seq[:self.seq_length - self.orig_seq_frame_count, ...]), axis=0)
+
+            self.motion_seq = blend_seq
+
+        self.orig_seq_changed = False
+
+    def setJointRotation(self, joint_index, joint_rot, frame_count):
+
+        joint_rot = np.asarray(joint_rot, dtype=np.float32)
+
+        if frame_count == 1:
+            self.motion_seq[-2, joint_index, :] = joint_rot
+        elif frame_count > 1:
+            frame_count = min(frame_count, self.seq_length)
+            self.motion_seq[:frame_count, joint_index, :] = joint_rot
+
+    def changeJointRotation(self, joint_index, joint_rot, frame_count):
+
+        joint_rot = np.asarray(joint_rot, dtype=np.float32)
+        joint_rot = joint_rot / np.linalg.norm(joint_rot)
+
+        if frame_count == 1:
+            self.motion_seq[-2, joint_index, :] = nquat.mul(self.motion_seq[-1, joint_index, :], joint_rot)
+        elif frame_count > 1:
+            frame_count = min(frame_count, self.seq_length)
+            self.motion_seq[:frame_count, joint_index, :] *= joint_rot
+
+    def update(self):
+
+        if self.orig_seq_changed == True:
+            self.changeSequence()
+
+        self.pred_pose = self.model(np.expand_dims(poseToModel(self.motion_seq, self.representation), axis=0))
+
+        # normalize pred pose
+        self.pred_pose = modelToPose(self.pred_pose, self.joint_count, self.representation)
+        self.pred_pose = self.pred_pose.reshape((1, self.joint_count, self.joint_dim))
+
+        self.synth_pose_lrot = self.pred_pose.reshape((self.joint_count, 4))
+
+        # append pred pose to sequence
+        self.motion_seq = np.concatenate([self.motion_seq[1:], self.pred_pose], axis=0)
+
+        # debug randomize first pose in motion seq
+        if self.seq_rand_range > 0:
+            rand_rot = np.random.rand(self.joint_count, 4).astype(np.float32)
+            rand_rot = rand_rot / np.linalg.norm(rand_rot, axis=1, keepdims=True)
+            rand_range = np.full([self.joint_count], self.seq_rand_range, dtype=np.float32)
+            self.motion_seq[0] = nquat.slerp(self.motion_seq[0], rand_rot, rand_range)
+
+        # convert quaternion pose to position pose
+        zero_trajectory = np.zeros((1, 1, 3), dtype=np.float32)
+
+        self.synth_pose_wpos, self.synth_pose_wrot = self._forward_kinematics(np.expand_dims(self.pred_pose, axis=0), zero_trajectory)
+
+        self.synth_pose_wpos = self.synth_pose_wpos.reshape((self.joint_count, 3))
+        self.synth_pose_wrot = self.synth_pose_wrot.reshape((self.joint_count, 4))
+
+    def _forward_kinematics(self, rotations, root_positions):
+        """
+        Perform forward kinematics using the given trajectory and local rotations.
+        Arguments (where N = batch size, L = sequence length, J = number of joints):
+         -- rotations: (N, L, J, 4) array of unit quaternions describing the local rotations of each joint.
+         -- root_positions: (N, L, 3) array describing the root joint positions.
+        """
+
+        assert len(rotations.shape) == 4
+        assert rotations.shape[-1] == 4
+
+        positions_world = np.empty(rotations.shape[:-1] + (3, ), dtype=np.float32)
+        rotations_world = np.empty(rotations.shape, dtype=np.float32)
+
+        for jI in range(self.joint_offsets.shape[0]):
+            if self.joint_parents[jI] == -1:
+                positions_world[:, :, jI] = root_positions
+                rotations_world[:, :, jI] = rotations[:, :, jI]
+            else:
+                positions_world[:, :, jI] = nquat.rot(rotations_world[:, :, self.joint_parents[jI]], self.joint_offsets[jI]) \
+                                       + positions_world[:, :, self.joint_parents[jI]]
+                if len(self.joint_children[jI]) > 0:
+                    rotations_world[:, :, jI] = nquat.mul(rotations_world[:, :, self.joint_parents[jI]], rotations[:, :, jI])
+                else:
+                    # This joint is a terminal node -> it would be useless to compute the transformation
+                    rotations_world[:, :, jI] = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+
+        return positions_world, rotations_world
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import importlib.util
+from unittest import TestCase, skipIf
+import numpy as np
+import torch
+
+import motion_model
+import motion_synthesis
+
+onnx_available = importlib.util.find_spec("onnxruntime") is not None
+
+class TestMotionSynthesis(TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+
+        self.joint_count = 6
+        parents = [ -1, 0, 1, 2, 1, 4 ]
+
+        self.skeleton = {}
+        self.skeleton["offsets"] = rng.normal(size=(self.joint_count, 3)).astype(np.float32)
+        self.skeleton["parents"] = parents
+        self.skeleton["children"] = [ [ child for child, parent in enumerate(parents) if parent == joint ] for joint in range(self.joint_count) ]
+
+        orig_seq = rng.normal(size=(100, self.joint_count, 4)).astype(np.float32)
+        self.orig_sequences = [ orig_seq / np.linalg.norm(orig_seq, axis=-1, keepdims=True) ]
+
+        self.seq_length = 16
+
+    def createModelConfig(self, representation):
+
+        model_config = dict(motion_model.config)
+        model_config["input_length"] = self.seq_length
+        model_config["data_dim"] = self.joint_count * (6 if representation == "repr6d" else 4)
+        model_config["node_dim"] = 32
+        model_config["device"] = "cpu"
+        model_config["weights_path"] = ""
+        model_config["representation"] = representation
+
+        return model_config
+
+    def createSynthesis(self, model, representation, compile_step):
+
+        synthesis_config = dict(motion_synthesis.config)
+        synthesis_config["skeleton"] = self.skeleton
+        synthesis_config["model"] = model
+        synthesis_config["seq_length"] = self.seq_length
+        synthesis_config["orig_sequences"] = self.orig_sequences
+        synthesis_config["device"] = "cpu"
+        synthesis_config["representation"] = representation
+        synthesis_config["compile_step"] = compile_step
+
+        return motion_synthesis.MotionSynthesis(synthesis_config)
+
+    def test_compiled_step(self):
+
+        for representation in [ "quat", "repr6d" ]:
+
+            torch.manual_seed(0)
+            model = motion_model.createModel(self.createModelConfig(representation))
+
+            synthesis = self.createSynthesis(model, representation, compile_step=False)
+            compiled_synthesis = self.createSynthesis(model, representation, compile_step=True)
+
+            self.assertIsNotNone(compiled_synthesis.synthesis_step)
+
+            for _ in range(5):
+                synthesis.update()
+                compiled_synthesis.update()
+
+                np.testing.assert_allclose(compiled_synthesis.synth_pose_lrot, synthesis.synth_pose_lrot, atol=1e-5)
+                np.testing.assert_allclose(compiled_synthesis.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-4)
+
+    @skipIf(onnx_available == False, "onnxruntime is not installed")
+    def test_onnx_model_not_compiled(self):
+
+        torch.manual_seed(0)
+
+        model_config = self.createModelConfig("quat")
+        model = motion_model.createModel(model_config)
+        model.eval()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            model_config["backend"] = "onnx"
+            model_config["onnx_path"] = os.path.join(tmp_dir, "rnn.onnx")
+            model_config["onnx_step_path"] = ""
+
+            motion_model.exportOnnx(model, model_config, model_config["onnx_path"], stateful=False)
+
+            onnx_model = motion_model.createModel(model_config)
+
+            # tracing the onnx model would freeze its first prediction, the synthesis falls back to the uncompiled update
+            synthesis = self.createSynthesis(model, "quat", compile_step=False)
+            onnx_synthesis = self.createSynthesis(onnx_model, "quat", compile_step=True)
+
+            self.assertIsNone(onnx_synthesis.synthesis_step)
+
+            for _ in range(5):
+                synthesis.update()
+                onnx_synthesis.update()
+
+                np.testing.assert_allclose(onnx_synthesis.synth_pose_lrot, synthesis.synth_pose_lrot, atol=1e-5)
+                np.testing.assert_allclose(onnx_synthesis.synth_pose_wpos, synthesis.synth_pose_wpos, atol=1e-4)
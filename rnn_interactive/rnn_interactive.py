@@ -3,16 +3,26 @@ Simple sequence continuation model based on an LSTM neural network
 This version works with motion capture data that stores joint rotations and recorded in BVH or FBX format
 """
 
-import motion_model
-import motion_synthesis
+"""
+Model Backend
+"""
+
+# "torch" runs model and motion synthesis with torch
+# "numpy" runs both with numpy only (motion_model_np, motion_synthesis_np), torch is not imported
+# "onnx" runs the model with onnxruntime and the synthesis with numpy, torch is not imported either
+model_backend = "torch"
+
+if model_backend in ["numpy", "onnx"]:
+    import motion_model_np as motion_model
+    import motion_synthesis_np as motion_synthesis
+else:
+    import motion_model
+    import motion_synthesis
+import motion_lookahead
 import motion_sender
 import motion_gui
 import motion_control
 
-import torch
-from torch.utils.data import Dataset
-from torch.utils.data import DataLoader
-from torch import nn
 from collections import OrderedDict
 import networkx as nx
 import scipy.linalg as sclinalg
@@ -23,18 +33,20 @@ import math
 import pickle
 from time import sleep
 
-from common import utils
 from common import bvh_tools as bvh
 from common import fbx_tools as fbx
 from common import mocap_tools as mocap
-from common.quaternion import qmul, qrot, qnormalize_np, slerp, qfix
 from common.pose_renderer import PoseRenderer
 
 """
 Compute Device
 """
 
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
+if model_backend in ["numpy", "onnx"]:
+    device = 'cpu'
+else:
+    import torch
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print('Using {} device'.format(device))
 
 """
@@ -106,16 +118,31 @@ pose_dim = joint_count * joint_dim
 Load Model
 """
 
+# rotation representation the model was trained with, pose_representation in rnn.py ("quat" or "repr6d")
+motion_model.config["representation"] = "quat"
 motion_model.config["input_length"] = 64
-motion_model.config["data_dim"] = pose_dim
+motion_model.config["data_dim"] = joint_count * (6 if motion_model.config["representation"] == "repr6d" else joint_dim)
 motion_model.config["node_dim"] = 512
 motion_model.config["layer_count"] = 2
 motion_model.config["device"] = device
 motion_model.config["weights_path"] = "../rnn/results_ZED_Daniel_Solo/weights/rnn_weights_epoch_200"
 #motion_model.config["weights_path"] = "../rnn/results_XSens_Muriel_EmbodiedMachineVariations/weights/rnn_weights_epoch_200"
 
+if model_backend == "onnx":
+    # onnx file written with motion_model.exportOnnx (see below), the numpy synthesis only uses the stateless form
+    motion_model.config["backend"] = "onnx"
+    motion_model.config["onnx_path"] = "rnn_weights.onnx"
+    motion_model.config["onnx_step_path"] = ""
+
 model = motion_model.createModel(motion_model.config) 
 
+"""
+# export the model to onnx (with the torch backend), afterwards it can be loaded with onnxruntime
+# by setting model_backend = "onnx" above
+motion_model.exportOnnx(model, motion_model.config, "rnn_weights.onnx", stateful=False)
+motion_model.exportOnnx(model, motion_model.config, "rnn_weights_step.onnx", stateful=True)
+"""
+
 
 """
 Setup Motion Synthesis
@@ -128,9 +155,25 @@ synthesis_config["seq_length"] = motion_model.config["input_length"]
 synthesis_config["orig_sequences"] = all_pose_sequences
 synthesis_config["orig_seq_index"] = 0
 synthesis_config["device"] = motion_model.config["device"] 
+synthesis_config["representation"] = motion_model.config["representation"]
+synthesis_config["compile_step"] = True # only applies to torch models, the onnx backend runs uncompiled
 
 synthesis = motion_synthesis.MotionSynthesis(synthesis_config)
 
+"""
+Lookahead
+"""
+
+# number of frames the synthesis runs ahead of the output clock, 0 generates each frame on the output clock
+synthesis_lookahead_frames = 8
+
+if synthesis_lookahead_frames > 0:
+    motion_lookahead.config["synthesis"] = synthesis
+    motion_lookahead.config["lookahead_frames"] = synthesis_lookahead_frames
+    motion_lookahead.config["edit_hold"] = 0.2 # seconds without control messages before the lookahead resumes
+    
+    synthesis = motion_lookahead.MotionLookahead(motion_lookahead.config)
+
 
 """
 OSC Sender
@@ -180,9 +223,15 @@ osc_control = motion_control.MotionControl(motion_control.config)
 Start Application
 """
 
+if synthesis_lookahead_frames > 0:
+    synthesis.start()
+
 osc_control.start()
 gui.show()
 app.exec_()
 
 
 osc_control.stop()
+
+if synthesis_lookahead_frames > 0:
+    synthesis.stop()
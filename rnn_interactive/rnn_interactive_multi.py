@@ -0,0 +1,218 @@
+"""
+Simple sequence continuation model based on an LSTM neural network
+Multi dancer version: several independent synthesis sessions run in one process and share one model
+Each session is controlled through its own OSC port and sends to its own OSC address
+This version works with motion capture data that stores joint rotations and recorded in BVH or FBX format
+"""
+
+import motion_model
+import motion_engine
+import motion_control
+
+from pythonosc import dispatcher
+from pythonosc import osc_server
+
+import os, sys, time, threading
+import numpy as np
+import torch
+from time import sleep
+
+from common import bvh_tools as bvh
+from common import fbx_tools as fbx
+from common import mocap_tools as mocap
+
+"""
+Compute Device
+"""
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+print('Using {} device'.format(device))
+
+"""
+Mocap Settings
+"""
+
+mocap_file_path = "D:/Data/mocap/Daniel/Zed/fbx/"
+mocap_files = ["daniel_zed_solo1.fbx"]
+mocap_valid_frame_ranges = [ [ [ 0, 9100 ] ] ]
+mocap_pos_scale = 1.0
+mocap_fps = 30
+
+"""
+mocap_file_path = "D:/data/mocap/stocos/Solos/Canal_14-08-2023/fbx_50hz"
+mocap_files = [ "Muriel_Embodied_Machine_variation.fbx" ]
+mocap_valid_frame_ranges = [ [ [ 200, 6400] ] ]
+mocap_pos_scale = 1.0
+mocap_fps = 30
+"""
+
+"""
+Load Mocap Data
+"""
+
+bvh_tools = bvh.BVH_Tools()
+fbx_tools = fbx.FBX_Tools()
+mocap_tools = mocap.Mocap_Tools()
+
+all_mocap_data = []
+
+for mocap_file in mocap_files:
+    
+    print("process file ", mocap_file)
+    
+    if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+        bvh_data = bvh_tools.load(mocap_file_path + "/" + mocap_file)
+        mocap_data = mocap_tools.bvh_to_mocap(bvh_data)
+    elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+        fbx_data = fbx_tools.load(mocap_file_path + "/" + mocap_file)
+        mocap_data = mocap_tools.fbx_to_mocap(fbx_data)[0] # first skeleton only
+    
+    mocap_data["skeleton"]["offsets"] *= mocap_pos_scale
+    mocap_data["motion"]["pos_local"] *= mocap_pos_scale
+    
+    # set x and z offset of root joint to zero
+    mocap_data["skeleton"]["offsets"][0, 0] = 0.0 
+    mocap_data["skeleton"]["offsets"][0, 2] = 0.0 
+
+    if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat_bvh(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+    elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+
+    all_mocap_data.append(mocap_data)
+
+all_pose_sequences = []
+
+for mocap_data in all_mocap_data:
+    
+    pose_sequence = mocap_data["motion"]["rot_local"].astype(np.float32)
+    all_pose_sequences.append(pose_sequence)
+
+joint_count = all_pose_sequences[0].shape[1]
+joint_dim = all_pose_sequences[0].shape[2]
+pose_dim = joint_count * joint_dim
+
+"""
+Load Model
+"""
+
+# rotation representation the model was trained with, pose_representation in rnn.py ("quat" or "repr6d")
+motion_model.config["representation"] = "quat"
+motion_model.config["input_length"] = 64
+motion_model.config["data_dim"] = joint_count * (6 if motion_model.config["representation"] == "repr6d" else joint_dim)
+motion_model.config["node_dim"] = 512
+motion_model.config["layer_count"] = 2
+motion_model.config["device"] = device
+motion_model.config["weights_path"] = "../rnn/results_ZED_Daniel_Solo/weights/rnn_weights_epoch_200"
+
+model = motion_model.createModel(motion_model.config) 
+
+"""
+Setup Motion Engine
+"""
+
+dancer_count = 8
+engine_update_interval = 1.0 / 50.0
+engine_stateful = False # True: sessions continue from their LSTM state and feed one frame per tick
+
+control_ip = "0.0.0.0"
+engine_control_port = 9001
+session_control_port = 9010 # session i listens on session_control_port + i
+session_send_ip = "127.0.0.1"
+session_send_port = 9004
+session_send_address = "/dancer{}" # formatted with the session id, e.g. /dancer0/joint/pos_world
+
+motion_engine.config["model"] = model
+motion_engine.config["device"] = device
+motion_engine.config["representation"] = motion_model.config["representation"]
+motion_engine.config["stateful"] = engine_stateful
+motion_engine.config["update_interval"] = engine_update_interval
+
+engine = motion_engine.MotionEngine(motion_engine.config)
+
+session_controls = {}
+
+def addSession(seq_index, send_ip, send_port):
+    
+    session_config = dict(motion_engine.session_config)
+    session_config["skeleton"] = all_mocap_data[0]["skeleton"]
+    session_config["seq_length"] = motion_model.config["input_length"]
+    session_config["orig_sequences"] = all_pose_sequences
+    session_config["orig_seq_index"] = seq_index
+    session_config["ip"] = send_ip
+    session_config["port"] = send_port
+    session_config["address"] = session_send_address.format(engine.next_session_id)
+    
+    session_id = engine.addSession(session_config)
+    
+    control_config = dict(motion_control.config)
+    control_config["motion_seq"] = all_pose_sequences[seq_index]
+    control_config["synthesis"] = engine.getSession(session_id)
+    control_config["ip"] = control_ip
+    control_config["port"] = session_control_port + session_id
+    
+    session_controls[session_id] = motion_control.MotionControl(control_config)
+    session_controls[session_id].start()
+    
+    print("add session ", session_id, " control port ", control_config["port"], " address ", session_config["address"])
+    
+    return session_id
+
+def removeSession(session_id):
+    
+    engine.removeSession(session_id)
+    
+    if session_id in session_controls:
+        session_controls.pop(session_id).stop()
+        
+    print("remove session ", session_id)
+
+for dI in range(dancer_count):
+    addSession(dI % len(all_pose_sequences), session_send_ip, session_send_port)
+
+"""
+OSC Engine Control
+"""
+
+# /engine/addsession seq_index [send_ip send_port]
+# /engine/removesession session_id
+
+def osc_addSession(address, *args):
+    
+    seq_index = min(args[0], len(all_pose_sequences) - 1) if len(args) > 0 else 0
+    send_ip = args[1] if len(args) > 2 else session_send_ip
+    send_port = args[2] if len(args) > 2 else session_send_port
+    
+    addSession(seq_index, send_ip, send_port)
+    
+def osc_removeSession(address, *args):
+    
+    removeSession(args[0])
+
+engine_dispatcher = dispatcher.Dispatcher()
+engine_dispatcher.map("/engine/addsession", osc_addSession)
+engine_dispatcher.map("/engine/removesession", osc_removeSession)
+
+engine_server = osc_server.ThreadingOSCUDPServer((control_ip, engine_control_port), engine_dispatcher)
+engine_server_thread = threading.Thread(target=engine_server.serve_forever)
+
+"""
+Start Application
+"""
+
+engine_server_thread.start()
+engine.start()
+
+try:
+    while True:
+        sleep(5.0)
+        print("sessions ", len(engine.sessions), " update time ", engine.update_time)
+except KeyboardInterrupt:
+    pass
+
+engine.stop()
+engine_server.shutdown()
+engine_server.server_close()
+
+for session_id in list(session_controls.keys()):
+    session_controls.pop(session_id).stop()
@@ -0,0 +1,145 @@
+"""
+Simple sequence continuation model based on an LSTM neural network
+Inference service version: one process loads the model and serves "continue this window" and "advance session" requests
+from several client applications over OSC, requests are batched into one model forward
+This version works with motion capture data that stores joint rotations and recorded in BVH or FBX format
+"""
+
+import motion_model
+import motion_service
+
+import os, sys, time
+import numpy as np
+import torch
+from time import sleep
+
+from common import bvh_tools as bvh
+from common import fbx_tools as fbx
+from common import mocap_tools as mocap
+
+"""
+Compute Device
+"""
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+print('Using {} device'.format(device))
+
+"""
+Mocap Settings
+"""
+
+mocap_file_path = "D:/Data/mocap/Daniel/Zed/fbx/"
+mocap_files = ["daniel_zed_solo1.fbx"]
+mocap_valid_frame_ranges = [ [ [ 0, 9100 ] ] ]
+mocap_pos_scale = 1.0
+mocap_fps = 30
+
+"""
+mocap_file_path = "D:/data/mocap/stocos/Solos/Canal_14-08-2023/fbx_50hz"
+mocap_files = [ "Muriel_Embodied_Machine_variation.fbx" ]
+mocap_valid_frame_ranges = [ [ [ 200, 6400] ] ]
+mocap_pos_scale = 1.0
+mocap_fps = 30
+"""
+
+"""
+Load Mocap Data
+"""
+
+bvh_tools = bvh.BVH_Tools()
+fbx_tools = fbx.FBX_Tools()
+mocap_tools = mocap.Mocap_Tools()
+
+all_mocap_data = []
+
+for mocap_file in mocap_files:
+    
+    print("process file ", mocap_file)
+    
+    if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+        bvh_data = bvh_tools.load(mocap_file_path + "/" + mocap_file)
+        mocap_data = mocap_tools.bvh_to_mocap(bvh_data)
+    elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+        fbx_data = fbx_tools.load(mocap_file_path + "/" + mocap_file)
+        mocap_data = mocap_tools.fbx_to_mocap(fbx_data)[0] # first skeleton only
+    
+    mocap_data["skeleton"]["offsets"] *= mocap_pos_scale
+    mocap_data["motion"]["pos_local"] *= mocap_pos_scale
+    
+    # set x and z offset of root joint to zero
+    mocap_data["skeleton"]["offsets"][0, 0] = 0.0 
+    mocap_data["skeleton"]["offsets"][0, 2] = 0.0 
+
+    if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat_bvh(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+    elif mocap_file.endswith(".fbx") or mocap_file.endswith(".FBX"):
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+
+    all_mocap_data.append(mocap_data)
+
+all_pose_sequences = []
+
+for mocap_data in all_mocap_data:
+    
+    pose_sequence = mocap_data["motion"]["rot_local"].astype(np.float32)
+    all_pose_sequences.append(pose_sequence)
+
+joint_count = all_pose_sequences[0].shape[1]
+joint_dim = all_pose_sequences[0].shape[2]
+pose_dim = joint_count * joint_dim
+
+"""
+Load Model
+"""
+
+# rotation representation the model was trained with, pose_representation in rnn.py ("quat" or "repr6d")
+motion_model.config["representation"] = "quat"
+motion_model.config["input_length"] = 64
+motion_model.config["data_dim"] = joint_count * (6 if motion_model.config["representation"] == "repr6d" else joint_dim)
+motion_model.config["node_dim"] = 512
+motion_model.config["layer_count"] = 2
+motion_model.config["device"] = device
+motion_model.config["weights_path"] = "../rnn/results_ZED_Daniel_Solo/weights/rnn_weights_epoch_200"
+
+model = motion_model.createModel(motion_model.config) 
+
+"""
+Setup Inference Service
+"""
+
+motion_service.config["model"] = model
+motion_service.config["skeleton"] = all_mocap_data[0]["skeleton"]
+motion_service.config["seq_length"] = motion_model.config["input_length"]
+motion_service.config["orig_sequences"] = all_pose_sequences
+motion_service.config["device"] = device
+motion_service.config["representation"] = motion_model.config["representation"]
+motion_service.config["ip"] = "0.0.0.0"
+motion_service.config["port"] = 9010
+motion_service.config["max_latency"] = 0.005
+motion_service.config["max_batch_size"] = 32
+motion_service.config["default_budget"] = 0.02
+
+service = motion_service.MotionService(motion_service.config)
+
+"""
+Start Service
+"""
+
+metrics_interval = 10.0
+
+service.start()
+
+try:
+    while True:
+        sleep(metrics_interval)
+        
+        metrics = service.getMetrics()
+        print("requests ", metrics["request_count"], " late ", metrics["late_count"], " batches ", metrics["batch_count"], 
+              " mean batch size ", metrics["mean_batch_size"], " max batch size ", metrics["max_batch_size"],
+              " mean wait ", metrics["mean_wait"], " mean forward ", metrics["mean_forward"])
+        
+        service.resetMetrics()
+except KeyboardInterrupt:
+    pass
+
+service.stop()
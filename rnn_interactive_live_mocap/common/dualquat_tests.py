@@ -1,7 +1,10 @@
 import os
 from unittest import TestCase
 import common.dualquat_np as ndquat
+import common.dualquat_torch as tdquat
+import common.quaternion_np as nquat
 import numpy as np
+import torch
 
 class TestDualQuaternion(TestCase):
 
@@ -669,7 +672,11 @@ class TestDualQuaternion(TestCase):
         print("dq_r ", dq_r, " d ", dq_d, " t ", ndquat.translation(dq_r, dq_d))
         """
         
-        assert((dq_r == desired_dq_r).all() and (dq_d == desired_dq_d).all())
+        try:
+            np.testing.assert_array_almost_equal(dq_r, desired_dq_r)
+            np.testing.assert_array_almost_equal(dq_d, desired_dq_d)
+        except AssertionError as e:
+            self.fail(e)
 
     def test_from_screw_and_back(self):
         # start with a random valid dual quaternion
@@ -908,6 +915,111 @@ class TestDualQuaternion(TestCase):
         except AssertionError as e:
             self.fail(e)
 
+class TestBatchedDualQuaternion(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        
+        self.dq1_r, self.dq1_d = ndquat.qtvec2dq(rng.normal(size=(20, 4)), rng.normal(size=(20, 3)))
+        self.dq2_r, self.dq2_d = ndquat.qtvec2dq(rng.normal(size=(20, 4)), rng.normal(size=(20, 3)))
+        self.t = rng.uniform(0.0, 1.0, size=20)
+        
+        # small skeleton with three branches
+        self.parents = [-1, 0, 1, 2, 0, 4, 5, 0, 7, 8]
+        self.offsets = rng.normal(size=(len(self.parents), 3))
+        self.lq = nquat.normalize(rng.normal(size=(6, len(self.parents), 4)))
+        
+    def forward_kinematics(self):
+        # same as mocap_tools
+        frame_count, joint_count = self.lq.shape[:2]
+        
+        positions = np.zeros((frame_count, joint_count, 3))
+        rotations = np.zeros((frame_count, joint_count, 4))
+        
+        for jI, parent in enumerate(self.parents):
+            if parent == -1:
+                positions[:, jI] = self.offsets[jI]
+                rotations[:, jI] = self.lq[:, jI]
+            else:
+                positions[:, jI] = nquat.rot(rotations[:, parent], np.broadcast_to(self.offsets[jI], (frame_count, 3))) + positions[:, parent]
+                rotations[:, jI] = nquat.mul(rotations[:, parent], self.lq[:, jI])
+                
+        return positions, rotations
+        
+    def test_batch_equals_single(self):
+        
+        batch = {"mul": ndquat.mul(self.dq1_r, self.dq1_d, self.dq2_r, self.dq2_d),
+                 "normalize": ndquat.normalize(self.dq1_r * 2.0, self.dq1_d * 2.0),
+                 "pow": ndquat.pow(self.dq1_r, self.dq1_d, self.t * 3.0),
+                 "sclerp": ndquat.sclerp(self.dq1_r, self.dq1_d, self.dq2_r, self.dq2_d, self.t)}
+        
+        for i in range(self.t.shape[0]):
+            single = {"mul": ndquat.mul(self.dq1_r[i], self.dq1_d[i], self.dq2_r[i], self.dq2_d[i]),
+                      "normalize": ndquat.normalize(self.dq1_r[i] * 2.0, self.dq1_d[i] * 2.0),
+                      "pow": ndquat.pow(self.dq1_r[i], self.dq1_d[i], self.t[i] * 3.0),
+                      "sclerp": ndquat.sclerp(self.dq1_r[i], self.dq1_d[i], self.dq2_r[i], self.dq2_d[i], self.t[i])}
+            
+            for name in batch.keys():
+                np.testing.assert_array_almost_equal(batch[name][0][i], single[name][0], err_msg=name)
+                np.testing.assert_array_almost_equal(batch[name][1][i], single[name][1], err_msg=name)
+                
+        points = np.ones((20, 3))
+        np.testing.assert_array_almost_equal(ndquat.transform_point(self.dq1_r, self.dq1_d, points), np.stack([ ndquat.transform_point(self.dq1_r[i], self.dq1_d[i], points[i]) for i in range(20) ]))
+        
+    def test_pow_translation(self):
+        
+        dq_r, dq_d = ndquat.tvec2dq(np.array([[1.0, 2.0, 3.0], [0.0, 0.0, 0.0]]))
+        
+        pow_r, pow_d = ndquat.pow(dq_r, dq_d, 0.5)
+        
+        np.testing.assert_array_almost_equal(ndquat.translation(pow_r, pow_d), np.array([[0.5, 1.0, 1.5], [0.0, 0.0, 0.0]]))
+        
+    def test_sclerp_end_points(self):
+        
+        for t, dq_r, dq_d in [ (0.0, self.dq1_r, self.dq1_d), (1.0, self.dq2_r, self.dq2_d) ]:
+            
+            interpolated_r, interpolated_d = ndquat.sclerp(self.dq1_r, self.dq1_d, self.dq2_r, self.dq2_d, t)
+            
+            np.testing.assert_array_almost_equal(ndquat.dq2hmat(interpolated_r, interpolated_d), ndquat.dq2hmat(dq_r, dq_d))
+            
+    def test_sclerp_sign(self):
+        
+        # dq and -dq are the same transformation
+        interpolated1_r, interpolated1_d = ndquat.sclerp(self.dq1_r, self.dq1_d, self.dq2_r, self.dq2_d, self.t)
+        interpolated2_r, interpolated2_d = ndquat.sclerp(-self.dq1_r, -self.dq1_d, self.dq2_r, self.dq2_d, self.t)
+        
+        np.testing.assert_array_almost_equal(ndquat.dq2hmat(interpolated1_r, interpolated1_d), ndquat.dq2hmat(interpolated2_r, interpolated2_d))
+        
+    def test_localquats2currentdq(self):
+        
+        positions, rotations = self.forward_kinematics()
+        
+        frame_count, joint_count = self.lq.shape[:2]
+        
+        dq = ndquat.localquats2currentdq(self.lq.reshape(frame_count, -1), self.offsets, self.parents)
+        
+        self.assertEqual(dq.shape, (frame_count, joint_count * 8))
+        
+        dq = dq.reshape(frame_count, joint_count, 8)
+        
+        np.testing.assert_array_almost_equal(dq[..., :4], rotations)
+        np.testing.assert_array_almost_equal(ndquat.translation(dq[..., :4], dq[..., 4:]), positions)
+        
+    def test_localquats2currentdq_torch(self):
+        
+        frame_count = self.lq.shape[0]
+        
+        dq = ndquat.localquats2currentdq(self.lq.reshape(frame_count, -1), self.offsets, self.parents)
+        
+        lq = torch.from_numpy(self.lq.reshape(frame_count, -1)).requires_grad_(True)
+        dq_torch = tdquat.localquats2currentdq(lq, torch.from_numpy(self.offsets), self.parents)
+        
+        np.testing.assert_array_almost_equal(dq_torch.detach().numpy(), dq)
+        
+        # usable as training target
+        dq_torch.sum().backward()
+        self.assertTrue(torch.isfinite(lq.grad).all())
+
 tests = TestDualQuaternion()
 tests.setUp()
 tests.test_creation()
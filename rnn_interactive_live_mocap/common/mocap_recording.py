@@ -0,0 +1,392 @@
+"""
+OSC mocap recordings
+a recording stores one entry per received OSC message in the lists "sensor_ids", "sensor_values" and "time_stamps"
+the messages of all sensors are interleaved in the order in which they were received
+
+columnar recordings store the same data in a directory with one column per OSC address
+every column is a sequence of chunk files with float32 values of shape (frames, value_count) and float64 time stamps
+the chunks are saved as .npy files so they can be memory mapped and a time range can be read without loading the recording
+"""
+
+import numpy as np
+import itertools
+import os
+import json
+import pickle
+
+def sensor_columns(sensor_ids, mocap_sensor_ids):
+    """
+    map each distinct OSC address to the index of the first entry in mocap_sensor_ids it ends with, -1 if there is none
+    """
+
+    columns = {}
+
+    for sensor_id in sensor_ids:
+        if sensor_id in columns:
+            continue
+
+        columns[sensor_id] = next((sI for sI, mocap_sensor_id in enumerate(mocap_sensor_ids) if sensor_id.endswith(mocap_sensor_id)), -1)
+
+    return columns
+
+def sensor_codes(sensor_ids, mocap_sensor_ids, chunk_size=None):
+    """
+    column index (see sensor_columns) of every message of the recording as an int array
+    each distinct address is compared with mocap_sensor_ids only once, afterwards the messages are mapped with a dict lookup
+    """
+
+    message_count = len(sensor_ids)
+    chunk_size = max(message_count, 1) if chunk_size is None else chunk_size
+
+    codes = np.empty(message_count, dtype=np.int16)
+    columns = {}
+
+    for start in range(0, message_count, chunk_size):
+        chunk_ids = sensor_ids[start:start + chunk_size]
+
+        columns.update(sensor_columns(set(chunk_ids).difference(columns), mocap_sensor_ids))
+        codes[start:start + len(chunk_ids)] = np.fromiter(map(columns.__getitem__, chunk_ids), dtype=np.int16, count=len(chunk_ids))
+
+    return codes
+
+def recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids, chunk_size=100000):
+    """
+    gather the values of each sensor in mocap_sensor_ids into a float32 array of shape (frames, joints, dim)
+    a message belongs to the first sensor id its address ends with
+    the recording is processed in chunks of chunk_size messages (None: all at once), the values are written
+    directly into arrays that are allocated once per sensor
+    """
+
+    joint_count = len(skeleton_data["joints"])
+
+    sensor_ids = mocap_recording["sensor_ids"]
+    sensor_values = mocap_recording["sensor_values"]
+
+    message_count = len(sensor_ids)
+    chunk_size = message_count if chunk_size is None else max(chunk_size, 1)
+
+    codes = sensor_codes(sensor_ids, mocap_sensor_ids, chunk_size)
+    frame_counts = np.bincount(codes[codes >= 0], minlength=len(mocap_sensor_ids))
+
+    # allocate the arrays with the value count of the first message of each sensor
+    motion_data = {}
+
+    for sI, sensor_id in enumerate(mocap_sensor_ids):
+        value_count = len(sensor_values[np.argmax(codes == sI)]) if frame_counts[sI] > 0 else joint_count
+        motion_data[sensor_id] = np.empty((frame_counts[sI], value_count), dtype=np.float32)
+
+    frame_indices = np.zeros(len(mocap_sensor_ids), dtype=np.int64)
+
+    for start in range(0, message_count, chunk_size):
+        chunk_codes = codes[start:start + chunk_size]
+
+        for sI, sensor_id in enumerate(mocap_sensor_ids):
+            message_indices = np.flatnonzero(chunk_codes == sI) + start
+
+            if len(message_indices) == 0:
+                continue
+
+            frame_index = frame_indices[sI]
+            frame_values = motion_data[sensor_id][frame_index:frame_index + len(message_indices)]
+            frame_values.reshape(-1)[:] = np.fromiter(itertools.chain.from_iterable(map(sensor_values.__getitem__, message_indices.tolist())), dtype=np.float32, count=frame_values.size)
+            frame_indices[sI] += len(message_indices)
+
+    for sensor_id in mocap_sensor_ids:
+        motion_data[sensor_id] = np.reshape(motion_data[sensor_id], (motion_data[sensor_id].shape[0], joint_count, motion_data[sensor_id].shape[1] // joint_count))
+
+    return motion_data
+
+"""
+Columnar Recordings
+"""
+
+recording_index_file = "recording.json"
+recording_format_version = 1
+
+class RecordingWriter:
+    """
+    append only writer for columnar recordings
+    the values of each OSC address are buffered in a preallocated chunk that is saved once it is full
+    the index file is rewritten after every saved chunk so that an interrupted recording stays readable
+    """
+
+    def __init__(self, path, chunk_size=4096, attributes=None):
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.attributes = {} if attributes is None else dict(attributes)
+        self.columns = {}
+
+        os.makedirs(path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, sensor_id, time_stamps, values):
+        """
+        append frames to the column of sensor_id
+        time_stamps: shape (frames), values: shape (frames, value_count) or anything that can be reshaped to it
+        """
+
+        time_stamps = np.atleast_1d(np.asarray(time_stamps, dtype=np.float64))
+        values = np.asarray(values, dtype=np.float32).reshape(time_stamps.shape[0], -1)
+
+        if sensor_id not in self.columns:
+            self.columns[sensor_id] = self._create_column(sensor_id, values.shape[1])
+
+        column = self.columns[sensor_id]
+
+        if values.shape[1] != column["value_count"]:
+            raise ValueError("sensor {} has {} values per frame, got {}".format(sensor_id, column["value_count"], values.shape[1]))
+
+        start = 0
+
+        while start < values.shape[0]:
+            fill = column["fill"]
+            count = min(self.chunk_size - fill, values.shape[0] - start)
+
+            column["time_stamps"][fill:fill + count] = time_stamps[start:start + count]
+            column["values"][fill:fill + count] = values[start:start + count]
+            column["fill"] += count
+            start += count
+
+            if column["fill"] == self.chunk_size:
+                self._save_chunk(column)
+
+    def flush(self):
+        for column in self.columns.values():
+            if column["fill"] > 0:
+                self._save_chunk(column)
+
+        self._save_index()
+
+    def close(self):
+        self.flush()
+
+    def _create_column(self, sensor_id, value_count):
+
+        column = {}
+        column["id"] = sensor_id
+        column["name"] = "sensor_{}".format(len(self.columns))
+        column["value_count"] = value_count
+        column["chunks"] = []
+        column["time_stamps"] = np.empty(self.chunk_size, dtype=np.float64)
+        column["values"] = np.empty((self.chunk_size, value_count), dtype=np.float32)
+        column["fill"] = 0
+
+        os.makedirs(os.path.join(self.path, column["name"]), exist_ok=True)
+
+        return column
+
+    def _save_chunk(self, column):
+
+        chunk_index = len(column["chunks"])
+        fill = column["fill"]
+        time_stamps = column["time_stamps"][:fill]
+
+        np.save(os.path.join(self.path, column["name"], "time_stamps_{:06d}.npy".format(chunk_index)), time_stamps)
+        np.save(os.path.join(self.path, column["name"], "values_{:06d}.npy".format(chunk_index)), column["values"][:fill])
+
+        column["chunks"].append({"frame_count": int(fill), "start_time": float(time_stamps[0]), "end_time": float(time_stamps[-1])})
+        column["fill"] = 0
+
+        self._save_index()
+
+    def _save_index(self):
+
+        index = {}
+        index["format_version"] = recording_format_version
+        index["chunk_size"] = self.chunk_size
+        index["attributes"] = self.attributes
+        index["sensors"] = [ { key: column[key] for key in ["id", "name", "value_count", "chunks"] } for column in self.columns.values() ]
+
+        # replace the index in one step so that readers never see a partially written file
+        index_file = os.path.join(self.path, recording_index_file)
+
+        with open(index_file + ".tmp", "w") as f:
+            json.dump(index, f)
+
+        os.replace(index_file + ".tmp", index_file)
+
+class Recording:
+    """
+    read access to a columnar recording
+    chunks are memory mapped when mmap_mode is set, reading a time range only touches the chunks that overlap it
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+
+        self.path = path
+        self.mmap_mode = mmap_mode
+
+        with open(os.path.join(path, recording_index_file)) as f:
+            self.index = json.load(f)
+
+        self.sensors = { sensor["id"]: sensor for sensor in self.index["sensors"] }
+
+    @property
+    def sensor_ids(self):
+        return list(self.sensors.keys())
+
+    @property
+    def attributes(self):
+        return self.index["attributes"]
+
+    def frame_count(self, sensor_id):
+        return sum( chunk["frame_count"] for chunk in self.sensors[sensor_id]["chunks"] )
+
+    def time_range(self, sensor_id):
+        chunks = self.sensors[sensor_id]["chunks"]
+        return (chunks[0]["start_time"], chunks[-1]["end_time"]) if len(chunks) > 0 else (None, None)
+
+    def read_chunk(self, sensor_id, chunk_index):
+
+        name = self.sensors[sensor_id]["name"]
+
+        time_stamps = np.load(os.path.join(self.path, name, "time_stamps_{:06d}.npy".format(chunk_index)), mmap_mode=self.mmap_mode)
+        values = np.load(os.path.join(self.path, name, "values_{:06d}.npy".format(chunk_index)), mmap_mode=self.mmap_mode)
+
+        return time_stamps, values
+
+    def read(self, sensor_id, start_time=None, end_time=None):
+        """
+        time stamps and values of the frames with start_time <= time stamp < end_time (None: unbounded)
+        the time stamps of a column are expected to increase, as they do for recordings in the order of arrival
+        a range within a single chunk is returned as a view of the memory mapped chunk
+        """
+
+        sensor = self.sensors[sensor_id]
+
+        time_stamps = []
+        values = []
+
+        for chunk_index, chunk in enumerate(sensor["chunks"]):
+
+            if start_time is not None and chunk["end_time"] < start_time:
+                continue
+            if end_time is not None and chunk["start_time"] >= end_time:
+                break
+
+            chunk_time_stamps, chunk_values = self.read_chunk(sensor_id, chunk_index)
+
+            start = 0 if start_time is None else np.searchsorted(chunk_time_stamps, start_time, side="left")
+            end = len(chunk_time_stamps) if end_time is None else np.searchsorted(chunk_time_stamps, end_time, side="left")
+
+            time_stamps.append(chunk_time_stamps[start:end])
+            values.append(chunk_values[start:end])
+
+        if len(values) == 0:
+            return np.empty(0, dtype=np.float64), np.empty((0, sensor["value_count"]), dtype=np.float32)
+        if len(values) == 1:
+            return time_stamps[0], values[0]
+
+        return np.concatenate(time_stamps), np.concatenate(values)
+
+def write_recording(mocap_recording, path, chunk_size=4096, message_chunk_size=100000):
+    """
+    convert a recording dict with interleaved "sensor_ids", "sensor_values" and "time_stamps" lists into a columnar recording
+    the messages are processed in chunks of message_chunk_size, every OSC address becomes its own column
+    """
+
+    sensor_ids = mocap_recording["sensor_ids"]
+    sensor_values = mocap_recording["sensor_values"]
+    time_stamps = mocap_recording["time_stamps"]
+
+    # scalar entries such as class_id are kept as attributes
+    attributes = { key: value for key, value in mocap_recording.items() if isinstance(value, (str, int, float, bool)) }
+
+    addresses = list(dict.fromkeys(sensor_ids))
+    columns = { address: aI for aI, address in enumerate(addresses) }
+
+    with RecordingWriter(path, chunk_size=chunk_size, attributes=attributes) as writer:
+
+        for start in range(0, len(sensor_ids), message_chunk_size):
+            chunk_ids = sensor_ids[start:start + message_chunk_size]
+            chunk_codes = np.fromiter(map(columns.__getitem__, chunk_ids), dtype=np.int32, count=len(chunk_ids))
+            chunk_time_stamps = np.asarray(time_stamps[start:start + message_chunk_size], dtype=np.float64)
+
+            for aI in np.unique(chunk_codes):
+                message_indices = np.flatnonzero(chunk_codes == aI)
+                value_count = len(sensor_values[start + message_indices[0]])
+
+                values = np.fromiter(itertools.chain.from_iterable(map(sensor_values.__getitem__, (message_indices + start).tolist())), dtype=np.float32, count=len(message_indices) * value_count)
+
+                writer.append(addresses[aI], chunk_time_stamps[message_indices], values.reshape(len(message_indices), value_count))
+
+def convert_recording(pickle_file, path, chunk_size=4096):
+    """
+    convert a pickled recording into a columnar recording
+    """
+
+    with open(pickle_file, "rb") as f:
+        mocap_recording = pickle.load(f)
+
+    write_recording(mocap_recording, path, chunk_size=chunk_size)
+
+def load_motiondata(path, skeleton_data, mocap_sensor_ids, start_time=None, end_time=None):
+    """
+    same result as recording_to_motiondata for a columnar recording (directory) or a pickled recording (file)
+    only the frames with start_time <= time stamp < end_time are loaded, a columnar recording only reads the chunks in this range
+    """
+
+    if not os.path.isdir(path):
+        with open(path, "rb") as f:
+            mocap_recording = pickle.load(f)
+
+        if start_time is not None or end_time is not None:
+            time_stamps = np.asarray(mocap_recording["time_stamps"], dtype=np.float64)
+            selected = np.ones(len(time_stamps), dtype=bool)
+            if start_time is not None:
+                selected &= time_stamps >= start_time
+            if end_time is not None:
+                selected &= time_stamps < end_time
+
+            mocap_recording = { key: list(itertools.compress(mocap_recording[key], selected)) for key in ["sensor_ids", "sensor_values", "time_stamps"] }
+
+        return recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids)
+
+    joint_count = len(skeleton_data["joints"])
+
+    recording = Recording(path)
+    columns = sensor_columns(recording.sensor_ids, mocap_sensor_ids)
+
+    motion_data = {}
+
+    for sI, sensor_id in enumerate(mocap_sensor_ids):
+
+        addresses = [ address for address in recording.sensor_ids if columns[address] == sI ]
+        column_data = [ recording.read(address, start_time, end_time) for address in addresses ]
+
+        if len(column_data) == 0:
+            values = np.empty((0, joint_count), dtype=np.float32)
+        elif len(column_data) == 1:
+            values = column_data[0][1]
+        else:
+            # several addresses end with the same sensor id, merge them in the order of arrival
+            order = np.argsort(np.concatenate([ time_stamps for time_stamps, _ in column_data ]), kind="stable")
+            values = np.concatenate([ column_values for _, column_values in column_data ])[order]
+
+        motion_data[sensor_id] = np.reshape(values, (values.shape[0], joint_count, values.shape[1] // joint_count))
+
+    return motion_data
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="convert pickled OSC mocap recordings into columnar recordings")
+    parser.add_argument("pickle_files", nargs="+")
+    parser.add_argument("--output_path", type=str, default=None, help="directory for the converted recordings (default: next to the pickle files)")
+    parser.add_argument("--chunk_size", type=int, default=4096, help="frames per chunk file")
+    args = parser.parse_args()
+
+    for pickle_file in args.pickle_files:
+        recording_path = os.path.splitext(pickle_file)[0] + ".rec"
+        if args.output_path is not None:
+            recording_path = os.path.join(args.output_path, os.path.basename(recording_path))
+
+        print("convert ", pickle_file, " -> ", recording_path)
+        convert_recording(pickle_file, recording_path, chunk_size=args.chunk_size)
@@ -4,48 +4,27 @@
 
 import torch
 import numpy as np
+import common.quaternion_np as nquat
+import common.quaternion_torch as tquat
 
 def qmul(q, r):
     """
     Multiply quaternion(s) q with quaternion(s) s
-    Expects two equally-sized tensors of shape (*, 4), where * denotes any number of dimensions
+    Expects two tensors of shape (*, 4) that broadcast against each other
     Returns q*r as a tensor of shape (*, 4)
     """
 
-    assert q.shape[-1] == 4
-    assert r.shape[-1] == 4
-
-    original_shape = q.shape
-    
-    # Compute outer product
-    terms = torch.bmm(r.view(-1, 4, 1), q.view(-1, 1, 4))
-    
-    w = terms[:, 0, 0] - terms[:, 1, 1] - terms[:, 2, 2] - terms[:, 3, 3]
-    x = terms[:, 0, 1] + terms[:, 1, 0] - terms[:, 2, 3] + terms[:, 3, 2]
-    y = terms[:, 0, 2] + terms[:, 1, 3] + terms[:, 2, 0] - terms[:, 3, 1]
-    z = terms[:, 0, 3] - terms[:, 1, 2] + terms[:, 2, 1] + terms[:, 3, 0]
-    return torch.stack((w, x, y, z), dim=1).view(original_shape)
+    return tquat.mul(q, r)
 
 def qrot(q, v):
     """
     Rotate vector(s) v about the rotation described by quaternion(s) q.
-    Expects a tensor of shape (*, 4) for q and a tensor of shape (*, 3) for v,
-    where * denotes any number of dimensions.
+    Expects a tensor of shape (*, 4) for q and a tensor of shape (*, 3) for v
+    that broadcast against each other.
     Returns a tensor of shape (*, 3).
     """
-    assert q.shape[-1] == 4
-    assert v.shape[-1] == 3
-    assert q.shape[:-1] == v.shape[:-1]
-    
-    original_shape = list(v.shape)
-    q = q.view(-1, 4)
-    v = v.view(-1, 3)
-    
-    qvec = q[:, 1:]
-    
-    uv = torch.cross(qvec, v, dim=1)
-    uuv = torch.cross(qvec, uv, dim=1)
-    return (v + 2 * (q[:, :1] * uv + uuv)).view(original_shape)
+
+    return tquat.rot(q, v)
 
 def qeuler(q, order, epsilon=0):
     """
@@ -107,14 +86,10 @@ def qnormalize_np(q):
     return q_norm
 
 def qmul_np(q, r):
-    q = torch.from_numpy(q).contiguous()
-    r = torch.from_numpy(r).contiguous()
-    return qmul(q, r).numpy()
+    return nquat.mul(q, r)
 
 def qrot_np(q, v):
-    q = torch.from_numpy(q).contiguous()
-    v = torch.from_numpy(v).contiguous()
-    return qrot(q, v).numpy()
+    return nquat.rot(q, v)
 
 def qeuler_np(q, order, epsilon=0, use_gpu=False):
     if use_gpu:
@@ -143,6 +118,78 @@ def qfix(q):
     result[1:][mask] *= -1
     return result
 
+class QFixFilter:
+    """
+    Streaming version of qfix.
+    Keeps the last filtered pose and flips each incoming quaternion onto the same hemisphere,
+    so that poses arriving one at a time (or in chunks) stay continuous with what came before.
+    
+    Expects poses of shape (J, 4) in update and sequences of shape (L, J, 4) in process.
+    """
+    
+    def __init__(self, reference=None):
+        self.reset(reference)
+        
+    def reset(self, reference=None):
+        self.reference = None if reference is None else np.array(reference)
+        
+    def update(self, q):
+        """
+        Filter a single pose of shape (J, 4). Returns a new array of the same shape.
+        """
+        assert q.shape[-1] == 4
+        
+        if self.reference is None:
+            result = np.array(q)
+        else:
+            flip = np.sum(q * self.reference, axis=-1, keepdims=True) < 0
+            result = np.where(flip, -q, q)
+        
+        self.reference = result
+        return result
+        
+    def process(self, q, out=None):
+        """
+        Filter a sequence of shape (L, J, 4) that continues the previously filtered poses.
+        The result is written to out, which may be q itself.
+        """
+        assert len(q.shape) == 3
+        assert q.shape[-1] == 4
+        
+        if out is None:
+            out = np.empty_like(q)
+        
+        flips = np.empty(q.shape[:2], dtype=bool)
+        if self.reference is None:
+            flips[0] = False
+        else:
+            flips[0] = np.sum(q[0] * self.reference, axis=-1) < 0
+        flips[1:] = np.einsum("ljk,ljk->lj", q[1:], q[:-1]) < 0
+        
+        signs = 1.0 - 2.0 * (np.cumsum(flips, axis=0) % 2)
+        np.multiply(q, signs[..., np.newaxis].astype(q.dtype), out=out)
+        
+        self.reference = out[-1].copy()
+        return out
+
+def qfix_chunked(q, chunk_size=4096, out=None):
+    """
+    Same result as qfix, but processes the time dimension in chunks of chunk_size frames
+    so that the temporary arrays stay small for long sequences.
+    Pass out=q to fix the sequence in place.
+    """
+    assert len(q.shape) == 3
+    assert q.shape[-1] == 4
+    
+    if out is None:
+        out = np.empty_like(q)
+    
+    qfix_filter = QFixFilter()
+    for start in range(0, q.shape[0], chunk_size):
+        qfix_filter.process(q[start:start + chunk_size], out=out[start:start + chunk_size])
+        
+    return out
+
 def expmap_to_quaternion(e):
     """
     Convert axis-angle rotations (aka exponential maps) to quaternions.
@@ -202,154 +249,31 @@ def euler_to_quaternion(e, order):
     return result.reshape(original_shape)
 
 def slerp(q0, q1, amount=0.5):
-    # TODO: modify this code so it works for arrays of quaternions
+    """
+    spherical linear interpolation of numpy quaternions (*, 4), q0 and q1 are normalised and amount is clipped to 0 .. 1
+    """
     
-    # Ensure quaternion inputs are unit quaternions and 0 <= amount <=1
-    q0 = qnormalize_np(q0)
-    q1 = qnormalize_np(q1)
-
-    amount = np.clip(amount, 0, 1)
-
-    dot = np.dot(q0, q1)
-
-    # If the dot product is negative, slerp won't take the shorter path.
-    # Note that v1 and -v1 are equivalent when the negation is applied to all four components.
-    # Fix by reversing one quaternion
-    if dot < 0.0:
-        q0 = -q0
-        dot = -dot
-
-    # sin_theta_0 can not be zero
-    if dot > 0.9995:
-        qr = q0 + amount * (q1 - q0)
-        qr = qnormalize_np(qr)
-        return qr
-
-    theta_0 = np.arccos(dot)  # Since dot is in range [0, 0.9995], np.arccos() is safe
-    sin_theta_0 = np.sin(theta_0)
-        
-    theta = theta_0 * amount
-    sin_theta = np.sin(theta)
-
-    s0 = np.cos(theta) - dot * sin_theta / sin_theta_0
-    s1 = sin_theta / sin_theta_0
-    qr = (s0 * q0) + (s1 * q1)
-    qr = qnormalize_np(qr)
-    return qr
+    return nquat.slerp(q0, q1, np.clip(amount, 0, 1), unit=False)
 
 def slerp_np(q0, q1, amount=0.5):
-    orig_shape = q0.shape
-
-    q0 = np.reshape(q0, (-1, 4))
-    q1 = np.reshape(q1, (-1, 4))
-
+    """
+    spherical linear interpolation of numpy quaternions (*, 4), q0 and q1 are normalised and amount is clipped to 0 .. 1
+    amount is a scalar or has one value per quaternion
+    """
     
-    # Ensure quaternion inputs are unit quaternions and 0 <= amount <=1
-    q0 = qnormalize_np(q0)
-    q1 = qnormalize_np(q1)
-
     amount = np.clip(amount, 0, 1)
     
-    dot = np.sum(np.multiply(q0, q1), axis=1)
-
-
-    # If the dot product is negative, slerp won't take the shorter path.
-    # Note that v1 and -v1 are equivalent when the negation is applied to all four components.
-    # Fix by reversing one quaternion
-    negdot = dot > 0.0
-    negdot = negdot.astype(np.float32)
-    negdot = negdot * 2.0 - 1.0
-    dot = dot * negdot
+    if np.ndim(amount) > 0:
+        amount = np.reshape(amount, q0.shape[:-1])
     
-    negdot = np.expand_dims(negdot, axis=1)
-
-    
-    negdot = np.repeat(negdot, 4, axis=1)
-
-    
-    q0 = q0 * negdot
-
-    # sin_theta_0 can not be zero
-    bigdot = dot > 0.9995
-    bigdot = bigdot.astype(np.float32)
-    bigqr = q0 + (q1 - q0) * np.repeat(np.reshape(amount, (-1, 1)), 4, axis=1)
-    bigqr = qnormalize_np(bigqr)
-    dot = np.clip(dot, float('-inf'), 0.9995)
-    theta_0 = np.arccos(dot)
-    sin_theta_0 = np.sin(theta_0)
-    
-    theta = theta_0 * amount
-    sin_theta = np.sin(theta)
-    
-    s0 = np.cos(theta) - dot * sin_theta / sin_theta_0
-    s0 = np.repeat(np.reshape(s0, (-1, 1)), 4, axis=1)
-    
-    s1 = sin_theta / sin_theta_0
-    s1 = np.repeat(np.reshape(s1, (-1, 1)), 4, axis=1)
-    
-    smallqr = (s0 * q0) + (s1 * q1)
-    invbigdot = np.ones_like(bigdot) - bigdot
-    
-    qr = bigqr * np.repeat(np.reshape(bigdot, (-1, 1)), 4, axis=1) + smallqr * np.repeat(np.reshape(invbigdot, (-1, 1)), 4, axis=1)
-    qr = qnormalize_np(qr)
-    
-    qr = np.reshape(qr, orig_shape)
-    
-    return qr
+    return nquat.slerp(q0, q1, amount, unit=False)
 
 def slerp2(q0, q1, amount):
+    """
+    spherical linear interpolation of torch quaternions (*, 4), q0 and q1 are normalised and amount is clamped to 0 .. 1
+    amount has one value per quaternion
+    """
     
-    orig_shape = q0.shape
-    
-    q0 = torch.reshape(q0, (-1, 4))
-    q1 = torch.reshape(q1, (-1, 4))
-    amount = torch.clamp(amount, 0.0, 1.0)
-    
-    #Ensure quaternion inputs are unit quaternions and 0 <= amount <= 1	
-    q0 = torch.nn.functional.normalize(q0)
-    q1 = torch.nn.functional.normalize(q1)
-    
-    dot = torch.bmm(torch.reshape(q0, (-1, 1, 4)), torch.reshape(q1, (-1, 4, 1)))
-    dot = torch.squeeze(dot)
-    
-    negdot = dot > 0.0
-    negdot = negdot.to(torch.float32)
-    negdot = negdot * 2.0 - 1.0
-    
-    dot = dot * negdot
-    
-    negdot = torch.unsqueeze(negdot, 1)
-    negdot = negdot.repeat((1, 4))
-    
-    q0 = q0 * negdot
-    
-    bigdot = dot > 0.9995
-    bigdot = bigdot.to(torch.float32)
-    
-    #calculate qr as if dot was bigger than 0.9995
-    bigqr = q0 + (q1 - q0) * torch.reshape(amount, (-1, 1)).repeat((1, 4))
-    
-    #calculate qr as if dot was smaller than 0.9995
-    dot = torch.clamp_max(dot, 0.9995)
-    theta_0 = torch.arccos(dot)
-    
-    sin_theta_0 = torch.sin(theta_0)
-    theta = theta_0 * amount
-    
-    sin_theta = torch.sin(theta)
-    
-    s0 = torch.cos(theta) - dot * sin_theta / sin_theta_0
-    s0 = torch.reshape(s0, (-1, 1)).repeat((1, 4))
-    
-    s1 = sin_theta / sin_theta_0
-    s1 = torch.reshape(s1, (-1, 1)).repeat((1, 4))
-    
-    smallqr = (s0 * q0) + (s1 * q1)
-    
-    invbigdot = torch.ones_like(bigdot) - bigdot
-    
-    qr = bigqr * torch.reshape(bigdot,(-1, 1)).repeat((1, 4)) + smallqr * torch.reshape(invbigdot, (-1, 1)).repeat((1, 4))
-    qr = torch.nn.functional.normalize(qr)
-    qr = torch.reshape(qr, orig_shape)
+    amount = torch.reshape(torch.clamp(amount, 0.0, 1.0), q0.shape[:-1])
     
-    return qr
\ No newline at end of file
+    return tquat.slerp(q0, q1, amount, unit=False)
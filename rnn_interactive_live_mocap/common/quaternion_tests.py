@@ -0,0 +1,254 @@
+from unittest import TestCase
+import numpy as np
+import torch
+
+import common.quaternion as quat
+import common.quaternion_np as nquat
+import common.quaternion_torch as tquat
+import common.quaternion_benchmark as qbench
+import common.repr6d_torch as repr6d
+
+class TestKernelEquivalence(TestCase):
+
+    def setUp(self):
+        self.kernels = qbench.create_kernels()
+        self.settings = {"device": "cpu", "min_time": 0.0, "min_repeats": 1, "loop_max_size": 100, "check_max_size": 100, "seed": 0}
+
+    def check_kernel(self, kernel_name, sizes=[1, 2, 100]):
+
+        kernel = self.kernels[kernel_name]
+        results = qbench.run_kernel(kernel_name, kernel, sizes, self.settings)
+
+        for result in results:
+            self.assertIsNone(result["error"], "{} size {}".format(result["implementation"], result["size"]))
+            self.assertLessEqual(result["difference"], kernel["tolerance"], "{} size {}".format(result["implementation"], result["size"]))
+
+    def test_qmul(self):
+        self.check_kernel("qmul")
+
+    def test_qrot(self):
+        self.check_kernel("qrot")
+
+    def test_slerp(self):
+        self.check_kernel("slerp")
+
+    def test_quat2euler(self):
+        self.check_kernel("quat2euler")
+
+    def test_dq_mul(self):
+        self.check_kernel("dq_mul")
+
+    def test_dq_sclerp(self):
+        self.check_kernel("dq_sclerp", sizes=[1, 20])
+
+    def test_dq_hierarchy(self):
+        self.check_kernel("dq_hierarchy", sizes=[1, 96])
+
+    def test_euler_round_trip(self):
+
+        rng = np.random.default_rng(0)
+        q = qbench.euler_inputs(100, rng)[0]
+
+        e = quat.qeuler_np(q, "xyz")
+        q2 = quat.euler_to_quaternion(e, "xyz").astype(np.float32)
+
+        # q and -q are the same rotation
+        self.assertLess(np.max(1.0 - np.abs(np.sum(q * q2, axis=-1))), 1e-5)
+
+    def test_slerp_end_points(self):
+
+        rng = np.random.default_rng(0)
+        q0, q1, _ = qbench.slerp_inputs(10, rng)
+
+        for name, backend, _, function in self.kernels["slerp"]["implementations"]:
+            for t_value, q_expected in [ (0.0, q0), (1.0, q1) ]:
+                t = np.full(10, t_value, dtype=np.float32)
+                q = qbench.to_numpy(function(*qbench.prepare_inputs((q0, q1, t), backend, "cpu")))
+                # q and -q are the same rotation
+                np.testing.assert_allclose(np.abs(np.sum(q * q_expected, axis=-1)), 1.0, atol=1e-5, err_msg=name)
+
+class TestSlerp(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        
+        self.q0 = qbench.random_quats(60, rng).reshape(5, 12, 4)
+        self.q1 = qbench.random_quats(60, rng).reshape(5, 12, 4)
+        self.t = rng.uniform(0.0, 1.0, size=(5, 12)).astype(np.float32)
+        
+    def test_broadcast(self):
+        
+        for t in [ 0.3, self.t, self.t[:1] ]:
+            
+            q = nquat.slerp(self.q0, self.q1, t)
+            q_torch = tquat.slerp(torch.from_numpy(self.q0), torch.from_numpy(self.q1), torch.as_tensor(t))
+            
+            t_flat = np.broadcast_to(t, (5, 12)).reshape(-1)
+            q_flat = quat.slerp(self.q0.reshape(-1, 4), self.q1.reshape(-1, 4), t_flat).reshape(5, 12, 4)
+            
+            np.testing.assert_allclose(q, q_flat, atol=1e-5)
+            np.testing.assert_allclose(q_torch.numpy(), q_flat, atol=1e-5)
+            
+    def test_shorter_path(self):
+        
+        # q1 and -q1 are the same rotation
+        np.testing.assert_allclose(nquat.slerp(self.q0, -self.q1, self.t), nquat.slerp(self.q0, self.q1, self.t), atol=1e-5)
+        np.testing.assert_allclose(tquat.slerp(torch.from_numpy(self.q0), torch.from_numpy(-self.q1), torch.from_numpy(self.t)).numpy(), nquat.slerp(self.q0, self.q1, self.t), atol=1e-5)
+        
+    def test_parallel(self):
+        
+        q0 = torch.from_numpy(self.q0).requires_grad_(True)
+        
+        q = tquat.slerp(q0, q0.detach(), torch.from_numpy(self.t))
+        q.sum().backward()
+        
+        np.testing.assert_allclose(q.detach().numpy(), self.q0, atol=1e-6)
+        self.assertTrue(torch.isfinite(q0.grad).all())
+        
+        np.testing.assert_allclose(nquat.slerp(self.q0, self.q0, self.t), self.q0, atol=1e-6)
+
+class TestProduct(TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        
+        self.q = qbench.random_quats(60, rng).reshape(5, 12, 4)
+        self.r = qbench.random_quats(60, rng).reshape(5, 12, 4)
+        self.v = rng.standard_normal((5, 12, 3)).astype(np.float32)
+        
+    @staticmethod
+    def mul_reference(q, r):
+        # outer product formulation used by the original Quaternet code
+        terms = torch.bmm(r.reshape(-1, 4, 1), q.reshape(-1, 1, 4))
+        
+        w = terms[:, 0, 0] - terms[:, 1, 1] - terms[:, 2, 2] - terms[:, 3, 3]
+        x = terms[:, 0, 1] + terms[:, 1, 0] - terms[:, 2, 3] + terms[:, 3, 2]
+        y = terms[:, 0, 2] + terms[:, 1, 3] + terms[:, 2, 0] - terms[:, 3, 1]
+        z = terms[:, 0, 3] - terms[:, 1, 2] + terms[:, 2, 1] + terms[:, 3, 0]
+        return torch.stack((w, x, y, z), dim=1).reshape(q.shape)
+    
+    @staticmethod
+    def rot_reference(q, v):
+        qvec = q.reshape(-1, 4)[:, 1:]
+        v_flat = v.reshape(-1, 3)
+        
+        uv = torch.cross(qvec, v_flat, dim=1)
+        uuv = torch.cross(qvec, uv, dim=1)
+        return (v_flat + 2 * (q.reshape(-1, 4)[:, :1] * uv + uuv)).reshape(v.shape)
+    
+    def check_gradients(self, function, reference, a, b):
+        
+        a0 = torch.from_numpy(a).requires_grad_(True)
+        b0 = torch.from_numpy(b).requires_grad_(True)
+        a1 = torch.from_numpy(a).requires_grad_(True)
+        b1 = torch.from_numpy(b).requires_grad_(True)
+        
+        # weight the output so that every component contributes its own gradient
+        out0 = function(a0, b0)
+        out1 = reference(a1, b1)
+        weights = torch.linspace(-1.0, 1.0, out0.numel()).reshape(out0.shape)
+        (out0 * weights).sum().backward()
+        (out1 * weights).sum().backward()
+        
+        np.testing.assert_allclose(out0.detach().numpy(), out1.detach().numpy(), atol=1e-6)
+        np.testing.assert_allclose(a0.grad.numpy(), a1.grad.numpy(), atol=1e-5)
+        np.testing.assert_allclose(b0.grad.numpy(), b1.grad.numpy(), atol=1e-5)
+        
+    def test_mul_gradients(self):
+        self.check_gradients(quat.qmul, self.mul_reference, self.q, self.r)
+        
+    def test_rot_gradients(self):
+        self.check_gradients(quat.qrot, self.rot_reference, self.q, self.v)
+        
+    def test_numpy(self):
+        
+        np.testing.assert_allclose(quat.qmul_np(self.q, self.r), self.mul_reference(torch.from_numpy(self.q), torch.from_numpy(self.r)).numpy(), atol=1e-6)
+        np.testing.assert_allclose(quat.qrot_np(self.q, self.v), self.rot_reference(torch.from_numpy(self.q), torch.from_numpy(self.v)).numpy(), atol=1e-5)
+        
+    def test_broadcast(self):
+        
+        # one rotation applied to a whole window, as in the forward kinematics of a single joint
+        q = torch.from_numpy(self.q[:, :1])
+        r = torch.from_numpy(self.r)
+        v = torch.from_numpy(self.v)
+        
+        np.testing.assert_allclose(tquat.mul(q, r).numpy(), self.mul_reference(q.expand_as(r), r).numpy(), atol=1e-6)
+        np.testing.assert_allclose(tquat.rot(q, v).numpy(), self.rot_reference(q.expand(5, 12, 4), v).numpy(), atol=1e-5)
+        np.testing.assert_allclose(nquat.mul(self.q[:, :1], self.r), tquat.mul(q, r).numpy(), atol=1e-6)
+        np.testing.assert_allclose(nquat.rot(self.q[:, :1], self.v), tquat.rot(q, v).numpy(), atol=1e-5)
+
+class TestQFix(TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        
+        # a smooth sequence with random sign flips
+        q0 = qbench.random_quats(12, rng)
+        q1 = qbench.random_quats(12, rng)
+        t = np.linspace(0.0, 1.0, 200, dtype=np.float32).reshape(-1, 1)
+        q = nquat.slerp(q0[np.newaxis], q1[np.newaxis], t)
+        signs = np.where(rng.uniform(size=(200, 12, 1)) < 0.3, -1.0, 1.0).astype(np.float32)
+        
+        self.q = q * signs
+        self.expected = quat.qfix(self.q)
+        
+    def test_chunked(self):
+        
+        for chunk_size in [1, 7, 64, 1000]:
+            np.testing.assert_array_equal(quat.qfix_chunked(self.q, chunk_size=chunk_size), self.expected)
+            
+        q = self.q.copy()
+        quat.qfix_chunked(q, chunk_size=32, out=q)
+        np.testing.assert_array_equal(q, self.expected)
+        
+    def test_streaming(self):
+        
+        qfix_filter = quat.QFixFilter()
+        result = np.stack([ qfix_filter.update(pose) for pose in self.q ])
+        
+        np.testing.assert_array_equal(result, self.expected)
+        self.assertTrue(np.all(np.sum(result[1:] * result[:-1], axis=-1) >= 0))
+        
+    def test_reference(self):
+        
+        # the first pose is fixed against the reference, e.g. the identity rotation
+        identity = np.tile(np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32), (12, 1))
+        
+        qfix_filter = quat.QFixFilter(identity)
+        result = qfix_filter.process(self.q)
+        
+        self.assertTrue(np.all(result[0, :, 0] >= 0))
+        np.testing.assert_array_equal(np.abs(result), np.abs(self.expected))
+
+class TestRepr6d(TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        
+        self.q = qbench.random_quats(240, rng).reshape(4, 5, 12, 4)
+        
+    def test_round_trip(self):
+        
+        q = torch.from_numpy(self.q)
+        q2 = repr6d.repr6d2quat(repr6d.quat2repr6d(q))
+        
+        self.assertEqual(q2.shape, q.shape)
+        # q and -q are the same rotation
+        np.testing.assert_allclose(torch.abs(torch.sum(q * q2, dim=-1)).numpy(), 1.0, atol=1e-5)
+        
+    def test_mat2quat(self):
+        
+        m = nquat.quat2mat(self.q)
+        
+        np.testing.assert_allclose(tquat.mat2quat(torch.from_numpy(m)).numpy(), nquat.mat2quat(m), atol=1e-6)
+        
+    def test_gradients(self):
+        
+        # unnormalised 6d values as predicted by a model
+        x = torch.randn((4, 5, 12, 6), dtype=torch.float32, generator=torch.Generator().manual_seed(0)).requires_grad_(True)
+        
+        q = repr6d.repr6d2quat(x)
+        q.sum().backward()
+        
+        np.testing.assert_allclose(torch.norm(q, dim=-1).detach().numpy(), 1.0, atol=1e-5)
+        self.assertTrue(torch.isfinite(x.grad).all())
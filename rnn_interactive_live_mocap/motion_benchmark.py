@@ -0,0 +1,440 @@
+import threading
+import socket
+import time
+import json
+import argparse
+import numpy as np
+
+from pythonosc.udp_client import SimpleUDPClient
+
+import motion_sender
+import motion_control
+
+"""
+headless benchmark of the interactive loop
+drives the synthesis and the OSC output for a fixed number of ticks without the GUI and injects synthetic control traffic
+together with a synthetic live mocap stream (/mocap/joint/rot_local) that replays the frames of a recording at live_rate
+the OSC output goes to a dummy UDP sink on the local machine, no network or other application is needed
+
+clock modes:
+ -- simulated: ticks run back to back, tick k happens at simulated time k * update_interval,
+    control events are delivered at their simulated time so that runs are reproducible
+ -- realtime: ticks are paced like in MotionGui
+
+control transport:
+ -- direct: events are passed to the MotionControl handlers on the tick thread before the synthesis update
+ -- osc: events are sent as OSC messages to a running MotionControl server and are handled on its thread like on stage
+
+a tick misses its deadline when control handling, synthesis update and OSC output together take longer than update_interval
+"""
+
+config = {"synthesis": None,
+          "tick_count": 5000,
+          "warmup_ticks": 50,
+          "update_interval": 1.0 / 30.0,
+          "clock": "simulated",
+          "control_transport": "direct",
+          "events": [ {"address": "/mocap/joint/rot_local", "rate": 30.0, "periodic": True},
+                      {"address": "/mocap/seqblend", "rate": 0.5, "burst": 1, "burst_interval": 0.0},
+                      {"address": "/mocap/changejointrot", "rate": 0.2, "burst": 20, "burst_interval": 1.0 / 60.0} ],
+          "seed": 0
+          }
+
+class DummySink():
+    """
+    receives and discards the OSC output, counts the messages and bytes
+    """
+
+    def __init__(self, ip="127.0.0.1"):
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((ip, 0))
+        self.socket.settimeout(0.1)
+
+        self.ip = ip
+        self.port = self.socket.getsockname()[1]
+
+        self.message_count = 0
+        self.byte_count = 0
+
+    def start(self):
+
+        self.sink_thread_event = threading.Event()
+        self.sink_thread = threading.Thread(target=self.receive)
+        self.sink_thread.start()
+
+    def stop(self):
+
+        self.sink_thread_event.set()
+        self.sink_thread.join()
+        self.socket.close()
+
+    def receive(self):
+
+        while self.sink_thread_event.is_set() == False:
+
+            try:
+                data = self.socket.recv(65535)
+            except socket.timeout:
+                continue
+
+            self.message_count += 1
+            self.byte_count += len(data)
+
+class MotionBenchmark():
+
+    def __init__(self, config):
+
+        self.synthesis = config["synthesis"]
+        self.tick_count = config["tick_count"]
+        self.warmup_ticks = config["warmup_ticks"]
+        self.update_interval = config["update_interval"]
+        self.clock = config["clock"]
+        self.control_transport = config["control_transport"]
+        self.events = config["events"]
+        self.seed = config["seed"]
+
+        self.rng = np.random.default_rng(self.seed)
+
+        self.sink = DummySink()
+
+        sender_config = dict(motion_sender.config)
+        sender_config["ip"] = self.sink.ip
+        sender_config["port"] = self.sink.port
+
+        self.sender = motion_sender.OscSender(sender_config)
+
+        control_config = dict(motion_control.config)
+        control_config["synthesis"] = self.synthesis
+        control_config["input_length"] = self.synthesis.seq_length
+        control_config["ip"] = "127.0.0.1"
+        control_config["port"] = 0 # any free port
+
+        self.control = motion_control.MotionControl(control_config)
+
+        if self.control_transport == "osc":
+            self.control_client = SimpleUDPClient("127.0.0.1", self.control.server.server_address[1])
+
+        self.createSchedule()
+
+    """
+    control traffic
+    """
+
+    def createSchedule(self):
+        """
+        event bursts start at random times (poisson process with the rate of the event),
+        the messages of a burst follow each other with burst_interval
+        periodic events (the live mocap stream) are sent with a fixed rate
+        """
+
+        duration = (self.warmup_ticks + self.tick_count) * self.update_interval
+
+        self.schedule = []
+
+        for event in self.events:
+
+            if event["rate"] <= 0.0:
+                continue
+
+            if event.get("periodic", False) == True:
+                self.schedule += [ (event_time, event["address"]) for event_time in np.arange(0.0, duration, 1.0 / event["rate"]) ]
+                continue
+
+            burst_time = self.rng.exponential(1.0 / event["rate"])
+
+            while burst_time < duration:
+
+                for mI in range(event["burst"]):
+                    self.schedule.append((burst_time + mI * event["burst_interval"], event["address"]))
+
+                burst_time += self.rng.exponential(1.0 / event["rate"])
+
+        self.schedule.sort(key=lambda scheduled_event: scheduled_event[0])
+
+        self.live_frame_index = 0
+
+        self.schedule = [ (event_time, address, self.createEventArgs(address)) for event_time, address in self.schedule ]
+
+    def createEventArgs(self, address):
+
+        if address == "/mocap/joint/rot_local" or address == "/mocap/0/joint/rot_local":
+            # the recording is replayed as the live performer
+            orig_sequence = self.synthesis.orig_sequences[0]
+            live_pose = orig_sequence[self.live_frame_index % orig_sequence.shape[0]]
+            self.live_frame_index += 1
+            return live_pose.reshape(-1).tolist()
+
+        if address == "/mocap/seqblend":
+            return [ float(self.rng.uniform(0.0, 1.0)) ]
+
+        if address == "/mocap/rand":
+            return [ float(self.rng.uniform(0.0, 0.01)) ]
+
+        if address == "/mocap/setjointrot" or address == "/mocap/changejointrot":
+            rot_axis = self.rng.normal(size=3)
+            rot_axis /= np.linalg.norm(rot_axis)
+            return [ int(self.rng.integers(0, self.synthesis.joint_count)) ] + rot_axis.tolist() + [ float(self.rng.uniform(-0.1, 0.1)) ]
+
+        raise ValueError("no synthetic arguments for " + address)
+
+    def deliverEvents(self, tick_time):
+
+        while self.next_event < len(self.schedule) and self.schedule[self.next_event][0] <= tick_time:
+
+            _, address, args = self.schedule[self.next_event]
+            self.next_event += 1
+
+            if self.control_transport == "osc":
+                self.control_client.send_message(address, args)
+            else:
+                for handler in self.control.dispatcher.handlers_for_address(address):
+                    handler.callback(address, *args)
+
+    """
+    output
+    """
+
+    def sendOsc(self):
+
+        # same output path as MotionGui.update_osc
+        if self.synthesis.synth_pose_wpos is None:
+            return
+
+        self.sender.sendPose(self.synthesis.synth_pose_wpos, self.synthesis.synth_pose_wrot, self.synthesis.synth_pose_lrot)
+
+    """
+    run
+    """
+
+    def run(self):
+
+        self.sink.start()
+
+        if self.control_transport == "osc":
+            self.control.start()
+
+        self.next_event = 0
+
+        tick_times = np.zeros((self.warmup_ticks + self.tick_count, 4), dtype=np.float64) # control, update, send, start delay
+
+        start_time = time.perf_counter()
+
+        for tI in range(self.warmup_ticks + self.tick_count):
+
+            tick_time = tI * self.update_interval
+
+            if self.clock == "realtime":
+                # wait for the tick like the update thread of MotionGui
+                wait_time = start_time + tick_time - time.perf_counter()
+                if wait_time > 0.0:
+                    time.sleep(wait_time)
+                tick_times[tI, 3] = time.perf_counter() - start_time - tick_time
+
+            control_start = time.perf_counter()
+
+            self.deliverEvents(tick_time)
+
+            update_start = time.perf_counter()
+
+            self.synthesis.update()
+
+            send_start = time.perf_counter()
+
+            self.sendOsc()
+
+            send_end = time.perf_counter()
+
+            tick_times[tI, 0] = update_start - control_start
+            tick_times[tI, 1] = send_start - update_start
+            tick_times[tI, 2] = send_end - send_start
+
+        # let the sink receive the last messages
+        time.sleep(0.2)
+
+        if self.control_transport == "osc":
+            self.control.stop_server()
+        else:
+            self.control.server.server_close()
+
+        self.sink.stop()
+
+        return self.createResults(tick_times[self.warmup_ticks:])
+
+    def createResults(self, tick_times):
+
+        tick_latency = np.sum(tick_times[:, :3], axis=1)
+
+        def distribution(values):
+            values = values * 1000.0 # ms
+            return {"mean": float(np.mean(values)),
+                    "p50": float(np.percentile(values, 50)),
+                    "p90": float(np.percentile(values, 90)),
+                    "p99": float(np.percentile(values, 99)),
+                    "p999": float(np.percentile(values, 99.9)),
+                    "max": float(np.max(values))}
+
+        results = {"tick_count": self.tick_count,
+                   "update_interval_ms": self.update_interval * 1000.0,
+                   "clock": self.clock,
+                   "control_transport": self.control_transport,
+                   "event_count": self.next_event,
+                   "tick": distribution(tick_latency),
+                   "control": distribution(tick_times[:, 0]),
+                   "update": distribution(tick_times[:, 1]),
+                   "send": distribution(tick_times[:, 2]),
+                   "deadline_misses": int(np.sum(tick_latency > self.update_interval)),
+                   "sink_messages": self.sink.message_count,
+                   "sink_bytes": self.sink.byte_count}
+
+        if self.clock == "realtime":
+            results["start_delay"] = distribution(tick_times[:, 3])
+
+        return results
+
+def printResults(results):
+
+    print("ticks ", results["tick_count"], " interval ", "{:01.2f}".format(results["update_interval_ms"]), " ms ", results["clock"], " clock ", results["control_transport"], " control ", results["event_count"], " events")
+
+    for name in [ "tick", "control", "update", "send", "start_delay" ]:
+
+        if name not in results:
+            continue
+
+        values = results[name]
+        print("{:>12} ms  mean {:7.3f}  p50 {:7.3f}  p90 {:7.3f}  p99 {:7.3f}  p99.9 {:7.3f}  max {:7.3f}".format(name, values["mean"], values["p50"], values["p90"], values["p99"], values["p999"], values["max"]))
+
+    print("deadline misses ", results["deadline_misses"], " / ", results["tick_count"], " sink messages ", results["sink_messages"], " bytes ", results["sink_bytes"])
+
+"""
+synthetic skeleton and motion, used when no mocap file is given
+"""
+
+def createSkeleton(joint_count, rng):
+
+    parents = [ -1 ]
+
+    for jI in range(1, joint_count):
+        parents.append(jI - 1 if rng.uniform() < 0.7 else int(rng.integers(0, jI)))
+
+    children = [ [] for _ in range(joint_count) ]
+
+    for jI, parent in enumerate(parents):
+        if parent >= 0:
+            children[parent].append(jI)
+
+    offsets = rng.normal(size=(joint_count, 3)) * 10.0
+    offsets[0] = 0.0
+
+    return {"offsets": offsets, "parents": parents, "children": children}
+
+def createMotion(joint_count, frame_count, rng, step_size=0.02):
+
+    from common.quaternion import qfix, expmap_to_quaternion
+
+    # random walk of the joint rotations in axis-angle space
+    rotations = np.cumsum(rng.normal(scale=step_size, size=(frame_count, joint_count, 3)), axis=0)
+
+    return qfix(expmap_to_quaternion(rotations)).astype(np.float32)
+
+def loadMocap(mocap_file):
+
+    from common import bvh_tools as bvh
+    from common import fbx_tools as fbx
+    from common import mocap_tools as mocap
+
+    # same as rnn_interactive.py
+    mocap_tools = mocap.Mocap_Tools()
+
+    if mocap_file.endswith(".bvh") or mocap_file.endswith(".BVH"):
+        mocap_data = mocap_tools.bvh_to_mocap(bvh.BVH_Tools().load(mocap_file))
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat_bvh(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+    else:
+        mocap_data = mocap_tools.fbx_to_mocap(fbx.FBX_Tools().load(mocap_file))[0]
+        mocap_data["motion"]["rot_local"] = mocap_tools.euler_to_quat(mocap_data["motion"]["rot_local_euler"], mocap_data["rot_sequence"])
+
+    mocap_data["skeleton"]["offsets"][0, 0] = 0.0
+    mocap_data["skeleton"]["offsets"][0, 2] = 0.0
+
+    return mocap_data["skeleton"], mocap_data["motion"]["rot_local"].astype(np.float32)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="headless benchmark of the interactive loop")
+
+    parser.add_argument("--backend", choices=["torch", "numpy"], default="torch")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--mocap", default=None, help="BVH or FBX file, a synthetic skeleton is used otherwise")
+    parser.add_argument("--weights", default="", help="trained weights, random weights otherwise")
+    parser.add_argument("--representation", choices=["quat", "repr6d"], default="quat", help="rotation representation of the model")
+    parser.add_argument("--joint_count", type=int, default=34)
+    parser.add_argument("--input_length", type=int, default=64)
+    parser.add_argument("--node_dim", type=int, default=512)
+    parser.add_argument("--layer_count", type=int, default=2)
+    parser.add_argument("--ticks", type=int, default=config["tick_count"])
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--live_rate", type=float, default=30.0, help="frames per second of the live mocap stream")
+    parser.add_argument("--clock", choices=["simulated", "realtime"], default=config["clock"])
+    parser.add_argument("--control", choices=["direct", "osc"], default=config["control_transport"])
+    parser.add_argument("--event_scale", type=float, default=1.0, help="multiplies the rates of all control events")
+    parser.add_argument("--seed", type=int, default=config["seed"])
+    parser.add_argument("--output", default=None, help="json file for the results")
+
+    args = parser.parse_args()
+
+    import torch
+    import motion_model
+    import motion_synthesis
+
+    torch.manual_seed(args.seed)
+
+    rng = np.random.default_rng(args.seed)
+
+    if args.mocap is not None:
+        skeleton, pose_sequence = loadMocap(args.mocap)
+    else:
+        skeleton = createSkeleton(args.joint_count, rng)
+        pose_sequence = createMotion(args.joint_count, 2000, rng)
+
+    joint_count = pose_sequence.shape[1]
+
+    motion_model.config["input_length"] = args.input_length
+    motion_model.config["data_dim"] = joint_count * (6 if args.representation == "repr6d" else 4)
+    motion_model.config["node_dim"] = args.node_dim
+    motion_model.config["layer_count"] = args.layer_count
+    motion_model.config["device"] = args.device
+    motion_model.config["weights_path"] = args.weights
+    motion_model.config["backend"] = args.backend
+
+    model = motion_model.createModel(motion_model.config)
+
+    synthesis_config = motion_synthesis.config
+    synthesis_config["skeleton"] = skeleton
+    synthesis_config["model"] = model
+    synthesis_config["seq_length"] = args.input_length
+    synthesis_config["orig_sequences"] = [ pose_sequence ]
+    synthesis_config["orig_seq_index"] = 0
+    synthesis_config["device"] = args.device
+    synthesis_config["representation"] = args.representation
+
+    synthesis = motion_synthesis.MotionSynthesis(synthesis_config)
+
+    benchmark_config = dict(config)
+    benchmark_config["synthesis"] = synthesis
+    benchmark_config["tick_count"] = args.ticks
+    benchmark_config["update_interval"] = 1.0 / args.fps
+    benchmark_config["clock"] = args.clock
+    benchmark_config["control_transport"] = args.control
+    benchmark_config["events"] = [ dict(event, rate=args.live_rate) if event.get("periodic", False) == True else dict(event, rate=event["rate"] * args.event_scale) for event in config["events"] ]
+    benchmark_config["seed"] = args.seed
+
+    benchmark = MotionBenchmark(benchmark_config)
+    results = benchmark.run()
+
+    printResults(results)
+
+    if args.output is not None:
+        results["settings"] = vars(args)
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
@@ -9,6 +9,7 @@ from pythonosc import osc_server
 config = {"motion_seq": None,
           "synthesis": None,
           "gui": None,
+          "recorder": None,
           "input_length": 64,
           "ip": "127.0.0.1",
           "port": 9007}
@@ -20,6 +21,7 @@ class MotionControl():
         self.motion_seq = config["motion_seq"]
         self.synthesis = config["synthesis"]
         self.gui = config["gui"]
+        self.recorder = config["recorder"]
         self.input_length = config["input_length"]
         self.ip = config["ip"]
         self.port = config["port"]
@@ -60,6 +62,9 @@ class MotionControl():
         
         rot_local = np.asarray(osc_values, dtype=np.float32)
         
+        if self.recorder is not None:
+            self.recorder.record("/mocap/live/joint/rot_local", rot_local)
+        
         self.synthesis.updateLiveSeq(rot_local)
         
     def initLiveSeq(self, address, *args):
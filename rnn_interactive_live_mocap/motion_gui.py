@@ -16,6 +16,7 @@ import motion_synthesis
 
 config = {"synthesis": None,
           "sender": None,
+          "recorder": None,
           "update_interval": 0.02,
           "view_min": np.array([-100, -100, -100], dtype=np.float32),
           "view_max": np.array([100, 100, 100], dtype=np.float32),
@@ -32,6 +33,7 @@ class MotionGui(QtWidgets.QWidget):
         
         self.synthesis = config["synthesis"]
         self.sender = config["sender"]
+        self.recorder = config["recorder"]
         
         self.edges = self.synthesis.edge_list
         
@@ -118,61 +120,11 @@ class MotionGui(QtWidgets.QWidget):
         if self.synth_pose_wpos is None:
             return
         
-        # convert from left handed bvh coordinate system to right handed standard coordinate system
-        self.synth_pose_wpos_rh = np.copy(self.synth_pose_wpos)
-
-        self.synth_pose_wpos_rh[:, 0] = self.synth_pose_wpos[:, 0] / 100.0
-        self.synth_pose_wpos_rh[:, 1] = -self.synth_pose_wpos[:, 2] / 100.0
-        self.synth_pose_wpos_rh[:, 2] = self.synth_pose_wpos[:, 1] / 100.0
-
-        self.synth_pose_wrot_rh = np.copy(self.synth_pose_wrot)
-        
-        self.synth_pose_wrot_rh[:, 1] = self.synth_pose_wrot[:, 1] # x -> x
-        self.synth_pose_wrot_rh[:, 2] = -self.synth_pose_wrot[:, 3] # z -> -y
-        self.synth_pose_wrot_rh[:, 3] = self.synth_pose_wrot[:, 2] # y -> z
-        
-        self.synth_pose_lrot_rh = np.copy(self.synth_pose_lrot)
-        
-        # debug: send identity quaternion
-        #self.synth_pose_lrot_rh[:] = np.array([1.0, 0.0, 0.0, 0.0])
-
-        # quat in python: w x y z, quat in unreal x y z w
-        """
-        self.synth_pose_lrot_rh[:, 3] = self.synth_pose_lrot[:, 0] 
-        self.synth_pose_lrot_rh[:, 0] = self.synth_pose_lrot[:, 1]
-        self.synth_pose_lrot_rh[:, 1] = self.synth_pose_lrot[:, 2]
-        self.synth_pose_lrot_rh[:, 2] = -self.synth_pose_lrot[:, 3]
-        """
-        
-        """
-        self.synth_pose_lrot_rh[:, 0] = self.synth_pose_lrot[:, 0] 
-        self.synth_pose_lrot_rh[:, 1] = self.synth_pose_lrot[:, 1]
-        self.synth_pose_lrot_rh[:, 2] = -self.synth_pose_lrot[:, 2]
-        self.synth_pose_lrot_rh[:, 3] = self.synth_pose_lrot[:, 3]
-        """
-        
-        """
-        self.synth_pose_lrot_rh[:, 3] = self.synth_pose_lrot[:, 0] 
-        self.synth_pose_lrot_rh[:, 0] = self.synth_pose_lrot[:, 1]
-        self.synth_pose_lrot_rh[:, 1] = self.synth_pose_lrot[:, 2]
-        self.synth_pose_lrot_rh[:, 2] = -self.synth_pose_lrot[:, 3]
-        """
-
-        
-        """
-        self.synth_pose_lrot_rh[:, 3] = self.synth_pose_lrot[:, 0] # w
-        self.synth_pose_lrot_rh[:, 0] = self.synth_pose_lrot[:, 1] # x -> x
-        self.synth_pose_lrot_rh[:, 1] = -self.synth_pose_lrot[:, 3] # z -> -y
-        self.synth_pose_lrot_rh[:, 2] = self.synth_pose_lrot[:, 2] # y -> z
-        """
-        
-        #self.synth_pose_lrot_rh[:, 1] = self.synth_pose_lrot[:, 1]
-        #self.synth_pose_lrot_rh[:, 2] = -self.synth_pose_lrot[:, 3]
-        #self.synth_pose_lrot_rh[:, 3] = self.synth_pose_lrot[:, 2]
+        # convert from left handed bvh coordinate system to right handed standard coordinate system and send
+        self.synth_pose_wpos_rh, self.synth_pose_wrot_rh, self.synth_pose_lrot_rh = self.sender.sendPose(self.synth_pose_wpos, self.synth_pose_wrot, self.synth_pose_lrot)
         
-        self.sender.send("/mocap/joint/pos_world", self.synth_pose_wpos_rh)
-        self.sender.send("/mocap/joint/rot_world", self.synth_pose_wrot_rh)
-        self.sender.send("/mocap/joint/rot_local", self.synth_pose_lrot_rh)
+        if self.recorder is not None:
+            self.recorder.record("/mocap/synth/joint/rot_local", self.synth_pose_lrot_rh)
 
     def update_seq_plot(self):
         
@@ -1,6 +1,7 @@
 import torch
 from torch import nn
 from collections import OrderedDict
+import inspect
 import math
 
 """
@@ -13,7 +14,11 @@ config = {
     "node_dim": 512,
     "layer_count": 2,
     "device": "cuda",
-    "weights_path": "results/weights/rnn_weights_epoch_400"
+    "weights_path": "results/weights/rnn_weights_epoch_400",
+    "backend": "torch",
+    "onnx_path": "",
+    "onnx_step_path": "",
+    "representation": "quat"
     }
 
 class Reccurent(nn.Module):
@@ -42,8 +47,81 @@ class Reccurent(nn.Module):
         
         return x
     
+    def forward_state(self, x, state=None):
+        """
+        stateful variant of forward
+        continues from the LSTM state (h, c) returned by a previous call instead of starting from zeros
+        """
+        
+        x, state = self.rnn_layers.rnn(x, state)
+        
+        x = x[:, -1, :] # only last time step 
+        x = self.dense_layers(x)
+        
+        return x, state
+    
+class ReccurentStep(nn.Module):
+    """
+    stateful single step form of Reccurent with explicit h / c inputs and outputs, used for onnx export
+    """
+    
+    def __init__(self, model):
+        super(ReccurentStep, self).__init__()
+        
+        self.model = model
+        
+    def forward(self, x, h, c):
+        x, (h, c) = self.model.forward_state(x, (h, c))
+        
+        return x, h, c
+    
+def exportOnnx(model, config, onnx_path, stateful=False):
+    """
+    export model to onnx
+    the stateless form takes a window (batch, length, data_dim) and returns the next pose (batch, data_dim)
+    the stateful form additionally takes and returns the LSTM state h and c (layer_count, batch, node_dim)
+    """
+    
+    model.eval()
+    
+    # use the torchscript based exporter, newer torch versions default to the dynamo based one
+    export_args = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_args["dynamo"] = False
+    
+    device = next(model.parameters()).device
+    x = torch.zeros((1, config["input_length"], config["data_dim"]), dtype=torch.float32).to(device)
+    
+    if stateful == False:
+        torch.onnx.export(model, (x, ), onnx_path, 
+                          input_names=["x"], output_names=["y"], 
+                          dynamic_axes={"x": {0: "batch", 1: "length"}, "y": {0: "batch"}}, 
+                          **export_args)
+    else:
+        h = torch.zeros((config["layer_count"], 1, config["node_dim"]), dtype=torch.float32).to(device)
+        c = torch.zeros((config["layer_count"], 1, config["node_dim"]), dtype=torch.float32).to(device)
+        
+        torch.onnx.export(ReccurentStep(model), (x, h, c), onnx_path, 
+                          input_names=["x", "h", "c"], output_names=["y", "h_out", "c_out"], 
+                          dynamic_axes={"x": {0: "batch", 1: "length"}, "y": {0: "batch"}, 
+                                        "h": {1: "batch"}, "c": {1: "batch"}, 
+                                        "h_out": {1: "batch"}, "c_out": {1: "batch"}}, 
+                          **export_args)
+    
+    model.train()
+    
 def createModel(config):
     
+    if config["backend"] == "onnx":
+        import motion_model_onnx
+        
+        return motion_model_onnx.createModel(config)
+    
+    if config["backend"] == "numpy":
+        import motion_model_np
+        
+        return motion_model_np.createModel(config)
+    
     rnn = Reccurent(config["data_dim"], config["node_dim"], config["data_dim"], config["layer_count"]).to( config["device"])
 
     if config["weights_path"] != "":
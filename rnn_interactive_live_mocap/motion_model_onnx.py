@@ -0,0 +1,95 @@
+import numpy as np
+import onnxruntime as ort
+
+"""
+onnxruntime backed version of the recurrent model
+has the same call interface as motion_model.Reccurent but does not depend on torch
+the onnx files are created with motion_model.exportOnnx
+"""
+
+config = {
+    "input_length": 64,
+    "data_dim": 308,
+    "node_dim": 512,
+    "layer_count": 2,
+    "device": "cpu",
+    "onnx_path": "results/weights/rnn_weights_epoch_400.onnx",
+    "onnx_step_path": "results/weights/rnn_weights_epoch_400_step.onnx"
+    }
+
+class OnnxReccurent():
+    def __init__(self, onnx_path, onnx_step_path, hidden_dim, layer_count, device):
+        
+        self.hidden_dim = hidden_dim
+        self.layer_count = layer_count
+        
+        if device == "cuda":
+            self.providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        else:
+            self.providers = ["CPUExecutionProvider"]
+        
+        self.session = None
+        self.step_session = None
+        
+        if onnx_path != "":
+            self.session = ort.InferenceSession(onnx_path, providers=self.providers)
+        if onnx_step_path != "":
+            self.step_session = ort.InferenceSession(onnx_step_path, providers=self.providers)
+            
+    def __call__(self, x):
+        return self.forward(x)
+    
+    def forward(self, x):
+        
+        _x, to_input_type = self._to_numpy(x)
+        
+        y = self.session.run(["y"], {"x": _x})[0]
+        
+        return to_input_type(y)
+    
+    def forward_state(self, x, state=None):
+        
+        _x, to_input_type = self._to_numpy(x)
+        
+        if state is None:
+            h = np.zeros((self.layer_count, _x.shape[0], self.hidden_dim), dtype=np.float32)
+            c = np.zeros((self.layer_count, _x.shape[0], self.hidden_dim), dtype=np.float32)
+        else:
+            h = self._to_numpy(state[0])[0]
+            c = self._to_numpy(state[1])[0]
+        
+        y, h, c = self.step_session.run(["y", "h_out", "c_out"], {"x": _x, "h": h, "c": c})
+        
+        return to_input_type(y), (to_input_type(h), to_input_type(c))
+    
+    def _to_numpy(self, x):
+        """
+        accept numpy arrays and torch tensors, results are returned as the same type as the input
+        """
+        
+        if isinstance(x, np.ndarray):
+            return np.ascontiguousarray(x, dtype=np.float32), lambda y: y
+        
+        # torch tensor, torch is only used here if the caller already works with torch
+        import torch
+        
+        device = x.device
+        
+        return x.detach().cpu().numpy().astype(np.float32), lambda y: torch.from_numpy(y).to(device)
+    
+    # no-ops for interface compatibility with torch modules
+    
+    def eval(self):
+        return self
+    
+    def train(self, mode=True):
+        return self
+    
+    def to(self, device):
+        return self
+    
+def createModel(config):
+    
+    rnn = OnnxReccurent(config["onnx_path"], config["onnx_step_path"], config["node_dim"], config["layer_count"], config["device"])
+    
+    return rnn
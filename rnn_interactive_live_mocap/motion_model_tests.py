@@ -0,0 +1,168 @@
+import os
+import sys
+import subprocess
+import tempfile
+import importlib.util
+from unittest import TestCase, skipIf
+import numpy as np
+import torch
+
+import motion_model
+import motion_model_np
+
+onnx_available = importlib.util.find_spec("onnxruntime") is not None
+
+@skipIf(onnx_available == False, "onnxruntime is not installed")
+class TestOnnxModel(TestCase):
+
+    def setUp(self):
+        
+        torch.manual_seed(0)
+        
+        self.config = dict(motion_model.config)
+        self.config["input_length"] = 16
+        self.config["data_dim"] = 40
+        self.config["node_dim"] = 32
+        self.config["layer_count"] = 2
+        self.config["device"] = "cpu"
+        self.config["weights_path"] = ""
+        
+        self.model = motion_model.createModel(self.config)
+        self.model.eval()
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        
+        self.config["backend"] = "onnx"
+        self.config["onnx_path"] = os.path.join(self.tmp_dir.name, "rnn.onnx")
+        self.config["onnx_step_path"] = os.path.join(self.tmp_dir.name, "rnn_step.onnx")
+        
+        motion_model.exportOnnx(self.model, self.config, self.config["onnx_path"], stateful=False)
+        motion_model.exportOnnx(self.model, self.config, self.config["onnx_step_path"], stateful=True)
+        
+        self.onnx_model = motion_model.createModel(self.config)
+        
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        
+    def test_window_parity(self):
+        
+        for batch_size in [1, 4]:
+            x = torch.randn((batch_size, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+            
+            with torch.no_grad():
+                y = self.model(x).numpy()
+            
+            # numpy input
+            y_onnx = self.onnx_model(x.numpy())
+            np.testing.assert_allclose(y, y_onnx, atol=1e-5)
+            
+            # torch input
+            y_onnx = self.onnx_model(x)
+            self.assertTrue(isinstance(y_onnx, torch.Tensor))
+            np.testing.assert_allclose(y, y_onnx.numpy(), atol=1e-5)
+            
+    def test_state_parity(self):
+        
+        x = torch.randn((2, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        x_next = torch.randn((2, 1, self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y, state = self.model.forward_state(x)
+            y_next, _ = self.model.forward_state(x_next, state)
+            
+        y_onnx, state_onnx = self.onnx_model.forward_state(x.numpy())
+        y_next_onnx, _ = self.onnx_model.forward_state(x_next.numpy(), state_onnx)
+        
+        np.testing.assert_allclose(y.numpy(), y_onnx, atol=1e-5)
+        np.testing.assert_allclose(state[0].numpy(), state_onnx[0], atol=1e-5)
+        np.testing.assert_allclose(state[1].numpy(), state_onnx[1], atol=1e-5)
+        np.testing.assert_allclose(y_next.numpy(), y_next_onnx, atol=1e-5)
+        
+    def test_stateful_matches_window(self):
+        
+        # stepping the state one pose at a time ends where the full window ends
+        x = torch.randn((1, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y = self.model(x).numpy()
+        
+        state = None
+        for pI in range(self.config["input_length"]):
+            y_step, state = self.onnx_model.forward_state(x[:, pI:pI+1].numpy(), state)
+            
+        np.testing.assert_allclose(y, y_step, atol=1e-5)
+        
+    def test_torch_free_model(self):
+        
+        # the torch free runtime creates onnx models with motion_model_np, which must not import torch
+        config = dict(motion_model_np.config)
+        config["node_dim"] = self.config["node_dim"]
+        config["layer_count"] = self.config["layer_count"]
+        config["backend"] = "onnx"
+        config["onnx_path"] = self.config["onnx_path"]
+        config["onnx_step_path"] = self.config["onnx_step_path"]
+        
+        x = np.random.default_rng(0).standard_normal((1, self.config["input_length"], self.config["data_dim"])).astype(np.float32)
+        
+        np.testing.assert_allclose(motion_model_np.createModel(config)(x), self.onnx_model(x), atol=1e-6)
+        
+        code = "import sys, motion_model_np; motion_model_np.createModel({}); sys.exit(int('torch' in sys.modules))".format(repr(config))
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        
+        self.assertEqual(subprocess.run([sys.executable, "-c", code], cwd=test_dir).returncode, 0)
+
+class TestNumpyModel(TestCase):
+
+    def setUp(self):
+        
+        torch.manual_seed(0)
+        
+        self.config = dict(motion_model.config)
+        self.config["input_length"] = 16
+        self.config["data_dim"] = 40
+        self.config["node_dim"] = 32
+        self.config["layer_count"] = 2
+        self.config["device"] = "cpu"
+        self.config["weights_path"] = ""
+        
+        self.model = motion_model.createModel(self.config)
+        self.model.eval()
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        
+        self.config["backend"] = "numpy"
+        self.config["weights_path"] = os.path.join(self.tmp_dir.name, "rnn_weights")
+        
+        torch.save(self.model.state_dict(), self.config["weights_path"])
+        
+        self.numpy_model = motion_model.createModel(self.config)
+        
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        
+    def test_window_parity(self):
+        
+        for batch_size in [1, 4]:
+            x = torch.randn((batch_size, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+            
+            with torch.no_grad():
+                y = self.model(x).numpy()
+            
+            y_numpy = self.numpy_model(x.numpy())
+            np.testing.assert_allclose(y, y_numpy, atol=1e-5)
+            
+    def test_state_parity(self):
+        
+        x = torch.randn((2, self.config["input_length"], self.config["data_dim"]), dtype=torch.float32)
+        x_next = torch.randn((2, 1, self.config["data_dim"]), dtype=torch.float32)
+        
+        with torch.no_grad():
+            y, state = self.model.forward_state(x)
+            y_next, _ = self.model.forward_state(x_next, state)
+            
+        y_numpy, state_numpy = self.numpy_model.forward_state(x.numpy())
+        y_next_numpy, _ = self.numpy_model.forward_state(x_next.numpy(), state_numpy)
+        
+        np.testing.assert_allclose(y.numpy(), y_numpy, atol=1e-5)
+        np.testing.assert_allclose(state[1].numpy(), state_numpy[1], atol=1e-5)
+        np.testing.assert_allclose(y_next.numpy(), y_next_numpy, atol=1e-5)
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import queue
+import threading
+import numpy as np
+
+from common.quaternion import qnormalize_np, qfix_chunked
+from common.mocap_recording import RecordingWriter
+
+"""
+records incoming and outgoing pose frames into an append only binary log
+
+a log file starts with a json header of log_header_size bytes followed by chunks of chunk_size bytes
+a chunk holds the frames of one stream: a chunk header, float64 time stamps and float32 values of shape (frames, value_count)
+log files are preallocated with chunks_per_file chunks, a new file is started once a file is full
+
+frames are copied into preallocated chunk buffers, full buffers are written by a background thread
+if the writer falls behind and no free buffer is left, frames are dropped instead of blocking the caller
+"""
+
+config = {"log_path": "recordings",
+          "log_name": "motion",
+          "streams": {}, # stream name: values per frame
+          "chunk_size": 65536, # bytes
+          "chunks_per_file": 1024,
+          "buffer_count": 8 # chunk buffers per stream
+          }
+
+log_header_size = 4096
+log_file_extension = ".mlog"
+chunk_magic = 0x4b4e4843
+chunk_header_dtype = np.dtype([("magic", "<u4"), ("stream", "<u4"), ("frame_count", "<u4"), ("value_count", "<u4"), ("sequence", "<u8"), ("reserved", "<u8")])
+
+def chunkFrameCount(chunk_size, value_count):
+    return (chunk_size - chunk_header_dtype.itemsize) // (8 + 4 * value_count)
+
+def chunkViews(chunk, frame_count, value_count):
+    """
+    header, time stamps and values views of a chunk given as uint8 array of chunk_size bytes
+    """
+
+    time_offset = chunk_header_dtype.itemsize
+    value_offset = time_offset + 8 * frame_count
+
+    header = chunk[:time_offset].view(chunk_header_dtype)
+    time_stamps = chunk[time_offset:value_offset].view("<f8")
+    values = chunk[value_offset:value_offset + 4 * frame_count * value_count].view("<f4").reshape(frame_count, value_count)
+
+    return header, time_stamps, values
+
+class MotionRecorder():
+
+    def __init__(self, config):
+
+        self.log_path = config["log_path"]
+        self.log_name = config["log_name"]
+        self.chunk_size = config["chunk_size"]
+        self.chunks_per_file = config["chunks_per_file"]
+        self.buffer_count = config["buffer_count"]
+
+        self.streams = {}
+
+        for stream_index, (stream_name, value_count) in enumerate(config["streams"].items()):
+
+            frame_count = chunkFrameCount(self.chunk_size, value_count)
+
+            if frame_count < 1:
+                raise ValueError("chunk_size {} is too small for stream {} with {} values".format(self.chunk_size, stream_name, value_count))
+
+            stream = {}
+            stream["name"] = stream_name
+            stream["index"] = stream_index
+            stream["value_count"] = value_count
+            stream["frame_count"] = frame_count
+            stream["buffers"] = np.zeros((self.buffer_count, self.chunk_size), dtype=np.uint8)
+            stream["views"] = [ chunkViews(buffer, frame_count, value_count) for buffer in stream["buffers"] ]
+            stream["free_buffers"] = queue.Queue()
+            stream["buffer_index"] = None
+            stream["fill"] = 0
+            stream["recorded_frames"] = 0
+            stream["dropped_frames"] = 0
+            stream["lock"] = threading.Lock()
+
+            for buffer_index in range(self.buffer_count):
+                stream["free_buffers"].put(buffer_index)
+
+            self.streams[stream_name] = stream
+
+        self.write_queue = queue.Queue()
+        self.chunk_sequence = 0
+        self.sequence_lock = threading.Lock()
+        self.file_index = 0
+        self.file = None
+        self.file_chunk_index = 0
+        self.th = None
+
+    def start(self):
+
+        os.makedirs(self.log_path, exist_ok=True)
+
+        self.th = threading.Thread(target=self._write_chunks)
+        self.th.start()
+
+    def stop(self):
+
+        # write the partially filled buffers and wait for the writer thread
+        for stream in self.streams.values():
+            with stream["lock"]:
+                if stream["buffer_index"] is not None and stream["fill"] > 0:
+                    self._submit_buffer(stream)
+
+        self.write_queue.put(None)
+        self.th.join()
+        self.th = None
+
+    def record(self, stream_name, values, time_stamp=None):
+        """
+        append one frame to a stream, values can be any array or sequence with value_count entries
+        returns False if the frame was dropped
+        """
+
+        stream = self.streams[stream_name]
+
+        if time_stamp is None:
+            time_stamp = time.time()
+
+        with stream["lock"]:
+
+            if stream["buffer_index"] is None:
+                try:
+                    stream["buffer_index"] = stream["free_buffers"].get_nowait()
+                except queue.Empty:
+                    stream["dropped_frames"] += 1
+                    return False
+
+            _, buffer_time_stamps, buffer_values = stream["views"][stream["buffer_index"]]
+            fill = stream["fill"]
+
+            buffer_time_stamps[fill] = time_stamp
+            buffer_values[fill] = np.ravel(values)
+
+            stream["fill"] += 1
+            stream["recorded_frames"] += 1
+
+            if stream["fill"] == stream["frame_count"]:
+                self._submit_buffer(stream)
+
+        return True
+
+    def _submit_buffer(self, stream):
+
+        header = stream["views"][stream["buffer_index"]][0]
+        header["magic"] = chunk_magic
+        header["stream"] = stream["index"]
+        header["frame_count"] = stream["fill"]
+        header["value_count"] = stream["value_count"]
+
+        # the streams are recorded from different threads and only hold their own lock,
+        # the sequence number is shared by all streams and is taken together with the place in the write queue
+        with self.sequence_lock:
+            header["sequence"] = self.chunk_sequence
+            self.chunk_sequence += 1
+
+            self.write_queue.put((stream["name"], stream["buffer_index"]))
+
+        stream["buffer_index"] = None
+        stream["fill"] = 0
+
+    def _write_chunks(self):
+
+        while True:
+
+            item = self.write_queue.get()
+
+            if item is None:
+                break
+
+            stream_name, buffer_index = item
+            stream = self.streams[stream_name]
+
+            if self.file is None or self.file_chunk_index == self.chunks_per_file:
+                self._open_file()
+
+            self.file.seek(log_header_size + self.file_chunk_index * self.chunk_size)
+            self.file.write(stream["buffers"][buffer_index].data)
+            self.file.flush()
+            self.file_chunk_index += 1
+
+            stream["free_buffers"].put(buffer_index)
+
+        self._close_file()
+
+    def _open_file(self):
+
+        self._close_file()
+
+        header = {}
+        header["chunk_size"] = self.chunk_size
+        header["chunks_per_file"] = self.chunks_per_file
+        header["streams"] = [ { key: stream[key] for key in ["name", "value_count", "frame_count"] } for stream in self.streams.values() ]
+        header["start_time"] = time.time()
+
+        header_bytes = json.dumps(header).encode("utf-8")
+
+        if len(header_bytes) > log_header_size:
+            raise ValueError("log header exceeds {} bytes".format(log_header_size))
+
+        file_name = os.path.join(self.log_path, "{}_{:04d}{}".format(self.log_name, self.file_index, log_file_extension))
+        self.file_index += 1
+
+        # preallocate the whole file so that appending a chunk never grows it
+        self.file = open(file_name, "wb")
+        self.file.truncate(log_header_size + self.chunks_per_file * self.chunk_size)
+        self.file.write(header_bytes)
+        self.file_chunk_index = 0
+
+    def _close_file(self):
+
+        if self.file is None:
+            return
+
+        # release the preallocated space that was not used
+        self.file.truncate(log_header_size + self.file_chunk_index * self.chunk_size)
+        self.file.close()
+        self.file = None
+
+"""
+Log Conversion
+"""
+
+def logFiles(log_path, log_name=config["log_name"]):
+    return sorted([ os.path.join(log_path, file_name) for file_name in os.listdir(log_path) if file_name.startswith(log_name + "_") and file_name.endswith(log_file_extension) ])
+
+def readLog(log_path, log_name=config["log_name"]):
+    """
+    read all log files of a recording
+    returns {stream name: (time stamps, values)} with time stamps of shape (frames) and values of shape (frames, value_count)
+    """
+
+    stream_chunks = {}
+    stream_value_counts = {}
+
+    for file_name in logFiles(log_path, log_name):
+
+        with open(file_name, "rb") as f:
+            header = json.loads(f.read(log_header_size).rstrip(b"\0").decode("utf-8"))
+
+        chunk_size = header["chunk_size"]
+        chunk_count = (os.path.getsize(file_name) - log_header_size) // chunk_size
+
+        if chunk_count == 0:
+            continue
+
+        chunks = np.memmap(file_name, dtype=np.uint8, mode="r", offset=log_header_size, shape=(chunk_count, chunk_size))
+
+        for chunk in chunks:
+
+            chunk_header = chunk[:chunk_header_dtype.itemsize].view(chunk_header_dtype)[0]
+
+            # unwritten space of a file that was not closed
+            if chunk_header["magic"] != chunk_magic:
+                continue
+
+            stream = header["streams"][chunk_header["stream"]]
+            _, time_stamps, values = chunkViews(chunk, stream["frame_count"], stream["value_count"])
+            frame_count = chunk_header["frame_count"]
+
+            stream_chunks.setdefault(stream["name"], []).append((int(chunk_header["sequence"]), time_stamps[:frame_count], values[:frame_count]))
+            stream_value_counts[stream["name"]] = stream["value_count"]
+
+    log_data = {}
+
+    for stream_name, chunks in stream_chunks.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        log_data[stream_name] = (np.concatenate([ chunk[1] for chunk in chunks ]), np.concatenate([ chunk[2] for chunk in chunks ]))
+
+    return log_data
+
+def logToPoseSequences(log_path, joint_count, log_name=config["log_name"]):
+    """
+    convert the quaternion streams of a log into training ready pose sequences
+    returns {stream name: (frames, joint_count, 4) float32 array} with normalised quaternions on a continuous hemisphere
+    """
+
+    pose_sequences = {}
+
+    for stream_name, (_, values) in readLog(log_path, log_name).items():
+
+        if values.shape[1] != joint_count * 4:
+            continue
+
+        pose_sequence = qnormalize_np(values.reshape(-1, joint_count, 4)).astype(np.float32)
+        pose_sequences[stream_name] = qfix_chunked(pose_sequence, out=pose_sequence)
+
+    return pose_sequences
+
+def logToRecording(log_path, recording_path, log_name=config["log_name"]):
+    """
+    convert a log into a columnar recording (see common/mocap_recording.py), one column per stream
+    """
+
+    with RecordingWriter(recording_path) as writer:
+        for stream_name, (time_stamps, values) in readLog(log_path, log_name).items():
+            writer.append(stream_name, time_stamps, values)
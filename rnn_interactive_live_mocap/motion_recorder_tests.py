@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+import threading
+from unittest import TestCase
+import numpy as np
+
+import motion_recorder
+from common import mocap_recording
+from common.quaternion import qfix
+
+class TestMotionRecorder(TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+
+        self.joint_count = 5
+        self.live_poses = rng.standard_normal((300, self.joint_count, 4)).astype(np.float32)
+        self.synth_poses = rng.standard_normal((200, self.joint_count, 4)).astype(np.float32)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.config = dict(motion_recorder.config)
+        self.config["log_path"] = os.path.join(self.tmp_dir.name, "log")
+        self.config["streams"] = { "/mocap/live/joint/rot_local": self.joint_count * 4, "/mocap/synth/joint/rot_local": self.joint_count * 4 }
+        # 15 frames per chunk, 4 chunks per file
+        self.config["chunk_size"] = motion_recorder.chunk_header_dtype.itemsize + 15 * (8 + 4 * self.joint_count * 4)
+        self.config["chunks_per_file"] = 4
+        self.config["buffer_count"] = 64
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def record(self, recorder):
+
+        # incoming and outgoing frames are recorded from different threads
+        def record_live():
+            for fI, pose in enumerate(self.live_poses):
+                recorder.record("/mocap/live/joint/rot_local", pose, time_stamp=fI * 0.01)
+
+        def record_synth():
+            for fI, pose in enumerate(self.synth_poses):
+                recorder.record("/mocap/synth/joint/rot_local", pose.reshape(-1).tolist(), time_stamp=fI * 0.02)
+
+        recorder.start()
+
+        threads = [ threading.Thread(target=record_live), threading.Thread(target=record_synth) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        recorder.stop()
+
+    def test_round_trip(self):
+
+        self.record(motion_recorder.MotionRecorder(self.config))
+
+        log_data = motion_recorder.readLog(self.config["log_path"])
+
+        time_stamps, values = log_data["/mocap/live/joint/rot_local"]
+        np.testing.assert_array_equal(values, self.live_poses.reshape(300, -1))
+        np.testing.assert_allclose(time_stamps, np.arange(300) * 0.01)
+
+        time_stamps, values = log_data["/mocap/synth/joint/rot_local"]
+        np.testing.assert_array_equal(values, self.synth_poses.reshape(200, -1))
+        np.testing.assert_allclose(time_stamps, np.arange(200) * 0.02)
+
+    def test_rollover(self):
+
+        self.record(motion_recorder.MotionRecorder(self.config))
+
+        # 20 live and 14 synth chunks, 4 chunks per file, the unused space of the last file is released
+        log_files = motion_recorder.logFiles(self.config["log_path"])
+
+        self.assertEqual(len(log_files), 9)
+        self.assertEqual(os.path.getsize(log_files[0]), motion_recorder.log_header_size + 4 * self.config["chunk_size"])
+        self.assertEqual(os.path.getsize(log_files[-1]), motion_recorder.log_header_size + 2 * self.config["chunk_size"])
+
+    def test_chunk_sequence(self):
+
+        # one frame per chunk so that both threads submit chunks all the time
+        self.config["chunk_size"] = motion_recorder.chunk_header_dtype.itemsize + 8 + 4 * self.joint_count * 4
+        self.config["chunks_per_file"] = 10000
+        self.config["buffer_count"] = 1000
+
+        self.live_poses = np.tile(self.live_poses, (10, 1, 1))
+        self.synth_poses = np.tile(self.synth_poses, (10, 1, 1))
+
+        recorder = motion_recorder.MotionRecorder(self.config)
+
+        # switch threads as often as possible so that the submissions of both streams interleave
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        try:
+            self.record(recorder)
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        chunk_count = sum([ stream["recorded_frames"] for stream in recorder.streams.values() ])
+
+        # the chunks are numbered without gaps or repeats in the order they were written
+        sequences = []
+
+        for file_name in motion_recorder.logFiles(self.config["log_path"]):
+            chunks = np.fromfile(file_name, dtype=np.uint8, offset=motion_recorder.log_header_size).reshape(-1, self.config["chunk_size"])
+            sequences += [ int(chunk[:motion_recorder.chunk_header_dtype.itemsize].view(motion_recorder.chunk_header_dtype)[0]["sequence"]) for chunk in chunks ]
+
+        self.assertEqual(sequences, list(range(chunk_count)))
+
+    def test_dropped_frames(self):
+
+        # without a running writer thread the buffers are never returned, the recorder drops frames instead of blocking
+        self.config["buffer_count"] = 2
+        recorder = motion_recorder.MotionRecorder(self.config)
+
+        recorded = [ recorder.record("/mocap/live/joint/rot_local", pose) for pose in self.live_poses ]
+
+        self.assertEqual(sum(recorded), 30)
+        self.assertEqual(recorder.streams["/mocap/live/joint/rot_local"]["dropped_frames"], 270)
+
+    def test_pose_sequences(self):
+
+        self.record(motion_recorder.MotionRecorder(self.config))
+
+        pose_sequences = motion_recorder.logToPoseSequences(self.config["log_path"], self.joint_count)
+        live_poses = self.live_poses / np.linalg.norm(self.live_poses, axis=-1, keepdims=True)
+
+        self.assertEqual(pose_sequences["/mocap/live/joint/rot_local"].shape, (300, self.joint_count, 4))
+        np.testing.assert_allclose(pose_sequences["/mocap/live/joint/rot_local"], qfix(live_poses), atol=1e-5)
+
+    def test_recording(self):
+
+        self.record(motion_recorder.MotionRecorder(self.config))
+
+        recording_path = os.path.join(self.tmp_dir.name, "log.rec")
+        motion_recorder.logToRecording(self.config["log_path"], recording_path)
+
+        recording = mocap_recording.Recording(recording_path)
+        time_stamps, values = recording.read("/mocap/synth/joint/rot_local", 1.0, 2.0)
+
+        np.testing.assert_array_equal(values, self.synth_poses[50:100].reshape(50, -1))
@@ -7,6 +7,43 @@ config = {
     "port": 9005
     }
 
+def toRightHanded(pose_wpos, pose_wrot, pose_lrot):
+    """
+    convert a pose from the left handed bvh coordinate system to the right handed standard coordinate system
+    world positions are also converted from cm to m, local rotations are sent unchanged
+    Arguments (where J = number of joints):
+     -- pose_wpos: (J, 3) array of world joint positions
+     -- pose_wrot: (J, 4) array of world joint rotations
+     -- pose_lrot: (J, 4) array of local joint rotations
+    """
+    
+    pose_wpos_rh = np.copy(pose_wpos)
+
+    pose_wpos_rh[:, 0] = pose_wpos[:, 0] / 100.0
+    pose_wpos_rh[:, 1] = -pose_wpos[:, 2] / 100.0
+    pose_wpos_rh[:, 2] = pose_wpos[:, 1] / 100.0
+
+    pose_wrot_rh = np.copy(pose_wrot)
+    
+    pose_wrot_rh[:, 1] = pose_wrot[:, 1] # x -> x
+    pose_wrot_rh[:, 2] = -pose_wrot[:, 3] # z -> -y
+    pose_wrot_rh[:, 3] = pose_wrot[:, 2] # y -> z
+    
+    pose_lrot_rh = np.copy(pose_lrot)
+    
+    # debug: send identity quaternion
+    #pose_lrot_rh[:] = np.array([1.0, 0.0, 0.0, 0.0])
+
+    # quat in python: w x y z, quat in unreal x y z w
+    """
+    pose_lrot_rh[:, 3] = pose_lrot[:, 0] # w
+    pose_lrot_rh[:, 0] = pose_lrot[:, 1] # x -> x
+    pose_lrot_rh[:, 1] = -pose_lrot[:, 3] # z -> -y
+    pose_lrot_rh[:, 2] = pose_lrot[:, 2] # y -> z
+    """
+    
+    return pose_wpos_rh, pose_wrot_rh, pose_lrot_rh
+
 class OscSender():
     def __init__(self, config):
         self.osc_sender = SimpleUDPClient(config["ip"], config["port"])
@@ -15,5 +52,18 @@ class OscSender():
 
         osc_values = np.reshape(values, (-1)).tolist()
         
-        self.osc_sender.send_message(address, osc_values) 
-    
\ No newline at end of file
+        self.osc_sender.send_message(address, osc_values)
+
+    def sendPose(self, pose_wpos, pose_wrot, pose_lrot):
+        """
+        send a synthesised pose in right handed coordinates, returns the converted pose
+        used by MotionGui and motion_benchmark so that the benchmark measures the same output path
+        """
+        
+        pose_wpos_rh, pose_wrot_rh, pose_lrot_rh = toRightHanded(pose_wpos, pose_wrot, pose_lrot)
+        
+        self.send("/mocap/joint/pos_world", pose_wpos_rh)
+        self.send("/mocap/joint/rot_world", pose_wrot_rh)
+        self.send("/mocap/joint/rot_local", pose_lrot_rh)
+        
+        return pose_wpos_rh, pose_wrot_rh, pose_lrot_rh
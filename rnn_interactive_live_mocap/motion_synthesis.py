@@ -2,15 +2,17 @@ import torch
 from torch import nn
 import numpy as np
 
-from common.quaternion import qmul, qrot, qnormalize_np, qfix, slerp
-#from common.quaternion_torch import slerp
+from common.quaternion import qmul, qrot, qnormalize_np, qfix, QFixFilter
+from common.quaternion_torch import slerp
+from common.repr6d_torch import quat2repr6d, repr6d2quat
 
 config = {"skeleton": None,
           "model": None,
           "seq_length": 64,
           "orig_sequences": [],
           "orig_seq_index": 0,
-          "device": "cuda"
+          "device": "cuda",
+          "representation": "quat"
           }
 
 """
@@ -24,6 +26,31 @@ test_rot_norm = nn.functional.normalize(test_rot, p=2, dim=0)
 test_rot_norm
 """
 
+"""
+Model Representation
+"""
+
+def poseToModel(motion_seq, representation):
+    """
+    convert a (L, J, 4) quaternion window into the (L, J * D) model input
+    D is 4 for models trained on quaternions and 6 for models trained on the 6d representation
+    """
+    
+    if representation == "repr6d":
+        motion_seq = quat2repr6d(motion_seq)
+        
+    return motion_seq.reshape(motion_seq.shape[0], -1)
+
+def modelToPose(pred_pose, joint_count, representation):
+    """
+    convert a model prediction with J * D values into a (J, 4) tensor of unit quaternions
+    """
+    
+    if representation == "repr6d":
+        return repr6d2quat(pred_pose.reshape(joint_count, 6))
+    
+    return nn.functional.normalize(pred_pose.reshape(joint_count, 4), p=2, dim=1)
+
 class MotionSynthesis():
     
     def __init__(self, config):
@@ -37,6 +64,7 @@ class MotionSynthesis():
         self.orig_seq_frame_count = self.seq_length
         self.orig_seq_blend_factor = 1.0
         self.seq_rand_range = 0.00 # TODO: remove this, doesn't help a bit
+        self.representation = config["representation"]
 
         self.motion_seq = torch.from_numpy(self.orig_sequences[self.orig_seq_index][self.orig_seq_start_frame_index:self.orig_seq_start_frame_index + self.orig_seq_frame_count, ...]).to(self.device)
     
@@ -50,6 +78,7 @@ class MotionSynthesis():
         self.live_seq = self.live_seq.reshape(self.seq_length, self.joint_count, 4)
         self.motion_seq = self.motion_seq.reshape(self.seq_length, self.joint_count, 4)
         self.live_pose = None
+        self.live_filter = QFixFilter(self.live_seq[-1].numpy())
         self.live_seq_changed = False
         self.live_seq_ready = False
         self.live_seq_update_counter = 0
@@ -79,8 +108,9 @@ class MotionSynthesis():
         #if self.live_seq_ready == True:
         #    return
         
-        rotLocal = torch.tensor(rotLocal).to(dtype=torch.float32)
-        rotLocal = rotLocal.reshape(self.joint_count, 4)
+        # keep each joint on the same hemisphere as its previous live rotation
+        rotLocal = np.asarray(rotLocal, dtype=np.float32).reshape(self.joint_count, 4)
+        rotLocal = torch.from_numpy(self.live_filter.update(rotLocal))
         
         self.live_pose = rotLocal
         self.live_seq = torch.cat([self.live_seq[1:, ...], self.live_pose.reshape(1, self.joint_count, 4)], axis=0)
@@ -227,12 +257,10 @@ class MotionSynthesis():
         # get pred pose
         self.model.eval()
         with torch.no_grad():
-            self.pred_pose = self.model(torch.unsqueeze(self.motion_seq.reshape(-1, self.pose_dim), axis=0))
+            self.pred_pose = self.model(torch.unsqueeze(poseToModel(self.motion_seq, self.representation), axis=0))
             
         # normalize pred pose
-        self.pred_pose = torch.squeeze(self.pred_pose)
-        self.pred_pose = self.pred_pose.reshape((-1, 4))
-        self.pred_pose = nn.functional.normalize(self.pred_pose, p=2, dim=1)
+        self.pred_pose = modelToPose(self.pred_pose, self.joint_count, self.representation)
         self.pred_pose = self.pred_pose.reshape((1, self.joint_count, self.joint_dim))
             
         if self.live_seq_ready == False: 
@@ -253,13 +281,6 @@ class MotionSynthesis():
             blend_pose = self.pred_pose 
         """
         
-        """
-        # torch slerp really not working for some reason....
-        blend_factor = torch.ones([self.joint_count], dtype=torch.float32).to(self.device) * self.orig_seq_blend_factor
-        blend_pose = slerp(live_pose[0, ...], self.pred_pose[0, ...], blend_factor)
-        blend_pose = blend_pose.reshape(1, self.joint_count, self.joint_dim)
-        """
-        
         # increment blend factor
 
         if self.live_seq_ready == False: 
@@ -271,20 +292,8 @@ class MotionSynthesis():
         
         #print("blend_factor ", blend_factor)
 
-        # numpy slerp
-        live_pose_np = live_pose.detach().cpu().numpy()
-        pred_pose_np = self.pred_pose.detach().cpu().numpy()
-        blend_pose_np = np.zeros_like(live_pose_np)
-        
-        for ji in range(self.joint_count): 
-                current_quat = live_pose_np[0, ji, :]
-                target_quat = pred_pose_np[0, ji, :]
-                quat_mix = blend_factor
-                mix_quat = slerp(current_quat, target_quat, quat_mix )
-                
-                blend_pose_np[0, ji] = mix_quat
-        
-        blend_pose = torch.tensor(blend_pose_np).to(self.device)
+        # all joints at once
+        blend_pose = slerp(live_pose, self.pred_pose, blend_factor, unit=False)
 
         #blend_pose = live_pose
 
@@ -9,6 +9,7 @@ import motion_synthesis
 import motion_sender
 import motion_gui
 import motion_control
+import motion_recorder
 
 import torch
 from torch.utils.data import Dataset
@@ -111,24 +112,35 @@ all_pose_sequences[0].shape
 Load Model
 """
 
+# rotation representation the model was trained with, pose_representation in rnn.py ("quat" or "repr6d")
+model_representation = "quat"
+model_pose_dim = joint_count * (6 if model_representation == "repr6d" else joint_dim)
 
 motion_model.config = {
     "input_length": 64,
-    "data_dim": pose_dim,
+    "data_dim": model_pose_dim,
     "node_dim": 512,
     "layer_count": 2,
     "device": "cuda",
-    "weights_path": "../rnn/results_ZED_Daniel_Solo/weights/rnn_weights_epoch_200"
+    "weights_path": "../rnn/results_ZED_Daniel_Solo/weights/rnn_weights_epoch_200",
+    "backend": "torch",
+    "onnx_path": "",
+    "onnx_step_path": "",
+    "representation": model_representation
     }
 
 """
 motion_model.config = {
     "input_length": 64,
-    "data_dim": pose_dim,
+    "data_dim": model_pose_dim,
     "node_dim": 512,
     "layer_count": 2,
     "device": "cuda",
-    "weights_path": "../rnn/results_XSens_Muriel_EmbodiedMachineVariations/weights/rnn_weights_epoch_200"
+    "weights_path": "../rnn/results_XSens_Muriel_EmbodiedMachineVariations/weights/rnn_weights_epoch_200",
+    "backend": "torch",
+    "onnx_path": "",
+    "onnx_step_path": "",
+    "representation": model_representation
     }
 """
 
@@ -146,6 +158,7 @@ synthesis_config["seq_length"] = mocap_input_length
 synthesis_config["orig_sequences"] = all_pose_sequences
 synthesis_config["orig_seq_index"] = 0
 synthesis_config["device"] = device
+synthesis_config["representation"] = model_representation
 
 synthesis = motion_synthesis.MotionSynthesis(synthesis_config)
 
@@ -160,6 +173,18 @@ motion_sender.config["port"] = 9008
 osc_sender = motion_sender.OscSender(motion_sender.config)
 
 
+"""
+Motion Recorder
+"""
+
+# True: record the received live poses and the sent synthesised poses, see motion_recorder.logToPoseSequences for retraining
+record_motion = False
+
+motion_recorder.config["log_path"] = "recordings/{}".format(time.strftime("%Y%m%d_%H%M%S"))
+motion_recorder.config["streams"] = { "/mocap/live/joint/rot_local": joint_count * 4, "/mocap/synth/joint/rot_local": joint_count * 4 }
+
+recorder = motion_recorder.MotionRecorder(motion_recorder.config) if record_motion == True else None
+
 """
 GUI
 """
@@ -172,6 +197,7 @@ from pathlib import Path
 
 motion_gui.config["synthesis"] = synthesis
 motion_gui.config["sender"] = osc_sender
+motion_gui.config["recorder"] = recorder
 motion_gui.config["update_interval"] = 1.0 / mocap_fps
 
 app = QtWidgets.QApplication(sys.argv)
@@ -189,6 +215,7 @@ OSC Control
 motion_control.config["motion_seq"] = pose_sequence
 motion_control.config["synthesis"] = synthesis
 motion_control.config["gui"] = gui
+motion_control.config["recorder"] = recorder
 motion_control.config["ip"] = "0.0.0.0"
 motion_control.config["port"] = 9007
 
@@ -198,9 +225,15 @@ osc_control = motion_control.MotionControl(motion_control.config)
 Start Application
 """
 
+if recorder is not None:
+    recorder.start()
+
 osc_control.start()
 gui.show()
 app.exec_()
 
 
 osc_control.stop()
+
+if recorder is not None:
+    recorder.stop()
@@ -1,48 +1,65 @@
 """
 conversions and calculations of dual quaternion representation of positions and rotations, operate on numpy arrays
 representation per quaternion: w, x, y, z
+
+a dual quaternion is stored as a pair of arrays q_r (real part) and q_d (dual part)
+all functions operate on batches: q_r and q_d have shape (*, 4), translations and points (*, 3), scalars (*)
+a single dual quaternion is a pair of arrays of shape (4)
 """
 
 import numpy as np
 import common.quaternion_np as nquat
 
-def normalize(q_r, q_d):
-    return nquat.normalize(q_r), nquat.normalize(q_d)
+def _pure(v):
+    """
+    pure quaternion (0, v) from vectors of shape (*, 3)
+    """
+
+    v = np.asarray(v)
+
+    return np.concatenate((np.zeros(v.shape[:-1] + (1,), dtype=v.dtype), v), axis=-1)
 
 def dconj(q_r, q_d):
     """
     Return the dual number conjugate (qr, qd)* = (qr, -qd) (tested)
     This form of conjugate is seldom used.
     """
-    
+
     return q_r, -q_d
 
+def conj(q_r, q_d):
+    """
+    Return the quaternion conjugate (qr, qd)* = (qr*, qd*) (tested)
+    """
+
+    return nquat.conj(q_r), nquat.conj(q_d)
+
 def cconj(q_r, q_d):
     """
     Return the combination of the quaternion conjugate and dual number conjugate (tested)
     (qr, qd)* = (qr*, -qd*)
     """
-    
+
     return nquat.conj(q_r), -nquat.conj(q_d)
 
 def inv(q_r, q_d):
     """
     Return the dual quaternion inverse (tested)
     """
-    
+
     q_r_inv = nquat.inv(q_r)
     q_d_inv = nquat.mul(nquat.mul(-q_r_inv, q_d), q_r_inv)
-    
+
     return q_r_inv, q_d_inv
 
 def translation(q_r, q_d):
     """
     Get the translation component of the dual quaternion in vector form (tested)
     """
-    
+
     mult = nquat.mul((2.0 * q_d), nquat.conj(nquat.normalize(q_r)))
-    return mult[1:]
-    
+    return mult[..., 1:]
+
 
 def mul(q1_r, q1_d, q2_r, q2_d):
     """
@@ -51,38 +68,38 @@ def mul(q1_r, q1_d, q2_r, q2_d):
     :return product: DualQuaternion object. Math:
         dq1 * dq2 = q1_r * q2_r + (q1_r * q2_d + q1_d * q2_r) * eps
     """
-    
+
     q_r_prod = nquat.mul(q1_r, q2_r)
     q_d_prod = nquat.mul(q1_r, q2_d) + nquat.mul(q1_d, q2_r)
-    
+
     return q_r_prod, q_d_prod
 
 def smul(q_r, q_d, sc):
     """
     Multiplication with a scalar (tested)
     """
-    
+
     return q_r * sc, q_d * sc
 
 def div(q1_r, q1_d, q2_r, q2_d):
     """
     Dual quaternion division. (tested)
     """
-    
+
     q2_r_sq = nquat.mul(q2_r, q2_r)
     div_r = nquat.mul(nquat.mul(q1_r, q2_r), nquat.inv(q2_r_sq))
     div_d = nquat.mul((nquat.mul(q2_r, q1_d) - nquat.mul(q1_r, q2_d)), nquat.inv(q2_r_sq))
-    
+
     return div_r, div_d
 
 def add(q1_r, q1_d, q2_r, q2_d):
     """
     Dual quaternion addition. (tested)
     """
-    
+
     return q1_r + q2_r, q1_d + q2_d
-    
-  
+
+
 def eq(q1_r, q1_d, q2_r, q2_d):
 
     return (q1_r == q2_r or q1_r == -q2_r) and (q1_d == q2_d or q1_d == -q2_d)
@@ -91,49 +108,53 @@ def transform_point(q1_r, q1_d, pt):
         """
         Convenience function to apply the transformation to a given vector. (tested)
         """
-        
-        qv_r = np.array([1.0, 0.0, 0.0, 0.0])
-        qv_d = np.hstack((0, pt))
+
+        qv_d = _pure(pt)
+        qv_r = np.zeros_like(qv_d)
+        qv_r[..., 0] = 1.0
         resq_r, resq_d = mul(*mul(q1_r, q1_d, qv_r, qv_d), *cconj(q1_r, q1_d))
-        
-        return resq_d[1:]
-    
+
+        return resq_d[..., 1:]
+
 def identity():
-    
+
     return np.array([1.0, 0.0, 0.0, 0.0]), np.array([0.0, 0.0, 0.0, 0.0])
-    
-    
+
+
 def hmat2dq(matrix):
     """
     Create dual quaternion from a 4 by 4 homogeneous transformation matrix (tested)
     """
 
-    q_r = nquat.normalize(nquat.mat2quat(matrix[:3, :3]))
-    v_t = matrix[:3, 3]
-    
-    q_d = nquat.mul(0.5 * np.array([0, v_t[0], v_t[1], v_t[2]]), q_r)
-    
+    q_r = nquat.normalize(nquat.mat2quat(matrix[..., :3, :3]))
+    v_t = matrix[..., :3, 3]
+
+    q_d = nquat.mul(0.5 * _pure(v_t), q_r)
+
     return q_r, q_d
 
 def dq2hmat(q_r, q_d):
     """
     Homogeneous 4x4 transformation matrix from the dual quaternion (tested)
     """
-    
-    hmat = np.eye(4)
-    hmat[:3, :3] = nquat.quat2mat(q_r)
-    hmat[:3, 3] = translation(q_r, q_d)
-    
+
+    hmat = np.zeros(q_r.shape[:-1] + (4, 4))
+    hmat[..., :3, :3] = nquat.quat2mat(q_r)
+    hmat[..., :3, 3] = translation(q_r, q_d)
+    hmat[..., 3, 3] = 1.0
+
     return hmat
-    
+
 
 def qtvec2dq(q_r, v_t):
     """
     Create a dual quaternion from a quaternion q_r and translation v_t (tested)
+    q_r is normalised
     """
-    
-    q_d = nquat.mul(0.5 * np.array([0.0, v_t[0], v_t[1], v_t[2]]), q_r)
-    
+
+    q_r = nquat.normalize(q_r)
+    q_d = nquat.mul(0.5 * _pure(v_t), q_r)
+
     return q_r, q_d
 
 def dq2qtvec(q_r, q_t):
@@ -150,122 +171,204 @@ def tvec2dq(v_t):
     """
     Create dual quaternion from a cartesian point (tested)
     """
-    
-    q_r = np.array([1.0, 0.0, 0.0, 0.0])
-    q_d = nquat.mul(0.5 * np.array([0, v_t[0], v_t[1], v_t[2]]), q_r)
-    
+
+    q_d = 0.5 * _pure(np.asarray(v_t, dtype=np.float64))
+    q_r = np.zeros_like(q_d)
+    q_r[..., 0] = 1.0
+
     return q_r, q_d
-    
+
 
 def normalize(q_r, q_d):
     """
     Normalize dual quaternion (tested)
     """
-    
+
     norm_qr = nquat.mag(q_r)
-    
+
     return q_r / norm_qr, q_d / norm_qr
 
+def is_normalized(q_r, q_d, atol=1e-6):
+    """
+    True if the real part has unit length and is orthogonal to the dual part (tested)
+    """
+
+    unit = np.isclose(np.sum(q_r * q_r, axis=-1), 1.0, atol=atol)
+    orthogonal = np.isclose(np.sum(q_r * q_d, axis=-1), 0.0, atol=atol)
+
+    return np.all(unit & orthogonal)
+
+def screw(q_r, q_d):
+    """
+    Screw parameters of the dual quaternion (tested)
+    any rigid displacement is a rotation about a line and a translation along the line (Chasles' theorem)
+    returns the Pluecker coordinates of the line l (*, 3) and m (*, 3), the rotation angle theta (*) and the displacement d (*)
+    for a pure translation l points along the translation and m is infinite
+    """
+
+    q_r, q_d = normalize(q_r, q_d)
+
+    vec = q_r[..., 1:]
+    vec_norm = np.linalg.norm(vec, axis=-1)
+
+    theta = 2.0 * np.arctan2(vec_norm, q_r[..., 0])
+    t = translation(q_r, q_d)
+
+    rotation = ~np.isclose(theta, 0.0)
+
+    # rotation
+    sin_half = np.where(rotation, np.sin(theta / 2.0), 1.0)
+    tan_half = np.where(rotation, np.tan(theta / 2.0), 1.0)
+
+    l_rot = vec / sin_half[..., None]
+    d_rot = np.sum(t * l_rot, axis=-1)
+    t_l = np.cross(t, l_rot)
+    m_rot = 0.5 * (t_l + np.cross(l_rot, t_l) / tan_half[..., None])
+
+    # pure translation
+    t_norm = np.linalg.norm(t, axis=-1)
+    translation_only = ~np.isclose(t_norm, 0.0)
+    l_trans = np.where(translation_only[..., None], t / np.where(translation_only, t_norm, 1.0)[..., None], np.array([0.0, 0.0, 1.0]))
+
+    l = np.where(rotation[..., None], l_rot, l_trans)
+    m = np.where(rotation[..., None], m_rot, np.inf)
+    theta = np.where(rotation, theta, 0.0)
+    d = np.where(rotation, d_rot, t_norm)
+
+    return l, m, theta, d
+
+def from_screw(l, m, theta, d):
+    """
+    Create a dual quaternion from screw parameters (tested)
+    l: unit vector along the screw axis, m: moment of the screw axis
+    theta: rotation around the screw axis, d: displacement along the screw axis
+    """
+
+    l = np.asarray(l)
+    m = np.asarray(m)
+    theta = np.asarray(theta)[..., None]
+    d = np.asarray(d)[..., None]
+
+    sin_half = np.sin(theta / 2.0)
+    cos_half = np.cos(theta / 2.0)
+
+    q_r = np.concatenate((cos_half, sin_half * l), axis=-1)
+    q_d = np.concatenate((-d / 2.0 * sin_half, sin_half * m + d / 2.0 * cos_half * l), axis=-1)
+
+    return q_r, q_d
+
 def pow(q_r, q_d, exp):
     """
-    exponent (semi-tested)
-    """
-    
-    #print("pow q_r ", q_r, " q_d ", q_d)
-
-    exp = float(exp)
-    
-    #print("q_r[0] ", q_r[0])
-    
-    theta = 2 * np.arccos(q_r[0])
-    
-    #print("theta ", theta)
-    
-    if np.isclose(theta, 0):
-        t_v = exp * translation(q_r, q_d)
-        return tvec2dq(t_v)
-    else:
-        s0 = q_r[1:] / np.sin(theta / 2)
-        
-        #print("s0 ", s0)
-        
-        d = -2. * q_d[0] / np.sin(theta / 2)
-        
-        #print("d ", d)
-        
-        #print("q_d[1:] ", q_d[1:])
-        
-        se = (q_d[1:] - s0 * d / 2 * np.cos(theta / 2)) / np.sin(theta / 2)
-        
-        #print("se ", se)
-        
-    powq_r = np.hstack((np.cos(exp * theta / 2), np.sin(exp * theta / 2) * s0))
-    
-    powq_d_s = -exp * d / 2 * np.sin(exp * theta / 2)
-    powq_d_v = exp * d / 2 * np.cos(exp * theta / 2) * s0 + np.sin(exp * theta / 2) * se
-    powq_d = np.hstack((powq_d_s, powq_d_v))
-    
+    exponent (tested)
+    exp is a scalar or an array of shape (*)
+    """
+
+    exp = np.asarray(exp, dtype=q_r.dtype)[..., None]
+
+    theta = (2.0 * np.arccos(np.clip(q_r[..., 0], -1.0, 1.0)))[..., None]
+
+    rotation = ~np.isclose(theta, 0.0)
+
+    # rotation
+    sin_half = np.where(rotation, np.sin(theta / 2.0), 1.0)
+
+    s0 = q_r[..., 1:] / sin_half
+    d = -2.0 * q_d[..., :1] / sin_half
+    se = (q_d[..., 1:] - s0 * d / 2.0 * np.cos(theta / 2.0)) / sin_half
+
+    sin_exp = np.sin(exp * theta / 2.0)
+    cos_exp = np.cos(exp * theta / 2.0)
+
+    powq_r = np.concatenate((cos_exp, sin_exp * s0), axis=-1)
+    powq_d = np.concatenate((-exp * d / 2.0 * sin_exp, exp * d / 2.0 * cos_exp * s0 + sin_exp * se), axis=-1)
+
+    # pure translation
+    trans_r, trans_d = tvec2dq(exp * translation(q_r, q_d))
+
+    powq_r = np.where(rotation, powq_r, trans_r)
+    powq_d = np.where(rotation, powq_d, trans_d)
+
     return powq_r, powq_d
 
-    
+
 def sclerp(q1_r, q1_d, q2_r, q2_d, t):
     """
-    Screw Linear Interpolation (semi-tested)
+    Screw Linear Interpolation (tested)
 
     Generalization of Quaternion slerp (Shoemake et al.) for rigid body motions
     ScLERP guarantees both shortest path (on the manifold) and constant speed
     interpolation and is independent of the choice of coordinate system.
     ScLERP(dq1, dq2, t) = dq1 * dq12^t where dq12 = dq1^-1 * dq2
+    t is a scalar or an array of shape (*)
     """
-    
+
     # ensure we always find closest solution. See Kavan and Zara 2005
-    if nquat.mul(q1_r, q2_r)[0] < 0:
-        q1_r *= -1
-        
-    #print("start r", q1_r, " d ", q1_d)
-    #print("start inv ", inv(q1_r, q1_d))
-    #print("stop r", q2_r, " d ", q2_d)
-    #print("start * (start.inverse() * stop) ", mul(*mul(q1_r, q1_d, *inv(q1_r, q1_d)), q2_r, q2_d))
-    
+    # dq and -dq are the same transformation, the whole dual quaternion changes its sign
+    sign = np.where(np.sum(q1_r * q2_r, axis=-1, keepdims=True) < 0.0, -1.0, 1.0)
+    q1_r = q1_r * sign
+    q1_d = q1_d * sign
+
     return mul(q1_r, q1_d, *pow( *(mul(*inv(q1_r, q1_d), q2_r, q2_d)), t))
 
+def joint_levels(parents):
+    """
+    joint indices grouped by their depth in the hierarchy, the root joints (parent -1) are in the first group
+    all joints of a group can be processed at once once the previous group is done
+    """
+
+    depths = [ None ] * len(parents)
 
+    def depth(joint):
+        if depths[joint] is None:
+            depths[joint] = 0 if parents[joint] < 0 else depth(parents[joint]) + 1
+        return depths[joint]
 
-def localquats2currentdq(lq, offsets, parh,joints_num = 32):
+    for joint in range(len(parents)):
+        depth(joint)
+
+    return [ np.array([ joint for joint in range(len(parents)) if depths[joint] == level ]) for level in range(max(depths) + 1) ]
+
+def localquats2currentdq(lq, offsets, parh, joints_num=None):
     """takes in local quaternion, offsets, and parents to produce hierarchy-aware dual quaternions
+    all joints of the same depth in the hierarchy are processed at once for all frames
 
     inputs
     ------
-    lq: array of local quaternions, size: (T,J*4) (#frames x (number of joints used*4))
+    lq: array of local quaternions, size: (*, J*4) (for example #frames x (number of joints used*4))
     offsets: array, size: #joints used x 3
-    parh: parents list , for us size = 31 (I think for MotioNet - the joints that the network predicts)
+    parh: parents list, -1 for the root
+    joints_num: number of joints used, all joints in parh if None
 
 
     outputs
     -------
-    allcq: current dual quaternions for each joint, size: #frames x (#joints used *8)
-    """
-    allcq = []
-    # print(parh)
-    for ff in range(lq.shape[0]):
-        cq = {}
-        for i in range(joints_num):
-            if i == 0:
-                cq[i] = DualQuaternion.from_quat_pose_array(
-                    list(lq[ff, i * 4:i * 4 + 4]) + list(offsets[0])).normalized().dq_array()
-            else:
-                cq[i] = (DualQuaternion.from_dq_array((cq[parh[i]])) * DualQuaternion.from_quat_pose_array(
-                    list(lq[ff, i * 4:i * 4 + 4]) + list(offsets[i]))).normalized().dq_array()
-        temp = []
-        for i in cq.items():
-            temp.append(i[1][0])
-            temp.append(i[1][1])
-            temp.append(i[1][2])
-            temp.append(i[1][3])
-            temp.append(i[1][4])
-            temp.append(i[1][5])
-            temp.append(i[1][6])
-            temp.append(i[1][7])
-        allcq.append(temp)
-    allcq = np.array(allcq)
+    allcq: current dual quaternions for each joint, size: (*, #joints used *8)
+    """
+
+    if joints_num is None:
+        joints_num = len(parh)
+
+    parents = np.array(parh[:joints_num])
+    offsets = np.asarray(offsets)[:joints_num]
+
+    batch_shape = lq.shape[:-1]
+    lq = np.reshape(lq, batch_shape + (-1, 4))[..., :joints_num, :]
+
+    # local transformations
+    local_r, local_d = qtvec2dq(lq, offsets.astype(lq.dtype))
+
+    current_r = np.empty_like(local_r)
+    current_d = np.empty_like(local_d)
+
+    for level, joints in enumerate(joint_levels(parents)):
+
+        if level == 0:
+            current_r[..., joints, :], current_d[..., joints, :] = normalize(local_r[..., joints, :], local_d[..., joints, :])
+        else:
+            joint_parents = parents[joints]
+            current_r[..., joints, :], current_d[..., joints, :] = normalize(*mul(current_r[..., joint_parents, :], current_d[..., joint_parents, :], local_r[..., joints, :], local_d[..., joints, :]))
+
+    allcq = np.concatenate((current_r, current_d), axis=-1)
+    allcq = np.reshape(allcq, batch_shape + (joints_num * 8, ))
+
     return allcq
@@ -1,6 +1,7 @@
 import numpy as np
 from matplotlib import pyplot as plt
-import matplotlib.animation as animation 
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from PIL import Image
 
@@ -8,28 +9,27 @@ from PIL import Image
 class PoseRenderer:
     def __init__(self, edge_data):
         self.edge_data = edge_data
-    
+
     def _fig2data (self, fig):
         """
-        @brief Convert a Matplotlib figure to a 4D numpy array with RGBA channels and return it
-        @param fig a matplotlib figure
-        @return a numpy 3D array of RGBA values
+        @brief Draw a Matplotlib figure and return its RGBA buffer
+        @param fig a matplotlib figure with an agg canvas
+        @return a numpy 3D array of RGBA values with shape (height, width, 4), it shares memory with the canvas and is overwritten by the next draw
         """
         # draw the renderer
         fig.canvas.draw ( )
- 
-        # Get the RGBA buffer from the figure
-        w,h = fig.canvas.get_width_height()
-        
-        #print("w ", w, " h ", h)
-        
-        buf = np.fromstring ( fig.canvas.tostring_argb(), dtype=np.uint8 )
-        buf.shape = ( w, h,4 )
- 
-        # canvas.tostring_argb give pixmap in ARGB mode. Roll the ALPHA channel to have it in RGBA mode
-        buf = np.roll ( buf, 3, axis = 2 )
-        return buf
-    
+
+        return np.asarray ( fig.canvas.buffer_rgba() )
+
+    def _canvas2img (self, canvas):
+        """
+        @brief Copy the current RGBA buffer of an agg canvas into a PIL Image
+        @param canvas a matplotlib agg canvas
+        @return a Python Imaging Library ( PIL ) image
+        """
+        # the canvas buffer is reused by the next draw, the image gets its own copy
+        return Image.fromarray ( np.array ( canvas.buffer_rgba() ) )
+
     def _fig2img (self, fig):
         """
         @brief Convert a Matplotlib figure to a PIL Image in RGBA format and return it
@@ -37,132 +37,117 @@ class PoseRenderer:
         @return a Python Imaging Library ( PIL ) image
         """
         # put the figure pixmap into a numpy array
-        buf = self._fig2data ( fig )
-        w, h, d = buf.shape
-        
-        return Image.frombuffer( "RGBA", ( w ,h ), buf.tostring( ) )
-    
-    def create_pose_image(self, pose, axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch):
-        point_data = np.array([pose[:,0], pose[:,1], pose[:,2]])
-        lines_data = np.array([[pose[edge[0],:], pose[edge[1],:]] for edge in self.edge_data])
+        self._fig2data ( fig )
 
-        fig = plt.figure(figsize=(image_xinch,image_yinch)) 
-        plt.axis("off")
+        return self._canvas2img ( fig.canvas )
+
+    def _create_pose_axes(self, axis_min, axis_max, rot_elev, rot_azi, image_xinch, image_yinch):
+
+        # figure with its own agg canvas, no window is created
+        fig = Figure(figsize=(image_xinch,image_yinch))
+        FigureCanvas(fig)
+
+        fig.add_subplot().axis("off")
         fig.tight_layout()
-            
-        ax = plt.axes(projection="3d")
+
+        ax = fig.add_subplot(projection="3d")
         ax.view_init(elev=rot_elev, azim=rot_azi)
-        
+
         ax.set_xlim(axis_min[0], axis_max[0])
         ax.set_ylim(axis_min[1], axis_max[1])
         ax.set_zlim(axis_min[2], axis_max[2])
-            
+
         # Make panes transparent
         ax.xaxis.pane.fill = False # Left pane
         ax.yaxis.pane.fill = False # Right pane
         ax.zaxis.pane.fill = False # Right pane
-            
+
         ax.grid(False) # Remove grid lines
-            
+
         # Remove tick labels
         ax.set_xticklabels([])
         ax.set_yticklabels([])
         ax.set_zticklabels([])
-            
+
         # Transparent spines
-        ax.w_xaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_yaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_zaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-            
+        ax.xaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
+        ax.yaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
+        ax.zaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
+
         # Transparent panes
-        ax.w_xaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_yaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
-            
+        ax.xaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
+        ax.yaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
+
         # No ticks
         ax.set_xticks([])
         ax.set_yticks([])
         ax.set_zticks([])
-            
-        for line in lines_data:
-            ax.plot(line[:,0], line[:,1], zs=line[:,2], linewidth=line_width, color='cadetblue', alpha=0.5)
-            ax.scatter(point_data[0, :], point_data[1, :], point_data[2, :], s=line_width * 8, color='darkslateblue', alpha=0.5)
-    
-        fig.show()
-    
+
+        return fig, ax
+
+    def _create_pose_artists(self, ax, pose, line_width):
+
+        # one line per edge and one scatter for all joints, their data is replaced for every pose
+        lines = [ ax.plot(pose[edge, 0], pose[edge, 1], zs=pose[edge, 2], linewidth=line_width, color='cadetblue', alpha=0.5)[0] for edge in self.edge_data ]
+        points = ax.scatter(pose[:, 0], pose[:, 1], pose[:, 2], s=line_width * 8.0, color='darkslateblue', alpha=0.5)
+
+        return lines, points
+
+    def _update_pose_artists(self, lines, points, pose):
+
+        for line, edge in zip(lines, self.edge_data):
+            line.set_data_3d(pose[edge, 0], pose[edge, 1], pose[edge, 2])
+
+        # scatter plots in 3d have no public setter for their data
+        points._offsets3d = (pose[:, 0], pose[:, 1], pose[:, 2])
+
+    def create_pose_image(self, pose, axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch):
+
+        fig, ax = self._create_pose_axes(axis_min, axis_max, rot_elev, rot_azi, image_xinch, image_yinch)
+        self._create_pose_artists(ax, pose, line_width)
+
         pose_image = self._fig2img ( fig )
-    
-        plt.close()
-        
+
         return pose_image
-    
+
     def create_pose_images(self, poses, axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch):
         pose_count = poses.shape[0]
         pose_images = []
-        
-        fig = plt.figure(figsize=(image_xinch,image_yinch)) 
-        plt.axis("off")
-        fig.tight_layout()
-        
-        ax = plt.axes(projection="3d")
-        ax.view_init(elev=rot_elev, azim=rot_azi)
-        
-        ax.set_xlim(axis_min[0], axis_max[0])
-        ax.set_ylim(axis_min[1], axis_max[1])
-        ax.set_zlim(axis_min[2], axis_max[2])
-        
-        # Make panes transparent
-        ax.xaxis.pane.fill = False # Left pane
-        ax.yaxis.pane.fill = False # Right pane
-        ax.zaxis.pane.fill = False # Right pane
-        
-        ax.grid(False) # Remove grid lines
-        
-        # Remove tick labels
-        ax.set_xticklabels([])
-        ax.set_yticklabels([])
-        ax.set_zticklabels([])
-        
-        # Transparent spines
-        ax.w_xaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_yaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_zaxis.line.set_color((1.0, 1.0, 1.0, 0.0))
-        
-        # Transparent panes
-        ax.w_xaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
-        ax.w_yaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
-        
-        # No ticks
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.set_zticks([])
-        
-        scatter_data = None
-        
-        fig.show()
-        
+
+        if pose_count == 0:
+            return pose_images
+
+        fig, ax = self._create_pose_axes(axis_min, axis_max, rot_elev, rot_azi, image_xinch, image_yinch)
+        lines, points = self._create_pose_artists(ax, poses[0], line_width)
+
+        # the axes don't change, draw them once without the skeleton and restore this background for every pose
+        for artist in lines + [points]:
+            artist.set_visible(False)
+
+        fig.canvas.draw()
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+
+        for artist in lines + [points]:
+            artist.set_visible(True)
+
         for pI in range(pose_count):
-            
-            # cleanup previous drawing
-            if scatter_data != None:
-                scatter_data.remove()
-            if len(ax.lines) > 0:
-                ax.lines.clear()
-            
-            point_data = np.array([poses[pI, :,0], poses[pI, :,1], poses[pI,:,2]])
-            lines_data = np.array([[poses[pI, edge[0],:], poses[pI, edge[1],:]] for edge in self.edge_data])
-            
-            for line in lines_data:
-                ax.plot(line[:,0], line[:,1], zs=line[:,2], linewidth=line_width, color='cadetblue', alpha=0.5)
-            scatter_data = ax.scatter(point_data[0, :], point_data[1, :], point_data[2, :], s=line_width*8.0, color='darkslateblue', alpha=0.5)
-
-            im = self._fig2img ( fig )
-            
+
+            self._update_pose_artists(lines, points, poses[pI])
+
+            fig.canvas.restore_region(background)
+
+            # same order as a full draw: lines first, then the depth sorted scatter
+            for line in lines:
+                ax.draw_artist(line)
+            points.do_3d_projection()
+            ax.draw_artist(points)
+
+            im = self._canvas2img ( fig.canvas )
+
             pose_images.append(im)
-    
-        plt.close()
-            
+
         return pose_images
- 
+
     def create_grid_image(self, images, grid):
         h_count = grid[0]
         v_count = grid[1]
@@ -183,10 +168,208 @@ class PoseRenderer:
             fig.tight_layout()
 
         fig.show()
-    
+
         grid_image = self._fig2img ( fig )
-    
+
         plt.close()
-        
+
         return grid_image
-    
\ No newline at end of file
+
+
+class PoseRasterizer(PoseRenderer):
+    """
+    draws poses directly into numpy image buffers instead of rendering a matplotlib 3d plot
+    the joints are projected with a fixed orthographic or perspective camera that uses the same elevation and azimuth convention as matplotlib
+    bones and joints are antialiased by their pixel coverage, the images look close to but not exactly like the ones of PoseRenderer
+    """
+    def __init__(self, edge_data, projection="perspective", camera_distance=10.0, box_aspect=(4, 4, 3), dpi=None):
+        super().__init__(edge_data)
+
+        self.edges = np.array(edge_data, dtype=np.int64).reshape(-1, 2)
+        self.projection = projection
+        self.camera_distance = camera_distance
+        self.box_aspect = np.array(box_aspect, dtype=np.float64) / max(box_aspect)
+        self.dpi = plt.rcParams["figure.dpi"] if dpi is None else dpi
+
+        # same colors and opacity as PoseRenderer
+        self.bone_color = np.array(to_rgb('cadetblue'), dtype=np.float32) * 255.0
+        self.joint_color = np.array(to_rgb('darkslateblue'), dtype=np.float32) * 255.0
+        self.opacity = 0.5
+
+    def project(self, poses, axis_min, axis_max, rot_elev, rot_azi, image_width, image_height):
+        """
+        pixel coordinates of shape (..., 2) of joint positions of shape (..., 3)
+        the axis box is scaled to box_aspect and its bounding sphere fills the image
+        """
+        axis_min = np.asarray(axis_min, dtype=np.float64)
+        axis_range = np.asarray(axis_max, dtype=np.float64) - axis_min
+        axis_range[axis_range == 0.0] = 1.0
+
+        positions = ((np.asarray(poses, dtype=np.float64) - axis_min) / axis_range - 0.5) * self.box_aspect
+
+        elev = np.radians(rot_elev)
+        azim = np.radians(rot_azi)
+
+        view_dir = np.array([np.cos(elev) * np.cos(azim), np.cos(elev) * np.sin(azim), np.sin(elev)])
+        right_dir = np.array([-np.sin(azim), np.cos(azim), 0.0])
+        up_dir = np.cross(view_dir, right_dir)
+
+        x = positions @ right_dir
+        y = positions @ up_dir
+
+        if self.projection == "perspective":
+            depth_scale = self.camera_distance / (self.camera_distance - positions @ view_dir)
+            x *= depth_scale
+            y *= depth_scale
+
+        scale = min(image_width, image_height) / np.linalg.norm(self.box_aspect)
+
+        return np.stack([image_width * 0.5 + x * scale, image_height * 0.5 - y * scale], axis=-1)
+
+    def _bone_coverage(self, starts, ends, half_width):
+        """
+        pixels, coverage and line index of antialiased lines between starts and ends (B, 2)
+        every line is sampled once per pixel along its major axis and covers the pixels across it by the overlap with its thickness
+        """
+        steep = np.abs(ends[:, 1] - starts[:, 1]) > np.abs(ends[:, 0] - starts[:, 0])
+
+        a0 = np.where(steep, starts[:, 1], starts[:, 0])
+        b0 = np.where(steep, starts[:, 0], starts[:, 1])
+        a1 = np.where(steep, ends[:, 1], ends[:, 0])
+        b1 = np.where(steep, ends[:, 0], ends[:, 1])
+
+        flip = a1 < a0
+        a0, a1 = np.where(flip, a1, a0), np.where(flip, a0, a1)
+        b0, b1 = np.where(flip, b1, b0), np.where(flip, b0, b1)
+
+        slope = (b1 - b0) / np.maximum(a1 - a0, 1e-8)
+        half_thickness = half_width * np.sqrt(1.0 + slope * slope)
+
+        # pixels whose center lies between the end points along the major axis
+        first = np.ceil(a0 - 0.5).astype(np.int64)
+        counts = np.maximum(np.floor(a1 - 0.5).astype(np.int64) - first + 1, 0)
+
+        line_indices = np.repeat(np.arange(len(counts)), counts)
+        sample_major = np.arange(len(line_indices)) - np.repeat(np.cumsum(counts) - counts, counts) + first[line_indices]
+
+        sample_center = b0[line_indices] + (sample_major + 0.5 - a0[line_indices]) * slope[line_indices]
+        sample_half = half_thickness[line_indices]
+
+        offsets = np.arange(int(np.ceil(2.0 * half_width * np.sqrt(2.0))) + 2)
+        minor = np.floor(sample_center - sample_half).astype(np.int64)[:, np.newaxis] + offsets
+        coverage = np.minimum(minor + 1, (sample_center + sample_half)[:, np.newaxis]) - np.maximum(minor, (sample_center - sample_half)[:, np.newaxis])
+
+        sample_major = sample_major[:, np.newaxis]
+        sample_steep = steep[line_indices][:, np.newaxis]
+
+        x = np.where(sample_steep, minor, sample_major)
+        y = np.where(sample_steep, sample_major, minor)
+
+        return x.reshape(-1), y.reshape(-1), np.clip(coverage, 0.0, 1.0).reshape(-1), np.repeat(line_indices, len(offsets))
+
+    def _joint_coverage(self, centers, radius):
+        """
+        pixels, coverage and disc index of antialiased discs around centers (J, 2)
+        """
+        offsets = np.arange(int(np.ceil(2.0 * radius)) + 2)
+
+        x = np.floor(centers[:, 0] - radius).astype(np.int64)[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        y = np.floor(centers[:, 1] - radius).astype(np.int64)[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+
+        distance = np.hypot(x + 0.5 - centers[:, 0, np.newaxis, np.newaxis], y + 0.5 - centers[:, 1, np.newaxis, np.newaxis])
+        coverage = np.clip(radius + 0.5 - distance, 0.0, 1.0)
+
+        x, y = np.broadcast_arrays(x, y)
+
+        return x.reshape(-1), y.reshape(-1), coverage.reshape(-1), np.repeat(np.arange(len(centers)), len(offsets) * len(offsets))
+
+    def _composite(self, images, layers, pixel_slots):
+        """
+        draw layers of (frames, x, y, coverage, color) one above the other into the white images (F, H, W, 4)
+        each primitive covers its pixels with opacity * coverage, overlapping primitives of a layer are blended one after another as with separate matplotlib artists
+        pixel_slots is an int32 scratch array with one entry per pixel of images, its content is irrelevant
+        """
+        height, width = images.shape[1:3]
+
+        layer_pixels = []
+        layer_weights = []
+
+        for frames, x, y, coverage, _ in layers:
+            inside = (coverage > 0.0) & (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+            layer_pixels.append((frames[inside] * height + y[inside]) * width + x[inside])
+            # blending n times with alpha a_i leaves prod(1 - a_i) of the color below
+            layer_weights.append(np.log1p(-self.opacity * coverage[inside]))
+
+        # number the touched pixels without sorting: one of the entries of each pixel wins the slot, the winners are the distinct pixels
+        entry_pixels = np.concatenate(layer_pixels)
+        entry_numbers = np.arange(len(entry_pixels), dtype=np.int32)
+
+        pixel_slots[entry_pixels] = entry_numbers
+        pixel_indices = entry_pixels[pixel_slots[entry_pixels] == entry_numbers]
+
+        pixel_slots[pixel_indices] = np.arange(len(pixel_indices), dtype=np.int32)
+        entry_slots = pixel_slots[entry_pixels]
+
+        layer_starts = np.cumsum([0] + [ len(weights) for weights in layer_weights ])
+        values = np.full((len(pixel_indices), 3), 255.0, dtype=np.float32)
+
+        for lI, (layer, weights) in enumerate(zip(layers, layer_weights)):
+            transmittance = np.exp(np.bincount(entry_slots[layer_starts[lI]:layer_starts[lI + 1]], weights=weights, minlength=len(pixel_indices)))[:, np.newaxis]
+            values = layer[4] + (values - layer[4]) * transmittance
+
+        # write the touched pixels as packed opaque rgba values
+        values = np.rint(values).astype(np.uint32)
+        images.view("<u4").reshape(-1)[pixel_indices] = values[:, 0] | (values[:, 1] << 8) | (values[:, 2] << 16) | 0xff000000
+
+    def create_pose_image(self, pose, axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch):
+
+        return self.create_pose_images(pose[np.newaxis], axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch)[0]
+
+    def create_pose_images(self, poses, axis_min, axis_max, rot_elev, rot_azi, line_width, image_xinch, image_yinch, batch_size=16):
+
+        image_width = int(round(image_xinch * self.dpi))
+        image_height = int(round(image_yinch * self.dpi))
+
+        # line widths are given in points, scatter sizes in points squared with an edge of the default line width
+        bone_half_width = 0.5 * line_width * self.dpi / 72.0
+        joint_radius = 0.5 * (np.sqrt(line_width * 8.0) + plt.rcParams["lines.linewidth"]) * self.dpi / 72.0
+
+        positions = self.project(poses, axis_min, axis_max, rot_elev, rot_azi, image_width, image_height)
+        joint_count = positions.shape[1]
+        edge_count = len(self.edges)
+
+        pose_images = []
+        pixel_slots = np.empty(min(batch_size, positions.shape[0]) * image_height * image_width, dtype=np.int32)
+
+        # several poses are drawn with each numpy call
+        for batch_start in range(0, positions.shape[0], batch_size):
+
+            batch_positions = positions[batch_start:batch_start + batch_size]
+            images = np.full((batch_positions.shape[0], image_height, image_width, 4), 255, dtype=np.uint8)
+
+            layers = []
+
+            if edge_count > 0:
+                x, y, coverage, line_indices = self._bone_coverage(batch_positions[:, self.edges[:, 0]].reshape(-1, 2), batch_positions[:, self.edges[:, 1]].reshape(-1, 2), bone_half_width)
+                layers.append((line_indices // edge_count, x, y, coverage, self.bone_color))
+
+            x, y, coverage, joint_indices = self._joint_coverage(batch_positions.reshape(-1, 2), joint_radius)
+            layers.append((joint_indices // joint_count, x, y, coverage, self.joint_color))
+
+            self._composite(images, layers, pixel_slots)
+
+            pose_images += [ Image.fromarray(image) for image in images ]
+
+        return pose_images
+
+def create_pose_renderer(edge_data, backend="matplotlib"):
+    """
+    PoseRenderer for backend "matplotlib", PoseRasterizer for backend "raster"
+    """
+    if backend == "matplotlib":
+        return PoseRenderer(edge_data)
+    elif backend == "raster":
+        return PoseRasterizer(edge_data)
+
+    raise ValueError("unknown pose renderer backend {}".format(backend))
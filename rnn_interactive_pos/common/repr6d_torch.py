@@ -23,9 +23,9 @@ def repr6d2mat(repr):
     x = repr[..., :3]
     y = repr[..., 3:]
     x = x / x.norm(dim=-1, keepdim=True)
-    z = torch.cross(x, y)
+    z = torch.linalg.cross(x, y, dim=-1)
     z = z / z.norm(dim=-1, keepdim=True)
-    y = torch.cross(z, x)
+    y = torch.linalg.cross(z, x, dim=-1)
     res = [x, y, z]
     res = [v.unsqueeze(-2) for v in res]
     mat = torch.cat(res, dim=-2)
@@ -35,18 +35,11 @@ def repr6d2mat(repr):
 def repr6d2quat(repr):
     """
     from paper: GANimator (tested)
+    
+    converts any number of leading dimensions in one batched op, e.g. (N, L, J, 6) -> (N, L, J, 4)
     """
     
-    x = repr[..., :3]
-    y = repr[..., 3:]
-    x = x / x.norm(dim=-1, keepdim=True)
-    z = torch.cross(x, y)
-    z = z / z.norm(dim=-1, keepdim=True)
-    y = torch.cross(z, x)
-    res = [x, y, z]
-    res = [v.unsqueeze(-2) for v in res]
-    mat = torch.cat(res, dim=-2)
-    return tquat.mat2quat(mat)
+    return tquat.mat2quat(repr6d2mat(repr))
 
 def interpolate_6d(input, size):
     """
@@ -26,6 +26,7 @@ from time import sleep
 
 from common import utils
 from common.pose_renderer import PoseRenderer
+from common.mocap_recording import load_motiondata
 
 """
 Compute Device
@@ -78,25 +79,6 @@ def config_to_skeletondata(mocap_config):
     
     return skeleton_data
 
-def recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids):
-    
-    joint_count = len(skeleton_data["joints"])
-    
-    # gather sensor values
-    motion_data = {}
-    
-    sensor_ids = mocap_recording["sensor_ids"]
-    sensor_values = mocap_recording["sensor_values"]
-    
-    for sensor_id in mocap_sensor_ids:
-
-        #print("sensor_id ", sensor_id)
-        motion_data[sensor_id]  = [ sensor_values [vI] for vI in range(len(sensor_values)) if sensor_ids[vI].endswith(sensor_id) ]
-        motion_data[sensor_id] = np.array(motion_data[sensor_id], dtype=np.float32)
-        motion_data[sensor_id] = np.reshape(motion_data[sensor_id], (motion_data[sensor_id].shape[0], joint_count, -1))
-
-    return motion_data
-
 skeleton_data = config_to_skeletondata(mocap_config)
 
 all_motion_data = []
@@ -105,12 +87,10 @@ for mocap_file in mocap_files:
     
     print("process file ", mocap_file)
     
-    with open(mocap_file_path + "/" + mocap_file, "rb") as f:
-        mocap_recording = pickle.load(f)
-        
-        motion_data = recording_to_motiondata(mocap_recording, skeleton_data, mocap_sensor_ids)
-        
-        all_motion_data.append(motion_data)
+    # pickled recording or columnar recording directory (see common/mocap_recording.py)
+    motion_data = load_motiondata(mocap_file_path + "/" + mocap_file, skeleton_data, mocap_sensor_ids)
+    
+    all_motion_data.append(motion_data)
         
 # retrieve mocap properties
 
@@ -153,6 +133,13 @@ motion_model.config["weights_path"] = "../rnn/results_MMPose3D_HannahMartin/weig
 
 model = motion_model.createModel(motion_model.config) 
 
+"""
+# export the model to onnx, afterwards it can be loaded with onnxruntime by setting
+# motion_model.config["backend"] = "onnx" and motion_model.config["onnx_path"] / ["onnx_step_path"]
+motion_model.exportOnnx(model, motion_model.config, "rnn_weights.onnx", stateful=False)
+motion_model.exportOnnx(model, motion_model.config, "rnn_weights_step.onnx", stateful=True)
+"""
+
 """
 Setup Motion Synthesis
 """